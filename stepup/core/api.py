@@ -74,6 +74,7 @@ from .utils import as_list, extract_env_overrides, parse_resources
 
 __all__ = (
     "CommandArg",
+    "_clear_amend_history",
     "amend",
     "call",
     "copy",
@@ -364,6 +365,7 @@ def step(
     shell: bool = False,
     env_overrides: dict[str, str] | None = None,
     duration: float | None = None,
+    priority: int = 0,
 ) -> StepInfo:
     """Add a step to the build graph.
 
@@ -437,9 +439,20 @@ def step(
         An initial estimate of the step's wall time in seconds,
         used by the scheduler (when `--duration` is enabled)
         to prioritize execution order before any measurement is available.
-        Once the step has run, the scheduler overwrites this with the measured duration.
-        When not given, a new step starts with a default estimate of `1.0`;
+        Once the step has run, the scheduler overwrites this
+        with an estimate derived from its recently measured durations.
+        When not given, a new step starts from the estimate of similar steps
+        (same program and/or working directory) measured before, or `1.0` if there are none;
         a recycled step keeps its previously measured (or given) duration.
+    priority
+        An integer that moves the step forward (positive) or backward (negative)
+        in the order in which runnable steps are started.
+        The scheduler first starts steps that only need to check their stored hash,
+        then planning steps, then steps with the highest priority,
+        and among steps with the same priority, those with the longest critical path.
+        Use this for latency-sensitive steps, e.g. the report users are waiting for,
+        instead of inflating their `duration`.
+        The default is `0`.
 
     Returns
     -------
@@ -455,7 +468,8 @@ def step(
         when a command callable declares an unsupported parameter,
         when an env override collides with an `env` dependency or a reserved variable name,
         when a resource quantity is not a strictly positive integer,
-        or when `duration` is not a finite non-negative number.
+        when `duration` is not a finite non-negative number,
+        or when `priority` is not an integer.
     TypeError
         When `resources` is not a `dict`, a `str`, or `None`.
 
@@ -490,6 +504,10 @@ def step(
     ):
         raise StepUpError(f"Invalid duration: {duration!r}. Must be a non-negative number.")
 
+    # Validate the priority, excluding `bool` for the same reason as `duration`.
+    if isinstance(priority, bool) or not isinstance(priority, int):
+        raise StepUpError(f"Invalid priority: {priority!r}. Must be an integer.")
+
     # Validate the environment overrides against the env dependencies and reserved names.
     if env_overrides is not None:
         overlap = set(env_deps) & set(env_overrides)
@@ -570,6 +588,7 @@ def step(
         shell,
         env_overrides,
         duration,
+        priority,
     )
     return StepInfo(command, su_inp_paths, env_deps, su_out_paths, su_vol_paths, tr_workdir)
 
@@ -589,6 +608,7 @@ def call(
     resources: dict[str, int] | str | None = None,
     args_file: StrPath | None = None,
     duration: float | None = None,
+    priority: int = 0,
     **kwargs: Any,
 ) -> StepInfo:
     """Register a step that calls a named function in an executable.
@@ -633,6 +653,8 @@ def call(
         when absent, a JSON string is embedded directly in the command.
     duration
         See [`step()`][stepup.core.api.step] for more information.
+    priority
+        See [`step()`][stepup.core.api.step] for more information.
     **kwargs
         Additional keyword arguments forwarded to the function.
         Must be serializable to JSON by the `cattrs` JSON converter.
@@ -726,6 +748,7 @@ def call(
         need=need,
         resources=resources,
         duration=duration,
+        priority=priority,
     )
 
 
@@ -839,6 +862,16 @@ _AMEND_HISTORY = {
 }
 
 
+def _clear_amend_history() -> None:
+    """Forget what was amended, before the current process runs another step.
+
+    This is only needed by the warm workers of `call()` steps,
+    see `stepup.core.run.CallWorkerPool`.
+    """
+    for history in _AMEND_HISTORY.values():
+        history.clear()
+
+
 class _HoldState:
     """How many `hold()` blocks the current process is nested inside of.
 
@@ -15,6 +15,7 @@ __all__ = (
     "wait_for_any_event",
     "wait_for_path",
     "wait_for_readable_fd",
+    "wait_for_writable_fd",
 )
 
 MessageType = TypeVar("MessageType")
@@ -41,6 +42,22 @@ async def wait_for_readable_fd(fd: int) -> None:
         loop.remove_reader(fd)
 
 
+async def wait_for_writable_fd(fd: int) -> None:
+    """Wait until file descriptor `fd` becomes writable."""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def _on_writable():
+        if not future.done():
+            future.set_result(None)
+
+    loop.add_writer(fd, _on_writable)
+    try:
+        await future
+    finally:
+        loop.remove_writer(fd)
+
+
 async def wait_for_any_event(*events: asyncio.Event) -> None:
     """Wait until at least one of the events is set."""
     tasks = [asyncio.create_task(event.wait(), name="wait_for_event") for event in events]
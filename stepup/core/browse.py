@@ -561,12 +561,16 @@ class GraphServer(BaseHTTPRequestHandler):
                 block = "\n".join(f"{name}={value}" for name, value in env_overrides.items())
                 yield f"<pre>{block}</pre>"
 
-            sql_res = "SELECT name, units FROM step_resource WHERE node = ? ORDER BY name"
+            sql_res = (
+                "SELECT name, units, implicit FROM step_resource WHERE node = ? "
+                "ORDER BY implicit, name"
+            )
             resources = list(self.con.execute(sql_res, (node_i,)))
             if len(resources) > 0:
                 yield "<h3>Required Resources</h3>"
-                for res_name, res_units in resources:
-                    yield f"<p><b>{res_name}:</b> {res_units}</p>"
+                for res_name, res_units, res_implicit in resources:
+                    suffix = " (implicit)" if res_implicit else ""
+                    yield f"<p><b>{res_name}:</b> {res_units}{suffix}</p>"
 
             sql_nglob = "SELECT data FROM nglob WHERE node = ?"
             nglob_rows = list(self.con.execute(sql_nglob, (node_i,)))
@@ -599,7 +603,7 @@ class GraphServer(BaseHTTPRequestHandler):
             yield from self._format_step_hash(node_i)
 
             sql_outcome = (
-                "SELECT returncode, stdout, stderr, utime, stime, wtime "
+                "SELECT returncode, stdout, stderr, utime, stime, wtime, maxrss "
                 "FROM step_outcome WHERE node = ?"
             )
             row = self.con.execute(sql_outcome, (node_i,)).fetchone()
@@ -616,8 +620,29 @@ class GraphServer(BaseHTTPRequestHandler):
                 yield f"<li>User CPU Time: {row[3]:.3f} s</li>"
                 yield f"<li>System CPU Time: {row[4]:.3f} s</li>"
                 yield f"<li>Wall Clock Time: {row[5]:.3f} s</li>"
+                yield f"<li>Peak Memory: {row[6]:.1f} MiB</li>"
                 yield "</ul>"
 
+            sql_history = (
+                "SELECT run, wtime, ctime, maxrss FROM step_duration WHERE node = ? "
+                "ORDER BY run DESC"
+            )
+            history = self.con.execute(sql_history, (node_i,)).fetchall()
+            if len(history) > 0:
+                yield "<h3>Duration History</h3>"
+                yield (
+                    "<table><tr><th>Run</th><th>Wall Time</th><th>CPU Time</th>"
+                    "<th>Peak Memory</th></tr>"
+                )
+                for run_i, wtime, ctime, maxrss in history:
+                    ctime_str = "-" if ctime is None else f"{ctime:.3f} s"
+                    maxrss_str = "-" if maxrss is None else f"{maxrss:.1f} MiB"
+                    yield (
+                        f"<tr><td>{run_i}</td><td>{wtime:.3f} s</td><td>{ctime_str}</td>"
+                        f"<td>{maxrss_str}</td></tr>"
+                    )
+                yield "</table>"
+
             sql_sub = (
                 "SELECT cmd, workdir, env_overrides, returncode, shell, stdin, stdout, stderr "
                 "FROM step_subprocess WHERE node = ? ORDER BY rowid"
@@ -659,15 +684,13 @@ class GraphServer(BaseHTTPRequestHandler):
                 (node_i,),
             ).fetchone()
             state = FileState(state_i)
-            file_hash = FileHash.from_json(hash_value)
+            file_hash = FileHash.from_blob(hash_value)
             yield f'<p><b>State:</b> <span class="{state.name.lower()}">{state.name}</span></p>'
             yield f"<p><b>Digest:</b> {fmt_short_digest(file_hash.digest)}</p>"
             if len(file_hash.digest) > 1:
                 yield f"<p><b>Mode:</b> {stat.filemode(file_hash.mode)}</p>"
-                yield (
-                    "<p><b>Modified:</b> "
-                    f"{datetime.fromtimestamp(file_hash.mtime).strftime('%Y-%m-%d %H:%M:%S')}</p>"
-                )
+                modified = datetime.fromtimestamp(file_hash.mtime_ns / 1e9)
+                yield f"<p><b>Modified:</b> {modified.strftime('%Y-%m-%d %H:%M:%S')}</p>"
                 yield f"<p><b>Size:</b> {file_hash.size}</p>"
                 yield f"<p><b>Inode:</b> {file_hash.inode}</p>"
 
@@ -816,7 +839,7 @@ class GraphServer(BaseHTTPRequestHandler):
         if row is None:
             yield "<p>No digest stored for this step.</p>"
             return
-        step_hash = StepHash.from_json(row[0])
+        step_hash = StepHash.from_blob(row[0])
         yield f"<p><b>Input Digest:</b> {fmt_short_digest(step_hash.inp_digest)}</p>"
         yield f"<p><b>Output Digest:</b> {fmt_short_digest(step_hash.out_digest)}</p>"
 
@@ -855,7 +878,9 @@ class GraphServer(BaseHTTPRequestHandler):
             if file_hash.is_unknown:
                 yield "<td>-</td><td>-</td><td>-</td><td>-</td></tr>"
             else:
-                modified = datetime.fromtimestamp(file_hash.mtime).strftime("%Y-%m-%d %H:%M:%S")
+                modified = datetime.fromtimestamp(file_hash.mtime_ns / 1e9).strftime(
+                    "%Y-%m-%d %H:%M:%S"
+                )
                 yield f"<td>{stat.filemode(file_hash.mode)}</td>"
                 yield f"<td>{modified}</td>"
                 yield f"<td>{file_hash.size}</td>"
@@ -29,8 +29,8 @@ from .enums import HashUpdateCause, ReturnCode
 from .executor import Executor
 from .finalize import remove_deletable_files, report_unbuilt, revert_optional_steps
 from .hash import FileHash
-from .hash_queue import HashJob, HashQueue
-from .job import Job, init_joblog
+from .hash_queue import HashBatch, HashQueue
+from .job import Job, append_joblog_record, init_joblog
 from .reporter import ReporterClient
 from .scheduler import Scheduler
 from .sqlite3 import DBSession
@@ -42,13 +42,22 @@ __all__ = ("AnyJob", "Builder")
 logger = logging.getLogger(__name__)
 
 
-AnyJob = Job | HashJob
+AnyJob = Job | HashBatch
 """Any unit of work the builder tracks as an asyncio task.
 
 Only `job_i` is common to both.
 """
 
 
+def _uses_hash_slot(job: AnyJob) -> bool:
+    """Whether a job takes a slot of the hash budget (`Builder.njob_hash`).
+
+    Hash batches and jobs that check whether a step can be skipped only hash files.
+    Only jobs that run the step's command take a slot of the `njob` budget.
+    """
+    return isinstance(job, HashBatch) or not job.runs_command
+
+
 @attrs.define
 class Builder:
     # References to other StepUp components.
@@ -77,6 +86,14 @@ class Builder:
     njob: int = attrs.field(kw_only=True)
     """The maximum number of steps to run concurrently."""
 
+    njob_hash: int | None = attrs.field(kw_only=True, default=None)
+    """The maximum number of hash batches and hash checks to run concurrently.
+
+    These use their own slots, next to the `njob` slots for steps that run their command,
+    so that I/O-bound hashing and CPU-bound commands do not starve each other.
+    When `None`, they share the `njob` slots with the commands.
+    """
+
     live_progress: bool = attrs.field(kw_only=True)
     """Whether the reporter is an interactive terminal that wants live step-count updates."""
 
@@ -103,7 +120,7 @@ class Builder:
     # attrs evaluates defaults in field order and the default below reads that event.
 
     hash_queue: HashQueue = attrs.field(init=False)
-    """The hash-job queue, drained with priority over `scheduler.pop_next_job()`."""
+    """The hash-job queue, drained with priority over `scheduler.pop_next_jobs()`."""
 
     @hash_queue.default
     def _default_hash_queue(self) -> HashQueue:
@@ -121,6 +138,17 @@ class Builder:
     returncode: ReturnCode = attrs.field(init=False, default=ReturnCode.PENDING)
     """Exit code for the director, based on the last build phase."""
 
+    njob_limit: int = attrs.field(init=False)
+    """The current maximum number of steps to run concurrently, at most `njob`.
+
+    This is equal to `njob`, unless it is lowered or raised with `set_njob_limit()`,
+    e.g. by `AdaptiveJobs` in response to the pressure on the CPU, IO and memory.
+    """
+
+    @njob_limit.default
+    def _default_njob_limit(self) -> int:
+        return self.njob
+
     async def run_once(self, stop_event: asyncio.Event) -> bool:
         """Wait for `resume`, then run a single build phase (`job_loop` + `finalize`).
 
@@ -156,8 +184,12 @@ class Builder:
         """Run all runnable jobs until there are none left or the scheduler is draining."""
         await self._report_counts()
         await self.reporter("PHASE", "build")
+        # Files may have changed since the previous build phase.
+        self.workflow.hash_memo.clear()
         if self.executor.write_joblog:
             init_joblog(self.njob)
+            if self.njob_limit != self.njob:
+                append_joblog_record("NJOB", 0, f"concurrent jobs: {self.njob_limit}")
 
         # Drain runnable work (done tasks, hash jobs, step jobs) as asyncio tasks.
         while True:
@@ -172,18 +204,20 @@ class Builder:
             # pending hash jobs are bookkeeping for work already under way
             # and must finish for the phase to end cleanly,
             # which falls out naturally here
-            # since draining is only enforced inside scheduler.pop_next_job().
-            if len(self.running_tasks) < self.njob:
-                hash_job = self.hash_queue.pop_nowait()
-                if hash_job is not None:
-                    self.start_hash_task(hash_job)
+            # since draining is only enforced inside scheduler.pop_next_jobs().
+            free_run, free_hash = self._free_slots()
+            if (free_run if free_hash is None else free_hash) > 0:
+                batch = self.hash_queue.pop_batch_nowait()
+                if batch is not None:
+                    self.start_hash_task(batch)
                     continue
 
-            # Get the next job and start it as a task if there is such a job.
-            if len(self.running_tasks) < self.njob:
-                job = await self.scheduler.pop_next_job()
-                if job is not None:
+            # Fill all free slots with new jobs at once and start them as tasks.
+            if free_run > 0 or (free_hash is not None and free_hash > 0):
+                jobs = await self.scheduler.pop_next_jobs(max(free_run, 0), free_hash)
+                for job in jobs:
                     self.start_task(job)
+                if len(jobs) > 0:
                     continue
 
             # When there is nothing left to do, the builder must stop.
@@ -199,8 +233,42 @@ class Builder:
             await self.wake_job_loop.wait()
             self.wake_job_loop.clear()
 
+    def _free_slots(self) -> tuple[int, int | None]:
+        """Count the free slots for commands and for hash work.
+
+        Returns
+        -------
+        free_run
+            The number of steps that may start running their command,
+            or, when `njob_hash` is `None`, the number of jobs of any kind that may start.
+        free_hash
+            The number of hash batches and hash checks that may start,
+            or `None` when they share the slots of the commands.
+            Both numbers are negative when more is running than the (lowered) limit allows.
+        """
+        if self.njob_hash is None:
+            return self.njob_limit - len(self.running_tasks), None
+        nhash = sum(1 for job in self.running_tasks.values() if _uses_hash_slot(job))
+        return self.njob_limit - len(self.running_tasks) + nhash, self.njob_hash - nhash
+
+    async def set_njob_limit(self, njob_limit: int):
+        """Change the number of steps to run concurrently.
+
+        Running jobs are never interrupted:
+        when the limit is lowered, fewer new jobs are started until the excess has finished.
+        The change is recorded in the `--joblog` and shown in the progress bar.
+        """
+        self.njob_limit = njob_limit
+        if self.executor.write_joblog:
+            append_joblog_record("NJOB", 0, f"concurrent jobs: {njob_limit}")
+        await self.reporter.set_njob(njob_limit)
+        self.wake_job_loop.set()
+
     async def finalize(self):
         """Wrap up the build phase after the builder has executed its jobs."""
+        # Workers of `call()` steps must not outlive the phase:
+        # the next phase may need a modified version of their scripts.
+        await self.executor.close_call_pool()
         await self.reporter("DIRECTOR", f"Ran {self.scheduler.run_counter} job(s).")
         self.returncode = await report_unbuilt(self.workflow, self.scheduler, self.reporter)
         # Reverting optional steps resets their outputs in the database,
@@ -248,7 +316,7 @@ class Builder:
         and it shows the job as running from the moment its task begins,
         including input hash computation, not just once the command itself starts.
 
-        Hash jobs get the same treatment from `Executor.run_hash_job` itself,
+        Hash jobs get the same treatment from `Executor.run_hash_batch` itself,
         since they are also started outside this class (see `gather_hashes`).
         """
         self.reporter.job_started(job.job_i, job.letter, job.label)
@@ -257,19 +325,21 @@ class Builder:
         finally:
             self.reporter.job_stopped(job.job_i)
 
-    def start_hash_task(self, hash_job: HashJob) -> None:
-        """Start an asyncio task that runs `hash_job` on the executor.
+    def start_hash_task(self, batch: HashBatch) -> None:
+        """Start an asyncio task that runs a `batch` of hash jobs on the executor.
 
         Sibling of `start_task`, sharing the `running_tasks`/`done_tasks` bookkeeping with it.
+        A whole batch takes a single slot of the `njob_hash` budget
+        (or of the `njob` budget when `njob_hash` is `None`).
         It differs from `start_task` in only two respects:
 
-        1. A hash job is named after its path instead of after a step
+        1. A hash batch is named after its paths instead of after a step
         2. It is not logged as a step being run.
         """
         task = asyncio.create_task(
-            self.executor.run_hash_job(hash_job), name=f"HASH: {hash_job.path}"
+            self.executor.run_hash_batch(batch), name=f"HASH: {batch.description}"
         )
-        self.running_tasks[task] = hash_job
+        self.running_tasks[task] = batch
         task.add_done_callback(self._task_done)
 
     async def run_promoted_hash_jobs(
@@ -320,10 +390,10 @@ class Builder:
                 msg = f"Exception in task {task.get_name()}"
                 raise RuntimeError(msg) from exc
             # Hash jobs get no Scheduler bookkeeping:
-            # they never went through scheduler.pop_next_job(),
+            # they never went through scheduler.pop_next_jobs(),
             # so job.job_i isn't a key in scheduler.jobs,
             # and there is no Step to record a duration for.
-            if not isinstance(job, HashJob):
+            if not isinstance(job, HashBatch):
                 self.scheduler.record_job_completed(job)
             self.wake_job_loop.set()
 
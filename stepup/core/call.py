@@ -6,11 +6,13 @@ The `driver()` function is the explicit entry point.
 """
 
 import argparse
+import contextlib
 import inspect
 import json
 import os
 import shlex
 import sys
+from collections.abc import Iterator
 from typing import Any, get_type_hints
 
 from path import Path
@@ -19,7 +21,14 @@ from rich.console import Console
 from .api import loadns
 from .cattrs import json_converter
 
-__all__ = ("driver",)
+__all__ = ("capture_driver", "driver", "run_case")
+
+
+_captured: list[tuple[str, dict[str, Any]]] | None = None
+"""When not `None`, `driver()` records its script here instead of dispatching.
+
+See `capture_driver()`.
+"""
 
 
 def driver() -> None:
@@ -38,14 +47,53 @@ def driver() -> None:
     """
     ns = inspect.currentframe().f_back.f_globals
     script_path = ns.get("__file__", sys.argv[0])
-    args = _parse_args(script_path)
+    if _captured is not None:
+        _captured.append((script_path, ns))
+        return
+    run_case(script_path, ns, sys.argv[1:])
+
+
+@contextlib.contextmanager
+def capture_driver() -> Iterator[list[tuple[str, dict[str, Any]]]]:
+    """Make `driver()` record the path and namespace of its script instead of dispatching.
+
+    This is used by a worker that runs the `call()` steps of one script:
+    the script is executed once within this context,
+    after which `run_case()` dispatches every case in the recorded namespace.
+
+    Yields
+    ------
+    captured
+        A list to which `driver()` appends `(script_path, namespace)` pairs.
+    """
+    global _captured  # noqa: PLW0603
+    _captured = []
+    try:
+        yield _captured
+    finally:
+        _captured = None
+
+
+def run_case(script_path: str, ns: dict[str, Any], argv: list[str]) -> None:
+    """Dispatch one invocation of a script that calls `driver()`.
+
+    Parameters
+    ----------
+    script_path
+        The path of the script, used in messages.
+    ns
+        The global namespace of the script.
+    argv
+        The command-line arguments, without the script itself.
+    """
+    args = _parse_args(script_path, argv)
     if args.function is None:
         _print_list(script_path, ns)
     else:
         _dispatch(script_path, ns, args)
 
 
-def _parse_args(script_path: str) -> argparse.Namespace:
+def _parse_args(script_path: str, argv: list[str]) -> argparse.Namespace:
     """Parse command line arguments for `driver()`."""
     parser = argparse.ArgumentParser(
         prog=script_path,
@@ -71,7 +119,7 @@ def _parse_args(script_path: str) -> argparse.Namespace:
         help="Path to a Python, JSON, TOML or YAML file of keyword arguments "
         "(mutually exclusive with positional JSON).",
     )
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     if args.json_inp is not None and args.path_inp is not None:
         parser.error("Cannot use both positional JSON and --inp.")
     return args
@@ -1,7 +1,8 @@
 # SPDX-FileCopyrightText: 2024 Toon Verstraelen <Toon.Verstraelen@UGent.be>
 # SPDX-License-Identifier: LGPL-3.0-or-later
-"""Shared cgroup v2 helpers, used for both memory accounting and CPU core detection."""
+"""Shared cgroup v2 helpers, used for memory accounting, CPU core detection and pressure files."""
 
+import contextlib
 import logging
 import math
 import os
@@ -13,7 +14,13 @@ from path import Path
 
 from .exceptions import CgroupError
 
-__all__ = ("cgroup_scope_prefix", "find_own_memory_cgroup", "get_ncore_from_cgroup")
+__all__ = (
+    "cgroup_scope_prefix",
+    "find_own_memory_cgroup",
+    "find_pressure_files",
+    "get_memory_gib_from_cgroup",
+    "get_ncore_from_cgroup",
+)
 
 
 logger = logging.getLogger(__name__)
@@ -244,3 +251,88 @@ def get_ncore_from_cgroup(cgroup_root: str = "/sys/fs/cgroup") -> int:
             f"is readable in {own_dir}."
         )
     return max(1, math.floor(min(candidates)))
+
+
+def get_memory_gib_from_cgroup(cgroup_root: str = "/sys/fs/cgroup") -> int:
+    """Determine the memory limit of this process, in whole GiB, from cgroup v2 accounting.
+
+    Reads `memory.max`, e.g. the memory allocated to a Slurm or PBS job.
+    Like `get_ncore_from_cgroup()`, this does not require exclusive use of the cgroup.
+
+    Parameters
+    ----------
+    cgroup_root
+        The cgroup v2 mount point.
+        Overridable so tests can point this at a fake tree instead of the real `/sys/fs/cgroup`.
+
+    Returns
+    -------
+    memory_gib
+        The memory limit of the cgroup, floored to an integer number of GiB with a minimum of 1.
+
+    Raises
+    ------
+    CgroupError
+        If cgroups are unavailable, if `memory.max` cannot be read or if it has no limit.
+    """
+    own_dir = _own_cgroup_dir(cgroup_root)
+    try:
+        with open(own_dir / "memory.max") as fh:
+            text = fh.read().strip()
+    except OSError as exc:
+        raise CgroupError(f"Cgroups unavailable: failed to read memory.max in {own_dir}.") from exc
+    if text == "max":
+        raise CgroupError(f"Cgroups unavailable: no memory limit in {own_dir}.")
+    try:
+        limit = int(text)
+    except ValueError as exc:
+        raise CgroupError(f"Cgroups unavailable: invalid memory.max in {own_dir}.") from exc
+    return max(1, limit // 1024**3)
+
+
+PRESSURE_RESOURCES = ("cpu", "io", "memory")
+"""The resources for which the kernel reports pressure stall information (PSI)."""
+
+
+def find_pressure_files(
+    cgroup_root: str = "/sys/fs/cgroup", proc_root: str = "/proc/pressure"
+) -> dict[str, Path]:
+    """Locate the pressure stall information (PSI) files of the CPU, IO and memory.
+
+    The files of this process's own cgroup (`cpu.pressure`, `io.pressure`, `memory.pressure`)
+    are preferred, because they only count stalls of the processes in that cgroup,
+    e.g. the processes of a Slurm or PBS job.
+    The system-wide files in `/proc/pressure` are used as a fallback.
+    Like `get_ncore_from_cgroup()`, this does not require exclusive use of the cgroup.
+
+    Parameters
+    ----------
+    cgroup_root
+        The cgroup v2 mount point.
+        Overridable so tests can point this at a fake tree instead of the real `/sys/fs/cgroup`.
+    proc_root
+        The directory with the system-wide pressure files.
+        Overridable for the same reason.
+
+    Returns
+    -------
+    paths
+        The pressure file of each resource in `PRESSURE_RESOURCES`, keyed by resource name.
+
+    Raises
+    ------
+    CgroupError
+        If no complete set of readable pressure files is found,
+        e.g. when not running on Linux or when the kernel was built without PSI support.
+    """
+    candidates = []
+    with contextlib.suppress(CgroupError):
+        own_dir = _own_cgroup_dir(cgroup_root)
+        candidates.append({name: own_dir / f"{name}.pressure" for name in PRESSURE_RESOURCES})
+    if sys.platform == "linux":
+        candidates.append({name: Path(proc_root) / name for name in PRESSURE_RESOURCES})
+    for paths in candidates:
+        if all(os.access(path, os.R_OK) for path in paths.values()):
+            logger.info("Pressure stall information found in %s.", paths["cpu"].parent)
+            return paths
+    raise CgroupError("Pressure stall information unavailable.")
@@ -280,7 +280,7 @@ def search_consuming_paths(
         if detached_only:
             select_outputs += " AND detached"
         return [
-            (Path(row[0]), FileState(row[1]), bool(row[2]), FileHash.from_json(row[3]))
+            (Path(row[0]), FileState(row[1]), bool(row[2]), FileHash.from_blob(row[3]))
             for row in con.execute(RECURSE_SINKS_MULTI + select_outputs)
         ]
     finally:
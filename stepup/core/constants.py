@@ -19,6 +19,7 @@ __all__ = (
     "PERF_DATA",
     "PLAN_PY",
     "RENDER_JINJA_MODES",
+    "SPOOL_DIR",
     "SQLLOG_CSV",
     "SQLLOG_JSON",
     "STEPUP_DIR",
@@ -45,6 +46,8 @@ SUCCESS_LOG = STEPUP_DIR / "success.log"
 SQLLOG_JSON = STEPUP_DIR / "sqllog.json"
 SQLLOG_CSV = STEPUP_DIR / "sqllog.csv"
 JOBLOG_CSV = STEPUP_DIR / "joblog.csv"
+# The directory of the (anonymous) files receiving the output of running steps.
+SPOOL_DIR = STEPUP_DIR / "spool"
 
 # The planning script that StepUp executes first to define the workflow.
 PLAN_PY = Path("plan.py")
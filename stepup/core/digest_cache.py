@@ -0,0 +1,198 @@
+# SPDX-FileCopyrightText: 2024 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""A persistent cache of file digests, shared by all workflows of a user.
+
+The digest of a file is looked up by a fingerprint of its `os.stat_result`:
+device, inode, size, modification time and change time, all in nanoseconds where applicable.
+A file whose fingerprint is unchanged is assumed to have unchanged content,
+the same assumption that `FileHash.refreshed` makes within a single workflow.
+The cache extends this assumption beyond the lifetime of `.stepup/graph.db`,
+so a fresh database does not have to read every file again.
+
+The cache is an SQLite file under `$XDG_CACHE_HOME/stepup` (or `~/.cache/stepup`).
+Its size is bounded by evicting the least recently used entries when it is closed.
+Errors in the cache are never fatal: a failing lookup is a miss and a failing store is skipped.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Self
+
+import attrs
+from path import Path
+
+from .sqlite3 import connect
+
+__all__ = (
+    "DIGEST_CACHE_MAX_ENTRIES",
+    "DigestCache",
+    "default_digest_cache_path",
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+# About 100 bytes per entry, so the cache file stays around 100 MiB.
+DIGEST_CACHE_MAX_ENTRIES = 1 << 20
+
+# Entries are marked as used at most once per this period, to avoid a write for every hit.
+DIGEST_CACHE_TOUCH_NS = 3600_000_000_000
+
+DIGEST_CACHE_SCHEMA_VERSION = 1
+
+DIGEST_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS digest (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ctime_ns INTEGER NOT NULL,
+    algorithm TEXT NOT NULL,
+    digest BLOB NOT NULL,
+    used INTEGER NOT NULL,
+    PRIMARY KEY (dev, ino, size, mtime_ns, ctime_ns, algorithm)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS digest_used ON digest(used);
+"""
+
+
+def default_digest_cache_path() -> Path:
+    """Return the location of the digest cache, following the XDG base directory convention."""
+    cache_home = os.environ.get("XDG_CACHE_HOME", "")
+    if cache_home == "":
+        cache_home = Path("~/.cache").expanduser()
+    return Path(cache_home) / "stepup" / "digests.db"
+
+
+def _signed64(value: int) -> int:
+    """Map an unsigned 64-bit integer (e.g. an inode number) onto SQLite's signed range."""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _fingerprint(st: os.stat_result, algorithm: str) -> tuple[int, int, int, int, int, str]:
+    """The primary key of the cache entry for a file with properties `st`."""
+    return (
+        _signed64(st.st_dev),
+        _signed64(st.st_ino),
+        st.st_size,
+        st.st_mtime_ns,
+        st.st_ctime_ns,
+        algorithm,
+    )
+
+
+@attrs.define(eq=False)
+class DigestCache:
+    """A persistent mapping from file fingerprints to digests.
+
+    Instances are shared by the threads of the hash pool.
+    A lock serializes access to the single connection,
+    which is cheap compared to the digest computations that the cache replaces.
+    Other processes (e.g. directors of other workspaces) may use the same file concurrently,
+    which SQLite handles with its own locking.
+    """
+
+    con: sqlite3.Connection | None = attrs.field()
+    """The connection to the cache database, or `None` once closed."""
+
+    max_entries: int = attrs.field(default=DIGEST_CACHE_MAX_ENTRIES, kw_only=True)
+    """The number of entries kept by `evict`."""
+
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+
+    @classmethod
+    def open(cls, path: str, **kwargs) -> Self:
+        """Open (or create) the cache database at `path`.
+
+        A database created with another schema version is emptied first.
+        The keyword arguments are passed on to the constructor.
+
+        Raises
+        ------
+        OSError
+            When the parent directory cannot be created.
+        sqlite3.Error
+            When the database cannot be opened.
+        """
+        path = Path(path)
+        path.parent.makedirs_p()
+        con = connect(path, check_same_thread=False, timeout=5)
+        try:
+            version = con.execute("PRAGMA user_version").fetchone()[0]
+            if version != DIGEST_CACHE_SCHEMA_VERSION:
+                con.execute("DROP TABLE IF EXISTS digest")
+                con.executescript(DIGEST_CACHE_SCHEMA)
+                con.execute(f"PRAGMA user_version = {DIGEST_CACHE_SCHEMA_VERSION:d}")
+        except sqlite3.Error:
+            con.close()
+            raise
+        return cls(con, **kwargs)
+
+    def lookup(self, st: os.stat_result, algorithm: str) -> bytes | None:
+        """Return the cached digest of a file with properties `st`, or `None` if not cached."""
+        key = _fingerprint(st, algorithm)
+        now = time.time_ns()
+        with self._lock:
+            if self.con is None:
+                return None
+            try:
+                row = self.con.execute(
+                    "SELECT digest, used FROM digest WHERE dev = ? AND ino = ? AND size = ? "
+                    "AND mtime_ns = ? AND ctime_ns = ? AND algorithm = ?",
+                    key,
+                ).fetchone()
+                if row is None:
+                    return None
+                if now - row[1] > DIGEST_CACHE_TOUCH_NS:
+                    self.con.execute(
+                        "UPDATE digest SET used = ? WHERE dev = ? AND ino = ? AND size = ? "
+                        "AND mtime_ns = ? AND ctime_ns = ? AND algorithm = ?",
+                        (now, *key),
+                    )
+            except sqlite3.Error:
+                logger.warning("Digest cache lookup failed.", exc_info=True)
+                return None
+        return row[0]
+
+    def store(self, st: os.stat_result, algorithm: str, digest: bytes):
+        """Record the digest of a file with properties `st`.
+
+        The caller must not store racy digests, see `FileHash.racy`.
+        """
+        now = time.time_ns()
+        with self._lock:
+            if self.con is None:
+                return
+            try:
+                self.con.execute(
+                    "INSERT OR REPLACE INTO digest VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (*_fingerprint(st, algorithm), digest, now),
+                )
+            except sqlite3.Error:
+                logger.warning("Digest cache store failed.", exc_info=True)
+
+    def evict(self):
+        """Remove the least recently used entries in excess of `max_entries`."""
+        with self._lock:
+            if self.con is None:
+                return
+            try:
+                self.con.execute(
+                    "DELETE FROM digest WHERE used <= "
+                    "(SELECT used FROM digest ORDER BY used DESC LIMIT 1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            except sqlite3.Error:
+                logger.warning("Digest cache eviction failed.", exc_info=True)
+
+    def close(self):
+        """Evict old entries and close the connection. Later calls of other methods are no-ops."""
+        self.evict()
+        with self._lock:
+            if self.con is not None:
+                self.con.close()
+                self.con = None
@@ -9,6 +9,8 @@ import logging
 import multiprocessing
 import os
 import signal
+import sqlite3
+import subprocess
 import sys
 import time
 import traceback
@@ -27,7 +29,7 @@ except ImportError:
 
 from .asyncio import wait_for_any_event
 from .builder import Builder
-from .cgroups import get_ncore_from_cgroup
+from .cgroups import get_memory_gib_from_cgroup, get_ncore_from_cgroup
 from .constants import (
     DIRECTOR_LOG_PID_PREFIX,
     DIRECTOR_LOG_SOCKET_PREFIX,
@@ -36,22 +38,29 @@ from .constants import (
     GRAPH_DB,
     JOBLOG_CSV,
     PLAN_PY,
+    SPOOL_DIR,
     SQLLOG_CSV,
     SQLLOG_JSON,
 )
+from .digest_cache import DigestCache, default_digest_cache_path
 from .enums import FileState, HashUpdateCause, Need, ReturnCode, StepState
 from .exceptions import CgroupError, GraphError
 from .executor import Executor
 from .file import File
-from .hash import FileHash
+from .hash import DEFAULT_DIGEST_ALGORITHM, DIGEST_ALGORITHM_CHOICES, FileHash
 from .nglob import NamedGlob
+from .preload import parse_preload_modules, probe_preload_modules
+from .pressure import AdaptiveJobs
 from .reporter import ReporterClient
 from .rpc import SocketRPCServer, allow_rpc
+from .run import CallWorkerPool
 from .scheduler import Scheduler
+from .spawner import Spawner
 from .sqlite3 import DBSession, SQLLog
 from .startup import resume_from_db
 from .stepinfo import StepInfo
-from .tool import positive_int
+from .storage import default_hash_jobs, detect_storage_kind
+from .tool import nonnegative_int, positive_int
 from .usage import CgroupMemorySampler, finalize_resource_usage
 from .watcher import WATCHER_AVAILABLE, Watcher
 from .workflow import Workflow
@@ -90,6 +99,20 @@ class ServeConfig:
     njob: int = attrs.field(default=1)
     """The maximum number of steps to run concurrently."""
 
+    hash_threads: int = attrs.field(default=4)
+    """The number of threads computing file hashes, independent of `njob`."""
+
+    njob_hash: int | None = attrs.field(default=None)
+    """The maximum number of hash batches and hash checks to run concurrently, next to `njob`.
+    When `None`, they share the `njob` slots with the steps that run their command."""
+
+    adaptive_jobs: bool = attrs.field(default=False)
+    """Whether to adapt the number of concurrent steps to the pressure stall information.
+    The number then varies between `njob_min` and `njob`."""
+
+    njob_min: int = attrs.field(default=1)
+    """The lowest number of concurrent steps when `adaptive_jobs` is set."""
+
     # Boolean flags below follow the `do_` prefix only where it disambiguates a flag
     # from a same-named noun elsewhere in the codebase (`do_clean`, `do_watch`);
     # otherwise a verb or adjective form is used.
@@ -140,6 +163,20 @@ class ServeConfig:
     before it is failed instead of parked pending again.
     A livelock guard."""
 
+    digest_algorithm: str = attrs.field(default=DEFAULT_DIGEST_ALGORITHM)
+    """The algorithm of new file digests, one of `hash.DIGEST_ALGORITHM_CHOICES`."""
+
+    digest_cache: Path | None = attrs.field(default=None)
+    """The location of the persistent digest cache, or `None` to hash without it."""
+
+    use_ready_heap: bool = attrs.field(default=False)
+    """Whether to select steps from an in-memory heap instead of walking the dispatch index."""
+
+    call_workers: bool = attrs.field(default=False)
+    """Whether to run the `call()` steps of a Python script in warm forkserver children
+    that load the script only once.
+    Only has effect when a forkserver is used."""
+
     targets: list[Path] = attrs.field(factory=list)
     """Restrict the build to steps needed to produce these output files.
     An empty list builds the full default workflow."""
@@ -151,6 +188,16 @@ class ServeConfig:
     def __attrs_post_init__(self) -> None:
         if self.njob < 1:
             raise ValueError(f"Number of parallel tasks must be strictly positive, got {self.njob}")
+        if self.njob_min < 1:
+            raise ValueError(
+                f"Minimum number of parallel tasks must be strictly positive, got {self.njob_min}"
+            )
+        if self.njob_hash is not None and self.njob_hash < 1:
+            raise ValueError(f"Number of hash jobs must be strictly positive, got {self.njob_hash}")
+        if self.hash_threads < 1:
+            raise ValueError(
+                f"Number of hash threads must be strictly positive, got {self.hash_threads}"
+            )
         if self.watch_first and not self.do_watch:
             raise ValueError("watch_first cannot be set without do_watch.")
 
@@ -159,6 +206,10 @@ class ServeConfig:
         """Build the configuration from parsed command-line arguments."""
         return cls(
             njob=njob,
+            hash_threads=_default_hash_threads(),
+            njob_hash=_interpret_hash_jobs(args.hash_jobs),
+            adaptive_jobs=args.adaptive_jobs,
+            njob_min=args.min_jobs,
             use_cgroup=args.cgroup,
             do_clean=args.clean,
             use_duration=args.duration,
@@ -171,6 +222,10 @@ class ServeConfig:
             watch_first=args.watch_first,
             available_resources=args.resources,
             defer_cap=args.defer_cap,
+            digest_algorithm=args.digest_algorithm,
+            digest_cache=default_digest_cache_path() if args.digest_cache else None,
+            use_ready_heap=args.ready_heap,
+            call_workers=args.call_workers,
             targets=args.targets,
             target_dirs=args.target_dirs,
         )
@@ -178,21 +233,23 @@ class ServeConfig:
 
 def main():
     args = parse_args()
-    mp_ctx = None
-    if args.forkserver:
-        mp_ctx = multiprocessing.get_context("forkserver")
-        preload = ["stepup.core.executor"]
-        if args.preload_modules:
-            preload.extend(m.strip() for m in args.preload_modules.split(",") if m.strip())
-        mp_ctx.set_forkserver_preload(preload)
+    # The modules to pre-load are set in `async_main`, where problems can be reported.
+    # This is early enough, because the forkserver only starts when the first step is forked.
+    mp_ctx = multiprocessing.get_context("forkserver") if args.forkserver else None
     with contextlib.ExitStack() as stack:
+        # The spawn helper is started before the database is opened,
+        # while the director process is still small.
+        spawner = None
+        if args.spawn_helper:
+            spawner = Spawner.start()
+            stack.callback(spawner.close)
         sqllog = (
             stack.enter_context(SQLLog(path_queries=SQLLOG_JSON, path_timings=SQLLOG_CSV))
             if args.sqllog
             else None
         )
         db = stack.enter_context(DBSession.open(GRAPH_DB, sqllog=sqllog))
-        returncode = asyncio.run(async_main(args, db, mp_ctx))
+        returncode = asyncio.run(async_main(args, db, mp_ctx, spawner))
     sys.exit(returncode)
 
 
@@ -206,6 +263,13 @@ def parse_args() -> argparse.Namespace:
         type=Path,
         help="The socket at which StepUp will listen for instructions.",
     )
+    parser.add_argument(
+        "--adaptive-jobs",
+        default=False,
+        action=argparse.BooleanOptionalAction,
+        help="Adapt the number of jobs running in parallel to the pressure on CPU, IO and memory, "
+        "between --min-jobs and --jobs.",
+    )
     parser.add_argument(
         "--cgroup",
         default=False,
@@ -252,6 +316,20 @@ def parse_args() -> argparse.Namespace:
         "When given as a real number with digits after the decimal point, "
         "it is multiplied with the number of available cores. [default=%(default)s]",
     )
+    parser.add_argument(
+        "--min-jobs",
+        type=positive_int,
+        default=1,
+        help="Lowest number of jobs running in parallel with --adaptive-jobs. "
+        "[default=%(default)s]",
+    )
+    parser.add_argument(
+        "--hash-jobs",
+        type=nonnegative_int,
+        default=None,
+        help="Number of hash jobs running in parallel, next to the --jobs steps running commands. "
+        "Zero shares the slots of --jobs. [default: derived from the storage type]",
+    )
     parser.add_argument(
         "--joblog",
         default=False,
@@ -280,6 +358,20 @@ def parse_args() -> argparse.Namespace:
         help="Comma-separated list of Python modules to pre-load into the forkserver. "
         "Only has effect when --forkserver is active.",
     )
+    parser.add_argument(
+        "--spawn-helper",
+        default=False,
+        action=argparse.BooleanOptionalAction,
+        help="Start the subprocesses of steps from a small helper process "
+        "instead of the director. [default=%(default)s]",
+    )
+    parser.add_argument(
+        "--call-workers",
+        default=False,
+        action=argparse.BooleanOptionalAction,
+        help="Run call() steps of the same Python script in warm forkserver children "
+        "that load the script only once. Only has effect when --forkserver is active.",
+    )
     parser.add_argument(
         "--live-progress",
         default=False,
@@ -301,6 +393,24 @@ def parse_args() -> argparse.Namespace:
         help="Maximum number of consecutive defers (since the last success) before "
         "a step is failed instead of parked. A livelock guard. [default=%(default)s]",
     )
+    parser.add_argument(
+        "--digest-algorithm",
+        default=DEFAULT_DIGEST_ALGORITHM,
+        choices=DIGEST_ALGORITHM_CHOICES,
+        help="The hash algorithm for file contents. [default=%(default)s]",
+    )
+    parser.add_argument(
+        "--digest-cache",
+        default=False,
+        action=argparse.BooleanOptionalAction,
+        help="Look up file digests in a persistent cache shared by all workflows of the user.",
+    )
+    parser.add_argument(
+        "--ready-heap",
+        default=False,
+        action=argparse.BooleanOptionalAction,
+        help="Select the next step to run from an in-memory priority queue.",
+    )
     parser.add_argument(
         "--resources",
         default=None,
@@ -368,6 +478,7 @@ async def async_main(
     args: argparse.Namespace,
     db: DBSession,
     mp_ctx: multiprocessing.context.BaseContext | None = None,
+    spawner: Spawner | None = None,
 ) -> int:
     """Set up logging and the reporter, then run `serve()` and report its outcome.
 
@@ -401,6 +512,8 @@ async def async_main(
         await reporter.set_njob(njob)
         version = get_version("stepup")
         await reporter("DIRECTOR", f"Listening on {args.director_socket} (StepUp Core {version})")
+        if mp_ctx is not None:
+            await _set_forkserver_preload(mp_ctx, args.preload_modules, reporter)
         serve_result = None
         try:
             serve_result = await serve(
@@ -409,6 +522,7 @@ async def async_main(
                 reporter=reporter,
                 db=db,
                 mp_ctx=mp_ctx,
+                spawner=spawner,
             )
         except Exception as exc:
             tbstr = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))
@@ -457,6 +571,79 @@ def _get_ncore() -> int:
     return os.cpu_count() or 1
 
 
+def _default_hash_threads() -> int:
+    """The default number of hash threads, derived from the number of available cores.
+
+    This follows the default size of `concurrent.futures.ThreadPoolExecutor`:
+    hashing small files mostly waits for `open` and `stat` calls,
+    so a few more threads than cores keep the cores busy.
+    """
+    return min(32, _get_ncore() + 4)
+
+
+def _interpret_hash_jobs(hash_jobs: int | None) -> int | None:
+    """Convert the `hash_jobs` command-line argument into `ServeConfig.njob_hash`.
+
+    When not given, the number is derived from the type of storage of the working directory.
+    Zero means that hash jobs share the slots of `--jobs`, for which `None` is returned.
+    """
+    if hash_jobs is None:
+        return default_hash_jobs(detect_storage_kind(os.getcwd()), _get_ncore())
+    return None if hash_jobs == 0 else hash_jobs
+
+
+def _get_memory_gib() -> int | None:
+    """Determine the memory available to this process, in whole GiB, or `None` if unknown.
+
+    Like `_get_ncore()`, the cgroup v2 limit (`memory.max`) is tried first,
+    because a batch scheduler may allocate less memory than is physically present on the node.
+    """
+    try:
+        return get_memory_gib_from_cgroup()
+    except CgroupError:
+        pass
+    try:
+        return max(1, os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // 1024**3)
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+async def _set_forkserver_preload(
+    mp_ctx: multiprocessing.context.BaseContext,
+    preload_modules: str | None,
+    reporter: ReporterClient,
+):
+    """Set the modules that the forkserver imports before forking Python steps.
+
+    The modules given by the user are first imported in a separate interpreter,
+    see `probe_preload_modules()`.
+    Modules that fail to import, start threads or open sockets are not pre-loaded,
+    and the import times of the others are reported.
+    """
+    preload = ["stepup.core.executor"]
+    modules = parse_preload_modules(preload_modules)
+    if len(modules) > 0:
+        try:
+            reports = await asyncio.to_thread(probe_preload_modules, modules)
+        except subprocess.CalledProcessError as exc:
+            await reporter(
+                "WARNING",
+                f"Not pre-loading any modules: the import check crashed "
+                f"(exit code {exc.returncode}).",
+            )
+            reports = []
+        for report in reports:
+            if report.problem is None:
+                await reporter(
+                    "DIRECTOR",
+                    f"Pre-loading {report.module} ({report.import_time:.2f} s import time)",
+                )
+                preload.append(report.module)
+            else:
+                await reporter("WARNING", f"Not pre-loading {report.module}: {report.problem}")
+    mp_ctx.set_forkserver_preload(preload)
+
+
 def interpret_jobs(jobs: Decimal) -> int:
     """Convert the `jobs` command-line argument into an integer."""
     ncore = _get_ncore() if jobs.as_tuple().exponent < 0 else 1
@@ -470,6 +657,7 @@ async def serve(
     reporter: ReporterClient,
     db: DBSession,
     mp_ctx: multiprocessing.context.BaseContext | None = None,
+    spawner: Spawner | None = None,
     handle_signals: bool = True,
 ) -> ServeResult:
     """Run the director: wire up the workflow components and drive the build to completion.
@@ -487,6 +675,9 @@ async def serve(
     mp_ctx
         A `multiprocessing` forkserver context for Python step execution,
         or `None` to use plain subprocesses.
+    spawner
+        The spawn helper creating the subprocesses of steps,
+        or `None` to create them in the director process.
     handle_signals
         Whether to install handlers for `SIGINT` and `SIGTERM` that abort the build.
         See `DirectorHandler.interrupt`.
@@ -519,12 +710,19 @@ async def serve(
         infra_env["SOURCE_DATE_EPOCH"] = "315532800"
 
     memory_sampler = CgroupMemorySampler() if config.use_cgroup else None
+    adaptive_jobs = None
+    if config.adaptive_jobs:
+        try:
+            adaptive_jobs = AdaptiveJobs(min(config.njob_min, config.njob), config.njob)
+        except CgroupError as exc:
+            await reporter("WARNING", f"Adaptive number of jobs disabled: {exc}")
     handler = await _wire_director(
         db=db,
         reporter=reporter,
         config=config,
         infra_env=infra_env,
         mp_ctx=mp_ctx,
+        spawner=spawner,
     )
 
     # Define the initial plan.py as a static file and create a step for it.
@@ -550,6 +748,7 @@ async def serve(
     await _run_tasks(
         handler,
         memory_sampler,
+        adaptive_jobs,
         director_socket_path=director_socket_path,
         watch_first=config.watch_first,
         handle_signals=handle_signals,
@@ -575,6 +774,7 @@ async def _wire_director(
     config: ServeConfig,
     infra_env: dict[str, str],
     mp_ctx: multiprocessing.context.BaseContext | None,
+    spawner: Spawner | None = None,
 ) -> "DirectorHandler":
     """Construct and wire the long-lived objects that make up a running director.
 
@@ -593,11 +793,23 @@ async def _wire_director(
     )
     await workflow.initialize()
     scheduler = Scheduler(
-        workflow, db=db, use_duration=config.use_duration, write_joblog=config.write_joblog
+        workflow,
+        db=db,
+        use_duration=config.use_duration,
+        write_joblog=config.write_joblog,
+        use_ready_heap=config.use_ready_heap,
+        default_memory_budget=_get_memory_gib(),
     )
     if config.available_resources is not None:
         await reporter("DIRECTOR", f"Setting available resources: {config.available_resources}")
     await scheduler.initialize(config.available_resources)
+    digest_cache = None
+    if config.digest_cache is not None:
+        try:
+            digest_cache = DigestCache.open(config.digest_cache)
+        except (OSError, sqlite3.Error) as exc:
+            await reporter("WARNING", f"Digest cache disabled: {exc}")
+    SPOOL_DIR.makedirs_p()
     executor = Executor(
         scheduler=scheduler,
         workflow=workflow,
@@ -609,12 +821,19 @@ async def _wire_director(
         live_progress=config.live_progress,
         write_joblog=config.write_joblog,
         infra_env=infra_env,
+        digest_algorithm=config.digest_algorithm,
+        digest_cache=digest_cache,
+        spool_dir=str(SPOOL_DIR.absolute()),
+        call_pool=CallWorkerPool(mp_ctx) if config.call_workers and mp_ctx is not None else None,
+        spawner=spawner,
+        hash_threads=config.hash_threads,
     )
     # Builder is agnostic of watch mode;
     # it is built first because the watcher needs builder.hash_queue,
     # which shares the wake event that a hash-job submission uses to nudge a parked job_loop.
     builder = Builder(
         njob=config.njob,
+        njob_hash=config.njob_hash,
         scheduler=scheduler,
         workflow=workflow,
         db=db,
@@ -631,7 +850,7 @@ async def _wire_director(
             dir_queue=dir_queue,
             executor=executor,
             hash_queue=builder.hash_queue,
-            njob=config.njob,
+            njob=config.njob if config.njob_hash is None else config.njob_hash,
         )
         if config.do_watch
         else None
@@ -651,6 +870,7 @@ async def _wire_director(
 async def _run_tasks(
     handler: "DirectorHandler",
     memory_sampler: CgroupMemorySampler | None,
+    adaptive_jobs: AdaptiveJobs | None,
     *,
     director_socket_path: Path,
     watch_first: bool,
@@ -667,6 +887,8 @@ async def _run_tasks(
     ]
     if memory_sampler is not None:
         coroutines.append(memory_sampler.loop(handler.stop_event))
+    if adaptive_jobs is not None:
+        coroutines.append(adaptive_jobs.loop(handler.builder.set_njob_limit, handler.stop_event))
     if handler.watcher is not None:
         coroutines.append(handler.watcher.loop(handler.stop_event))
         if watch_first:
@@ -689,6 +911,9 @@ async def _run_tasks(
         # The signal handlers stay installed for its duration:
         # a step ignoring the first interrupt is killed by a second one during `builder.stop()`.
         await handler.builder.stop()
+        # All hash computations have finished or were cancelled by `builder.stop()`.
+        handler.executor.close_hash_pool()
+        await handler.executor.close_call_pool()
         exit_event.set()
         await rpc_server
         director_socket_path.remove_p()
@@ -879,6 +1104,7 @@ class DirectorHandler:
         shell: bool = False,
         env_overrides: dict[str, str] | None = None,
         duration: float | None = None,
+        priority: int = 0,
     ) -> None:
         """Create a step in the workflow.
 
@@ -901,6 +1127,7 @@ class DirectorHandler:
                 shell=shell,
                 env_overrides=env_overrides,
                 duration=duration,
+                priority=priority,
             )
         self._submit_to_check(to_check)
         # The new step may already be runnable, so wake up the scheduler to check for it.
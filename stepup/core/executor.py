@@ -4,7 +4,7 @@
 
 The `Executor` runs each step directly inside the director's event loop as an asyncio task.
 Launching the step's command (subprocess or forkserver child, see `stepup.core.run`)
-and hashing its inputs/outputs (in a dedicated thread, see `stepup.core.hash`)
+and hashing its inputs/outputs (in a bounded thread pool, see `stepup.core.hash`)
 are delegated to their own modules;
 the `Executor` ties the results into the step lifecycle.
 
@@ -13,6 +13,7 @@ Per-step mutable state lives in a `Run` created for each job.
 """
 
 import asyncio
+import concurrent.futures
 import functools
 import multiprocessing
 import os
@@ -25,22 +26,26 @@ from typing import Any
 import attrs
 from path import Path
 
+from .digest_cache import DigestCache
 from .enums import FileState, HashUpdateCause, StepState
 from .exceptions import HashCancelledError
 from .file import File
 from .hash import (
+    DEFAULT_DIGEST_ALGORITHM,
     FileHash,
     StepHash,
     compare_step_hashes,
     compute_both_hashes,
     compute_inp_hashes,
     compute_out_hashes,
+    refresh_file_hashes,
 )
-from .hash_queue import HashJob
+from .hash_queue import HashBatch, HashJob
 from .outcome import ChildOutcome, ResourceUsage
 from .reporter import PROGRESS_REFRESH_DELAY, ReporterClient
-from .run import Run, ThreadWorker, launch_command
+from .run import CallWorkerPool, Run, ThreadWorker, launch_command
 from .scheduler import Scheduler
+from .spawner import Spawner
 from .sqlite3 import DBSession
 from .step import Step
 from .utils import format_subprocess
@@ -77,7 +82,8 @@ class Executor:
 
     - `validate_dynamic_job`, `try_skip_job` and `execute_job` are the coroutines
       created for each job.
-    - `run_hash_job` is the coroutine created for each hash job.
+    - `run_hash_batch` is the coroutine created for each batch of hash jobs,
+      and `run_hash_job` its variant for a single job.
     - `defer` marks a running job as deferred for later execution.
     - `interrupt` signals every currently running job.
     - `suspend` and `resume` stop and continue the running step commands.
@@ -123,13 +129,40 @@ class Executor:
     infra_env: dict = attrs.field(kw_only=True)
     """Environment variables from the director for step child processes, overriding `os.environ`."""
 
+    digest_algorithm: str = attrs.field(kw_only=True, default=DEFAULT_DIGEST_ALGORITHM)
+    """The algorithm of new file digests, one of `hash.DIGEST_ALGORITHM_CHOICES`."""
+
+    digest_cache: DigestCache | None = attrs.field(kw_only=True, default=None)
+    """The persistent digest cache consulted by hash jobs, if enabled."""
+
+    spool_dir: str | None = attrs.field(kw_only=True, default=None)
+    """The directory of the spool files receiving the output of running steps.
+
+    The default `None` uses the default temporary directory.
+    """
+
+    call_pool: CallWorkerPool | None = attrs.field(kw_only=True, default=None)
+    """Warm workers for the `call()` steps of Python scripts, or `None` to disable them."""
+
+    spawner: Spawner | None = attrs.field(kw_only=True, default=None)
+    """The spawn helper creating the subprocesses of steps, or `None` to create them directly."""
+
+    hash_threads: int = attrs.field(kw_only=True, default=4)
+    """The number of threads in `hash_pool`.
+
+    This is independent of the number of concurrent jobs:
+    hashing is limited by storage and memory bandwidth, not by the number of steps.
+    """
+
     # Internal state
 
-    running: NoOverwriteDict[int, Run | HashJob] = attrs.field(init=False, factory=NoOverwriteDict)
-    """The `Run`/`HashJob` instances currently in flight, keyed by `job_i`.
+    running: NoOverwriteDict[int, Run | HashBatch] = attrs.field(
+        init=False, factory=NoOverwriteDict
+    )
+    """The `Run`/`HashBatch` instances currently in flight, keyed by `job_i`.
 
     `interrupt`, `suspend` and `resume` only read `.worker` from the values here,
-    so a `HashJob` (which has no `.step`) can share this dict with `Run` without issue.
+    so a `HashBatch` (which has no `.step`) can share this dict with `Run` without issue.
     `defer` does read step-specific attributes, but only ever gets the `job_i` of a step.
     """
 
@@ -139,6 +172,9 @@ class Executor:
     _base_env_cache: dict | None = attrs.field(init=False, default=None)
     """Cache for `base_env`, populated lazily on first access."""
 
+    _hash_pool: concurrent.futures.ThreadPoolExecutor | None = attrs.field(init=False, default=None)
+    """The thread pool behind `hash_pool`, created lazily on first access."""
+
     _counts_flush_handle: asyncio.TimerHandle | None = attrs.field(init=False, default=None)
     """Handle for the scheduled step-counts flush, or `None` when none is pending.
 
@@ -174,6 +210,39 @@ class Executor:
             self._base_env_cache = {**os.environ, **self.infra_env}
         return self._base_env_cache
 
+    @property
+    def hash_pool(self) -> concurrent.futures.ThreadPoolExecutor:
+        """The thread pool in which all file hashes are computed, with `hash_threads` threads.
+
+        A pool bounds the number of hashing threads, however many jobs are running,
+        and avoids starting a new thread for every hash computation.
+        """
+        if self._hash_pool is None:
+            self._hash_pool = concurrent.futures.ThreadPoolExecutor(
+                self.hash_threads, thread_name_prefix="stepup-hash"
+            )
+        return self._hash_pool
+
+    def close_hash_pool(self) -> None:
+        """Shut down the hash thread pool, after the last hash computation has finished.
+
+        The pool is created again if more hashes are computed after this call,
+        but the digest cache, which is closed as well, is no longer used.
+        """
+        if self._hash_pool is not None:
+            self._hash_pool.shutdown()
+            self._hash_pool = None
+        if self.digest_cache is not None:
+            self.digest_cache.close()
+
+    async def close_call_pool(self) -> None:
+        """Stop the idle workers of `call_pool`, if any.
+
+        New workers are started when more `call()` steps are executed after this call.
+        """
+        if self.call_pool is not None:
+            await self.call_pool.close()
+
     #
     # External control entry points
     #
@@ -540,14 +609,14 @@ class Executor:
     #
 
     async def _run_work_thread(self, run: Run, work: Callable[[threading.Event], Any]) -> Any:
-        """Run a GIL-releasing computation in a thread.
+        """Run a GIL-releasing computation in a thread of the hash pool.
 
         Returns `None` if the computation was cancelled by an interrupted shutdown
         (see `Executor.interrupt`) or failed outright,
         in which case `run` has already been marked failed.
         """
         with self._track_running(run):
-            worker = ThreadWorker(work=work, job_i=run.job_i)
+            worker = ThreadWorker(work=work, job_i=run.job_i, pool=self.hash_pool)
             run.worker = worker
             try:
                 return await worker.run_in_thread()
@@ -563,12 +632,20 @@ class Executor:
                 # (e.g. `HashFailedError` when a step's output turned out to be a directory,
                 # or a `PermissionError` from `stat()`).
                 # Treat it as this step's own failure instead,
-                # mirroring `_run_hash_job`'s handling of the same class of error.
+                # mirroring `_run_hash_batch`'s handling of the same class of error.
                 self._fail_run_with_message(run, f"Hash computation failed: {exc}")
                 return None
             finally:
                 run.worker = None
 
+    def _fanout_kwargs(self) -> dict[str, Any]:
+        """Keyword arguments to hash several files, or segments of one file, in parallel.
+
+        The thread that computes the hashes of a step already occupies one thread of the pool,
+        so at most `hash_threads - 1` helpers can join it.
+        """
+        return {"pool": self.hash_pool, "max_helpers": self.hash_threads - 1}
+
     @staticmethod
     def _fail_run_with_message(run: Run, message: str) -> None:
         """Mark `run` as failed, appending `message` to its outcome's stderr."""
@@ -582,8 +659,8 @@ class Executor:
             run.outcome = attrs.evolve(run.outcome, stderr=stderr)
 
     @contextmanager
-    def _track_running(self, job: Run | HashJob) -> Generator[None, None, None]:
-        """Track a `Run` or `HashJob` as running for the duration of the context."""
+    def _track_running(self, job: Run | HashBatch) -> Generator[None, None, None]:
+        """Track a `Run` or `HashBatch` as running for the duration of the context."""
         if job.job_i in self.running:
             raise RuntimeError(f"Job {job.job_i} is already tracked as running.")
         self.running[job.job_i] = job
@@ -593,40 +670,57 @@ class Executor:
             del self.running[job.job_i]
 
     async def run_hash_job(self, hash_job: HashJob) -> None:
-        """Run `hash_job`, bracketed by progress-bar start/stop calls.
+        """Run a single `hash_job`, as a batch of one, see `run_hash_batch`."""
+        await self.run_hash_batch(HashBatch([hash_job]))
+
+    async def run_hash_batch(self, batch: HashBatch) -> None:
+        """Run `batch`, bracketed by progress-bar start/stop calls.
 
         The bracket lives here, rather than at the places where a hash job is started,
         so a hash job is equally visible however it got claimed.
 
-        `"H"` is its letter in the progress bar, and `HashJob.job_i` is negative
+        `"H"` is its letter in the progress bar, and `HashBatch.job_i` is negative
         (see `hash_queue.py`), so it can never collide with a real `Step.i` in the
         reporter/progress-bar dict, which is keyed by whatever int it is given.
         """
-        self.reporter.job_started(hash_job.job_i, "H", hash_job.path)
+        self.reporter.job_started(batch.job_i, "H", batch.description)
         try:
-            await self._run_hash_job(hash_job)
+            await self._run_hash_batch(batch)
         finally:
-            self.reporter.job_stopped(hash_job.job_i)
+            self.reporter.job_stopped(batch.job_i)
 
-    async def _run_hash_job(self, hash_job: HashJob) -> None:
-        """Compute one file hash in a thread, apply it to the workflow, resolve the future.
+    async def _run_hash_batch(self, batch: HashBatch) -> None:
+        """Compute the file hashes of a batch in a thread, apply them, resolve the futures.
 
         Does not reuse `_run_work_thread`: that helper requires a `Run` (step-bound) and
-        writes a child outcome into `run.outcome`, neither of which applies to a `HashJob`.
+        writes a child outcome into `run.outcome`, neither of which applies to a `HashBatch`.
+        Each job in the batch succeeds or fails on its own, as if it had run by itself.
+        All hashes to be applied are written in a single database transaction.
         """
         worker = ThreadWorker(
-            work=functools.partial(FileHash.refreshed, hash_job.old_hash, hash_job.path),
-            job_i=hash_job.job_i,
+            work=functools.partial(
+                refresh_file_hashes,
+                [(job.path, job.old_hash) for job in batch.jobs],
+                algorithm=self.digest_algorithm,
+                cache=self.digest_cache,
+                **self._fanout_kwargs(),
+            ),
+            job_i=batch.job_i,
+            pool=self.hash_pool,
         )
-        hash_job.worker = worker
-        with self._track_running(hash_job):
+        batch.worker = worker
+        with self._track_running(batch):
             try:
-                new_hash = await worker.run_in_thread()
-            except HashCancelledError:
+                outcomes = await worker.run_in_thread()
+            finally:
+                batch.worker = None
+
+        updates: dict[HashUpdateCause, dict[str, FileHash]] = {}
+        for hash_job, outcome in zip(batch.jobs, outcomes, strict=True):
+            if isinstance(outcome, HashCancelledError):
                 hash_job.future.cancel()
                 await self.reporter("ERROR", f"Hash cancelled for {hash_job.path}")
-                return
-            except Exception as exc:  # noqa: BLE001
+            elif isinstance(outcome, Exception):
                 # E.g. a `PermissionError` from `stat()`,
                 # or a directory mistakenly used as a file input.
                 # Must not propagate as a task exception:
@@ -641,30 +735,31 @@ class Executor:
                 # A fire-and-forget submitter never awaits this future,
                 # so draining and the reported error are what surface the failure to the user.
                 self.scheduler.draining = True
-                hash_job.future.set_exception(exc)
+                hash_job.future.set_exception(outcome)
                 await self.reporter(
                     "ERROR",
-                    f"Could not hash {hash_job.path}: {exc}",
+                    f"Could not hash {hash_job.path}: {outcome}",
                     await self._format_provenance(hash_job.path),
                 )
-                return
-            finally:
-                hash_job.worker = None
-        if new_hash != hash_job.old_hash or hash_job.cause == HashUpdateCause.CONFIRMED:
-            # The CONFIRMED cause must be applied even when unchanged:
-            # only the update flips UNCONFIRMED -> CONFIRMED/MISSING.
-            # Unchanged results under other causes are deliberately NOT applied:
-            # e.g. the transition for (EXTERNAL, CONFIRMED, known)
-            # would call `handle_updated_file`
-            # and needlessly mark all sinks pending. (They should already be pending.)
+            elif outcome != hash_job.old_hash or hash_job.cause == HashUpdateCause.CONFIRMED:
+                # The CONFIRMED cause must be applied even when unchanged:
+                # only the update flips UNCONFIRMED -> CONFIRMED/MISSING.
+                # Unchanged results under other causes are deliberately NOT applied:
+                # e.g. the transition for (EXTERNAL, CONFIRMED, known)
+                # would call `handle_updated_file`
+                # and needlessly mark all sinks pending. (They should already be pending.)
+                updates.setdefault(hash_job.cause, {})[hash_job.path] = outcome
+        if len(updates) > 0:
             async with self.db:
-                self.workflow.update_file_hashes({hash_job.path: new_hash}, cause=hash_job.cause)
-        if not hash_job.future.done():
-            # Resolved after the DB write, so an awaiter that re-reads file state on wake always
-            # sees the post-transition state.
-            # Already done when the future was cancelled concurrently (e.g. Builder.stop());
-            # set_result would then raise InvalidStateError.
-            hash_job.future.set_result(new_hash)
+                for cause, file_hashes in updates.items():
+                    self.workflow.update_file_hashes(file_hashes, cause=cause)
+        for hash_job, outcome in zip(batch.jobs, outcomes, strict=True):
+            if isinstance(outcome, FileHash) and not hash_job.future.done():
+                # Resolved after the DB write, so an awaiter that re-reads file state on wake
+                # always sees the post-transition state.
+                # Already done when the future was cancelled concurrently (e.g. Builder.stop());
+                # set_result would then raise InvalidStateError.
+                hash_job.future.set_result(outcome)
 
     async def _format_provenance(self, path: str) -> list[tuple[str, str]]:
         """Format where `path` came from in the workflow, as a reporter page.
@@ -708,7 +803,16 @@ class Executor:
         env_deps: list[str],
     ) -> tuple[StepHash | None, dict[str, FileHash]]:
         """Compute the input part of a step hash and apply it to `run`."""
-        result = await self._run_work_thread(run, functools.partial(compute_inp_hashes, inp_hashes))
+        # This is only called before a step is executed, so the memo can be used.
+        result = await self._run_work_thread(
+            run,
+            functools.partial(
+                compute_inp_hashes,
+                inp_hashes,
+                memo=self.workflow.hash_memo,
+                **self._fanout_kwargs(),
+            ),
+        )
         if result is None:
             return None, {}
 
@@ -749,7 +853,15 @@ class Executor:
         async with self.db:
             out_hashes = {rec.path: rec.hash for rec in run.step.out_paths()}
 
-        result = await self._run_work_thread(run, functools.partial(compute_out_hashes, out_hashes))
+        result = await self._run_work_thread(
+            run,
+            functools.partial(
+                compute_out_hashes,
+                out_hashes,
+                algorithm=self.digest_algorithm,
+                **self._fanout_kwargs(),
+            ),
+        )
         if result is None:
             return None, {}
 
@@ -779,7 +891,14 @@ class Executor:
             env_overrides = run.step.get_env_overrides()
 
         result = await self._run_work_thread(
-            run, functools.partial(compute_both_hashes, inp_hashes, out_hashes)
+            run,
+            functools.partial(
+                compute_both_hashes,
+                inp_hashes,
+                out_hashes,
+                algorithm=self.digest_algorithm,
+                **self._fanout_kwargs(),
+            ),
         )
         if result is None:
             return None, {}, {}
@@ -842,7 +961,15 @@ class Executor:
         suspended_before = self.suspended_total
         with self._track_running(run):
             outcome = await launch_command(
-                command, shell=shell, env=env, cwd=workdir, mp_ctx=self.mp_ctx, run=run
+                command,
+                shell=shell,
+                env=env,
+                cwd=workdir,
+                mp_ctx=self.mp_ctx,
+                run=run,
+                spool_dir=self.spool_dir,
+                call_pool=self.call_pool,
+                spawner=self.spawner,
             )
         # A suspension stops the child but not the monotonic clock, on either launch path,
         # so it would otherwise be recorded as time the step spent working.
@@ -10,7 +10,7 @@ from path import Path
 
 from .enums import FileState
 from .exceptions import PathError
-from .hash import FileHash, fmt_full_digest
+from .hash import FILE_HASH_HEADER, FileHash, fmt_full_digest
 from .trellis import Node
 
 __all__ = ("REGULAR_OUTPUT_WHERE", "File")
@@ -35,13 +35,13 @@ CREATE TABLE IF NOT EXISTS file (
   node INTEGER PRIMARY KEY,
   state INTEGER NOT NULL
     CHECK(state >= {min(FileState)} AND state <= {max(FileState)}),
-  hash TEXT,
+  hash BLOB,
   FOREIGN KEY (node) REFERENCES node(i) ON DELETE CASCADE,
   CHECK (
     state NOT IN ({FileState.CONFIRMED.value}, {FileState.BUILT.value}, {FileState.OUTDATED.value})
     OR hash IS NOT NULL
   ),
-  CHECK (hash IS NULL OR json_valid(hash))
+  CHECK (hash IS NULL OR (typeof(hash) = 'blob' AND length(hash) > {FILE_HASH_HEADER.size}))
 ) WITHOUT ROWID;
 
 -- The file_clear_hash trigger is defined using the following arguments:
@@ -155,7 +155,7 @@ class File(Node):
         so a file that did not change on disk does not have to be hashed again
         and a step whose inputs and outputs are unchanged can still be skipped.
         """
-        hash_json = None
+        hash_blob = None
         # UNDECLARED means that nothing declares the file (yet) and PLANNED that it must still
         # be built. Neither is a reason to forget that a step produced the file before,
         # so the old output state is restored instead of the requested one.
@@ -164,7 +164,7 @@ class File(Node):
             row = self.db.execute(sql, (self.i,)).fetchone()
             if row is not None and row[0] in (FileState.BUILT.value, FileState.OUTDATED.value):
                 state = FileState(row[0])
-                hash_json = row[1]
+                hash_blob = row[1]
         # The upsert only assigns the state column when the row already exists,
         # so a recycled hash survives unless the file_clear_hash trigger nulls it afterward.
         # The old hash is nevertheless needed in the parameters below:
@@ -174,7 +174,7 @@ class File(Node):
         self.db.execute(
             "INSERT INTO file VALUES(:node, :state, :hash) "
             "ON CONFLICT DO UPDATE SET state = :state WHERE node = :node",
-            {"node": self.i, "state": state.value, "hash": hash_json},
+            {"node": self.i, "state": state.value, "hash": hash_blob},
         )
         # Recycled BUILT files should be assumed to be out-of-date.
         if state == FileState.BUILT:
@@ -246,4 +246,4 @@ class File(Node):
         """
         sql = "SELECT hash FROM file WHERE node = ?"
         row = self.db.execute(sql, (self.i,)).fetchone()
-        return FileHash.from_json(row[0])
+        return FileHash.from_blob(row[0])
@@ -422,7 +422,7 @@ async def revert_optional_steps(workflow: Workflow, reporter: ReporterClient):
         nstep = cur.rowcount
         cur = db.execute(SELECT_OPTIONAL_TO_BE_DELETED)
         to_be_deleted = {
-            row[0]: None if row[1] == FileState.VOLATILE.value else FileHash.from_json(row[2])
+            row[0]: None if row[1] == FileState.VOLATILE.value else FileHash.from_blob(row[2])
             for row in cur
         }
         if len(to_be_deleted) > 0:
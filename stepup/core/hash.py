@@ -3,27 +3,54 @@
 """File and step hashing.
 
 Because the hash computation is performed in threads to avoid blocking the director process,
-the functions `compute_inp_hashes`, `compute_out_hashes` and `compute_both_hashes` must be pure.
+the functions `compute_inp_hashes`, `compute_out_hashes`, `compute_both_hashes`,
+`refresh_file_hashes` and `find_stat_changes` must be pure.
+The only exception is the thread-safe `HashMemo` that `compute_inp_hashes` may update.
 """
 
+import concurrent.futures
+import contextlib
+import functools
 import hashlib
 import json
+import mmap
 import os
 import stat
+import struct
 import threading
-from collections.abc import Iterator, Mapping
-from typing import Self
+import time
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
+from typing import BinaryIO, Self, TypeVar
 
 import attrs
 from path import Path
 
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
 from .cattrs import json_converter
+from .digest_cache import DigestCache
 from .exceptions import ConsistencyError, HashCancelledError, HashFailedError
 
 __all__ = (
+    "DEFAULT_DIGEST_ALGORITHM",
+    "DIGEST_ALGORITHMS",
+    "DIGEST_ALGORITHM_CHOICES",
+    "FILE_HASH_HEADER",
     "HASH_CHUNK_SIZE",
+    "HASH_DROP_CACHE_SIZE",
+    "HASH_FANOUT_MIN_FILES",
+    "HASH_IO_STRATEGIES",
+    "RACY_WINDOW_COARSE_NS",
+    "RACY_WINDOW_NS",
+    "STEP_HASH_HEADER",
+    "TREE_DIGEST_ALGORITHMS",
+    "TREE_SEGMENT_SIZE",
     "FileHash",
     "HashComputeResult",
+    "HashMemo",
     "InpInfo",
     "OutInfo",
     "StepHash",
@@ -32,17 +59,56 @@ __all__ = (
     "compute_file_digest",
     "compute_inp_hashes",
     "compute_out_hashes",
+    "find_stat_changes",
     "fmt_env_value",
     "fmt_file_hash_diff",
     "fmt_full_digest",
     "fmt_short_digest",
+    "map_with_helpers",
+    "racy_window_ns",
+    "refresh_file_hashes",
 )
 
 
+ItemType = TypeVar("ItemType")
+ResultType = TypeVar("ResultType")
+
+
 # 256 KiB is the `_bufsize` default of `hashlib.file_digest`,
 # unchanged since CPython 3.11 introduced it (still so on the 3.15 development branch).
 HASH_CHUNK_SIZE = 1 << 18
 
+# The ways in which `compute_file_digest` can read the contents of a file.
+HASH_IO_STRATEGIES = ("read", "mmap")
+
+# Files at least this large are removed from the page cache after hashing.
+# Clean pages of smaller files are kept, as the next step will often read them again.
+HASH_DROP_CACHE_SIZE = 1 << 28
+
+
+# The algorithms with which file contents can be hashed, keyed by their configuration name.
+# Step digests are not affected by this choice: `HashWords` always uses SHA-256.
+DIGEST_ALGORITHMS = {
+    "sha256": hashlib.sha256,
+    "blake2b": functools.partial(hashlib.blake2b, digest_size=32),
+}
+if xxhash is not None:
+    DIGEST_ALGORITHMS["xxh3"] = xxhash.xxh3_128
+
+# The tree variants of the algorithms, mapped to the algorithm of their segments and root.
+# Their digests are never equal to plain digests, not even for files of a single segment.
+TREE_DIGEST_ALGORITHMS = {f"{name}-tree": name for name in DIGEST_ALGORITHMS}
+
+# All algorithms that can be configured.
+DIGEST_ALGORITHM_CHOICES = (*DIGEST_ALGORITHMS, *TREE_DIGEST_ALGORITHMS)
+
+DEFAULT_DIGEST_ALGORITHM = "sha256"
+
+# Large segments keep the number of leaf digests (and the root computation) small,
+# while a 1 GB file still consists of enough segments to keep all hash threads busy.
+TREE_SEGMENT_SIZE = 1 << 24
+TREE_DIGEST_TAG = b"stepup-tree-digest\0"
+
 
 #
 # Digest primitives
@@ -104,10 +170,115 @@ class HashWords:
         return self._hash.digest()
 
 
+def map_with_helpers(
+    func: Callable[[ItemType], ResultType],
+    items: Sequence[ItemType],
+    pool: concurrent.futures.Executor | None,
+    nhelper: int,
+) -> list[ResultType]:
+    """Apply a function to all items, in the calling thread and in helper threads of a pool.
+
+    The calling thread processes items too, claiming them one by one from a shared iterator.
+    Helpers submitted to `pool` join in when a thread of the pool becomes available.
+    Because the calling thread never waits for a helper that has not started,
+    this cannot deadlock when the caller itself runs in a thread of the same (busy) pool.
+
+    Parameters
+    ----------
+    func
+        The function to apply, which must be thread-safe.
+    items
+        The arguments of the function.
+    pool
+        The thread pool in which helpers are submitted, or `None` to work serially.
+    nhelper
+        The maximum number of helpers.
+
+    Returns
+    -------
+    results
+        The results of the function, in the order of `items`.
+
+    Raises
+    ------
+    Exception
+        The first exception raised by `func`, in the order of `items`.
+        After a failure, the remaining items are no longer claimed.
+    """
+    if pool is None or nhelper <= 0:
+        return [func(item) for item in items]
+
+    outcomes: list = [None] * len(items)
+    todo = iter(enumerate(items))
+    lock = threading.Lock()
+    failed = threading.Event()
+
+    def work():
+        while not failed.is_set():
+            with lock:
+                i, item = next(todo, (None, None))
+            if i is None:
+                return
+            try:
+                outcomes[i] = func(item)
+            except Exception as exc:  # noqa: BLE001
+                outcomes[i] = exc
+                failed.set()
+
+    futures = [pool.submit(work) for _ in range(min(nhelper, len(items) - 1))]
+    work()
+    # Helpers that have not started are cancelled. Only those already running are awaited:
+    # `concurrent.futures.wait` would block on a cancelled future until the pool picks it up.
+    concurrent.futures.wait([future for future in futures if not future.cancel()])
+
+    for outcome in outcomes:
+        if isinstance(outcome, Exception):
+            raise outcome
+    return outcomes
+
+
+def _hash_segment(
+    fd: int, offset: int, size: int, new_hash: Callable, cancel_event: threading.Event | None
+) -> bytes:
+    """Hash `size` bytes of an open file, starting at `offset`, with `os.pread`.
+
+    Fewer bytes are hashed when the file has been truncated in the meantime.
+    """
+    digest = new_hash()
+    end = offset + size
+    while offset < end:
+        if cancel_event is not None and cancel_event.is_set():
+            raise HashCancelledError(fd)
+        chunk = os.pread(fd, min(HASH_CHUNK_SIZE, end - offset), offset)
+        if len(chunk) == 0:
+            break
+        digest.update(chunk)
+        offset += len(chunk)
+    return digest.digest()
+
+
+def _tree_root(new_hash: Callable, size: int, leaves: Iterable[bytes]) -> bytes:
+    """Combine the digests of the segments of a file into the root of a tree digest.
+
+    The header makes the root differ from the plain digest of any data of the same size.
+    """
+    digest = new_hash(TREE_DIGEST_TAG)
+    digest.update(struct.pack("<QQ", TREE_SEGMENT_SIZE, size))
+    for leaf in leaves:
+        digest.update(leaf)
+    return digest.digest()
+
+
 def compute_file_digest(
-    path: str, follow_symlinks: bool = True, cancel_event: threading.Event | None = None
+    path: str,
+    follow_symlinks: bool = True,
+    cancel_event: threading.Event | None = None,
+    algorithm: str = DEFAULT_DIGEST_ALGORITHM,
+    pool: concurrent.futures.Executor | None = None,
+    max_helpers: int = 0,
+    io_strategy: str = "read",
 ) -> bytes:
-    """Compute the SHA-256 digest of a file or a symbolic link.
+    """Compute the digest of a file or a symbolic link.
 
     Parameters
     ----------
@@ -123,11 +294,30 @@ def compute_file_digest(
     cancel_event
         When given, the event is checked between chunks of `HASH_CHUNK_SIZE` bytes,
         so an in-progress hash of a large file can be aborted promptly.
+    algorithm
+        The name of the hash algorithm, one of `DIGEST_ALGORITHM_CHOICES`.
+        For a tree algorithm (see `TREE_DIGEST_ALGORITHMS`), the file is split into segments
+        of `TREE_SEGMENT_SIZE` bytes, whose digests are combined into a root digest.
+    pool, max_helpers
+        With a tree algorithm, up to `max_helpers` tasks are submitted to `pool`
+        to hash the segments of a large file in parallel.
+        The digest does not depend on these parameters.
+    io_strategy
+        How the contents of a regular file are read, one of `HASH_IO_STRATEGIES`:
+        `"read"` (default) reads chunks into a reused buffer,
+        `"mmap"` maps the file into memory and hashes slices of the map without copying.
+        The latter is not used by StepUp itself, because a file truncated by another process
+        while it is mapped crashes the director with `SIGBUS`.
+        (Tree digests always read segments with `os.pread`.)
+        In all cases, the kernel is advised to read ahead aggressively,
+        and files of at least `HASH_DROP_CACHE_SIZE` bytes are dropped from the page cache
+        after hashing, so that hashing them does not evict the data other steps work with.
 
     Returns
     -------
     digest
-        A 32-byte SHA-256 hash.
+        A 32-byte hash for SHA-256 and BLAKE2b, a 16-byte hash for XXH3.
+        (The tree variants have the same digest size.)
 
     Raises
     ------
@@ -139,30 +329,97 @@ def compute_file_digest(
     OSError
         When the file cannot be opened,
         e.g. a followed symbolic link whose target does not exist.
+    ValueError
+        When `io_strategy` is not supported.
     """
     # Cheap part:
     path = Path(path)
+    tree = algorithm in TREE_DIGEST_ALGORITHMS
+    new_hash = DIGEST_ALGORITHMS[TREE_DIGEST_ALGORITHMS[algorithm] if tree else algorithm]
     if path.islink() and not follow_symlinks:
-        return hashlib.sha256(path.readlink().encode("utf-8")).digest()
+        target = path.readlink().encode("utf-8")
+        if tree:
+            return _tree_root(new_hash, len(target), [new_hash(target).digest()])
+        return new_hash(target).digest()
     if path.is_dir():
         raise HashFailedError(f"File digests of directories are not supported: {path}")
     # Expensive part:
+    if io_strategy not in HASH_IO_STRATEGIES:
+        raise ValueError(f"Unknown I/O strategy for hashing: {io_strategy}")
+    with open(path, "rb", buffering=0) as fh:
+        fd = fh.fileno()
+        size = os.fstat(fd).st_size
+        _fadvise(fd, "POSIX_FADV_SEQUENTIAL")
+        try:
+            if tree:
+                offsets = range(0, size, TREE_SEGMENT_SIZE)
+                leaves = map_with_helpers(
+                    lambda offset: _hash_segment(
+                        fd, offset, TREE_SEGMENT_SIZE, new_hash, cancel_event
+                    ),
+                    offsets,
+                    pool,
+                    max_helpers,
+                )
+                return _tree_root(new_hash, size, leaves)
+            if io_strategy == "mmap" and size > 0:
+                return _digest_mmap(fd, size, new_hash, cancel_event)
+            return _digest_read(fh, new_hash, cancel_event)
+        except HashCancelledError:
+            raise HashCancelledError(path) from None
+        finally:
+            if size >= HASH_DROP_CACHE_SIZE:
+                _fadvise(fd, "POSIX_FADV_DONTNEED")
+
+
+def _fadvise(fd: int, advice: str):
+    """Call `os.posix_fadvise` for a whole file, if the platform and the file support it.
+
+    The advice is only a hint, so failures (e.g. `ESPIPE` for a pipe) are ignored.
+    """
+    if hasattr(os, "posix_fadvise") and hasattr(os, advice):
+        with contextlib.suppress(OSError):
+            os.posix_fadvise(fd, 0, 0, getattr(os, advice))
+
+
+def _digest_read(fh: BinaryIO, new_hash: Callable, cancel_event: threading.Event | None) -> bytes:
+    """Hash an unbuffered file object, reading it into a reused buffer."""
     # hashlib.file_digest is not used here:
     # the same algorithm is reimplemented with a cancellation check.
-    digest = hashlib.sha256()
+    digest = new_hash()
     buf = bytearray(HASH_CHUNK_SIZE)
     view = memoryview(buf)
     # With buffering=0, readinto performs at most one syscall,
     # so nread may be smaller than the buffer for pipes or network file systems;
     # only nread == 0 means EOF.
-    with open(path, "rb", buffering=0) as fh:
-        while True:
-            if cancel_event is not None and cancel_event.is_set():
-                raise HashCancelledError(path)
-            nread = fh.readinto(buf)
-            if nread == 0:
-                break
-            digest.update(view[:nread])
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            raise HashCancelledError(fh.name)
+        nread = fh.readinto(buf)
+        if nread == 0:
+            break
+        digest.update(view[:nread])
+    return digest.digest()
+
+
+def _digest_mmap(
+    fd: int, size: int, new_hash: Callable, cancel_event: threading.Event | None
+) -> bytes:
+    """Hash the first `size` bytes of a file, feeding slices of a memory map to the hash.
+
+    This avoids copying the data into a user-space buffer,
+    but the process receives `SIGBUS` when the file is truncated while it is being hashed.
+    """
+    digest = new_hash()
+    with mmap.mmap(fd, size, access=mmap.ACCESS_READ) as mm:
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        with memoryview(mm) as view:
+            for offset in range(0, size, HASH_CHUNK_SIZE):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise HashCancelledError(fd)
+                with view[offset : offset + HASH_CHUNK_SIZE] as chunk:
+                    digest.update(chunk)
     return digest.digest()
 
 
@@ -177,7 +434,7 @@ def fmt_short_digest(digest: bytes | None) -> str:
     Parameters
     ----------
     digest
-        A 32-byte SHA-256 hash,
+        A file or step digest,
         the `b"u"` placeholder of a file whose hash is unknown,
         or `None` when there is no digest at all.
 
@@ -195,9 +452,9 @@ def fmt_short_digest(digest: bytes | None) -> str:
 
 
 def fmt_full_digest(digest: bytes) -> str:
-    """Format a 32-byte digest as eight space-separated 8-character hex words."""
+    """Format a digest as space-separated 8-character hex words, eight for a 32-byte digest."""
     hexdigest = digest.hex()
-    return " ".join(hexdigest[i : i + 8] for i in range(0, 64, 8))
+    return " ".join(hexdigest[i : i + 8] for i in range(0, len(hexdigest), 8))
 
 
 def fmt_env_value(value: str | None) -> str:
@@ -221,11 +478,47 @@ def fmt_env_value(value: str | None) -> str:
 #
 
 
+# The fixed-size part of a `FileHash` blob:
+# mode, mtime_ns, ctime_ns, size, inode, algorithm code and flags, in that order.
+FILE_HASH_HEADER = struct.Struct("<IqqqQBB")
+_FILE_HASH_RACY = 1
+
+# The resolution of file system timestamps, as assumed by `racy_window_ns`.
+RACY_WINDOW_NS = 20_000_000
+RACY_WINDOW_COARSE_NS = 2_000_000_000
+
+
+def racy_window_ns(st: os.stat_result) -> int:
+    """Return how long after its last modification a file must be hashed to trust the digest.
+
+    Most Linux file systems store timestamps in nanoseconds,
+    but update them from a clock that ticks every few milliseconds.
+    Timestamps in whole seconds suggest a file system with a much coarser resolution,
+    e.g. two seconds for FAT.
+    """
+    if st.st_mtime_ns % 1_000_000_000 == 0:
+        return RACY_WINDOW_COARSE_NS
+    return RACY_WINDOW_NS
+
+
+# Codes of the digest algorithms in `FILE_HASH_HEADER`. Codes must never be reused.
+_DIGEST_CODES = {
+    "sha256": 0,
+    "blake2b": 1,
+    "xxh3": 2,
+    "sha256-tree": 3,
+    "blake2b-tree": 4,
+    "xxh3-tree": 5,
+}
+_DIGEST_NAMES = {code: name for name, code in _DIGEST_CODES.items()}
+
+
 @attrs.define(frozen=True)
 class FileHash:
     """A hash of a file's content and file properties.
 
-    For existing (regular) files, the `digest` attribute is a SHA-256 hash of the file content,
+    For existing (regular) files, the `digest` attribute is a hash of the file content,
+    computed with the recorded `algorithm`,
     and the mode of the file is also stored as "part of the hash".
     When the contents, the size or the mode changes, the file is considered changed.
 
@@ -235,17 +528,26 @@ class FileHash:
     In addition to the digest and the mode, some more properties are stored
     to decide whether the digest must be recomputed:
 
-    - the last modification time
+    - the last modification time, in nanoseconds
+    - the last status change time, in nanoseconds
     - the file size
     - the inode number
 
-    If all three (and also the mode) remained the same, the digest is not recomputed.
+    If all four (and also the mode) remained the same, the digest is not recomputed,
+    unless it must be replaced by one computed with a different algorithm,
+    or unless the hash is racy.
+
+    A hash is racy when the file was modified shortly before its digest was computed,
+    within the resolution of the file system timestamps (see `racy_window_ns`).
+    A later modification within the same timestamp tick would then go unnoticed,
+    so the digest of a racy hash is always recomputed, like a racily clean entry in Git.
+    Once the file is old enough, the recomputed hash is no longer racy.
     """
 
     # File properties whose changes are relevant.
 
     digest: bytes = attrs.field(converter=bytes, repr=fmt_short_digest)
-    """The SHA-256 hash of the file's content, or `b"u"` when the hash is unknown."""
+    """The hash of the file's content, or `b"u"` when the hash is unknown."""
 
     mode: int = attrs.field(converter=int, repr=stat.filemode)
     """The file mode, in the encoding of `os.stat_result.st_mode`."""
@@ -253,11 +555,11 @@ class FileHash:
     # Properties that are only used to detect changes.
     # If these have not changed, the digest is not recomputed.
 
-    # Note that mtime and inode are not used for sorting,
+    # Note that timestamps and inode are not used for sorting,
     # to ensure deterministic order across builds when sorting by FileHash instance.
 
-    mtime: float = attrs.field(converter=float, repr=False, eq=False)
-    """The last modification time, in seconds since the epoch."""
+    mtime_ns: int = attrs.field(converter=int, repr=False, eq=False)
+    """The last modification time, in nanoseconds since the epoch."""
 
     size: int = attrs.field(converter=int, repr=False)
     """The file size in bytes."""
@@ -265,12 +567,33 @@ class FileHash:
     inode: int = attrs.field(converter=int, repr=False, eq=False)
     """The inode number of the file on the file system."""
 
+    ctime_ns: int = attrs.field(default=0, converter=int, repr=False, eq=False)
+    """The last status change time, in nanoseconds since the epoch."""
+
+    algorithm: str = attrs.field(default=DEFAULT_DIGEST_ALGORITHM, repr=False)
+    """The name of the algorithm used to compute `digest`, one of `DIGEST_ALGORITHM_CHOICES`.
+
+    Digests computed with different algorithms are never equal,
+    so this is part of the comparison between hashes.
+    """
+
+    racy: bool = attrs.field(default=False, repr=False, eq=False)
+    """Whether the file was modified too shortly before the digest was computed to trust it."""
+
     @classmethod
     def unknown(cls):
         """Create the hash of a file that does not exist."""
-        return cls(b"u", 0, 0.0, 0, 0)
-
-    def refreshed(self, path: str, cancel_event: threading.Event | None = None) -> Self:
+        return cls(b"u", 0, 0, 0, 0)
+
+    def refreshed(
+        self,
+        path: str,
+        cancel_event: threading.Event | None = None,
+        algorithm: str | None = None,
+        cache: DigestCache | None = None,
+        pool: concurrent.futures.Executor | None = None,
+        max_helpers: int = 0,
+    ) -> Self:
         """Return the current hash of the given file on disk.
 
         Parameters
@@ -284,6 +607,18 @@ class FileHash:
         cancel_event
             When given, passed on to `compute_file_digest`
             so a digest computation in progress can be aborted promptly.
+        algorithm
+            The digest algorithm of the returned hash.
+            If it differs from the recorded one, the digest is recomputed,
+            even when the file properties did not change.
+            This is how hashes are migrated lazily after a change of configuration.
+            The default `None` keeps the recorded algorithm,
+            which suffices to check whether a file has changed.
+        cache
+            When given, a digest that must be recomputed is first looked up in this cache,
+            and a newly computed digest is stored in it.
+        pool, max_helpers
+            Passed on to `compute_file_digest`.
 
         Returns
         -------
@@ -292,7 +627,7 @@ class FileHash:
             If the file has not changed, no new hash is created and `self` is returned.
             For a proper comparison between hashes, use the `==` operator, not the `is` operator.
             Two hashes are considered the same if their content, size and mode are the same,
-            but timestamps and inodes may differ.
+            but timestamps, inodes and the racy flag may differ.
 
         Raises
         ------
@@ -304,6 +639,8 @@ class FileHash:
         # Check for cancellation early.
         if cancel_event is not None and cancel_event.is_set():
             raise HashCancelledError(path)
+        if algorithm is None:
+            algorithm = self.algorithm
         # A single stat call collects every property below and doubles as the existence test.
         path = Path(path)
         try:
@@ -311,34 +648,82 @@ class FileHash:
         except OSError:
             return self if self.is_unknown else self.unknown()
         # Decide whether the digest computation can be skipped.
-        if (
-            self.mode == st.st_mode
-            and self.mtime == st.st_mtime
+        if self.algorithm == algorithm and self.matches_stat(st):
+            return self
+        digest = None if cache is None else cache.lookup(st, algorithm)
+        if digest is None:
+            # Directories are rejected by compute_file_digest.
+            digest = compute_file_digest(
+                path,
+                cancel_event=cancel_event,
+                algorithm=algorithm,
+                pool=pool,
+                max_helpers=max_helpers,
+            )
+        # The clock is read after the digest is complete,
+        # because a modification during the computation is just as problematic.
+        racy = time.time_ns() - st.st_mtime_ns < racy_window_ns(st)
+        if cache is not None and not racy:
+            cache.store(st, algorithm, digest)
+        return self.__class__(
+            digest,
+            st.st_mode,
+            st.st_mtime_ns,
+            st.st_size,
+            st.st_ino,
+            st.st_ctime_ns,
+            algorithm,
+            racy,
+        )
+
+    def matches_stat(self, st: os.stat_result) -> bool:
+        """Whether the file properties in `st` are those recorded in this hash.
+
+        If so, `refreshed` trusts the recorded digest instead of reading the file again.
+        A racy hash never matches.
+        """
+        return (
+            not self.racy
+            and self.mode == st.st_mode
+            and self.mtime_ns == st.st_mtime_ns
+            and self.ctime_ns == st.st_ctime_ns
             and self.size == st.st_size
             and self.inode == st.st_ino
-        ):
-            return self
-        # Directories are rejected by compute_file_digest.
-        digest = compute_file_digest(path, cancel_event=cancel_event)
-        return self.__class__(digest, st.st_mode, st.st_mtime, st.st_size, st.st_ino)
+        )
 
     @property
     def is_unknown(self):
         """Whether the digest is the placeholder for a file that does not exist."""
         return self.digest == b"u"
 
-    def to_json(self) -> str | None:
-        """Serialize to the JSON representation stored in `file.hash`, or `None` if unknown."""
+    def to_blob(self) -> bytes | None:
+        """Serialize to the binary representation stored in `file.hash`, or `None` if unknown.
+
+        The fixed-size properties are packed with `FILE_HASH_HEADER`,
+        followed by the digest, which takes the remainder of the blob.
+        """
         if self.is_unknown:
             return None
-        return json.dumps(json_converter.unstructure(self))
+        header = FILE_HASH_HEADER.pack(
+            self.mode,
+            self.mtime_ns,
+            self.ctime_ns,
+            self.size,
+            self.inode,
+            _DIGEST_CODES[self.algorithm],
+            _FILE_HASH_RACY if self.racy else 0,
+        )
+        return header + self.digest
 
     @classmethod
-    def from_json(cls, value: str | None) -> Self:
-        """Deserialize from the JSON representation stored in `file.hash`."""
+    def from_blob(cls, value: bytes | None) -> Self:
+        """Deserialize from the binary representation stored in `file.hash`."""
         if value is None:
             return cls.unknown()
-        return json_converter.structure(json.loads(value), cls)
+        mode, mtime_ns, ctime_ns, size, inode, code, flags = FILE_HASH_HEADER.unpack_from(value)
+        digest = value[FILE_HASH_HEADER.size :]
+        racy = bool(flags & _FILE_HASH_RACY)
+        return cls(digest, mode, mtime_ns, size, inode, ctime_ns, _DIGEST_NAMES[code], racy)
 
 
 def fmt_file_hash_diff(old_hash: FileHash, new_hash: FileHash) -> str | None:
@@ -352,10 +737,17 @@ def fmt_file_hash_diff(old_hash: FileHash, new_hash: FileHash) -> str | None:
     Returns
     -------
     diff
-        A parenthesized summary of the changed digest, size and mode,
-        or `None` when none of these three differ.
+        A parenthesized summary of the changed algorithm, digest, size and mode,
+        or `None` when none of these differ.
+        The algorithm is only mentioned when both hashes are known.
     """
     changes = []
+    if (
+        old_hash.algorithm != new_hash.algorithm
+        and not old_hash.is_unknown
+        and not new_hash.is_unknown
+    ):
+        changes.append(f"algorithm {old_hash.algorithm} ➜ {new_hash.algorithm}")
     if old_hash.digest != new_hash.digest:
         changes.append(
             f"digest {fmt_short_digest(old_hash.digest)} ➜ {fmt_short_digest(new_hash.digest)}"
@@ -404,6 +796,12 @@ def _update_file_hashes(hw: HashWords, file_hashes: Mapping[str, FileHash]):
         hw.update(file_hash.digest)
 
 
+# The fixed-size part of a `StepHash` blob: flags and the lengths of both digests.
+STEP_HASH_HEADER = struct.Struct("<BBB")
+_STEP_HASH_HAS_OUT = 1
+_STEP_HASH_HAS_INFO = 2
+
+
 # Frozen because a step hash is a value object: `with_out_hashes` returns a new instance.
 # `unsafe_hash=False` keeps instances unhashable,
 # because a compact hash would otherwise be hashable while an explained one is not.
@@ -508,16 +906,44 @@ class StepHash:
         out_info = OutInfo(dict(out_hashes)) if self.inp_info is not None else None
         return self.__class__(self.inp_digest, self.inp_info, hw.digest(), out_info)
 
-    def to_json(self) -> str:
-        """Serialize to the JSON representation stored in `step.hash`."""
-        return json.dumps(json_converter.unstructure(self))
+    def to_blob(self) -> bytes:
+        """Serialize to the binary representation stored in `step_hash.hash`.
+
+        The blob starts with `STEP_HASH_HEADER`: flags and the lengths of both digests.
+        The digests follow, and an explained hash ends with its ingredients in JSON.
+        Only that last part goes through `cattrs`,
+        so a compact hash is encoded and decoded without it.
+        """
+        flags = 0
+        out_digest = b""
+        if self.out_digest is not None:
+            flags |= _STEP_HASH_HAS_OUT
+            out_digest = self.out_digest
+        parts = [b"", self.inp_digest, out_digest]
+        if self.inp_info is not None or self.out_info is not None:
+            flags |= _STEP_HASH_HAS_INFO
+            info = json_converter.unstructure([self.inp_info, self.out_info])
+            parts.append(json.dumps(info).encode())
+        parts[0] = STEP_HASH_HEADER.pack(flags, len(self.inp_digest), len(out_digest))
+        return b"".join(parts)
 
     @classmethod
-    def from_json(cls, value: str | None) -> Self | None:
-        """Deserialize from the JSON representation stored in `step.hash`."""
+    def from_blob(cls, value: bytes | None) -> Self | None:
+        """Deserialize from the binary representation stored in `step_hash.hash`."""
         if value is None:
             return None
-        return json_converter.structure(json.loads(value), cls)
+        flags, inp_size, out_size = STEP_HASH_HEADER.unpack_from(value)
+        begin = STEP_HASH_HEADER.size
+        inp_digest = value[begin : begin + inp_size]
+        begin += inp_size
+        out_digest = value[begin : begin + out_size] if flags & _STEP_HASH_HAS_OUT else None
+        begin += out_size
+        inp_info = out_info = None
+        if flags & _STEP_HASH_HAS_INFO:
+            inp_data, out_data = json.loads(value[begin:])
+            inp_info = json_converter.structure(inp_data, InpInfo | None)
+            out_info = json_converter.structure(out_data, OutInfo | None)
+        return cls(inp_digest, inp_info, out_digest, out_info)
 
 
 #
@@ -627,11 +1053,152 @@ def _compare_env_values(
             yield True, f"Modified {label}", f"{name} {old_var} ➜ {new_var}"
 
 
+#
+# Memo of file hashes verified during a build phase
+#
+
+
+@attrs.define(eq=False)
+class HashMemo:
+    """File hashes that were found to match the file system during the current build phase.
+
+    A file used as input by many steps is checked before each of these steps is executed.
+    With the memo, only the first check calls `os.stat`,
+    and later checks of the same file in the same build phase trust the memo instead.
+
+    The memo is cleared at the start of every build phase.
+    Entries are invalidated when the workflow records a new hash for a file
+    (see `Workflow.update_file_hashes`) and when the watcher receives an event for it.
+    Hash computations running in threads may be overtaken by such an invalidation,
+    which is why `store` requires the `epoch` of the path from before the computation.
+    Unknown and racy hashes are never stored.
+    """
+
+    _hashes: dict[str, FileHash] = attrs.field(init=False, factory=dict)
+    """The verified hashes, keyed by path."""
+
+    _epochs: dict[str, int] = attrs.field(init=False, factory=dict)
+    """The number of times each path has been invalidated."""
+
+    _nclear: int = attrs.field(init=False, default=0)
+    """The number of times the whole memo has been cleared."""
+
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+
+    def epoch(self, path: str) -> tuple[int, int]:
+        """Return a token that changes whenever the entry of `path` is invalidated."""
+        with self._lock:
+            return self._nclear, self._epochs.get(path, 0)
+
+    def is_current(self, path: str, file_hash: FileHash) -> bool:
+        """Whether `file_hash` was verified against the file system in this build phase.
+
+        All recorded file properties must match, not only those compared by `==`.
+        """
+        with self._lock:
+            memo_hash = self._hashes.get(path)
+        return (
+            memo_hash is not None
+            and memo_hash == file_hash
+            and memo_hash.mtime_ns == file_hash.mtime_ns
+            and memo_hash.ctime_ns == file_hash.ctime_ns
+            and memo_hash.inode == file_hash.inode
+        )
+
+    def store(self, path: str, file_hash: FileHash, epoch: tuple[int, int]):
+        """Record a hash that was just computed, unless `path` was invalidated since `epoch`."""
+        if file_hash.is_unknown or file_hash.racy:
+            return
+        with self._lock:
+            if epoch == (self._nclear, self._epochs.get(path, 0)):
+                self._hashes[path] = file_hash
+
+    def invalidate(self, paths: Iterable[str]):
+        """Forget the verified hashes of the given paths."""
+        with self._lock:
+            for path in paths:
+                self._hashes.pop(path, None)
+                self._epochs[path] = self._epochs.get(path, 0) + 1
+
+    def clear(self):
+        """Forget all verified hashes."""
+        with self._lock:
+            self._hashes.clear()
+            self._epochs.clear()
+            self._nclear += 1
+
+
 #
 # Pure functions for threaded hash computation
 #
 
 
+# A step needs more files than this per extra thread before its hashes are computed in parallel.
+# Below this, the overhead of submitting to the pool outweighs the gain.
+HASH_FANOUT_MIN_FILES = 16
+
+
+def _refresh_sorted(
+    old_hashes: Mapping[str, FileHash],
+    cancel_event: threading.Event,
+    algorithm: str | None,
+    pool: concurrent.futures.Executor | None,
+    max_helpers: int,
+    memo: HashMemo | None = None,
+) -> dict[str, FileHash]:
+    """Refresh the hashes of files, possibly with helper threads, and return them sorted by path.
+
+    See `map_with_helpers` for how the work is divided over the threads.
+
+    Parameters
+    ----------
+    old_hashes
+        The old hashes of the files, keyed by path.
+    cancel_event
+        Set this event to cancel the hash computation.
+    algorithm
+        Passed on to `FileHash.refreshed`.
+    pool
+        The thread pool in which helpers are submitted, or `None` to work serially.
+        Also passed on to `FileHash.refreshed`, for the tree digests of large files.
+    max_helpers
+        The maximum number of helpers, further limited by `HASH_FANOUT_MIN_FILES`.
+    memo
+        When given, old hashes verified earlier in the build phase are returned as is,
+        and newly verified hashes are added to the memo.
+
+    Returns
+    -------
+    new_hashes
+        The new hashes, keyed by path, in sorted order.
+
+    Raises
+    ------
+    Exception
+        The first exception raised by `FileHash.refreshed`, in sorted order of the paths.
+        After a failure, the remaining files are no longer claimed.
+    """
+    paths = sorted(old_hashes)
+
+    def refresh(path: str) -> FileHash:
+        old_hash = old_hashes[path]
+        if memo is None:
+            return old_hash.refreshed(
+                path, cancel_event, algorithm, pool=pool, max_helpers=max_helpers
+            )
+        epoch = memo.epoch(path)
+        if memo.is_current(path, old_hash):
+            return old_hash
+        new_hash = old_hash.refreshed(
+            path, cancel_event, algorithm, pool=pool, max_helpers=max_helpers
+        )
+        memo.store(path, new_hash, epoch)
+        return new_hash
+
+    nhelper = min(max_helpers, (len(paths) - 1) // HASH_FANOUT_MIN_FILES)
+    return dict(zip(paths, map_with_helpers(refresh, paths, pool, nhelper), strict=True))
+
+
 @attrs.define
 class HashComputeResult:
     """The result of a hash computation.
@@ -655,16 +1222,31 @@ class HashComputeResult:
 
 
 def compute_inp_hashes(
-    inp_hashes: Mapping[str, FileHash], cancel_event: threading.Event
+    inp_hashes: Mapping[str, FileHash],
+    cancel_event: threading.Event,
+    pool: concurrent.futures.Executor | None = None,
+    max_helpers: int = 0,
+    memo: HashMemo | None = None,
 ) -> HashComputeResult:
     """Compute the new hashes of the inputs.
 
+    Every input is refreshed with the algorithm recorded in its old hash,
+    so a mere change of digest algorithm is never mistaken for an unexpected change.
+    (The startup rescan has already migrated the hashes to the configured algorithm.)
+
     Parameters
     ----------
     inp_hashes
         The old hashes of the input files, keyed by path.
     cancel_event
         Set this event to cancel the hash computation.
+    pool, max_helpers
+        For a step with many inputs, up to `max_helpers` tasks are submitted to `pool`
+        to refresh the hashes in parallel. The result does not depend on these parameters.
+    memo
+        When given, inputs verified earlier in the same build phase are not checked again.
+        This must only be used before a step is executed:
+        afterwards, all inputs must be checked for changes made by the step itself.
 
     Returns
     -------
@@ -685,11 +1267,9 @@ def compute_inp_hashes(
     """
     messages = []
     new_inp_hashes = {}
-    all_inp_hashes = {}
-    for path in sorted(inp_hashes):
+    all_inp_hashes = _refresh_sorted(inp_hashes, cancel_event, None, pool, max_helpers, memo)
+    for path, new_file_hash in all_inp_hashes.items():
         old_file_hash = inp_hashes[path]
-        new_file_hash = old_file_hash.refreshed(path, cancel_event)
-        all_inp_hashes[path] = new_file_hash
         if new_file_hash != old_file_hash:
             # Collect changed hashes, so callers can process them efficiently.
             new_inp_hashes[path] = new_file_hash
@@ -710,7 +1290,11 @@ def compute_inp_hashes(
 
 
 def compute_out_hashes(
-    out_hashes: Mapping[str, FileHash], cancel_event: threading.Event
+    out_hashes: Mapping[str, FileHash],
+    cancel_event: threading.Event,
+    algorithm: str | None = None,
+    pool: concurrent.futures.Executor | None = None,
+    max_helpers: int = 0,
 ) -> HashComputeResult:
     """Compute the new hashes of the outputs.
 
@@ -720,6 +1304,10 @@ def compute_out_hashes(
         The old hashes of the output files, keyed by path.
     cancel_event
         Set this event to cancel the hash computation.
+    algorithm
+        The digest algorithm of the new hashes, see `FileHash.refreshed`.
+    pool, max_helpers
+        See `compute_inp_hashes`.
 
     Returns
     -------
@@ -737,11 +1325,9 @@ def compute_out_hashes(
     """
     messages = []
     new_out_hashes = {}
-    all_out_hashes = {}
-    for path in sorted(out_hashes):
+    all_out_hashes = _refresh_sorted(out_hashes, cancel_event, algorithm, pool, max_helpers)
+    for path, new_file_hash in all_out_hashes.items():
         old_file_hash = out_hashes[path]
-        new_file_hash = old_file_hash.refreshed(path, cancel_event)
-        all_out_hashes[path] = new_file_hash
         # Collect changed hashes, so callers can process them efficiently.
         if new_file_hash != old_file_hash:
             new_out_hashes[path] = new_file_hash
@@ -756,6 +1342,9 @@ def compute_both_hashes(
     inp_hashes: Mapping[str, FileHash],
     out_hashes: Mapping[str, FileHash],
     cancel_event: threading.Event,
+    algorithm: str | None = None,
+    pool: concurrent.futures.Executor | None = None,
+    max_helpers: int = 0,
 ) -> tuple[HashComputeResult, HashComputeResult]:
     """Call `compute_inp_hashes` and `compute_out_hashes`, in that order.
 
@@ -764,6 +1353,110 @@ def compute_both_hashes(
     The parameters, the results and the exceptions are those of the two functions it calls.
     """
     return (
-        compute_inp_hashes(inp_hashes, cancel_event),
-        compute_out_hashes(out_hashes, cancel_event),
+        compute_inp_hashes(inp_hashes, cancel_event, pool, max_helpers),
+        compute_out_hashes(out_hashes, cancel_event, algorithm, pool, max_helpers),
     )
+
+
+def refresh_file_hashes(
+    old_hashes: Sequence[tuple[str, FileHash]],
+    cancel_event: threading.Event,
+    algorithm: str | None = None,
+    cache: DigestCache | None = None,
+    pool: concurrent.futures.Executor | None = None,
+    max_helpers: int = 0,
+) -> list[FileHash | Exception]:
+    """Call `FileHash.refreshed` for several unrelated files, in the given order.
+
+    This is the work of one hash batch (see `hash_queue.HashBatch`):
+    the files belong to independent hash jobs, so one failure must not affect the others.
+
+    Parameters
+    ----------
+    old_hashes
+        `(path, old_hash)` pairs of the files to hash.
+    cancel_event
+        Set this event to cancel the hash computation.
+        Files not hashed yet then get a `HashCancelledError` as outcome.
+    algorithm, cache, pool, max_helpers
+        Passed on to `FileHash.refreshed`.
+
+    Returns
+    -------
+    outcomes
+        For each pair, in the same order, the new hash or the exception raised by
+        `FileHash.refreshed`.
+    """
+    outcomes = []
+    for path, old_hash in old_hashes:
+        try:
+            outcomes.append(
+                old_hash.refreshed(path, cancel_event, algorithm, cache, pool, max_helpers)
+            )
+        except Exception as exc:  # noqa: BLE001
+            outcomes.append(exc)
+    return outcomes
+
+
+def find_stat_changes(
+    old_hashes: Mapping[str, FileHash], algorithm: str | None = None
+) -> list[str]:
+    """Find the files whose properties on disk no longer match their old hashes.
+
+    This is a cheap pre-pass for a large number of files that are expected to be unchanged:
+    the files are grouped by parent directory, each directory is listed once with `os.scandir`,
+    and only the entries of interest are stat'ed.
+    No digests are computed.
+
+    Parameters
+    ----------
+    old_hashes
+        The old hashes of the files to check, keyed by path.
+    algorithm
+        The digest algorithm of the new hashes, see `FileHash.refreshed`.
+        A known hash recorded with another algorithm is always included.
+
+    Returns
+    -------
+    changed
+        The paths, in the order of `old_hashes`, for which `FileHash.refreshed`
+        may return a different hash.
+        For all other paths, `FileHash.refreshed` would return the old hash as is.
+        When a directory cannot be listed or an entry cannot be stat'ed,
+        the paths involved are included, so `FileHash.refreshed` can decide.
+    """
+    names_by_dir: dict[str, dict[str, str]] = {}
+    for path in old_hashes:
+        dirname, name = os.path.split(path)
+        names_by_dir.setdefault(dirname, {})[name] = path
+    changed = set()
+    for dirname, names in names_by_dir.items():
+        found = set()
+        try:
+            with os.scandir(dirname or ".") as entries:
+                for entry in entries:
+                    path = names.get(entry.name)
+                    if path is None:
+                        continue
+                    found.add(entry.name)
+                    try:
+                        # Follows symbolic links, like `FileHash.refreshed`.
+                        st = entry.stat()
+                    except OSError:
+                        changed.add(path)
+                        continue
+                    old_hash = old_hashes[path]
+                    if not old_hash.matches_stat(st) or (
+                        algorithm is not None and old_hash.algorithm != algorithm
+                    ):
+                        changed.add(path)
+        except OSError:
+            changed.update(names.values())
+            continue
+        # A file absent from its directory is only a change if it was known to exist.
+        changed.update(
+            path
+            for name, path in names.items()
+            if name not in found and not old_hashes[path].is_unknown
+        )
+    return [path for path in old_hashes if path in changed]
@@ -8,6 +8,10 @@
 since a hash job's runnability never depends on the workflow database.
 `gather_hashes()` is the direct-drain counterpart used outside a build phase
 (startup and watch phases), when `job_loop` is not running to pump the queue.
+
+Both consumers claim jobs in a `HashBatch`:
+small files are hashed several at a time by one work item of the executor's thread pool,
+so a tree with many small files does not pay the per-job overhead for each of them.
 """
 
 import asyncio
@@ -26,7 +30,26 @@ if TYPE_CHECKING:
     # Avoid a runtime import cycle: executor.py imports HashJob from this module.
     from .executor import Executor
 
-__all__ = ("HashJob", "HashQueue", "gather_hashes")
+__all__ = (
+    "HASH_BATCH_BYTES",
+    "HASH_BATCH_JOBS",
+    "HashBatch",
+    "HashJob",
+    "HashQueue",
+    "gather_hashes",
+)
+
+
+HASH_BATCH_JOBS = 64
+"""The maximum number of hash jobs claimed together in one `HashBatch`."""
+
+HASH_BATCH_BYTES = 1 << 22
+"""A batch is closed once the sizes of its files, as far as known, add up to this many bytes.
+
+Sizes come from `HashJob.old_hash`, so a large file usually ends up in a batch of its own,
+where it does not delay the small files queued behind it.
+Files of unknown size (never hashed before) count as empty.
+"""
 
 
 @attrs.define(eq=False)
@@ -73,9 +96,49 @@ class HashJob:
     started: bool = attrs.field(init=False, default=False)
     """Set once a runner has claimed this job, through `HashQueue.claim()`."""
 
+
+@attrs.define(eq=False)
+class HashBatch:
+    """Claimed hash jobs that run together as a single work item in the hash thread pool.
+
+    A batch is tracked as one entry in `Executor.running`
+    and shown as one item in the progress bar, under the `job_i` of its first job.
+    """
+
+    jobs: list[HashJob] = attrs.field()
+    """The claimed jobs, in the order in which their files are hashed."""
+
     worker: ThreadWorker | None = attrs.field(init=False, default=None)
     """The in-flight hashing thread, if any, for `Executor.interrupt()`."""
 
+    @property
+    def job_i(self) -> int:
+        """The id under which the batch is tracked, i.e. that of its first job."""
+        return self.jobs[0].job_i
+
+    @property
+    def description(self) -> str:
+        """The label of the batch in the progress bar."""
+        path = self.jobs[0].path
+        if len(self.jobs) == 1:
+            return path
+        return f"{path} (+{len(self.jobs) - 1} more)"
+
+
+def _collect_batch(claimed: Iterator[HashJob]) -> HashBatch | None:
+    """Take jobs from `claimed` until a batch is full, see `HASH_BATCH_JOBS`/`HASH_BATCH_BYTES`.
+
+    Returns `None` when `claimed` is exhausted before yielding any job.
+    """
+    jobs = []
+    nbyte = 0
+    for job in claimed:
+        jobs.append(job)
+        nbyte += job.old_hash.size
+        if len(jobs) >= HASH_BATCH_JOBS or nbyte >= HASH_BATCH_BYTES:
+            break
+    return HashBatch(jobs) if len(jobs) > 0 else None
+
 
 @attrs.define
 class HashQueue:
@@ -187,13 +250,23 @@ class HashQueue:
         """
         return next(self._drain_claimed(), None)
 
+    def pop_batch_nowait(self) -> HashBatch | None:
+        """Pop unclaimed jobs from the queue, as many as fit in one `HashBatch`.
+
+        Returns
+        -------
+        batch
+            The claimed jobs, or `None` if the queue holds no (more) unclaimed jobs.
+        """
+        return _collect_batch(self._drain_claimed())
+
     def shutdown(self) -> None:
         """Cancel the futures of all not-yet-started jobs, and drain the queue.
 
         Prevents awaiters of a queued-but-never-started job from hanging forever.
         Already-started jobs are left alone:
         their cancellation is handled by `Executor.interrupt()`,
-        through the `HashJob.worker` they registered.
+        through the `HashBatch.worker` they registered.
         """
         for job in self._drain_claimed():
             job.future.cancel()
@@ -206,7 +279,7 @@ async def gather_hashes(
     path_hash_causes: Collection[tuple[str, FileHash, HashUpdateCause]],
     njob: int,
 ) -> dict[str, FileHash]:
-    """Submit hash jobs for `path_hash_causes` and run them with bounded concurrency.
+    """Submit hash jobs for `path_hash_causes` and run them in batches with bounded concurrency.
 
     Used by the startup scan and the watcher to drain a batch of hash jobs directly,
     independent of `Builder.job_loop`, which is not running during those phases.
@@ -221,15 +294,16 @@ async def gather_hashes(
     hash_queue
         Where jobs are submitted, for dedup with any other in-flight submitter.
     executor
-        Runs each claimed job in a thread.
+        Runs each `HashBatch` of claimed jobs in its hash thread pool.
     reporter
         Where `update_progress` is sent, coalesced to at most once per `PROGRESS_REFRESH_DELAY`.
-        (The per-job `job_started`/`job_stopped` bracket is `Executor.run_hash_job`'s own.)
+        (The per-batch `job_started`/`job_stopped` bracket is `Executor.run_hash_batch`'s own.)
     path_hash_causes
         `(path, old_hash, cause)` triples to (re)hash;
         see `HashJob.old_hash` and `HashJob.cause`.
     njob
-        Maximum number of jobs this call runs concurrently.
+        Maximum number of batches this call runs concurrently,
+        normally the budget of hash jobs (`--hash-jobs`).
         Jobs already claimed by another submitter (e.g. a duplicate path within `path_hash_causes`)
         are not run here, and therefore do not count against this budget.
         Only their shared future is awaited.
@@ -240,11 +314,10 @@ async def gather_hashes(
         The new hash of every path in `path_hash_causes`, keyed by path, in input order.
         A path whose hash could not be computed (e.g. a directory used as a file, or a `stat` error)
         is **absent** from the result:
-        `Executor.run_hash_job` has already reported the error and drained the scheduler,
+        `Executor.run_hash_batch` has already reported the error and drained the scheduler,
         and neither caller (startup nor watcher) can do anything with that path,
         so raising here would only take down the director over one bad file.
     """
-    sem = asyncio.Semaphore(njob)
     ntotal = len(path_hash_causes)
     nsuccess = 0
     counts_flush_handle: asyncio.TimerHandle | None = None
@@ -268,15 +341,17 @@ async def gather_hashes(
         counts_flush_tasks.add(task)
         task.add_done_callback(counts_flush_tasks.discard)
 
-    async def run_one(job: HashJob) -> FileHash | None:
+    async def run_batches() -> None:
+        # All runners share the `claimed` generator, so each job ends up in exactly one batch.
+        while (batch := _collect_batch(claimed)) is not None:
+            await executor.run_hash_batch(batch)
+
+    async def await_one(job: HashJob) -> FileHash | None:
         nonlocal nsuccess
-        if hash_queue.claim(job):
-            async with sem:
-                await executor.run_hash_job(job)
         try:
             new_hash = await asyncio.shield(job.future)
         except Exception:  # noqa: BLE001
-            # Already reported by `Executor.run_hash_job`, which also drained the scheduler.
+            # Already reported by `Executor.run_hash_batch`, which also drained the scheduler.
             # Dropping the path from the result is what keeps one unhashable file
             # from aborting the whole startup scan or watch cycle.
             # A cancelled job raises `CancelledError`,
@@ -287,7 +362,13 @@ async def gather_hashes(
         return new_hash
 
     jobs = [hash_queue.submit(path, old_hash, cause) for path, old_hash, cause in path_hash_causes]
-    new_hashes = await asyncio.gather(*(run_one(job) for job in jobs))
+    # Jobs are claimed lazily, when a runner is about to hash them,
+    # so a promoted runner may still take over one that is not batched yet.
+    claimed = (job for job in jobs if hash_queue.claim(job))
+    results = await asyncio.gather(
+        *(run_batches() for _ in range(njob)), *(await_one(job) for job in jobs)
+    )
+    new_hashes = results[njob:]
 
     if counts_flush_handle is not None:
         counts_flush_handle.cancel()
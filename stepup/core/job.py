@@ -46,9 +46,10 @@ def append_joblog_record(event: str, job_i: int, description: str) -> None:
     Parameters
     ----------
     event
-        The kind of event, e.g. `"CREATED"`, `"STARTED"`, `"ENDED"`, `"COMPLETED"`.
+        The kind of event, e.g. `"CREATED"`, `"STARTED"`, `"ENDED"`, `"COMPLETED"`,
+        or `"NJOB"` when the number of concurrent jobs changes.
     job_i
-        The unique job identifier.
+        The unique job identifier, or 0 for events not related to a job.
     description
         A human-readable description of the job or step, truncated to 100 characters.
 
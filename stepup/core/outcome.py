@@ -2,17 +2,28 @@
 # SPDX-License-Identifier: LGPL-3.0-or-later
 """Outcome and resource usage of a child process."""
 
+import sys
+
 import attrs
 
 __all__ = (
     "ChildOutcome",
     "ResourceUsage",
+    "maxrss_mib",
 )
 
 
+def maxrss_mib(ru_maxrss: int) -> float:
+    """Convert the `ru_maxrss` field of `resource.getrusage()` or `os.wait4()` to MiB.
+
+    The field is reported in kibibytes on Linux, but in bytes on macOS.
+    """
+    return ru_maxrss / 1024 if sys.platform == "linux" else ru_maxrss / 1024**2
+
+
 @attrs.define(frozen=True)
 class ResourceUsage:
-    """CPU and wall time consumed by one process (or a process and its children)."""
+    """CPU time, wall time and peak memory of one process (or a process and its children)."""
 
     utime: float = attrs.field(default=0.0)
     """User CPU time [s]."""
@@ -23,12 +34,20 @@ class ResourceUsage:
     wtime: float = attrs.field(default=0.0)
     """Wall-clock time [s]."""
 
+    maxrss: float = attrs.field(default=0.0)
+    """Peak resident set size [MiB].
+
+    For a process and its children, this is the largest peak of any single process,
+    not the peak of their sum, because the kernel does not track the latter.
+    """
+
     def __add__(self, other: "ResourceUsage") -> "ResourceUsage":
         """Combine the resource usage of two processes.
 
         The CPU times are added up, while the wall times are combined with `max`,
         because the two processes may have run concurrently,
         in which case the sum of their wall times is not the duration of anything.
+        The peak memory is combined with `max` as well, like `ru_maxrss` of the kernel.
 
         Returns
         -------
@@ -39,6 +58,7 @@ class ResourceUsage:
             utime=self.utime + other.utime,
             stime=self.stime + other.stime,
             wtime=max(self.wtime, other.wtime),
+            maxrss=max(self.maxrss, other.maxrss),
         )
 
     @classmethod
@@ -68,13 +88,17 @@ class ResourceUsage:
         -------
         usage
             The resource usage consumed between the two snapshots.
+            The peak memory cannot be taken as a difference:
+            it is the peak of the process or any of its children up to the end snapshot,
+            so it includes memory in use before the start snapshot.
         """
         utime = ru_self_end.ru_utime - ru_self_start.ru_utime
         stime = ru_self_end.ru_stime - ru_self_start.ru_stime
         utime += ru_children_end.ru_utime - ru_children_start.ru_utime
         stime += ru_children_end.ru_stime - ru_children_start.ru_stime
         wtime = wtime_end - wtime_start
-        return cls(utime=utime, stime=stime, wtime=wtime)
+        maxrss = maxrss_mib(max(ru_self_end.ru_maxrss, ru_children_end.ru_maxrss))
+        return cls(utime=utime, stime=stime, wtime=wtime, maxrss=maxrss)
 
 
 @attrs.define(frozen=True)
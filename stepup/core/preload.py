@@ -0,0 +1,160 @@
+# SPDX-FileCopyrightText: 2024 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Check modules before they are pre-loaded into the forkserver.
+
+Python steps are forked from the forkserver,
+so modules imported there once are available to every step at no cost.
+Not every module is safe to import before a fork, though:
+
+- Threads started at import time do not survive the fork,
+  and a lock held by such a thread at the time of the fork stays locked forever in the child.
+- Sockets opened at import time (e.g. a database or server connection)
+  would be shared by all steps forked from the server.
+
+The multiprocessing forkserver also silently ignores modules that fail to import.
+`probe_preload_modules()` therefore imports the modules in a separate interpreter,
+in the same order as the forkserver would,
+and reports for each module its import time, import error, new threads and new sockets.
+Only threads known to the `threading` module are detected:
+native thread pools, e.g. of a BLAS library, are not,
+but such libraries usually handle a fork themselves.
+Sockets are only detected on Linux, where `/proc/self/fd` exists.
+"""
+
+import json
+import subprocess
+import sys
+
+import attrs
+
+__all__ = ("PreloadReport", "parse_preload_modules", "probe_preload_modules")
+
+
+PRELOAD_PROBE = """\
+import json
+import os
+import sys
+import threading
+import time
+
+
+def count_sockets():
+    try:
+        names = os.listdir("/proc/self/fd")
+    except OSError:
+        return 0
+    count = 0
+    for name in names:
+        try:
+            count += os.readlink(f"/proc/self/fd/{name}").startswith("socket:")
+        except OSError:
+            pass
+    return count
+
+
+reports = []
+threads = {thread.ident for thread in threading.enumerate()}
+nsocket = count_sockets()
+for module in sys.argv[1:]:
+    start = time.perf_counter()
+    try:
+        __import__(module)
+    except BaseException as exc:
+        error = f"{type(exc).__name__}: {exc}"
+    else:
+        error = None
+    import_time = time.perf_counter() - start
+    new_threads = [thread for thread in threading.enumerate() if thread.ident not in threads]
+    threads.update(thread.ident for thread in new_threads)
+    new_nsocket = count_sockets()
+    reports.append(
+        {
+            "module": module,
+            "import_time": import_time,
+            "error": error,
+            "threads": sorted(thread.name for thread in new_threads),
+            "nsocket": max(0, new_nsocket - nsocket),
+        }
+    )
+    nsocket = new_nsocket
+# The leading newline puts the report on a line of its own,
+# even when an imported module printed something without a trailing newline.
+print("\\n" + json.dumps(reports))
+"""
+
+
+@attrs.define(frozen=True)
+class PreloadReport:
+    """What the import of one module did, in a fresh interpreter."""
+
+    module: str = attrs.field()
+    """The name of the imported module."""
+
+    import_time: float = attrs.field()
+    """The wall time of the import [s], including the modules it imported for the first time."""
+
+    error: str | None = attrs.field(default=None)
+    """A description of the exception raised by the import, or `None` if it succeeded."""
+
+    threads: list[str] = attrs.field(factory=list)
+    """The names of the threads started by the import."""
+
+    nsocket: int = attrs.field(default=0)
+    """The number of sockets left open by the import."""
+
+    @property
+    def problem(self) -> str | None:
+        """The reason why the module should not be pre-loaded, or `None` if it is safe."""
+        if self.error is not None:
+            return f"import failed ({self.error})"
+        if len(self.threads) > 0:
+            return f"it starts threads ({', '.join(self.threads)})"
+        if self.nsocket > 0:
+            return f"it opens {self.nsocket} socket(s)"
+        return None
+
+
+def parse_preload_modules(value: str | None) -> list[str]:
+    """Split the comma-separated `preload_modules` setting into module names."""
+    if value is None:
+        return []
+    return [module.strip() for module in value.split(",") if module.strip() != ""]
+
+
+def probe_preload_modules(
+    modules: list[str], env: dict[str, str] | None = None
+) -> list[PreloadReport]:
+    """Import modules in a fresh interpreter and report what each import did.
+
+    Parameters
+    ----------
+    modules
+        The modules to import, in the order in which the forkserver imports them.
+    env
+        The environment variables of the interpreter, by default those of the current process.
+
+    Returns
+    -------
+    reports
+        One report per module, in the same order.
+        A module whose import had side effects (threads, sockets)
+        is blamed for them, even if they were caused by a module it imported.
+
+    Raises
+    ------
+    subprocess.CalledProcessError
+        When the probe itself crashed, e.g. because an import killed the interpreter.
+    """
+    if len(modules) == 0:
+        return []
+    cp = subprocess.run(
+        [sys.executable, "-c", PRELOAD_PROBE, *modules],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=env,
+        stdin=subprocess.DEVNULL,
+    )
+    # The probe prints its JSON report on the last line,
+    # after anything the imported modules may have printed.
+    return [PreloadReport(**report) for report in json.loads(cp.stdout.splitlines()[-1])]
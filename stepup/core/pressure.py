@@ -0,0 +1,184 @@
+# SPDX-FileCopyrightText: 2024 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Adapt the number of concurrent jobs to the pressure stall information (PSI) of Linux.
+
+The kernel reports, for the CPU, IO and memory,
+the cumulative time during which at least one task was stalled waiting for that resource.
+When the fraction of stalled time rises, e.g. because other users started work on a shared node,
+`AdaptiveJobs` lowers the number of concurrent jobs of the builder.
+When the pressure is low again, it raises the number one step at a time,
+up to the value of `--jobs`.
+"""
+
+import asyncio
+import contextlib
+import logging
+import time
+from collections.abc import Awaitable, Callable
+
+import attrs
+from path import Path
+
+from .cgroups import find_pressure_files
+
+__all__ = ("AdaptiveJobs", "read_pressure_total")
+
+
+logger = logging.getLogger(__name__)
+
+
+PRESSURE_INTERVAL = 2.0
+"""Time between two samples of the pressure files [s]."""
+
+PRESSURE_HIGH = 0.3
+"""Stall fraction above which the number of concurrent jobs is lowered."""
+
+PRESSURE_LOW = 0.1
+"""Stall fraction below which the number of concurrent jobs is raised."""
+
+
+def read_pressure_total(path: Path) -> int:
+    """Read the cumulative stall time from the `some` line of a pressure file.
+
+    Parameters
+    ----------
+    path
+        A pressure file, e.g. `/proc/pressure/cpu` or `cpu.pressure` in a cgroup.
+
+    Returns
+    -------
+    total
+        The total time during which at least one task was stalled [µs].
+
+    Raises
+    ------
+    OSError
+        If the file cannot be read.
+    ValueError
+        If the file has no `some` line with a `total` field.
+    """
+    with open(path) as fh:
+        for line in fh:
+            words = line.split()
+            if len(words) > 0 and words[0] == "some":
+                for word in words[1:]:
+                    key, _, value = word.partition("=")
+                    if key == "total":
+                        return int(value)
+    raise ValueError(f"No total stall time in {path}.")
+
+
+@attrs.define
+class AdaptiveJobs:
+    """Lower or raise the number of concurrent jobs, based on the pressure of CPU, IO and memory.
+
+    The largest stall fraction of the three resources, measured between two samples,
+    drives a simple controller:
+    above `PRESSURE_HIGH`, the number of jobs is reduced by a quarter (at least one),
+    below `PRESSURE_LOW`, it is increased by one,
+    and in between, it is left unchanged.
+    The number of jobs always stays within `[njob_min, njob_max]`.
+    """
+
+    njob_min: int = attrs.field()
+    """The lowest number of concurrent jobs."""
+
+    njob_max: int = attrs.field()
+    """The highest number of concurrent jobs, i.e. the value of `--jobs`."""
+
+    paths: dict[str, Path] = attrs.field(factory=find_pressure_files)
+    """The pressure file of each resource.
+
+    Defaults to the files detected by `find_pressure_files()`,
+    which raises `CgroupError` if pressure stall information is unavailable.
+    """
+
+    interval: float = attrs.field(default=PRESSURE_INTERVAL)
+    """Sampling period [s]."""
+
+    njob: int = attrs.field(init=False)
+    """The current number of concurrent jobs, starting at `njob_max`."""
+
+    @njob.default
+    def _default_njob(self) -> int:
+        return self.njob_max
+
+    _last_totals: dict[str, int] | None = attrs.field(init=False, default=None)
+    """The cumulative stall times of the previous sample [µs]."""
+
+    _last_time: float = attrs.field(init=False, default=0.0)
+    """The monotonic time of the previous sample [s]."""
+
+    def __attrs_post_init__(self):
+        if self.njob_min < 1:
+            raise ValueError(
+                f"Minimum number of jobs must be strictly positive, got {self.njob_min}"
+            )
+        if self.njob_min > self.njob_max:
+            raise ValueError(
+                f"Minimum number of jobs ({self.njob_min}) exceeds the maximum ({self.njob_max})"
+            )
+
+    def sample(self, now: float | None = None) -> float | None:
+        """Read the pressure files and return the largest stall fraction since the last sample.
+
+        Parameters
+        ----------
+        now
+            The current monotonic time [s], by default `time.monotonic()`.
+
+        Returns
+        -------
+        stall
+            The largest fraction of time, over all resources, during which tasks were stalled,
+            or `None` for the first sample, or if a pressure file could not be read.
+        """
+        if now is None:
+            now = time.monotonic()
+        try:
+            totals = {name: read_pressure_total(path) for name, path in self.paths.items()}
+        except (OSError, ValueError):
+            logger.exception("Failed to read pressure stall information")
+            return None
+        last_totals, last_time = self._last_totals, self._last_time
+        self._last_totals, self._last_time = totals, now
+        if last_totals is None or now <= last_time:
+            return None
+        return max(
+            (totals[name] - last_totals[name]) / ((now - last_time) * 1e6) for name in totals
+        )
+
+    def update(self, stall: float) -> bool:
+        """Adjust `njob` to a measured stall fraction.
+
+        Returns
+        -------
+        changed
+            `True` if `njob` was changed.
+        """
+        njob = self.njob
+        if stall > PRESSURE_HIGH:
+            njob = max(self.njob_min, njob - max(1, njob // 4))
+        elif stall < PRESSURE_LOW:
+            njob = min(self.njob_max, njob + 1)
+        changed = njob != self.njob
+        self.njob = njob
+        return changed
+
+    async def loop(self, set_njob: Callable[[int], Awaitable[None]], stop_event: asyncio.Event):
+        """Sample the pressure periodically until `stop_event` is set.
+
+        Parameters
+        ----------
+        set_njob
+            Called with the new number of concurrent jobs, every time it changes.
+        stop_event
+            Set to stop the loop.
+        """
+        while not stop_event.is_set():
+            stall = self.sample()
+            if stall is not None and self.update(stall):
+                logger.info("Stall fraction %.3f: %d concurrent jobs", stall, self.njob)
+                await set_njob(self.njob)
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(stop_event.wait(), timeout=self.interval)
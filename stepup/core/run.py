@@ -7,12 +7,14 @@ Also defines `Worker`, the base class for the in-flight work of a `Run` that can
 
 import asyncio
 import atexit
+import concurrent.futures
 import contextlib
 import functools
 import importlib
 import io
 import logging
 import multiprocessing
+import multiprocessing.connection
 import os
 import resource
 import runpy
@@ -21,6 +23,7 @@ import shutil
 import signal
 import subprocess
 import sys
+import tempfile
 import threading
 import time
 from collections.abc import Callable
@@ -30,21 +33,25 @@ from typing import Any
 import attrs
 from path import Path
 
-from .api import amend
-from .asyncio import wait_for_readable_fd
+from .api import _clear_amend_history, amend
+from .asyncio import wait_for_readable_fd, wait_for_writable_fd
+from .call import capture_driver, run_case
 from .exceptions import RunError
 from .extapi import get_local_import_paths
-from .outcome import ChildOutcome, ResourceUsage
+from .outcome import ChildOutcome, ResourceUsage, maxrss_mib
+from .spawner import Spawner
 from .step import Step
 from .tracebacks import print_step_traceback
 from .utils import escape_control_chars
 
 __all__ = (
+    "CallWorkerPool",
     "ForkserverWorker",
     "Run",
     "SubprocessWorker",
     "ThreadWorker",
     "Worker",
+    "is_call_command",
     "launch_command",
 )
 
@@ -111,7 +118,7 @@ class Worker:
 
 @attrs.define
 class ThreadWorker(Worker):
-    """A computation running in a dedicated thread.
+    """A computation running in a thread of a (shared) thread pool.
 
     Computationally intensive work must be designed to release the GIL.
     Threads should never be used for client-specific commands.
@@ -120,36 +127,33 @@ class ThreadWorker(Worker):
     work: Callable[[threading.Event], Any] = attrs.field(kw_only=True)
     """The callable to run in the thread, which can be cancelled by a `threading.Event`."""
 
+    pool: concurrent.futures.Executor | None = attrs.field(kw_only=True, default=None)
+    """The thread pool in which `work` runs.
+
+    `None` means the default executor of the running event loop.
+    The `Executor` passes its own bounded hash pool,
+    so that the number of hashing threads does not grow with the number of concurrent jobs.
+    """
+
     # Internal state
 
     _cancel_event: threading.Event = attrs.field(init=False, factory=threading.Event)
     """The event that tells the thread to stop at the next opportunity."""
 
-    _loop: asyncio.AbstractEventLoop = attrs.field(init=False)
-    """The event loop that created this thread, used to resolve the future."""
-
-    _future: asyncio.Future = attrs.field(init=False)
-    """The future that will be resolved with the result of `work` or its exception."""
-
-    _thread: threading.Thread = attrs.field(init=False)
-    """The dedicated thread that runs `work`."""
-
-    def __attrs_post_init__(self):
-        self._loop = asyncio.get_running_loop()
-        self._future = self._loop.create_future()
-        self._thread = threading.Thread(target=self._run, daemon=True)
-
     async def run_in_thread(self) -> Any:
-        """Start the thread, wait for its result and return it, re-raising its exception."""
-        self._thread.start()
+        """Run `work` in the pool, wait for its result and return it, re-raising its exception."""
+        future = asyncio.get_running_loop().run_in_executor(
+            self.pool, self.work, self._cancel_event
+        )
         try:
-            return await self._future
+            return await asyncio.shield(future)
         finally:
             self._cancel_event.set()
-            # Try to join without waiting, or join in a thread pool if needed.
-            self._thread.join(timeout=0)
-            if self._thread.is_alive():
-                await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+            # When the surrounding task is cancelled, `work` must still finish
+            # before the job is considered stopped, as with a process worker.
+            # Work that has not started yet returns at its first cancellation check.
+            # `asyncio.wait` does not raise, and `shield` marks a late exception as retrieved.
+            await asyncio.wait([future])
 
     def interrupt(self, sig: int) -> None:
         logger.info("Cancelling background compute thread for job %d", self.job_i)
@@ -168,29 +172,6 @@ class ThreadWorker(Worker):
         See `suspend` docstring for details.
         """
 
-    def _run(self) -> None:
-        try:
-            outcome, error = self.work(self._cancel_event), None
-        except BaseException as exc:  # noqa: BLE001
-            outcome, error = None, exc
-        # The loop is guaranteed to still be running:
-        # `run_in_thread` joins this thread in its `finally` clause
-        # before the coroutine (and thus the loop) can wind down.
-        # Suppressing `RuntimeError` is cheap insurance against abnormal loop teardown.
-        with contextlib.suppress(RuntimeError):
-            self._loop.call_soon_threadsafe(self._resolve, outcome, error)
-
-    def _resolve(self, outcome: Any, error: BaseException | None) -> None:
-        # The future may already be cancelled
-        # if the surrounding asyncio task was cancelled independently;
-        # `set_result`/`set_exception` would then raise `InvalidStateError`.
-        if self._future.done():
-            return
-        if error is None:
-            self._future.set_result(outcome)
-        else:
-            self._future.set_exception(error)
-
 
 #
 # Worker classes for the child process launched by a step
@@ -202,7 +183,7 @@ def _signal_process_group(pid: int, sig: int) -> None:
 
     Every step runs in a session of its own:
     `start_new_session=True` for subprocesses, `os.setsid()` at the top of
-    `_forkserver_entry` for forkserver children.
+    `_forkserver_entry` and `_call_worker_entry` for forkserver children.
     This makes the pid of the process StepUp started double as its process group id,
     and signalling that group (instead of just the one process) is what reaches the actual
     work when a step is a shell command whose pipeline or `&&`-chain keeps the shell around
@@ -238,14 +219,15 @@ def _signal_process_group(pid: int, sig: int) -> None:
 class SubprocessWorker(Worker):
     """A running subprocess (shell command or direct exec)."""
 
-    proc: subprocess.Popen = attrs.field()
-    """The subprocess to signal."""
+    pid: int = attrs.field()
+    """The pid of the subprocess to signal,
+    which may have been started by the director or by the spawn helper."""
 
     def _describe(self) -> str:
-        return f"subprocess {self.proc.pid!r}"
+        return f"subprocess {self.pid!r}"
 
     def _signal(self, sig: int) -> None:
-        _signal_process_group(self.proc.pid, sig)
+        _signal_process_group(self.pid, sig)
 
 
 @attrs.define
@@ -520,30 +502,42 @@ def _detect_python_entrypoint(cmd: str) -> tuple[str | None, str]:
 #
 
 
-def _start_drain(read_all: Callable[[], bytes]) -> Callable[[], bytes]:
-    """Start a daemon thread that calls `read_all`, which blocks until EOF.
+MAX_CAPTURE_SIZE = 1024**2
+"""The maximum number of bytes of a step's standard output or error kept in memory.
+
+Larger output is reduced to its first and last `MAX_CAPTURE_SIZE // 2` bytes.
+"""
 
-    Returns a callable that joins the thread and returns the bytes it read.
-    Isolates the "read on a background thread, join later" pattern
-    shared by `_communicate_wait4` and `_redirect_os_fds`.
-    Both dodge a pipe-full deadlock this way:
-    a writer end of the pipe stays open elsewhere (in this process or a child one)
-    while the thread drains the corresponding reader end.
-    """
-    result = b""
 
-    def _run() -> None:
-        nonlocal result
-        result = read_all()
+def _open_spool(spool_dir: str | None) -> io.BufferedRandom:
+    """Open an anonymous spool file for a step's standard output or error.
+
+    The file has no name, so nothing is left behind when the step or the director is killed.
+
+    Parameters
+    ----------
+    spool_dir
+        The directory holding the spool file, normally `.stepup/spool/`,
+        or `None` for the default temporary directory.
+    """
+    return tempfile.TemporaryFile(dir=spool_dir)
 
-    thread = threading.Thread(target=_run, daemon=True)
-    thread.start()
 
-    def join() -> bytes:
-        thread.join()
-        return result
+def _read_spool(spool: io.BufferedRandom) -> str:
+    """Return the decoded contents of a spool file, limited to `MAX_CAPTURE_SIZE` bytes.
 
-    return join
+    When the file is larger, its head and tail are kept,
+    with a line in between telling how many bytes were omitted.
+    This keeps the memory used by the director (and the size of the `ChildOutcome`
+    sent back by a forkserver child) independent of how much output a step produces.
+    """
+    size = os.fstat(spool.fileno()).st_size
+    if size <= MAX_CAPTURE_SIZE:
+        return _decode(os.pread(spool.fileno(), size, 0))
+    half = MAX_CAPTURE_SIZE // 2
+    head = _decode(os.pread(spool.fileno(), half, 0))
+    tail = _decode(os.pread(spool.fileno(), half, size - half))
+    return f"{head}\n[{size - 2 * half} bytes of output omitted]\n{tail}"
 
 
 def _decode(data: bytes) -> str:
@@ -555,77 +549,191 @@ def _decode(data: bytes) -> str:
 #
 
 
-def _communicate_wait4(
-    proc: subprocess.Popen, stdin_data: bytes | None, wtime_start: float
-) -> tuple[bytes, bytes, ResourceUsage]:
-    """Communicate with `proc` and return `(stdout, stderr, usage)`.
+async def _write_pipe(pipe: io.BufferedWriter, data: bytes) -> None:
+    """Write `data` to the stdin pipe of a subprocess and close it.
 
-    Reads stdout and stderr concurrently in threads to avoid a pipe-full deadlock,
-    then calls `os.wait4` to reap the child and capture its individual CPU usage.
+    A child exiting without reading all of its input is not an error.
     """
-    stdout_join = _start_drain(proc.stdout.read) if proc.stdout is not None else None
-    stderr_join = _start_drain(proc.stderr.read) if proc.stderr is not None else None
+    fd = pipe.fileno()
+    view = memoryview(data)
+    try:
+        os.set_blocking(fd, False)
+        while len(view) > 0:
+            try:
+                view = view[os.write(fd, view) :]
+            except BlockingIOError:
+                await wait_for_writable_fd(fd)
+    except BrokenPipeError:
+        pass
+    finally:
+        pipe.close()
 
-    if stdin_data is not None and proc.stdin is not None:
-        try:
-            proc.stdin.write(stdin_data)
-        except BrokenPipeError:
-            pass
-        finally:
-            proc.stdin.close()
 
-    stdout = stdout_join() if stdout_join is not None else b""
-    stderr = stderr_join() if stderr_join is not None else b""
+async def _wait4(pid: int) -> tuple[int, resource.struct_rusage]:
+    """Reap the child `pid` and return its wait status and resource usage.
 
-    _, status, rusage = os.wait4(proc.pid, 0)
-    proc.returncode = os.waitstatus_to_exitcode(status)
+    On Linux, a `pidfd` of the child becomes readable in the event loop when it exits,
+    after which `os.wait4` with `WNOHANG` reaps it without blocking.
+    Where `os.pidfd_open` is not available (macOS, Linux before 5.3),
+    a blocking `os.wait4` is offloaded to the default thread-pool executor instead.
+    """
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        loop = asyncio.get_running_loop()
+        _, status, rusage = await loop.run_in_executor(None, os.wait4, pid, 0)
+        return status, rusage
+    try:
+        while True:
+            wpid, status, rusage = os.wait4(pid, os.WNOHANG)
+            if wpid != 0:
+                return status, rusage
+            await wait_for_readable_fd(pidfd)
+    finally:
+        os.close(pidfd)
+
+
+async def _communicate_wait4(
+    pid: int,
+    stdin: io.BufferedWriter | None,
+    stdin_data: bytes | None,
+    wtime_start: float,
+    spawner: Spawner | None = None,
+) -> tuple[int, ResourceUsage]:
+    """Feed `stdin_data` to the child `pid`, reap it and return its exit code and resource usage.
+
+    Writing stdin and waiting for the child are both handled by the event loop,
+    and `os.wait4` captures the individual CPU and memory usage of the child.
+    The director therefore needs no threads per running subprocess,
+    so its thread count does not grow with the number of concurrent jobs.
+    When the child was started by `spawner`, it is reaped by the spawn helper instead.
+    """
+    if stdin_data is not None and stdin is not None:
+        await _write_pipe(stdin, stdin_data)
+    status, rusage = await (_wait4(pid) if spawner is None else spawner.wait4(pid))
     usage = ResourceUsage(
         utime=rusage.ru_utime,
         stime=rusage.ru_stime,
         wtime=time.perf_counter() - wtime_start,
+        maxrss=maxrss_mib(rusage.ru_maxrss),
     )
-    return stdout, stderr, usage
+    return os.waitstatus_to_exitcode(status), usage
+
+
+async def _launch_spawned(
+    spawner: Spawner,
+    cmd,
+    *,
+    shell: bool,
+    env: dict,
+    cwd: Path,
+    stdin_data: bytes | None,
+    stdout_spool: io.BufferedRandom,
+    stderr_spool: io.BufferedRandom,
+) -> tuple[int, io.BufferedWriter | None]:
+    """Start `cmd` through the spawn helper.
+
+    Returns
+    -------
+    pid
+        The process id of the child.
+    stdin
+        The pipe to write `stdin_data` to, or `None` when `stdin_data` is `None`.
+    """
+    if stdin_data is None:
+        stdin_r = os.open(os.devnull, os.O_RDONLY)
+        stdin_w = None
+    else:
+        stdin_r, stdin_w = os.pipe()
+    try:
+        pid = await spawner.launch(
+            cmd,
+            shell=shell,
+            env=env,
+            cwd=str(cwd),
+            fds=(stdin_r, stdout_spool.fileno(), stderr_spool.fileno()),
+        )
+    except BaseException:
+        if stdin_w is not None:
+            os.close(stdin_w)
+        raise
+    finally:
+        os.close(stdin_r)
+    return pid, (None if stdin_w is None else open(stdin_w, "wb", buffering=0))
 
 
 async def _exec_subprocess(
-    cmd, *, shell: bool, env: dict, cwd: Path, stdin_data: bytes | None, run: Run
+    cmd,
+    *,
+    shell: bool,
+    env: dict,
+    cwd: Path,
+    stdin_data: bytes | None,
+    spool_dir: str | None,
+    run: Run,
+    spawner: Spawner | None = None,
 ) -> ChildOutcome:
     """Run `cmd` as a subprocess and return a `ChildOutcome`.
 
-    The process is created synchronously
-    so that `run.worker` can be set immediately for interrupts.
-    Blocking I/O and the `os.wait4` reap are offloaded to a thread-pool executor
-    so the event loop stays responsive.
+    The process is created synchronously, or by the spawn helper when `spawner` is given,
+    so that `run.worker` can be set as soon as its pid is known, for interrupts.
+    When the spawn helper cannot be reached, the process is created directly instead.
+    Its standard output and error are written directly to spool files,
+    of which only a bounded head and tail are read back, see `_read_spool`.
 
     Using `subprocess.Popen` (rather than `asyncio.create_subprocess_*`)
     means asyncio's child watcher never registers this PID,
     so the `os.wait4` call captures per-process CPU time without racing against the watcher.
+    When cancelled, the child is left to `subprocess.Popen` or the spawn helper,
+    which reaps it later.
     """
-    stdin = subprocess.PIPE if stdin_data is not None else subprocess.DEVNULL
-    wtime_start = time.perf_counter()
-    try:
-        proc = subprocess.Popen(
-            cmd,
-            shell=shell,
-            stdin=stdin,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            env=env,
-            cwd=cwd,
-            # Put the step in its own session; see `_signal_process_group`.
-            start_new_session=True,
-        )
-    except OSError as exc:
-        return ChildOutcome(1, "", f"Failed to launch command {cmd!r}: {exc}\n")
-    run.worker = SubprocessWorker(proc, job_i=run.job_i)
-    try:
-        loop = asyncio.get_running_loop()
-        stdout, stderr, usage = await loop.run_in_executor(
-            None, _communicate_wait4, proc, stdin_data, wtime_start
-        )
-    finally:
-        run.worker = None
-    return ChildOutcome(proc.returncode, _decode(stdout), _decode(stderr), usage)
+    with _open_spool(spool_dir) as stdout_spool, _open_spool(spool_dir) as stderr_spool:
+        wtime_start = time.perf_counter()
+        pid = None
+        if spawner is not None:
+            try:
+                pid, stdin = await _launch_spawned(
+                    spawner,
+                    cmd,
+                    shell=shell,
+                    env=env,
+                    cwd=cwd,
+                    stdin_data=stdin_data,
+                    stdout_spool=stdout_spool,
+                    stderr_spool=stderr_spool,
+                )
+            except ConnectionError:
+                # The helper is gone: fall back to creating the process here.
+                spawner = None
+            except OSError as exc:
+                return ChildOutcome(1, "", str(exc))
+        if pid is None:
+            try:
+                proc = subprocess.Popen(
+                    cmd,
+                    shell=shell,
+                    stdin=subprocess.PIPE if stdin_data is not None else subprocess.DEVNULL,
+                    stdout=stdout_spool,
+                    stderr=stderr_spool,
+                    env=env,
+                    cwd=cwd,
+                    # Put the step in its own session; see `_signal_process_group`.
+                    start_new_session=True,
+                )
+            except OSError as exc:
+                return ChildOutcome(1, "", f"Failed to launch command {cmd!r}: {exc}\n")
+            pid, stdin = proc.pid, proc.stdin
+        run.worker = SubprocessWorker(pid, job_i=run.job_i)
+        try:
+            returncode, usage = await _communicate_wait4(
+                pid, stdin, stdin_data, wtime_start, spawner
+            )
+        finally:
+            run.worker = None
+        if spawner is None:
+            # Tell `subprocess` the process was reaped, so it never tries to reap it itself.
+            proc.returncode = returncode
+        return ChildOutcome(returncode, _read_spool(stdout_spool), _read_spool(stderr_spool), usage)
 
 
 async def _run_subprocess(
@@ -636,6 +744,8 @@ async def _run_subprocess(
     cwd: Path,
     run: Run,
     stdin_data: bytes | None = None,
+    spool_dir: str | None = None,
+    spawner: Spawner | None = None,
 ) -> ChildOutcome:
     """Run `cmd` as a subprocess with or without a shell."""
     first_arg = shlex.split(cmd)[0] if isinstance(cmd, str) else cmd[0]
@@ -643,7 +753,14 @@ async def _run_subprocess(
     if message is not None:
         return ChildOutcome(1, "", message + "\n")
     return await _exec_subprocess(
-        cmd, shell=shell, env=env, cwd=cwd, stdin_data=stdin_data, run=run
+        cmd,
+        shell=shell,
+        env=env,
+        cwd=cwd,
+        stdin_data=stdin_data,
+        spool_dir=spool_dir,
+        run=run,
+        spawner=spawner,
     )
 
 
@@ -730,97 +847,86 @@ async def _exec_in_forkserver(
 
 
 @contextlib.contextmanager
-def _redirect_os_fds(stdout_buf: io.StringIO, stderr_buf: io.StringIO):
-    """Capture OS-level fd 1/2 output (subprocesses, C extensions)
-    that a `sys.stdout` / `sys.stderr` `StringIO` redirect does not see.
-
-    Redirects fds 1 and 2 to pipes drained on background threads
-    for the duration of the `with` block,
-    then restores the original fds
-    and appends whatever the drain threads read to `stdout_buf` / `stderr_buf`.
-    Restoring (rather than closing) the original fds is what signals EOF to the drain threads,
-    which is what unblocks their join.
+def _redirect_os_fds(stdout_spool: io.BufferedRandom, stderr_spool: io.BufferedRandom):
+    """Redirect fds 1 and 2 to spool files for the duration of the `with` block.
+
+    Yields text streams writing to fds 1 and 2, to be used as `sys.stdout` / `sys.stderr`.
+    Output written directly to the fds (subprocesses, C extensions) and output written to
+    the streams thus end up in the same spool files.
+    The streams are line-buffered, so both kinds of output are mostly kept in order.
+    At the end of the `with` block, the streams are flushed and the original fds are restored.
     """
-    saved_out_fd = os.dup(1)
-    saved_err_fd = os.dup(2)
-    r_out, w_out = os.pipe()
-    r_err, w_err = os.pipe()
-    os.dup2(w_out, 1)
-    os.close(w_out)
-    os.dup2(w_err, 2)
-    os.close(w_err)
-
-    def _read_fd_to_eof(fd: int) -> bytes:
-        # Blocks until EOF, i.e. until every writer of this pipe end has closed it.
-        # Same semantics as `_communicate_wait4`:
-        # a step that leaves a daemon holding the inherited fd open
-        # will keep this thread (and the join that waits for it) waiting.
-        with os.fdopen(fd, "rb") as f:
-            return f.read()
-
-    join_stdout = _start_drain(functools.partial(_read_fd_to_eof, r_out))
-    join_stderr = _start_drain(functools.partial(_read_fd_to_eof, r_err))
+    saved_fds = [os.dup(1), os.dup(2)]
+    streams = []
     try:
-        yield
+        for fd, spool in (1, stdout_spool), (2, stderr_spool):
+            os.dup2(spool.fileno(), fd)
+            streams.append(
+                open(  # noqa: SIM115
+                    fd, "w", encoding="utf-8", errors="backslashreplace", buffering=1, closefd=False
+                )
+            )
+        yield tuple(streams)
     finally:
-        os.dup2(saved_out_fd, 1)
-        os.close(saved_out_fd)
-        os.dup2(saved_err_fd, 2)
-        os.close(saved_err_fd)
-        # Decode tolerantly: subprocesses may emit invalid UTF-8.
-        stdout_buf.write(_decode(join_stdout()))
-        stderr_buf.write(_decode(join_stderr()))
+        for stream in streams:
+            stream.flush()
+        for fd, saved_fd in zip((1, 2), saved_fds, strict=True):
+            os.dup2(saved_fd, fd)
+            os.close(saved_fd)
 
 
-def _forkserver_entry(
-    cmd: str,
-    args: list[str],
+def _call_entry_point(ep_value: str) -> None:
+    """Import and call a console_script entry point given as a `module:attr` string."""
+    module_name, attr_name = ep_value.split(":", 1)
+    func = getattr(importlib.import_module(module_name), attr_name)
+    func()
+
+
+def _run_step_in_process(
+    target: Callable[[], Any],
+    argv: list[str],
     env_snapshot: dict[str, str],
     workdir: str,
-    ep_value: str | None,
-    result_conn,
-) -> None:
-    """Run a Python script or console_script entry point in a forkserver child.
+    script: str | None,
+    spool_dir: str | None,
+) -> ChildOutcome:
+    """Run `target()` as a step in the current process, which is a forkserver child.
 
-    This function runs in a forked child process
-    and sends a `ChildOutcome` back via `result_conn`.
-    When `ep_value` is `None`, `cmd` is a Python script path run via `runpy.run_path`,
-    with local imports auto-detected and registered as dynamic inputs.
-    When `ep_value` is a `module:attr` string,
-    the corresponding console_script function is imported and called directly
-    without import tracking.
+    The environment, working directory and `sys.argv` of the process are replaced by those
+    of the step, and its output is written to spool files in `spool_dir`,
+    of which only a bounded head and tail are returned, see `_read_spool`.
+    When `script` is not `None`, it is the path of the Python script being run:
+    its directory is put first in `sys.path`
+    and its local imports are amended as dynamic inputs after `target()` returns.
+
+    Returns
+    -------
+    outcome
+        The `ChildOutcome` of the step, also when `target()` raised an exception.
     """
-    # Put the step in its own session; see `_signal_process_group`.
-    # This cannot fail: a freshly forked child is never a process group leader.
-    os.setsid()
     # Note that the time needed to start/stop the forkserver child is not counted,
     # which is a minor accepted discrepancy with the subprocess path.
     wtime_start = time.perf_counter()
-    stdout_buf = io.StringIO()
-    stderr_buf = io.StringIO()
+    stdout_spool = _open_spool(spool_dir)
+    stderr_spool = _open_spool(spool_dir)
     returncode = 0
     ru_self_start = resource.getrusage(resource.RUSAGE_SELF)
     ru_children_start = resource.getrusage(resource.RUSAGE_CHILDREN)
     # The inner try/except must run inside the `with` block,
-    # so that the fd restore and append (in the `with` block's teardown)
-    # happen after the traceback (if any) has already been written to `stderr_buf`, not before.
-    with _redirect_os_fds(stdout_buf, stderr_buf):
+    # so that the fd restore and flush (in the `with` block's teardown)
+    # happen after the traceback (if any) has already been written to `stderr`, not before.
+    with _redirect_os_fds(stdout_spool, stderr_spool) as (stdout, stderr):
         try:
             os.environ.clear()
             os.environ.update(env_snapshot)
             os.chdir(workdir)
-            sys.stdout = stdout_buf
-            sys.stderr = stderr_buf
-            sys.argv = [cmd, *args]
+            sys.stdout = stdout
+            sys.stderr = stderr
+            sys.argv = list(argv)
             try:
-                if ep_value is None:
-                    script_dir = str(Path(cmd).realpath().parent)
-                    sys.path[0] = script_dir
-                    runpy.run_path(cmd, run_name="__main__")
-                else:
-                    module_name, attr_name = ep_value.split(":", 1)
-                    func = getattr(importlib.import_module(module_name), attr_name)
-                    func()
+                if script is not None:
+                    sys.path[0] = str(Path(script).realpath().parent)
+                target()
             except SystemExit as exc:
                 returncode = (
                     exc.code if isinstance(exc.code, int) else (0 if exc.code is None else 1)
@@ -832,13 +938,15 @@ def _forkserver_entry(
                 # There is no public API for this in CPython;
                 # `_run_exitfuncs` is a stable private implementation detail,
                 # present in every CPython release from 2.0 to 3.14 (last checked 2026-08).
+                # It also clears the registered handlers,
+                # so a warm worker does not run them again for the next step.
                 with contextlib.suppress(AttributeError):
                     atexit._run_exitfuncs()
-                if ep_value is None:
+                if script is not None:
                     # This is the first call that connects to the director in this child.
                     # The connection must not be opened before the fork,
                     # which is why `get_rpc_client()` creates it lazily.
-                    amend(inp=get_local_import_paths(script_path=Path(cmd)))
+                    amend(inp=get_local_import_paths(script_path=Path(script)))
         except BaseException as exc:  # noqa: BLE001
             # All exceptions must be caught here,
             # to be able to send the corresponding output and return code
@@ -846,7 +954,7 @@ def _forkserver_entry(
             # Otherwise, the parent process would just see a connection error.
             # This path catches the exception itself, so `sys.excepthook` never runs
             # and the traceback shortening must be requested explicitly.
-            print_step_traceback(exc, stderr_buf)
+            print_step_traceback(exc, stderr)
             returncode = 1
         finally:
             # Snapshot in a `finally`:
@@ -859,7 +967,40 @@ def _forkserver_entry(
     usage = ResourceUsage.from_diff(
         ru_self_start, ru_self_end, ru_children_start, ru_children_end, wtime_start, wtime_end
     )
-    result_conn.send(ChildOutcome(returncode, stdout_buf.getvalue(), stderr_buf.getvalue(), usage))
+    with stdout_spool, stderr_spool:
+        return ChildOutcome(returncode, _read_spool(stdout_spool), _read_spool(stderr_spool), usage)
+
+
+def _forkserver_entry(
+    cmd: str,
+    args: list[str],
+    env_snapshot: dict[str, str],
+    workdir: str,
+    ep_value: str | None,
+    spool_dir: str | None,
+    result_conn,
+) -> None:
+    """Run a Python script or console_script entry point in a forkserver child.
+
+    This function runs in a forked child process
+    and sends a `ChildOutcome` back via `result_conn`.
+    When `ep_value` is `None`, `cmd` is a Python script path run via `runpy.run_path`,
+    with local imports auto-detected and registered as dynamic inputs.
+    When `ep_value` is a `module:attr` string,
+    the corresponding console_script function is imported and called directly
+    without import tracking.
+    """
+    # Put the step in its own session; see `_signal_process_group`.
+    # This cannot fail: a freshly forked child is never a process group leader.
+    os.setsid()
+    if ep_value is None:
+        target = functools.partial(runpy.run_path, cmd, run_name="__main__")
+    else:
+        target = functools.partial(_call_entry_point, ep_value)
+    outcome = _run_step_in_process(
+        target, [cmd, *args], env_snapshot, workdir, cmd if ep_value is None else None, spool_dir
+    )
+    result_conn.send(outcome)
 
 
 PYCODE_WRAPPER = """\
@@ -884,18 +1025,33 @@ async def _run_python_script(
     cwd: Path,
     mp_ctx: multiprocessing.context.BaseContext | None,
     run: Run,
+    spool_dir: str | None = None,
+    call_pool: "CallWorkerPool | None" = None,
+    spawner: Spawner | None = None,
 ) -> ChildOutcome:
-    """Run a Python script, amending its local imports as inputs."""
+    """Run a Python script, amending its local imports as inputs.
+
+    `call()` steps are sent to `call_pool` if it is not `None`, see `is_call_command`.
+    """
     message = _check_executable(cwd / Path(script), shebang="#!/usr/bin/env python3")
     if message is not None:
         return ChildOutcome(1, "", message + "\n")
+    if call_pool is not None and is_call_command([script, *args]):
+        return await call_pool.run(script, args, env, cwd, run, spool_dir)
     if mp_ctx is not None:
         return await _exec_in_forkserver(
-            mp_ctx, _forkserver_entry, (script, args, env, str(cwd), None), run
+            mp_ctx, _forkserver_entry, (script, args, env, str(cwd), None, spool_dir), run
         )
     wrapper = PYCODE_WRAPPER.format(argv=repr([script, *args]), script=repr(script))
     return await _run_subprocess(
-        [sys.executable, "-"], shell=False, env=env, cwd=cwd, run=run, stdin_data=wrapper.encode()
+        [sys.executable, "-"],
+        shell=False,
+        env=env,
+        cwd=cwd,
+        run=run,
+        stdin_data=wrapper.encode(),
+        spool_dir=spool_dir,
+        spawner=spawner,
     )
 
 
@@ -907,13 +1063,176 @@ async def _run_python_entrypoint(
     cwd: Path,
     mp_ctx: multiprocessing.context.BaseContext | None,
     run: Run,
+    spool_dir: str | None = None,
+    spawner: Spawner | None = None,
 ) -> ChildOutcome:
     """Run a Python console_script entry point, using the forkserver when available."""
     if mp_ctx is not None:
         return await _exec_in_forkserver(
-            mp_ctx, _forkserver_entry, (cmd, args, env, str(cwd), ep_value), run
+            mp_ctx, _forkserver_entry, (cmd, args, env, str(cwd), ep_value, spool_dir), run
         )
-    return await _run_subprocess([cmd, *args], shell=False, env=env, cwd=cwd, run=run)
+    return await _run_subprocess(
+        [cmd, *args], shell=False, env=env, cwd=cwd, run=run, spool_dir=spool_dir, spawner=spawner
+    )
+
+
+#
+# Warm workers for call() steps
+#
+
+
+def is_call_command(parts: list[str]) -> bool:
+    """Test whether a split command line is that of a `call()` step of a Python script.
+
+    `stepup.core.api.call` creates commands of the form `script.py func '{json}'`
+    or `script.py func --inp=file`, whose arguments `stepup.core.call.driver` dispatches.
+    """
+    return (
+        len(parts) == 3
+        and parts[0].endswith(".py")
+        and parts[1].isidentifier()
+        and (parts[2].startswith("{") or parts[2].startswith("--inp="))
+    )
+
+
+def _load_call_script(script: str, argv: list[str], loaded: list) -> None:
+    """Run a script as `__main__` and dispatch the first case with the namespace of `driver()`.
+
+    The pair `(script_path, namespace)` recorded by `driver()` is appended to `loaded`.
+    When the script does not call `driver()`, it just ran as usual and `loaded` stays empty.
+    """
+    with capture_driver() as captured:
+        runpy.run_path(script, run_name="__main__")
+    if len(captured) > 0:
+        loaded.append(captured[0])
+        run_case(*captured[0], argv[1:])
+
+
+def _call_worker_entry(script: str, conn) -> None:
+    """Run the `call()` steps of one Python script, one after the other, in a forkserver child.
+
+    Each case is received from `conn` as `(args, env_snapshot, workdir, spool_dir)`,
+    and `(outcome, reusable)` is sent back, where `outcome` is the `ChildOutcome` of the step.
+    `None` is received when the worker should exit.
+
+    The script is executed only for the first case.
+    Later cases call the requested function directly, in the namespace of the loaded script,
+    so module-level imports and definitions are paid only once.
+    Only the history of `amend()` calls is reset between cases:
+    other module-level state, including that of the script, is shared by all cases.
+    A script that does not call `driver()`, or fails to load, is not reusable:
+    the worker exits after the first case, as a normal forkserver child would.
+    """
+    # Put the steps in a session of their own; see `_signal_process_group`.
+    os.setsid()
+    loaded = []
+    while True:
+        case = conn.recv()
+        if case is None:
+            break
+        args, env_snapshot, workdir, spool_dir = case
+        argv = [script, *args]
+        # Every step must amend its own dynamic dependencies.
+        _clear_amend_history()
+        if len(loaded) == 0:
+            target = functools.partial(_load_call_script, script, argv, loaded)
+        else:
+            target = functools.partial(run_case, *loaded[0], args)
+        outcome = _run_step_in_process(target, argv, env_snapshot, workdir, script, spool_dir)
+        reusable = len(loaded) > 0
+        conn.send((outcome, reusable))
+        if not reusable:
+            break
+
+
+@attrs.define
+class CallWorker:
+    """A forkserver child running `_call_worker_entry`, as seen from the director."""
+
+    proc: multiprocessing.process.BaseProcess = attrs.field()
+    """The worker process."""
+
+    conn: multiprocessing.connection.Connection = attrs.field()
+    """The director's end of the duplex pipe to the worker."""
+
+    async def close(self, kill: bool = False) -> None:
+        """Wait for the worker to exit, after killing it if `kill` is set, and close the pipe."""
+        if kill:
+            with contextlib.suppress(ProcessLookupError):
+                _signal_process_group(self.proc.pid, signal.SIGKILL)
+        await _wait_proc(self.proc)
+        self.conn.close()
+
+
+@attrs.define
+class CallWorkerPool:
+    """Warm forkserver children that run the `call()` steps of Python scripts.
+
+    A worker is dedicated to one script in one working directory and serves its steps
+    one at a time, so concurrent steps of the same script each get a worker of their own.
+    Idle workers are kept until `close()` is called at the end of the build phase,
+    which ensures that every phase loads the current version of each script.
+    """
+
+    mp_ctx: multiprocessing.context.BaseContext = attrs.field()
+    """The forkserver multiprocessing context used to start workers."""
+
+    idle: dict[tuple[str, str], list[CallWorker]] = attrs.field(init=False, factory=dict)
+    """Idle workers, keyed by working directory and script."""
+
+    async def run(
+        self,
+        script: str,
+        args: list[str],
+        env: dict,
+        cwd: Path,
+        run: Run,
+        spool_dir: str | None = None,
+    ) -> ChildOutcome:
+        """Run one `call()` step in an idle worker of its script, or in a new one.
+
+        The parameters have the same meaning as in `launch_command`.
+        """
+        key = (str(cwd), script)
+        workers = self.idle.get(key)
+        if workers:
+            worker = workers.pop()
+        else:
+            parent_conn, child_conn = self.mp_ctx.Pipe()
+            proc = self.mp_ctx.Process(target=_call_worker_entry, args=(script, child_conn))
+            proc.start()
+            child_conn.close()
+            worker = CallWorker(proc, parent_conn)
+        run.worker = ForkserverWorker(worker.proc.pid, job_i=run.job_i)
+        result = None
+        try:
+            worker.conn.send((args, env, str(cwd), spool_dir))
+            result = await _recv_conn(worker.conn)
+        except (EOFError, OSError):
+            # The worker died before or while sending its result, see `_exec_in_forkserver`.
+            pass
+        finally:
+            run.worker = None
+            if result is None:
+                # Also reached when the step is cancelled, in which case the worker is still busy.
+                await worker.close(kill=True)
+        if result is None:
+            return _lost_child_outcome(worker.proc.exitcode)
+        outcome, reusable = result
+        if reusable:
+            self.idle.setdefault(key, []).append(worker)
+        else:
+            await worker.close()
+        return outcome
+
+    async def close(self) -> None:
+        """Stop all idle workers."""
+        workers = [worker for workers in self.idle.values() for worker in workers]
+        self.idle.clear()
+        for worker in workers:
+            with contextlib.suppress(OSError):
+                worker.conn.send(None)
+            await worker.close()
 
 
 #
@@ -929,6 +1248,9 @@ async def launch_command(
     cwd: Path,
     mp_ctx: multiprocessing.context.BaseContext | None,
     run: Run,
+    spool_dir: str | None = None,
+    call_pool: CallWorkerPool | None = None,
+    spawner: Spawner | None = None,
 ) -> ChildOutcome:
     """Launch a step's command and return its `ChildOutcome`.
 
@@ -951,6 +1273,14 @@ async def launch_command(
         The forkserver multiprocessing context, or `None` to use plain subprocesses.
     run
         The `Run` whose `worker` attribute is set to the launched child while it is in flight.
+    spool_dir
+        The directory for the spool files receiving the standard output and error of the child,
+        or `None` for the default temporary directory.
+    call_pool
+        Warm workers for `call()` steps of Python scripts, or `None` to run them like any script.
+    spawner
+        The spawn helper creating subprocesses on behalf of the director,
+        or `None` to create them in the director itself.
 
     Returns
     -------
@@ -966,17 +1296,25 @@ async def launch_command(
     if not parts:
         raise ValueError(f"Empty command: {command!r}")
     if shell:
-        return await _run_subprocess(command, shell=True, env=env, cwd=cwd, run=run)
+        return await _run_subprocess(
+            command, shell=True, env=env, cwd=cwd, run=run, spool_dir=spool_dir, spawner=spawner
+        )
     if parts[0].endswith(".py"):
-        return await _run_python_script(parts[0], parts[1:], env, cwd, mp_ctx, run)
+        return await _run_python_script(
+            parts[0], parts[1:], env, cwd, mp_ctx, run, spool_dir, call_pool, spawner
+        )
     try:
         ep_value, warning = _detect_python_entrypoint(parts[0])
     except RunError as exc:
         return ChildOutcome(1, "", str(exc) + "\n")
     if ep_value is None:
-        outcome = await _run_subprocess(parts, shell=False, env=env, cwd=cwd, run=run)
+        outcome = await _run_subprocess(
+            parts, shell=False, env=env, cwd=cwd, run=run, spool_dir=spool_dir, spawner=spawner
+        )
     else:
-        outcome = await _run_python_entrypoint(parts[0], parts[1:], ep_value, env, cwd, mp_ctx, run)
+        outcome = await _run_python_entrypoint(
+            parts[0], parts[1:], ep_value, env, cwd, mp_ctx, run, spool_dir, spawner
+        )
     if len(warning) > 0:
         outcome = attrs.evolve(outcome, stderr=warning + outcome.stderr)
     return outcome
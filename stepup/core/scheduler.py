@@ -2,7 +2,9 @@
 # SPDX-License-Identifier: LGPL-3.0-or-later
 """The `Scheduler` turns PENDING jobs into RUNNING jobs as the builder requests them."""
 
+import heapq
 import logging
+import math
 import time
 
 import attrs
@@ -14,8 +16,8 @@ from .hash import FileHash
 from .job import Job, RunJob, ValidateDynamicJob, append_joblog_record
 from .path import dir_range_upper
 from .sqlite3 import DBSession
-from .step import STEP_DISPATCH_WHERE, Step, unavailable_input_sql
-from .utils import parse_resources
+from .step import STEP_DISPATCH_WHERE, Step, duration_class_keys, unavailable_input_sql
+from .utils import is_debug, parse_resources
 from .workflow import Workflow
 
 __all__ = ("Scheduler",)
@@ -25,9 +27,11 @@ logger = logging.getLogger(__name__)
 
 # The named resources that steps may reserve, as given on the command line.
 # Populated once in Scheduler.initialize() and read by RESOURCE_UNAVAILABLE.
+# The in_use column holds the units reserved by RUNNING steps,
+# maintained incrementally by the INIT_RESOURCE_IN_USE_TRIGGERS below.
 INIT_AVAILABLE_RESOURCE = """
 CREATE TEMPORARY TABLE IF NOT EXISTS available_resource
-(name TEXT PRIMARY KEY, units INTEGER NOT NULL)
+(name TEXT PRIMARY KEY, units INTEGER NOT NULL, in_use INTEGER NOT NULL DEFAULT 0)
 """
 
 
@@ -37,10 +41,78 @@ DELETE FROM available_resource
 
 
 INSERT_AVAILABLE_RESOURCE = """
-INSERT INTO available_resource VALUES (?, ?)
+INSERT INTO available_resource(name, units) VALUES (?, ?)
 """
 
 
+# Recount the units in use from scratch, e.g. after the available resources were (re)defined.
+# With STEPUP_DEBUG, the same subquery checks the incremental counters (see SELECT_IN_USE_DRIFT).
+RESOURCE_UNITS_RUNNING = f"""
+SELECT COALESCE(SUM(req.units), 0)
+FROM step_resource AS req
+JOIN step ON step.node = req.node
+WHERE req.name = available_resource.name AND step.state = {StepState.RUNNING.value}
+"""
+
+
+RESET_RESOURCE_IN_USE = f"""
+UPDATE available_resource SET in_use = ({RESOURCE_UNITS_RUNNING})
+"""
+
+
+SELECT_IN_USE_DRIFT = f"""
+SELECT name, in_use, ({RESOURCE_UNITS_RUNNING}) FROM available_resource
+WHERE in_use != ({RESOURCE_UNITS_RUNNING})
+"""
+
+
+# Keep available_resource.in_use in sync with the resources of RUNNING steps.
+# Like the triggers of the ready heap, these are temporary triggers,
+# so they cover every write path, including raw UPDATEs of the state column,
+# and they do not outlive the connection that owns the available_resource table.
+# A step deleted while RUNNING is handled by either the step or the step_resource trigger,
+# depending on which row the cascading delete removes first, never by both.
+INIT_RESOURCE_IN_USE_TRIGGERS = (
+    f"""
+CREATE TEMPORARY TRIGGER IF NOT EXISTS resource_in_use_state AFTER UPDATE OF state ON step
+WHEN (OLD.state = {StepState.RUNNING.value}) != (NEW.state = {StepState.RUNNING.value})
+BEGIN
+    UPDATE available_resource SET in_use = in_use
+        + IIF(NEW.state = {StepState.RUNNING.value}, 1, -1) * (
+            SELECT units FROM step_resource
+            WHERE node = NEW.node AND step_resource.name = available_resource.name
+        )
+    WHERE name IN (SELECT name FROM step_resource WHERE node = NEW.node);
+END
+""",
+    f"""
+CREATE TEMPORARY TRIGGER IF NOT EXISTS resource_in_use_step_del AFTER DELETE ON step
+WHEN OLD.state = {StepState.RUNNING.value}
+BEGIN
+    UPDATE available_resource SET in_use = in_use - (
+        SELECT units FROM step_resource
+        WHERE node = OLD.node AND step_resource.name = available_resource.name
+    )
+    WHERE name IN (SELECT name FROM step_resource WHERE node = OLD.node);
+END
+""",
+    f"""
+CREATE TEMPORARY TRIGGER IF NOT EXISTS resource_in_use_ins AFTER INSERT ON step_resource
+WHEN EXISTS (SELECT 1 FROM step WHERE node = NEW.node AND state = {StepState.RUNNING.value})
+BEGIN
+    UPDATE available_resource SET in_use = in_use + NEW.units WHERE name = NEW.name;
+END
+""",
+    f"""
+CREATE TEMPORARY TRIGGER IF NOT EXISTS resource_in_use_del AFTER DELETE ON step_resource
+WHEN EXISTS (SELECT 1 FROM step WHERE node = OLD.node AND state = {StepState.RUNNING.value})
+BEGIN
+    UPDATE available_resource SET in_use = in_use - OLD.units WHERE name = OLD.name;
+END
+""",
+)
+
+
 # The exact paths that `stepup build` was asked to produce.
 # Populated once in Scheduler.initialize(), since Workflow.targets is immutable
 # for the lifetime of the director process.
@@ -214,6 +286,46 @@ WHERE NOT node.detached AND step._check_after
 """
 
 
+def target_need_sql(node_expr: str) -> str:
+    """Return the need implied by targets among the outputs of one step, as an SQL expression.
+
+    The expression is `Need.TARGET` when the step must run because of a target,
+    and `Need.OPTIONAL` (the enum minimum, a no-op inside `MAX`) otherwise.
+    It references the `step` row of the enclosing query.
+    See `UPDATE_CHECK_AFTER` for the details.
+
+    Parameters
+    ----------
+    node_expr
+        The SQL expression identifying the node id of the step in the enclosing query.
+
+    Returns
+    -------
+    expression
+        A `CASE` expression.
+    """
+    return f"""CASE WHEN EXISTS (
+                SELECT 1 FROM dependency AS depo
+                JOIN node AS onode ON onode.i = depo.sink
+                JOIN file AS ofile ON ofile.node = depo.sink
+                WHERE depo.source = {node_expr}
+                  AND {REGULAR_OUTPUT_WHERE}
+                  AND onode.label IN (SELECT path FROM target_path)
+            ) THEN {Need.TARGET.value}
+            WHEN step.need = {Need.DEFAULT.value} AND EXISTS (
+                SELECT 1 FROM dependency AS depo
+                JOIN node AS onode ON onode.i = depo.sink
+                JOIN file AS ofile ON ofile.node = depo.sink
+                WHERE depo.source = {node_expr}
+                  AND {REGULAR_OUTPUT_WHERE}
+                  AND EXISTS (
+                      SELECT 1 FROM target_dir
+                      WHERE onode.label >= target_dir.path
+                        AND onode.label < target_dir.upper
+                  )
+            ) THEN {Need.TARGET.value} ELSE {Need.OPTIONAL.value} END"""
+
+
 # Compute the new _implied_need and _tail_time for each step in check_after,
 # and apply them directly in the same statement
 # (which avoids a round trip through a separate, materialized update_after table).
@@ -247,26 +359,7 @@ WITH cte AS (
         step._implied_need AS old_implied_need,
         MAX(
             step.need,
-            CASE WHEN EXISTS (
-                SELECT 1 FROM dependency AS depo
-                JOIN node AS onode ON onode.i = depo.sink
-                JOIN file AS ofile ON ofile.node = depo.sink
-                WHERE depo.source = check_after.i
-                  AND {REGULAR_OUTPUT_WHERE}
-                  AND onode.label IN (SELECT path FROM target_path)
-            ) THEN {Need.TARGET.value}
-            WHEN step.need = {Need.DEFAULT.value} AND EXISTS (
-                SELECT 1 FROM dependency AS depo
-                JOIN node AS onode ON onode.i = depo.sink
-                JOIN file AS ofile ON ofile.node = depo.sink
-                WHERE depo.source = check_after.i
-                  AND {REGULAR_OUTPUT_WHERE}
-                  AND EXISTS (
-                      SELECT 1 FROM target_dir
-                      WHERE onode.label >= target_dir.path
-                        AND onode.label < target_dir.upper
-                  )
-            ) THEN {Need.TARGET.value} ELSE {Need.OPTIONAL.value} END,
+            {target_need_sql("check_after.i")},
             COALESCE(
                 MAX(sink_step._implied_need),
                 {Need.OPTIONAL.value}
@@ -344,6 +437,188 @@ WHERE NOT source_node.detached
 """
 
 
+# The in-memory sweep (see update_after_sweep) is used when the affected subgraph,
+# i.e. the flagged steps and all their (recursive) source steps, has at most
+# AFTER_SWEEP_BASE_NODES + AFTER_SWEEP_NODES_PER_SEED * (number of flagged steps) nodes.
+# The subgraph is loaded without looking at values,
+# so a small change that does not propagate far could still load a large part of the graph.
+# Beyond this limit, the iterative SQL update (update_after_iterative) is used instead,
+# which stops propagating at steps whose values do not change.
+AFTER_SWEEP_BASE_NODES = 10_000
+AFTER_SWEEP_NODES_PER_SEED = 16
+
+
+INIT_AFTER_SUBGRAPH = """
+CREATE TEMPORARY TABLE IF NOT EXISTS after_subgraph(i INTEGER PRIMARY KEY)
+"""
+
+
+EMPTY_AFTER_SUBGRAPH = """
+DELETE FROM after_subgraph
+"""
+
+
+COUNT_FLAGGED_AFTER = """
+SELECT COUNT(*) FROM step WHERE _check_after
+"""
+
+
+# Collect the flagged steps and their (recursive) non-detached source steps,
+# following the same step -> file -> step edges as PROPAGATE_CHECK_AFTER.
+# The LIMIT inside the recursive CTE stops the traversal once the subgraph is too large.
+FILL_AFTER_SUBGRAPH = """
+INSERT INTO after_subgraph(i)
+WITH RECURSIVE upstream(i) AS (
+    SELECT step.node FROM step JOIN node ON step.node = node.i
+    WHERE NOT node.detached AND step._check_after
+    UNION
+    SELECT dep2.source
+    FROM upstream
+    JOIN dependency AS dep1 ON dep1.sink = upstream.i
+    JOIN dependency AS dep2 ON dep2.sink = dep1.source
+    JOIN step AS source_step ON source_step.node = dep2.source
+    JOIN node AS source_node ON source_node.i = dep2.source
+    WHERE NOT source_node.detached
+    LIMIT ?
+)
+SELECT i FROM upstream
+"""
+
+
+# The inputs of UPDATE_CHECK_AFTER's computation that do not depend on other steps,
+# and the current values, for each step in the subgraph.
+SELECT_AFTER_SUBGRAPH = f"""
+SELECT
+    step.node,
+    MAX(step.need, {target_need_sql("step.node")}),
+    step.duration,
+    step._implied_need,
+    step._tail_time
+FROM after_subgraph
+JOIN step ON step.node = after_subgraph.i
+"""
+
+
+# The non-detached sink steps of each step in the subgraph, with their current values.
+# The values are only used for sinks outside the subgraph, which are not updated.
+SELECT_AFTER_SINKS = """
+SELECT DISTINCT after_subgraph.i, sink_step.node, sink_step._implied_need, sink_step._tail_time
+FROM after_subgraph
+JOIN dependency AS dep1 ON dep1.source = after_subgraph.i
+JOIN dependency AS dep2 ON dep2.source = dep1.sink
+JOIN node AS sink_node ON sink_node.i = dep2.sink
+JOIN step AS sink_step ON sink_step.node = sink_node.i
+WHERE NOT sink_node.detached
+"""
+
+
+UPDATE_AFTER_VALUES = """
+UPDATE step SET _implied_need = ?, _tail_time = ? WHERE node = ?
+"""
+
+
+def update_after_iterative(db: DBSession):
+    """Update `_implied_need` and `_tail_time` with one round of SQL per level of the graph.
+
+    Every flagged step is recomputed in the first iteration.
+    Skipping the ones that also have a flagged (indirect) sink,
+    on the grounds that propagation from that sink will reach them anyway,
+    is not sound: propagation stops at the first step whose values do not change,
+    so a flagged step two or more hops upstream can be missed entirely.
+
+    The `_check_after` flags are left untouched.
+    The temporary tables `check_after` and `changed_after` must exist.
+    """
+    # Not using executescript to preserve atomicity of the transaction.
+    db.execute(EMPTY_CHECK_AFTER)
+    db.execute(SEED_CHECK_AFTER)
+    ncheck = db.execute(COUNT_CHECK_AFTER).fetchone()[0]
+    first = True
+    while ncheck > 0:
+        logger.debug("Found %d sources to update (first=%s)", ncheck, first)
+        # The first iteration is different:
+        # we need to propagate at least once,
+        # regardless of whether the metadata fields of the initial _check_after steps changed.
+        cur = db.execute(UPDATE_CHECK_AFTER, {"first": first})
+        changed_ids = cur.fetchall()
+        db.execute(EMPTY_CHECK_AFTER)
+        db.execute(EMPTY_CHANGED_AFTER)
+        db.executemany(INSERT_CHANGED_AFTER, changed_ids)
+        cur = db.execute(PROPAGATE_CHECK_AFTER)
+        ncheck = cur.rowcount
+        first = False
+
+
+def update_after_sweep(db: DBSession) -> bool:
+    """Update `_implied_need` and `_tail_time` with a single sweep over the affected subgraph.
+
+    The flagged steps and all their (recursive) source steps are loaded at once,
+    and their new values are computed in memory, in reverse topological order,
+    i.e. every step after all of its sinks in the subgraph.
+    This gives the same result as `update_after_iterative`,
+    but without one round of SQL per level of the graph.
+    Only the rows whose values changed are written back.
+
+    The `_check_after` flags are left untouched.
+    The temporary table `after_subgraph` must exist.
+
+    Returns
+    -------
+    swept
+        `False` if nothing was updated because the subgraph is too large
+        (see `AFTER_SWEEP_BASE_NODES`) or contains a cycle.
+        The caller should then fall back to `update_after_iterative`.
+    """
+    nseed = db.execute(COUNT_FLAGGED_AFTER).fetchone()[0]
+    max_nodes = AFTER_SWEEP_BASE_NODES + AFTER_SWEEP_NODES_PER_SEED * nseed
+    db.execute(EMPTY_AFTER_SUBGRAPH)
+    if db.execute(FILL_AFTER_SUBGRAPH, (max_nodes,)).rowcount >= max_nodes:
+        logger.debug("Subgraph of 'after' metadata exceeds %d nodes", max_nodes)
+        return False
+
+    # Node id -> (need without sinks, duration, old implied need, old tail time)
+    nodes = {row[0]: row[1:] for row in db.execute(SELECT_AFTER_SUBGRAPH)}
+    sinks = {}
+    sources = {}
+    npending = dict.fromkeys(nodes, 0)
+    outside = {}
+    for i, j, implied_need, tail_time in db.execute(SELECT_AFTER_SINKS):
+        sinks.setdefault(i, []).append(j)
+        if j in nodes:
+            sources.setdefault(j, []).append(i)
+            npending[i] += 1
+        else:
+            outside[j] = (implied_need, tail_time)
+
+    new_values = {}
+    todo = [i for i, count in npending.items() if count == 0]
+    while len(todo) > 0:
+        i = todo.pop()
+        implied_need, duration = nodes[i][:2]
+        tail_time = 0
+        for j in sinks.get(i, ()):
+            sink_implied_need, sink_tail_time = new_values[j] if j in nodes else outside[j]
+            implied_need = max(implied_need, sink_implied_need)
+            tail_time = max(tail_time, sink_tail_time)
+        new_values[i] = (implied_need, duration + tail_time)
+        for k in sources.get(i, ()):
+            npending[k] -= 1
+            if npending[k] == 0:
+                todo.append(k)
+    if len(new_values) < len(nodes):
+        logger.debug("Subgraph of 'after' metadata contains a cycle")
+        return False
+
+    updates = [
+        (implied_need, tail_time, i)
+        for i, (implied_need, tail_time) in new_values.items()
+        if (implied_need, tail_time) != tuple(nodes[i][2:])
+    ]
+    db.executemany(UPDATE_AFTER_VALUES, updates)
+    logger.debug("Swept %d steps, updated %d", len(nodes), len(updates))
+    return True
+
+
 # Recompute step._ready for every _check_ready-flagged step. See Scheduler._update_meta_ready.
 RECOMPUTE_READY = f"""
 UPDATE step SET
@@ -357,27 +632,18 @@ WHERE _check_ready
 # or over-committed (i.e. cannot be run right now).
 # Named resources are only relevant to actual execution,
 # never to hash-checking. (See SELECT_NEXT_STEP.)
+# The units reserved by RUNNING steps are read from the incrementally maintained
+# available_resource.in_use column, so each required resource costs a single primary-key lookup,
+# instead of a sum over all RUNNING steps for every candidate row examined by SELECT_NEXT_STEP.
 # Not shared with pending.py's similarly-shaped resource check:
 # that one runs after the builder has stopped
 # and therefore omits the currently-RUNNING subtraction,
 # so the two have different semantics despite the surface resemblance.
-RESOURCE_UNAVAILABLE = f"""
+RESOURCE_UNAVAILABLE = """
 SELECT 1 FROM step_resource AS req
 LEFT JOIN available_resource AS avail ON avail.name = req.name
 WHERE req.node = node.i
-  AND (
-      avail.name IS NULL
-      OR (
-          avail.units
-          - COALESCE((
-              SELECT SUM(r2.units)
-              FROM step_resource AS r2
-              JOIN step AS s2 ON s2.node = r2.node
-              WHERE r2.name = req.name
-                AND s2.state = {StepState.RUNNING.value}
-          ), 0)
-      ) < req.units
-  )
+  AND (avail.name IS NULL OR avail.units - avail.in_use < req.units)
 """
 
 
@@ -387,6 +653,8 @@ WHERE req.node = node.i
 # Checkable steps always take priority over runnable ones
 # because checking is cheap and unlocks more work early,
 # regardless of relative _tail_time, hence `_has_hash DESC` leads the ORDER BY.
+# Planning steps come next, because they define more work,
+# followed by the priority declared by the user and finally the (deferral-damped) _tail_time.
 #
 # This walks the step_dispatch partial index
 # (defined in STEP_SCHEMA, with STEP_DISPATCH_WHERE as its WHERE clause)
@@ -416,21 +684,29 @@ WHERE req.node = node.i
 # Without targets the threshold is OPTIONAL,
 # which this term already implies via STEP_DISPATCH_WHERE, so it then rejects nothing;
 # with targets it is DEFAULT, making DEFAULT-need steps optional-in-effect.
-SELECT_NEXT_STEP = f"""
+#
+# When the budget of hash-checking jobs (`--hash-jobs`) or that of commands is used up,
+# SELECT_NEXT_CHECK or SELECT_NEXT_RUN restrict the selection to one of the two paths.
+# Their extra equality on the leading column of step_dispatch narrows the walk to a range of it.
+_SELECT_NEXT_TEMPLATE = f"""
 SELECT node.i, node.label, step._has_hash
 FROM step INDEXED BY step_dispatch
 JOIN node ON node.i = step.node
 WHERE
-    {STEP_DISPATCH_WHERE} AND
+    {STEP_DISPATCH_WHERE} AND{{kind}}
     step._implied_need > ? AND
     NOT node.detached AND
     (step._has_hash OR NOT EXISTS ({RESOURCE_UNAVAILABLE}))
 ORDER BY
     step._has_hash DESC,
     (step._implied_need = {Need.PLAN.value}) DESC,
+    step.priority DESC,
     step._tail_time / (1 + step.defer_count) DESC
 LIMIT 1
 """
+SELECT_NEXT_STEP = _SELECT_NEXT_TEMPLATE.format(kind="")
+SELECT_NEXT_CHECK = _SELECT_NEXT_TEMPLATE.format(kind="\n    step._has_hash = 1 AND")
+SELECT_NEXT_RUN = _SELECT_NEXT_TEMPLATE.format(kind="\n    step._has_hash = 0 AND")
 
 
 # Select the input hashes and metadata for a given step.
@@ -447,17 +723,265 @@ WHERE dep.sink = ?
 """
 
 
-# Write the durations measured during a build phase.
+#
+# Optional in-memory mirror of the dispatch index (see Scheduler.use_ready_heap)
+#
+
+# Nodes whose dispatch eligibility or priority may have changed since the last sync.
+# Filled by the temporary triggers below, drained by Scheduler._sync_ready_heap().
+INIT_READY_CHANGE = """
+CREATE TEMPORARY TABLE IF NOT EXISTS ready_change (node INTEGER PRIMARY KEY)
+"""
+
+
+# Temporary triggers record every write to a column used by STEP_DISPATCH_WHERE,
+# SELECT_NEXT_STEP's ORDER BY, node.detached or a step's resource requirements.
+# This covers all writers at once, including the bulk updates of the _update_meta_* methods
+# and the triggers in STEP_SCHEMA, without having to instrument each call site in Python.
+# Temporary triggers live in the connection, like the ready_change table,
+# so they cost nothing when the in-memory mirror is not used.
+INIT_READY_TRIGGERS = (
+    """
+CREATE TEMPORARY TRIGGER IF NOT EXISTS ready_change_step_ins AFTER INSERT ON step
+BEGIN
+    INSERT OR IGNORE INTO ready_change VALUES (NEW.node);
+END
+""",
+    """
+CREATE TEMPORARY TRIGGER IF NOT EXISTS ready_change_step_upd AFTER UPDATE OF
+    state, deferred, defer_count, priority, _safe, _safe_ignoring_hold,
+    _implied_need, _tail_time, _has_hash, _ready
+ON step
+WHEN OLD.state != NEW.state OR OLD.deferred != NEW.deferred
+    OR OLD.defer_count != NEW.defer_count OR OLD.priority != NEW.priority
+    OR OLD._safe != NEW._safe OR OLD._safe_ignoring_hold != NEW._safe_ignoring_hold
+    OR OLD._implied_need != NEW._implied_need OR OLD._tail_time != NEW._tail_time
+    OR OLD._has_hash != NEW._has_hash OR OLD._ready != NEW._ready
+BEGIN
+    INSERT OR IGNORE INTO ready_change VALUES (NEW.node);
+END
+""",
+    """
+CREATE TEMPORARY TRIGGER IF NOT EXISTS ready_change_step_del AFTER DELETE ON step
+BEGIN
+    INSERT OR IGNORE INTO ready_change VALUES (OLD.node);
+END
+""",
+    """
+CREATE TEMPORARY TRIGGER IF NOT EXISTS ready_change_node_detached AFTER UPDATE OF detached ON node
+WHEN OLD.detached != NEW.detached
+BEGIN
+    INSERT OR IGNORE INTO ready_change VALUES (NEW.i);
+END
+""",
+    """
+CREATE TEMPORARY TRIGGER IF NOT EXISTS ready_change_resource_ins AFTER INSERT ON step_resource
+BEGIN
+    INSERT OR IGNORE INTO ready_change VALUES (NEW.node);
+END
+""",
+    """
+CREATE TEMPORARY TRIGGER IF NOT EXISTS ready_change_resource_del AFTER DELETE ON step_resource
+BEGIN
+    INSERT OR IGNORE INTO ready_change VALUES (OLD.node);
+END
+""",
+)
+
+
+# The columns of a heap entry, for steps that satisfy SELECT_NEXT_STEP,
+# except for the resource check, which is done when the entry is popped.
+READY_COLUMNS = f"""
+SELECT
+    node.i,
+    node.label,
+    step._has_hash,
+    step._implied_need = {Need.PLAN.value},
+    step.priority,
+    step._tail_time / (1 + step.defer_count),
+    EXISTS (SELECT 1 FROM step_resource WHERE step_resource.node = node.i)
+"""
+
+
+READY_WHERE = f"""
+WHERE
+    {STEP_DISPATCH_WHERE} AND
+    step._implied_need > ? AND
+    NOT node.detached
+"""
+
+
+SELECT_READY_ALL = f"""
+{READY_COLUMNS}
+FROM step JOIN node ON node.i = step.node
+{READY_WHERE}
+"""
+
+
+SELECT_READY_CHANGE = """
+SELECT node FROM ready_change
+"""
+
+
+SELECT_READY_CHANGED = f"""
+{READY_COLUMNS}
+FROM ready_change
+JOIN step ON step.node = ready_change.node
+JOIN node ON node.i = step.node
+{READY_WHERE}
+"""
+
+
+EMPTY_READY_CHANGE = """
+DELETE FROM ready_change
+"""
+
+
+# Whether the resources of a single step are currently unavailable.
+STEP_RESOURCE_UNAVAILABLE = f"""
+SELECT EXISTS ({RESOURCE_UNAVAILABLE}) FROM node WHERE node.i = ?
+"""
+
+
+# Number of recent executions per step kept in the step_duration table.
+DURATION_HISTORY_SIZE = 8
+
+# The quantile of the recent wall times used as the duration estimate of a step.
+# It is above the median, because an underestimated step on the critical path
+# delays the whole build more than an overestimated one elsewhere.
+DURATION_QUANTILE = 0.75
+
+# Weight of a new step estimate in the running average of its duration classes.
+DURATION_CLASS_WEIGHT = 0.25
+
+
+def estimate_duration(wtimes: list[float]) -> float:
+    """Estimate the wall time of the next execution of a step from its recent executions.
+
+    A quantile is insensitive to a single outlier,
+    unlike the last measurement or the mean, which follow every slow or fast run.
+
+    Parameters
+    ----------
+    wtimes
+        The measured wall times of recent executions (at least one), in any order.
+
+    Returns
+    -------
+    estimate
+        The `DURATION_QUANTILE` quantile of the wall times, interpolated linearly.
+    """
+    ordered = sorted(wtimes)
+    pos = DURATION_QUANTILE * (len(ordered) - 1)
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (pos - low) * (ordered[high] - ordered[low])
+
+
+# Append the durations measured during a build phase to the history.
+# The CPU time and peak memory are taken from the outcome that the same execution stored.
+# Nothing is appended for a step that was removed from the workflow since it ran.
+INSERT_STEP_DURATION = """
+INSERT INTO step_duration (node, run, wtime, ctime, maxrss)
+SELECT
+    :node,
+    COALESCE((SELECT MAX(run) FROM step_duration WHERE node = :node), 0) + 1,
+    :wtime,
+    (SELECT utime + stime FROM step_outcome WHERE node = :node),
+    (SELECT maxrss FROM step_outcome WHERE node = :node)
+FROM step WHERE node = :node
+"""
+
+
+PRUNE_STEP_DURATION = f"""
+DELETE FROM step_duration WHERE node = :node
+AND run <= (SELECT MAX(run) FROM step_duration WHERE node = :node) - {DURATION_HISTORY_SIZE}
+"""
+
+
+SELECT_STEP_DURATION = """
+SELECT wtime, maxrss FROM step_duration WHERE node = ?
+"""
+
+
+SELECT_STEP_LABEL = """
+SELECT label FROM node JOIN step ON node.i = step.node WHERE node.i = ?
+"""
+
+
+# Write the duration estimates derived from the history.
 # Only a change of more than 10% is written,
 # so ordinary run-to-run noise does not dirty a row on every build.
 # The threshold is relative to the stored duration, which is never zero:
-# a step that has never run keeps the schema default of one second.
+# a step that has never run keeps its initial estimate.
 UPDATE_DURATION = """
 UPDATE step SET duration = :duration
 WHERE node = :node AND ABS(duration - :duration) > 0.1 * duration
 """
 
 
+# The resource implicitly claimed by memory-hungry steps, in units of GiB.
+# The units available are given with `--resources`, like any other resource,
+# or default to the memory of the machine (or of the cgroup of the director).
+MEMORY_RESOURCE = "memgb"
+
+# Steps whose recent peak memory reaches this threshold claim MEMORY_RESOURCE implicitly [MiB].
+# Smaller steps make no claim, so the many light steps of a workflow are never held back.
+MEMORY_HUNGRY_MIB = 1024
+
+
+def memory_units(maxrss: float, budget: int) -> int | None:
+    """Return the units of `MEMORY_RESOURCE` to claim implicitly for a given peak memory.
+
+    Parameters
+    ----------
+    maxrss
+        The largest peak memory of the recent executions of a step [MiB].
+    budget
+        The units of `MEMORY_RESOURCE` available to all steps together.
+
+    Returns
+    -------
+    units
+        The peak memory rounded up to whole GiB, at most `budget` (and at least one),
+        so that a step needing more memory than the budget can still run, on its own.
+        `None` when the step is not memory-hungry.
+    """
+    if maxrss < MEMORY_HUNGRY_MIB:
+        return None
+    return max(1, min(math.ceil(maxrss / 1024), budget))
+
+
+UPSERT_IMPLICIT_RESOURCE = """
+INSERT INTO step_resource (node, name, units, implicit) VALUES (:node, :name, :units, 1)
+ON CONFLICT (node, name) DO UPDATE SET units = excluded.units WHERE implicit
+"""
+
+
+DELETE_IMPLICIT_RESOURCE = """
+DELETE FROM step_resource WHERE node = :node AND name = :name AND implicit
+"""
+
+
+# Drop the implicit claims when no units are available for them,
+# and clamp them to the available units, which may have changed since they were recorded.
+DELETE_ALL_IMPLICIT_RESOURCE = """
+DELETE FROM step_resource WHERE name = ? AND implicit
+"""
+
+
+CLAMP_IMPLICIT_RESOURCE = """
+UPDATE step_resource SET units = MAX(1, :units) WHERE name = :name AND implicit AND units > :units
+"""
+
+
+UPSERT_DURATION_CLASS = f"""
+INSERT INTO duration_class (key, duration) VALUES (:key, :duration)
+ON CONFLICT (key) DO UPDATE
+SET duration = duration + {DURATION_CLASS_WEIGHT} * (excluded.duration - duration)
+"""
+
+
 @attrs.define
 class Scheduler:
     """Turn PENDING jobs into RUNNING jobs as the builder requests them."""
@@ -498,7 +1022,8 @@ class Scheduler:
 
     In-memory only.
     Populated by `record_job_completed()`,
-    written and cleared by `build_completed()` at the end of a build phase.
+    appended to the duration history and cleared by `build_completed()`
+    at the end of a build phase.
     """
 
     jobs: dict[int, Step] = attrs.field(init=False, factory=dict)
@@ -522,6 +1047,50 @@ class Scheduler:
     write_joblog: bool = attrs.field(kw_only=True, default=False)
     """Whether to record `--joblog` events."""
 
+    default_memory_budget: int | None = attrs.field(kw_only=True, default=None)
+    """The units of `MEMORY_RESOURCE` available when they are not given to `initialize()`.
+
+    This is normally the memory of the machine or cgroup in GiB.
+    When `None` (and no units are given either), steps claim no memory implicitly.
+    """
+
+    memory_budget: int | None = attrs.field(init=False, default=None)
+    """The units of `MEMORY_RESOURCE` available to all steps together, set by `initialize()`."""
+
+    use_ready_heap: bool = attrs.field(kw_only=True, default=False)
+    """Whether to select steps from an in-memory heap instead of walking the dispatch index.
+
+    The heap mirrors the steps that satisfy `SELECT_NEXT_STEP`, in the same order,
+    except for the resource check, which is only done when a step is popped.
+    It is kept up to date incrementally from the `ready_change` table,
+    which temporary triggers fill on every relevant write,
+    so the database remains the source of truth.
+    With `STEPUP_DEBUG`, every selection is compared to that of `SELECT_NEXT_STEP`.
+    """
+
+    ready_heap: list[tuple[int, int, int, float, int]] = attrs.field(init=False, factory=list)
+    """Keys `(-has_hash, -is_plan, -priority, -tail_time, node)` of eligible runnable steps.
+
+    Entries are not removed when a step becomes ineligible or changes priority.
+    Instead, a key is stale when it differs from the one in `ready_entries`,
+    and stale keys are skipped when popped.
+    """
+
+    check_heap: list[tuple[int, int, int, float, int]] = attrs.field(init=False, factory=list)
+    """Keys of eligible hash-checkable steps, like `ready_heap`.
+
+    Checkable steps are kept apart, so that either kind can be popped without skipping the other,
+    when the budget of hash checks or that of commands is used up.
+    """
+
+    ready_entries: dict[int, tuple[tuple[int, int, int, float, int], str, bool]] = attrs.field(
+        init=False, factory=dict
+    )
+    """Step node id -> (current key, label, has resources), for every step in the heaps."""
+
+    ready_threshold: Need | None = attrs.field(init=False, default=None)
+    """The need threshold used to fill the heaps, or `None` when they must be reloaded."""
+
     #
     # Initialization
     #
@@ -539,27 +1108,44 @@ class Scheduler:
             The resources that steps may reserve,
             as an unparsed specification such as `"cpu:4,gpu:1"`,
             or `None` when no resources are defined.
+            When `MEMORY_RESOURCE` is not given, `default_memory_budget` is used for it.
         """
         async with self.db:
             self.db.execute(INIT_AVAILABLE_RESOURCE)
             self.db.execute(EMPTY_AVAILABLE_RESOURCE)
-            if available_resources is not None:
-                self.db.executemany(
-                    INSERT_AVAILABLE_RESOURCE, parse_resources(available_resources).items()
+            resources = {} if available_resources is None else parse_resources(available_resources)
+            if MEMORY_RESOURCE not in resources and self.default_memory_budget is not None:
+                resources[MEMORY_RESOURCE] = self.default_memory_budget
+            self.db.executemany(INSERT_AVAILABLE_RESOURCE, resources.items())
+            self.memory_budget = resources.get(MEMORY_RESOURCE)
+            if self.memory_budget is None:
+                self.db.execute(DELETE_ALL_IMPLICIT_RESOURCE, (MEMORY_RESOURCE,))
+            else:
+                self.db.execute(
+                    CLAMP_IMPLICIT_RESOURCE, {"name": MEMORY_RESOURCE, "units": self.memory_budget}
                 )
-            # check_after, changed_after, and safe_update are hot-path temp tables used by
-            # _update_meta_after()/_update_meta_safe().
+            for sql in INIT_RESOURCE_IN_USE_TRIGGERS:
+                self.db.execute(sql)
+            self.db.execute(RESET_RESOURCE_IN_USE)
+            # check_after, changed_after, after_subgraph and safe_update are hot-path temp tables
+            # used by _update_meta_after()/_update_meta_safe().
             # Creating them once here, instead of on every call,
             # avoids repeated schema-cookie bumps
             # (which invalidate SQLite's prepared-statement cache) on the dispatch hot path.
             self.db.execute(INIT_CHECK_AFTER)
             self.db.execute(INIT_CHANGED_AFTER)
+            self.db.execute(INIT_AFTER_SUBGRAPH)
             self.db.execute(INIT_SAFE_UPDATE)
             self.db.execute(INIT_TARGET_PATH)
             self.db.execute(EMPTY_TARGET_PATH)
             self.db.executemany(
                 INSERT_TARGET_PATH, ((str(path),) for path in sorted(self.workflow.targets))
             )
+            if self.use_ready_heap:
+                self.db.execute(INIT_READY_CHANGE)
+                for sql in INIT_READY_TRIGGERS:
+                    self.db.execute(sql)
+                self.ready_threshold = None
             self.db.execute(INIT_TARGET_DIR)
             self.db.execute(EMPTY_TARGET_DIR)
             self.db.executemany(
@@ -577,8 +1163,7 @@ class Scheduler:
     async def pop_next_job(self) -> Job | None:
         """Derive a job for the highest-priority step ready for dispatch.
 
-        The step is moved out of PENDING before this returns,
-        so the same step is never handed out twice.
+        This is a shorthand for `pop_next_jobs(1)`.
 
         Returns
         -------
@@ -586,41 +1171,124 @@ class Scheduler:
             The job to be carried out by the executor,
             or `None` when no step is eligible or the scheduler is draining.
         """
+        jobs = await self.pop_next_jobs(1)
+        return jobs[0] if len(jobs) > 0 else None
+
+    async def pop_next_jobs(self, max_jobs: int, max_checks: int | None = None) -> list[Job]:
+        """Derive jobs for up to `max_jobs` of the highest-priority steps ready for dispatch.
+
+        All jobs are derived in a single transaction,
+        so filling many free slots at once (e.g. at the start of a build phase with `--jobs 128`)
+        takes the database lock only once.
+        The result is the same as that of `max_jobs` consecutive calls to `pop_next_job()`:
+        each step is moved out of PENDING before the next one is selected,
+        so resources reserved by earlier steps in the batch are taken into account,
+        and the same step is never handed out twice.
+
+        Parameters
+        ----------
+        max_jobs
+            The maximum number of jobs to derive, typically the number of free slots.
+        max_checks
+            When given, steps selected through the hash-checkable path (state CHECKING)
+            are counted against this limit instead of `max_jobs`,
+            which then only limits the steps that will run their command.
+            This lets hash checks and commands have separate budgets (see `--hash-jobs`).
+
+        Returns
+        -------
+        jobs
+            The jobs to be carried out by the executor, in order of priority.
+            The list is shorter than `max_jobs` (plus `max_checks`), possibly empty,
+            when fewer steps are eligible or the scheduler is draining.
+        """
         if self.draining:
             logger.debug("Scheduler is draining, not popping any jobs")
-            return None
+            return []
 
+        jobs = []
+        nrun = 0
+        ncheck = 0
         # We're taking a rather long lock here,
         # but this is needed because subsequent changes to the database are correlated.
         # Allowing database changes in between
         # would result in potential race conditions and inconsistencies.
         async with self.db:
-            # A) Perform metadata updates for all steps whose changes have not been propagated
-            #    into the metadata columns yet.
+            while True:
+                if max_checks is None:
+                    allow_check = allow_run = len(jobs) < max_jobs
+                else:
+                    allow_check = ncheck < max_checks
+                    allow_run = nrun < max_jobs
+                if not (allow_check or allow_run):
+                    break
+
+                # A) Perform metadata updates for all steps whose changes have not been propagated
+                #    into the metadata columns yet.
+
+                # The metadata checks are flagged by _check_* columns in the step table,
+                # which are set to True when something relevant in the step has changed.
+                # Within a batch, this is usually a cheap no-op after the first iteration,
+                # but dispatching a step may flag others, e.g. the products of a creator.
+                self._update_meta_safe()
+                self._update_meta_after()
+                self._update_meta_ready()
+
+                # B) Identify the highest-priority PENDING step that is ready for dispatch:
+                #    a checkable step (stored hash, no resource check needed) if one exists,
+                #    otherwise a runnable step (subject to resources).
+                result = self._select_next_step(allow_check, allow_run)
+                if result is None:
+                    logger.debug("No runnable steps found")
+                    break
+                step, state = result
+                job = self._derive_job(step)
+                # A RUNNING step counts against the available resources in RESOURCE_UNAVAILABLE,
+                # which is how later steps in the same batch respect the resources of this one.
+                step.set_state(state)
+                logger.debug("Derived %s job: %s", state.name.lower(), job)
+                logger.info("Pop %s", job.name)
+                jobs.append(job)
+                if state == StepState.CHECKING:
+                    ncheck += 1
+                else:
+                    nrun += 1
+        return jobs
+
+    def _select_next_step(
+        self, allow_check: bool = True, allow_run: bool = True
+    ) -> tuple[Step, StepState] | None:
+        """Fetch the single best PENDING step to dispatch, from the heap or the database.
+
+        See `_get_next_step()` for the arguments and the return value.
+        """
+        if not self.use_ready_heap:
+            return self._get_next_step(allow_check, allow_run)
+        self._sync_ready_heap()
+        result = self._pop_ready_step(allow_check, allow_run)
+        if is_debug():
+            expected = self._get_next_step(allow_check, allow_run)
+            found_i = None if result is None else result[0].i
+            expected_i = None if expected is None else expected[0].i
+            if found_i != expected_i:
+                raise ConsistencyError(
+                    f"Ready heap selected step node {found_i}, "
+                    f"but the database selects step node {expected_i}"
+                )
+        return result
 
-            # The metadata checks are flagged by _check_* columns in the step table,
-            # which are set to True when something relevant in the step has changed.
-            self._update_meta_safe()
-            self._update_meta_after()
-            self._update_meta_ready()
-
-            # B) Identify the highest-priority PENDING step that is ready for dispatch:
-            #    a checkable step (stored hash, no resource check needed) if one exists,
-            #    otherwise a runnable step (subject to resources).
-            result = self._get_next_step()
-            if result is None:
-                logger.debug("No runnable steps found")
-                return None
-            step, state = result
-            job = self._derive_job(step)
-            step.set_state(state)
-            logger.debug("Derived %s job: %s", state.name.lower(), job)
-            logger.info("Pop %s", job.name)
-            return job
-
-    def _get_next_step(self) -> tuple[Step, StepState] | None:
+    def _get_next_step(
+        self, allow_check: bool = True, allow_run: bool = True
+    ) -> tuple[Step, StepState] | None:
         """Fetch the single best PENDING step to dispatch, if any.
 
+        Parameters
+        ----------
+        allow_check
+            Whether a step may be selected through the hash-checkable path.
+        allow_run
+            Whether a step may be selected through the runnable path.
+
         Returns
         -------
         step_and_state
@@ -629,7 +1297,15 @@ class Scheduler:
             `RUNNING` when it was selected through the runnable path.
             `None` if no PENDING step is currently eligible.
         """
-        row = self.db.execute(SELECT_NEXT_STEP, (self.workflow.need_threshold.value,)).fetchone()
+        if allow_check and allow_run:
+            sql = SELECT_NEXT_STEP
+        elif allow_check:
+            sql = SELECT_NEXT_CHECK
+        elif allow_run:
+            sql = SELECT_NEXT_RUN
+        else:
+            return None
+        row = self.db.execute(sql, (self.workflow.need_threshold.value,)).fetchone()
         if row is None:
             return None
         i, label, has_hash = row
@@ -658,7 +1334,7 @@ class Scheduler:
             # Amended or not, just process ready inputs.
             if not detached and file_state in (FileState.BUILT, FileState.CONFIRMED):
                 # Input is ready, collect its hash and look no further.
-                inp_hashes[path] = FileHash.from_json(hash_value)
+                inp_hashes[path] = FileHash.from_blob(hash_value)
                 continue
 
             # Sanity checks
@@ -710,6 +1386,107 @@ class Scheduler:
             append_joblog_record("CREATED", job_i, job.name)
         return job
 
+    #
+    # In-memory ready heap
+    #
+
+    def _sync_ready_heap(self):
+        """Bring the heaps up to date with the changes recorded in the `ready_change` table.
+
+        The heap is reloaded from scratch the first time and when the need threshold changed.
+        Otherwise, only the steps recorded as changed are looked up again.
+        """
+        threshold = self.workflow.need_threshold
+        if self.ready_threshold != threshold:
+            self.ready_entries = {}
+            for row in self.db.execute(SELECT_READY_ALL, (threshold.value,)):
+                self._set_ready_entry(row)
+            self._rebuild_ready_heap()
+            self.db.execute(EMPTY_READY_CHANGE)
+            self.ready_threshold = threshold
+            return
+
+        changed = self.db.execute(SELECT_READY_CHANGE).fetchall()
+        if len(changed) == 0:
+            return
+        old_keys = {}
+        for (i,) in changed:
+            old_entry = self.ready_entries.pop(i, None)
+            if old_entry is not None:
+                old_keys[i] = old_entry[0]
+        for row in self.db.execute(SELECT_READY_CHANGED, (threshold.value,)):
+            key = self._set_ready_entry(row)
+            # An unchanged key is still (validly) present in the heap.
+            if old_keys.get(key[-1]) != key:
+                heapq.heappush(self._heap_of(key), key)
+        self.db.execute(EMPTY_READY_CHANGE)
+        # Drop the stale keys once they outnumber the valid ones.
+        if len(self.ready_heap) + len(self.check_heap) > 2 * len(self.ready_entries) + 64:
+            self._rebuild_ready_heap()
+
+    def _set_ready_entry(self, row: tuple) -> tuple[int, int, int, float, int]:
+        """Store a row of `SELECT_READY_ALL` or `SELECT_READY_CHANGED` and return its key."""
+        i, label, has_hash, is_plan, priority, tail_time, has_resources = row
+        key = (-has_hash, -is_plan, -priority, -tail_time, i)
+        self.ready_entries[i] = (key, label, bool(has_resources))
+        return key
+
+    def _heap_of(self, key: tuple[int, int, int, float, int]) -> list:
+        """Return the heap to which a key belongs: `check_heap` or `ready_heap`."""
+        return self.check_heap if key[0] == -1 else self.ready_heap
+
+    def _rebuild_ready_heap(self):
+        """Recreate `ready_heap` and `check_heap` from `ready_entries`, without stale keys."""
+        self.ready_heap = []
+        self.check_heap = []
+        for key, _, _ in self.ready_entries.values():
+            self._heap_of(key).append(key)
+        heapq.heapify(self.ready_heap)
+        heapq.heapify(self.check_heap)
+
+    def _pop_ready_step(
+        self, allow_check: bool = True, allow_run: bool = True
+    ) -> tuple[Step, StepState] | None:
+        """Pop the best step from the heaps, skipping steps whose resources are in use.
+
+        See `_get_next_step()` for the arguments and the return value.
+        Checkable steps take priority over runnable ones, as in `SELECT_NEXT_STEP`.
+        """
+        if allow_check:
+            result = self._pop_heap(self.check_heap)
+            if result is not None:
+                return result
+        if allow_run:
+            return self._pop_heap(self.ready_heap)
+        return None
+
+    def _pop_heap(self, heap: list) -> tuple[Step, StepState] | None:
+        """Pop the best valid step from one heap, see `_pop_ready_step()`."""
+        skipped = []
+        try:
+            while len(heap) > 0:
+                key = heapq.heappop(heap)
+                i = key[-1]
+                entry = self.ready_entries.get(i)
+                if entry is None or entry[0] != key:
+                    continue
+                _, label, has_resources = entry
+                has_hash = key[0] == -1
+                if (
+                    not has_hash
+                    and has_resources
+                    and self.db.execute(STEP_RESOURCE_UNAVAILABLE, (i,)).fetchone()[0]
+                ):
+                    skipped.append(key)
+                    continue
+                del self.ready_entries[i]
+                state = StepState.CHECKING if has_hash else StepState.RUNNING
+                return Step(self.workflow, i, label), state
+            return None
+        finally:
+            for key in skipped:
+                heapq.heappush(heap, key)
+
     #
     # Metadata updates
     #
@@ -728,35 +1505,15 @@ class Scheduler:
     def _update_meta_after(self):
         """Update the "after" metadata fields where needed.
 
-        Every flagged step is recomputed in the first iteration.
-        Skipping the ones that also have a flagged (indirect) sink,
-        on the grounds that propagation from that sink will reach them anyway,
-        is not sound: propagation stops at the first step whose values do not change,
-        so a flagged step two or more hops upstream can be missed entirely.
-        It would then keep a stale `_implied_need` for good,
-        because `_check_after` is cleared for all steps at the end of this method.
+        A single in-memory sweep is tried first (see `update_after_sweep`),
+        with the iterative SQL update as a fallback.
+        The `_check_after` flags are cleared for all steps at the end,
+        so a step that is missed here would keep a stale `_implied_need` for good.
         """
         if not self._any_flagged("_check_after"):
             return
-        # Not using executescript to preserve atomicity of the transaction.
-        # check_after and changed_after are created once in Scheduler.initialize().
-        self.db.execute(EMPTY_CHECK_AFTER)
-        self.db.execute(SEED_CHECK_AFTER)
-        ncheck = self.db.execute(COUNT_CHECK_AFTER).fetchone()[0]
-        first = True
-        while ncheck > 0:
-            logger.debug("Found %d sources to update (first=%s)", ncheck, first)
-            # The first iteration is different:
-            # we need to propagate at least once,
-            # regardless of whether the metadata fields of the initial _check_after steps changed.
-            cur = self.db.execute(UPDATE_CHECK_AFTER, {"first": first})
-            changed_ids = cur.fetchall()
-            self.db.execute(EMPTY_CHECK_AFTER)
-            self.db.execute(EMPTY_CHANGED_AFTER)
-            self.db.executemany(INSERT_CHANGED_AFTER, changed_ids)
-            cur = self.db.execute(PROPAGATE_CHECK_AFTER)
-            ncheck = cur.rowcount
-            first = False
+        if not update_after_sweep(self.db):
+            update_after_iterative(self.db)
         logger.debug("Finished updating 'after' metadata fields")
         self._clear_flag("_check_after")
 
@@ -782,6 +1539,15 @@ class Scheduler:
         cur = self.db.execute(f"UPDATE step SET {column} = 0 WHERE {column}")
         logger.debug("Updated %d %s metadata field(s) for steps", cur.rowcount, column)
 
+    def _check_resource_in_use(self):
+        """Verify the incremental `available_resource.in_use` counters against a recount."""
+        drift = self.db.execute(SELECT_IN_USE_DRIFT).fetchall()
+        if len(drift) > 0:
+            details = ", ".join(
+                f"{name} ({in_use} counted, {running} running)" for name, in_use, running in drift
+            )
+            raise ConsistencyError(f"Resource units in use are out of sync: {details}")
+
     #
     # Job and timing bookkeeping
     #
@@ -870,6 +1636,45 @@ class Scheduler:
     # Build phase completion
     #
 
+    def _flush_durations(self):
+        """Append the measured durations to the history and update the derived estimates.
+
+        The duration of each step becomes `estimate_duration()` of its recent history.
+        The estimate is also averaged into the duration classes of the step,
+        from which new steps with a similar command or working directory start.
+        A step whose recent peak memory makes it memory-hungry claims `MEMORY_RESOURCE`
+        implicitly (see `memory_units()`), so the scheduler does not start more of them
+        than the memory budget allows.
+        Must be called inside a database transaction.
+        """
+        records = [{"node": node, "wtime": wtime} for node, wtime in self.new_durations.items()]
+        self.db.executemany(INSERT_STEP_DURATION, records)
+        self.db.executemany(PRUNE_STEP_DURATION, records)
+        estimates = []
+        classes = []
+        for node in self.new_durations:
+            row = self.db.execute(SELECT_STEP_LABEL, (node,)).fetchone()
+            if row is None:
+                continue
+            history = self.db.execute(SELECT_STEP_DURATION, (node,)).fetchall()
+            estimate = estimate_duration([wtime for wtime, _ in history])
+            estimates.append({"node": node, "duration": estimate})
+            if self.memory_budget is not None:
+                maxrss = max(maxrss or 0.0 for _, maxrss in history)
+                units = memory_units(maxrss, self.memory_budget)
+                claim = {"node": node, "name": MEMORY_RESOURCE, "units": units}
+                if units is None:
+                    self.db.execute(DELETE_IMPLICIT_RESOURCE, claim)
+                else:
+                    self.db.execute(UPSERT_IMPLICIT_RESOURCE, claim)
+            step = Step(self.workflow, node, row[0])
+            classes.extend(
+                {"key": key, "duration": estimate}
+                for key in duration_class_keys(*step.command_and_workdir)
+            )
+        self.db.executemany(UPDATE_DURATION, estimates)
+        self.db.executemany(UPSERT_DURATION_CLASS, classes)
+
     async def build_completed(self):
         """Wrap up a build phase: reset counters, flush durations and refresh tail times.
 
@@ -883,16 +1688,12 @@ class Scheduler:
         self.run_counter = 0
         if len(self.new_durations) > 0:
             async with self.db:
-                self.db.executemany(
-                    UPDATE_DURATION,
-                    [
-                        {"node": node, "duration": duration}
-                        for node, duration in self.new_durations.items()
-                    ],
-                )
+                self._flush_durations()
             self.new_durations.clear()
         async with self.db:
             self._update_meta_after()
+            if is_debug():
+                self._check_resource_in_use()
         # Also clear the timings used to detect unfresh inputs (see ran_concurrently).
         # This is safe to do here because the builder is guaranteed to have no RUNNING steps.
         self.start_times.clear()
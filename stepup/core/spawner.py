@@ -0,0 +1,320 @@
+# SPDX-FileCopyrightText: 2024 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""A small helper process that starts the subprocesses of steps on behalf of the director.
+
+Creating a subprocess forks the process that creates it.
+Once the director holds a large SQLite page cache and a large heap,
+every fork has more memory mappings to copy,
+which takes time away from the event loop in which all steps are managed.
+The spawn helper is started as a fresh interpreter while the director is still small,
+and stays small because it only ever starts and reaps subprocesses.
+
+The director and the helper are connected through a `SOCK_SEQPACKET` socket pair,
+which keeps the boundaries between messages.
+Each message is a pickled tuple:
+
+- A launch request from the director carries the command, shell flag, environment
+  and working directory of the step.
+  The file descriptors of the standard input, output and error of the step are passed along
+  with the request (`SCM_RIGHTS`), so the output is still written directly to the spool files
+  of the director, and its standard input is still written by the director.
+- The helper answers every request in order, with the pid of the new process
+  or with an error message when it could not be started.
+- When a process exits, the helper reaps it and sends its pid, wait status and resource usage.
+
+Every subprocess is started in a session of its own, as without the helper,
+so the director can signal, suspend and resume it through its pid.
+The helper runs in a session of its own too, so terminal signals never reach it,
+and it exits as soon as the director closes its end of the socket pair.
+"""
+
+import asyncio
+import collections
+import contextlib
+import os
+import pickle
+import resource
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+
+import attrs
+
+from .asyncio import wait_for_readable_fd, wait_for_writable_fd
+
+__all__ = ("Spawner",)
+
+
+MAX_REQUEST_SIZE = 1024**2
+"""The largest launch request the helper can receive [bytes]."""
+
+MAX_REPLY_SIZE = 64 * 1024
+"""The largest reply the director can receive [bytes]."""
+
+
+#
+# Helper process
+#
+
+
+def _launch(request: bytes, fds: list[int]) -> tuple[subprocess.Popen | None, str | None]:
+    """Start the subprocess described by a launch request and close the received fds.
+
+    Returns
+    -------
+    proc
+        The started process, or `None` if it could not be started.
+    error
+        The reason why the process could not be started, or `None` if it was started.
+    """
+    try:
+        if len(fds) != 3:
+            return None, f"Expected 3 file descriptors, got {len(fds)}\n"
+        cmd, shell, env, cwd = pickle.loads(request)
+        try:
+            proc = subprocess.Popen(
+                cmd,
+                shell=shell,
+                stdin=fds[0],
+                stdout=fds[1],
+                stderr=fds[2],
+                env=env,
+                cwd=cwd,
+                # Put the step in its own session; see `stepup.core.run._signal_process_group`.
+                start_new_session=True,
+            )
+        except OSError as exc:
+            return None, f"Failed to launch command {cmd!r}: {exc}\n"
+        return proc, None
+    finally:
+        for fd in fds:
+            os.close(fd)
+
+
+def _reap(procs: dict[int, subprocess.Popen]) -> list[tuple]:
+    """Reap all exited subprocesses and return the corresponding messages for the director."""
+    messages = []
+    while len(procs) > 0:
+        try:
+            pid, status, rusage = os.wait4(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            break
+        proc = procs.pop(pid, None)
+        if proc is not None:
+            # Tell `subprocess` the process was reaped, so it never tries to reap it itself.
+            proc.returncode = os.waitstatus_to_exitcode(status)
+        messages.append(("exited", pid, status, tuple(rusage)))
+    return messages
+
+
+def serve(sock: socket.socket) -> None:
+    """Start and reap subprocesses for the director until it closes its end of `sock`."""
+    procs = {}
+    # SIGCHLD wakes up the selector through the wakeup fd.
+    # A Python-level handler is needed for the wakeup fd to be written at all.
+    wakeup_r, wakeup_w = os.pipe()
+    os.set_blocking(wakeup_r, False)
+    os.set_blocking(wakeup_w, False)
+    signal.set_wakeup_fd(wakeup_w)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    selector = selectors.DefaultSelector()
+    selector.register(sock, selectors.EVENT_READ)
+    selector.register(wakeup_r, selectors.EVENT_READ)
+    while True:
+        for key, _ in selector.select():
+            if key.fd == wakeup_r:
+                with contextlib.suppress(BlockingIOError):
+                    while os.read(wakeup_r, 4096):
+                        pass
+                continue
+            request, fds, flags, _ = socket.recv_fds(sock, MAX_REQUEST_SIZE, 3)
+            if len(request) == 0:
+                for fd in fds:
+                    os.close(fd)
+                return
+            if flags & (socket.MSG_TRUNC | socket.MSG_CTRUNC):
+                for fd in fds:
+                    os.close(fd)
+                proc, error = None, "Launch request too large for the spawn helper\n"
+            else:
+                proc, error = _launch(request, fds)
+            if proc is not None:
+                procs[proc.pid] = proc
+            sock.sendall(pickle.dumps(("launched", None if proc is None else proc.pid, error)))
+        for message in _reap(procs):
+            sock.sendall(pickle.dumps(message))
+
+
+def main() -> None:
+    """Entry point of the helper process, receiving its end of the socket pair as an fd."""
+    # Leave signals meant for the director (e.g. a Ctrl-C in the terminal) to the director.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    with socket.socket(fileno=int(sys.argv[1])) as sock:
+        serve(sock)
+
+
+#
+# Client in the director
+#
+
+
+@attrs.define
+class Spawner:
+    """The director's connection to the spawn helper.
+
+    Use `Spawner.start()` to create an instance.
+    All other methods must be called from the event loop of the director.
+    """
+
+    proc: subprocess.Popen = attrs.field()
+    """The helper process."""
+
+    sock: socket.socket = attrs.field()
+    """The director's end of the socket pair."""
+
+    _launched: collections.deque[asyncio.Future] = attrs.field(
+        init=False, factory=collections.deque
+    )
+    """Futures of the launch requests not answered yet, in the order they were sent."""
+
+    _exited: dict[int, asyncio.Future] = attrs.field(init=False, factory=dict)
+    """Futures of the `(status, rusage)` of started processes that were not reaped yet."""
+
+    _reader: asyncio.Task | None = attrs.field(init=False, default=None)
+    """The task receiving the replies of the helper, started with the first launch request."""
+
+    _alive: bool = attrs.field(init=False, default=True)
+    """Whether the helper can still answer requests."""
+
+    @classmethod
+    def start(cls) -> "Spawner":
+        """Start the helper process, preferably while the director is still small."""
+        parent_sock, child_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        with child_sock:
+            proc = subprocess.Popen(
+                [sys.executable, "-m", "stepup.core.spawner", str(child_sock.fileno())],
+                pass_fds=[child_sock.fileno()],
+                stdin=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+        parent_sock.setblocking(False)
+        return cls(proc, parent_sock)
+
+    def close(self) -> None:
+        """Close the connection, after which the helper exits, and wait for it."""
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+        self.sock.close()
+        self.proc.wait()
+
+    async def launch(
+        self,
+        cmd: str | list[str],
+        *,
+        shell: bool,
+        env: dict,
+        cwd: str,
+        fds: tuple[int, int, int],
+    ) -> int:
+        """Start a subprocess through the helper and return its pid.
+
+        Parameters
+        ----------
+        cmd, shell, env, cwd
+            As for `subprocess.Popen`.
+        fds
+            The file descriptors of the standard input, output and error of the subprocess.
+            They are duplicated into the helper, so the caller must still close them.
+
+        Raises
+        ------
+        OSError
+            When the helper could not be reached, or could not start the subprocess.
+            In the latter case, the message is the one to show to the user.
+        """
+        if not self._alive:
+            raise ConnectionError("The spawn helper exited unexpectedly.")
+        if self._reader is None:
+            self._reader = asyncio.create_task(self._read_replies(), name="spawner")
+        request = pickle.dumps((cmd, shell, env, cwd))
+        while True:
+            try:
+                socket.send_fds(self.sock, [request], list(fds))
+                break
+            except BlockingIOError:
+                await wait_for_writable_fd(self.sock.fileno())
+        launched = asyncio.get_running_loop().create_future()
+        self._launched.append(launched)
+        pid, error = await launched
+        if pid is None:
+            raise OSError(error)
+        return pid
+
+    async def wait4(self, pid: int) -> tuple[int, resource.struct_rusage]:
+        """Wait for a subprocess started with `launch()` to exit.
+
+        Returns
+        -------
+        status, rusage
+            The wait status and the resource usage of the process, as returned by `os.wait4`.
+
+        Raises
+        ------
+        ConnectionError
+            When the helper died before the process exited.
+        """
+        try:
+            return await self._exited[pid]
+        finally:
+            del self._exited[pid]
+
+    async def _read_replies(self) -> None:
+        """Receive the replies of the helper and resolve the corresponding futures."""
+        fd = self.sock.fileno()
+        try:
+            while True:
+                try:
+                    data = self.sock.recv(MAX_REPLY_SIZE)
+                except BlockingIOError:
+                    await wait_for_readable_fd(fd)
+                    continue
+                if len(data) == 0:
+                    break
+                message = pickle.loads(data)
+                if message[0] == "launched":
+                    _, pid, error = message
+                    launched = self._launched.popleft()
+                    if not launched.done():
+                        if pid is not None:
+                            # Registered before any exit message of this pid can be processed.
+                            # It is removed by `wait4`, which may be called after the exit.
+                            self._exited[pid] = asyncio.get_running_loop().create_future()
+                        launched.set_result((pid, error))
+                    elif pid is not None:
+                        # The step was cancelled while waiting for the pid,
+                        # so nobody else can stop the process.
+                        with contextlib.suppress(ProcessLookupError):
+                            os.killpg(pid, signal.SIGKILL)
+                else:
+                    _, pid, status, rusage = message
+                    exited = self._exited.get(pid)
+                    if exited is not None and not exited.done():
+                        exited.set_result((status, resource.struct_rusage(rusage)))
+        except OSError:
+            pass
+        # The helper is gone: nothing pending can complete anymore.
+        self._alive = False
+        futures = [*self._launched, *self._exited.values()]
+        self._launched.clear()
+        for future in futures:
+            if not future.done():
+                future.set_exception(ConnectionError("The spawn helper exited unexpectedly."))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,13 @@
 # SPDX-License-Identifier: LGPL-3.0-or-later
 """Startup sequence after opening the database and configuring internal data structures."""
 
+import asyncio
 import logging
 import os
 
 from .builder import Builder
 from .enums import FileState, HashUpdateCause, StepState
-from .hash import FileHash, fmt_env_value, fmt_file_hash_diff
+from .hash import FileHash, find_stat_changes, fmt_env_value, fmt_file_hash_diff
 from .hash_queue import gather_hashes
 from .nglob import NamedGlob
 from .path import parent_dir
@@ -127,6 +128,10 @@ async def rescan_files(workflow: Workflow, reporter: ReporterClient, builder: Bu
     - Files in the VOLATILE state: they are expected to change.
     - Files in the PLANNED state: they are not yet built, so their content is not relevant.
     - Detached files: they are not part of the workflow, so their content is not relevant.
+
+    Before any hash job is submitted, `find_stat_changes` compares the stored file properties
+    with the ones on disk, one directory listing at a time.
+    On a restart without changes, this leaves almost no files to hash.
     """
     sql = (
         "SELECT label, state, hash "
@@ -142,7 +147,7 @@ async def rescan_files(workflow: Workflow, reporter: ReporterClient, builder: Bu
     old_hashes = {}
     path_hash_causes = []
     for path, state, hash_value in rows:
-        old_file_hash = FileHash.from_json(hash_value)
+        old_file_hash = FileHash.from_blob(hash_value)
         old_hashes[path] = old_file_hash
         # A stray `UNCONFIRMED` row is left behind by a director killed
         # while the hash job confirming that file was still queued or in flight.
@@ -156,8 +161,33 @@ async def rescan_files(workflow: Workflow, reporter: ReporterClient, builder: Bu
             else HashUpdateCause.EXTERNAL
         )
         path_hash_causes.append((path, old_file_hash, cause))
+
+    # Under the `EXTERNAL` cause, an unchanged hash is not applied,
+    # so there is no need to submit a hash job for a file whose properties are unchanged.
+    # `CONFIRMED` files always need their hash job, which applies the hash even when unchanged.
+    external_hashes = {
+        path: old_file_hash
+        for path, old_file_hash, cause in path_hash_causes
+        if cause == HashUpdateCause.EXTERNAL
+    }
+    if len(external_hashes) > 0:
+        loop = asyncio.get_running_loop()
+        changed = set(
+            await loop.run_in_executor(
+                builder.executor.hash_pool,
+                find_stat_changes,
+                external_hashes,
+                builder.executor.digest_algorithm,
+            )
+        )
+        path_hash_causes = [
+            (path, old_file_hash, cause)
+            for path, old_file_hash, cause in path_hash_causes
+            if cause != HashUpdateCause.EXTERNAL or path in changed
+        ]
+    njob_hash = builder.njob if builder.njob_hash is None else builder.njob_hash
     new_hashes = await gather_hashes(
-        builder.hash_queue, builder.executor, reporter, path_hash_causes, builder.njob
+        builder.hash_queue, builder.executor, reporter, path_hash_causes, njob_hash
     )
 
     for path, new_file_hash in new_hashes.items():
@@ -15,7 +15,7 @@ from .cattrs import json_converter
 from .enums import FILE_STATES_BY_ROLE, FileRole, FileState, Need, StepState
 from .exceptions import GraphError
 from .file import File
-from .hash import FileHash, StepHash, fmt_full_digest
+from .hash import STEP_HASH_HEADER, FileHash, StepHash, fmt_full_digest
 from .nglob import NamedGlob, convert_nglob_to_regex
 from .outcome import ChildOutcome, ResourceUsage
 from .static_tree import StaticTree
@@ -28,6 +28,7 @@ __all__ = (
     "UNAVAILABLE_INPUT_WHERE",
     "PathRecord",
     "Step",
+    "duration_class_keys",
     "truncate_output",
     "unavailable_input_sql",
 )
@@ -134,6 +135,9 @@ CREATE TABLE IF NOT EXISTS step (
     -- The result lives exclusively in _implied_need and is never persisted here.
     duration REAL NOT NULL CHECK(duration >= 0) DEFAULT 1.0,
     -- An estimate of the wall time of the step in seconds.
+    priority INTEGER NOT NULL DEFAULT 0,
+    -- The priority declared by the user. Among steps that are equally urgent otherwise
+    -- (see step_dispatch below), a higher priority is dispatched first, before _tail_time.
     deferred INTEGER NOT NULL CHECK(deferred IN (0, 1)) DEFAULT 0,
     -- Whether the step is deferred due to missing inputs (see StepState.PENDING).
     defer_count INTEGER NOT NULL CHECK(defer_count >= 0) DEFAULT 0,
@@ -219,6 +223,7 @@ CREATE INDEX IF NOT EXISTS step_check_ready ON step(node) WHERE _check_ready;
 CREATE INDEX IF NOT EXISTS step_dispatch ON step(
     _has_hash DESC,
     (_implied_need = {Need.PLAN.value}) DESC,
+    priority DESC,
     (_tail_time / (1 + defer_count)) DESC
 ) WHERE {STEP_DISPATCH_WHERE};
 
@@ -456,11 +461,11 @@ CREATE TABLE IF NOT EXISTS env_var (
 -- skipped.
 CREATE TABLE IF NOT EXISTS step_hash (
     node INTEGER PRIMARY KEY,
-    hash TEXT NOT NULL,
-    -- JSON-encoded StepHash of the last successful run.
+    hash BLOB NOT NULL,
+    -- Binary StepHash of the last successful run, see StepHash.to_blob.
     -- Absence of a row means no hash is stored (e.g. never run, or reset via Step.delete_hash).
     FOREIGN KEY (node) REFERENCES node(i) ON DELETE CASCADE,
-    CHECK (json_valid(hash))
+    CHECK (typeof(hash) = 'blob' AND length(hash) >= {STEP_HASH_HEADER.size})
 );
 
 -- Keep _has_hash in sync with step_hash rows. Step.set_hash uses INSERT OR REPLACE, whose
@@ -488,15 +493,49 @@ CREATE TABLE IF NOT EXISTS step_outcome (
     stime REAL NOT NULL CHECK(stime >= 0) DEFAULT 0.0,
     wtime REAL NOT NULL CHECK(wtime >= 0) DEFAULT 0.0,
     -- Resource usage of the step's command: user/system/wall time in seconds.
+    maxrss REAL NOT NULL CHECK(maxrss >= 0) DEFAULT 0.0,
+    -- Peak resident set size of the step's command (or its largest child process) in MiB.
     FOREIGN KEY (node) REFERENCES node(i) ON DELETE CASCADE
 );
 
+-- Measured durations of the most recent executions of each step's command.
+-- Written by Scheduler.build_completed(), which keeps at most DURATION_HISTORY_SIZE rows per
+-- step and derives step.duration from them with estimate_duration() (both in scheduler.py),
+-- so a single slow or fast run does not replace the estimate used for the tail times.
+CREATE TABLE IF NOT EXISTS step_duration (
+    node INTEGER NOT NULL,
+    run INTEGER NOT NULL CHECK(run > 0),
+    -- Sequence number of the execution, increasing per step: the highest is the most recent.
+    wtime REAL NOT NULL CHECK(wtime >= 0),
+    -- Wall time of the job that executed the step's command, in seconds.
+    ctime REAL CHECK(ctime >= 0),
+    -- User plus system CPU time of the command (including its children), in seconds,
+    -- taken from step_outcome, or NULL when no outcome was recorded.
+    maxrss REAL CHECK(maxrss >= 0),
+    -- Peak resident set size of the command in MiB, taken from step_outcome, or NULL.
+    PRIMARY KEY (node, run),
+    FOREIGN KEY (node) REFERENCES node(i) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+-- Duration estimates shared by steps with a similar command or working directory,
+-- see duration_class_keys(). A new step without an explicit duration starts from the estimate
+-- of its most specific known class instead of the schema default of one second.
+-- Not a satellite of any node: the estimates outlive the steps that contributed to them.
+CREATE TABLE IF NOT EXISTS duration_class (
+    key TEXT PRIMARY KEY,
+    duration REAL NOT NULL CHECK(duration >= 0)
+) WITHOUT ROWID;
+
 -- Named resource units (e.g. a semaphore-like GPU or license count) claimed by this step
 -- while it runs; consumed by the scheduler to cap concurrent resource usage.
 CREATE TABLE IF NOT EXISTS step_resource (
     node  INTEGER NOT NULL,
     name  TEXT    NOT NULL CHECK(name <> ''),
     units INTEGER NOT NULL CHECK(units > 0),
+    implicit INTEGER NOT NULL CHECK(implicit IN (0, 1)) DEFAULT 0,
+    -- Whether the claim was derived by the scheduler instead of declared by the step:
+    -- the memory claim of a memory-hungry step, see MEMORY_RESOURCE in scheduler.py.
+    -- Step.set_resources() keeps implicit claims, unless the step declares the same resource.
     PRIMARY KEY (node, name),
     FOREIGN KEY (node) REFERENCES node(i) ON DELETE CASCADE
 ) WITHOUT ROWID;
@@ -525,7 +564,8 @@ CREATE TABLE IF NOT EXISTS step_subprocess (
     stderr TEXT,
     -- The captured standard error of the subprocess, or NULL if not captured.
     -- ON DELETE CASCADE removes these rows when the node row is deleted, matching the
-    -- other satellite tables (env_var / step_hash / step_outcome / step_resource).
+    -- other satellite tables (env_var / step_hash / step_outcome / step_duration /
+    -- step_resource).
     -- Step.reset_for_rerun() still clears them explicitly between runs of a surviving step.
     FOREIGN KEY (node) REFERENCES node(i) ON DELETE CASCADE
 );
@@ -570,6 +610,43 @@ def truncate_output(content: str, max_bytes: int | None = None) -> str:
     return f"{truncated}\n[output truncated at {max_bytes} bytes]\n"
 
 
+def duration_class_keys(command: str, workdir: str) -> tuple[str, str, str]:
+    """Return the keys of the `duration_class` rows of a step, from most to least specific.
+
+    Steps running the same program in the same working directory are assumed
+    to take a similar amount of time, e.g. a series of simulations or plots.
+    Less specific classes only match the program, or only the working directory.
+
+    Parameters
+    ----------
+    command
+        The command of the step, without the working directory comment.
+    workdir
+        The working directory of the step, relative to `STEPUP_ROOT`.
+
+    Returns
+    -------
+    keys
+        The keys of the program in the working directory, the program and the working directory.
+    """
+    words = command.split(maxsplit=1)
+    program = words[0] if len(words) > 0 else ""
+    return f"prog:{program} wd:{workdir}", f"prog:{program}", f"wd:{workdir}"
+
+
+# The initial duration of a new step without an explicit duration:
+# the estimate of the most specific class in `duration_class`, or the schema default of one second.
+INITIAL_DURATION = """
+COALESCE(
+    :duration,
+    (SELECT duration FROM duration_class WHERE key = :key0),
+    (SELECT duration FROM duration_class WHERE key = :key1),
+    (SELECT duration FROM duration_class WHERE key = :key2),
+    1.0
+)
+"""
+
+
 # When a step is detached or recycled, its creator chain changes, which alters the "safe" state
 # of the step and of every step it created (recursively): whether their (indirect) creator is in
 # a state that allows queuing them. Flag _check_safe (and _check_after) on the step and all its
@@ -632,13 +709,13 @@ class PathRecord:
     dynamic: bool
     """Whether the path was a dynamic dependency, i.e. discovered while the step was running."""
 
-    _hash_json: str | None = attrs.field(repr=False)
-    """The JSON representation of the file's hash, decoded lazily through `hash`."""
+    _hash_blob: bytes | None = attrs.field(repr=False)
+    """The binary representation of the file's hash, decoded lazily through `hash`."""
 
     @property
     def hash(self) -> FileHash:
-        """The file's hash, lazily decoded from its JSON representation."""
-        return FileHash.from_json(self._hash_json)
+        """The file's hash, lazily decoded from its binary representation."""
+        return FileHash.from_blob(self._hash_blob)
 
 
 @attrs.define
@@ -672,6 +749,7 @@ class Step(Node):
         need: Need = Need.DEFAULT,
         shell: bool = False,
         duration: float | None = None,
+        priority: int = 0,
         _safe: bool = False,
         **kwargs,  # workdir is consumed by adjust_label, not used here
     ):
@@ -684,7 +762,11 @@ class Step(Node):
         shell
             Whether the step command is executed via a shell (shell=True).
         duration
-            An estimate of the wall time of the step in seconds. If not given, defaults to 1.0.
+            An estimate of the wall time of the step in seconds.
+            If not given, the estimate of the most similar steps measured before is used,
+            see `duration_class_keys`, or 1.0 when there are none.
+        priority
+            The priority declared by the user, used to order the dispatch of steps.
         _safe
             Whether this step is safe to run, meaning that all its (recursive) creators
             are in a state that allows queuing this step (RUNNING or SUCCEEDED).
@@ -717,8 +799,9 @@ class Step(Node):
         # `Scheduler._update_meta_after()`, in exchange for not depending on that unstated
         # call-order assumption.
 
-        # `duration` falls back to `1.0` (matching the column's own `DEFAULT`) when not given,
-        # since a brand-new step has no prior measurement to seed it with.
+        # `duration`, when not given, falls back to the estimate of a class of similar steps,
+        # since a brand-new step has no prior measurement of its own to seed it with,
+        # and finally to `1.0` (matching the column's own `DEFAULT`).
 
         # `_safe_ignoring_hold` is seeded to the same value as `_safe`
         # (rather than left at its own `DEFAULT 0`).
@@ -729,18 +812,23 @@ class Step(Node):
         # `DEFAULT 0` until its own state next changes and re-flags `_check_safe`.
         # Every top-level step's `_safe_ignoring_hold` chain is seeded from the root's,
         # via `creator_step._safe_ignoring_hold` in `FILL_SAFE_UPDATE`.
+        key0, key1, key2 = duration_class_keys(*self.command_and_workdir)
         self.db.execute(
             "INSERT INTO step "
-            "(node, state, need, duration, shell, _safe, _check_safe, _safe_ignoring_hold, "
-            "_implied_need, _check_after, _has_hash) "
-            "VALUES(:node, :state, :need, :duration, :shell, :safe, :check_safe, :safe, "
-            ":implied_need, 1, "
+            "(node, state, need, duration, priority, shell, _safe, _check_safe, "
+            "_safe_ignoring_hold, _implied_need, _check_after, _has_hash) "
+            f"VALUES(:node, :state, :need, {INITIAL_DURATION}, :priority, :shell, :safe, "
+            ":check_safe, :safe, :implied_need, 1, "
             "(SELECT EXISTS(SELECT 1 FROM step_hash WHERE node = :node)))",
             {
                 "node": self.i,
                 "need": need.value,
                 "state": StepState.PENDING.value,
-                "duration": 1.0 if duration is None else duration,
+                "duration": duration,
+                "priority": priority,
+                "key0": key0,
+                "key1": key1,
+                "key2": key2,
                 "shell": int(shell),
                 "safe": int(_safe),
                 "check_safe": int(not _safe),
@@ -756,8 +844,8 @@ class Step(Node):
 
     def format_properties(self) -> Iterator[tuple[str, str]]:
         """Iterate over key-value pairs that represent the properties of the node."""
-        sql = "SELECT state, need, _implied_need FROM step WHERE node = ?"
-        state_id, need_id, implied_need_id = self.db.execute(sql, (self.i,)).fetchone()
+        sql = "SELECT state, need, _implied_need, priority FROM step WHERE node = ?"
+        state_id, need_id, implied_need_id, priority = self.db.execute(sql, (self.i,)).fetchone()
         state = StepState(state_id)
         yield "state", state.name
         need = Need(need_id)
@@ -766,6 +854,8 @@ class Step(Node):
             yield "need", need.name
         else:
             yield "need", f"{implied_need.name} (implied by sinks > {need.name})"
+        if priority != 0:
+            yield "priority", str(priority)
 
         sql = "SELECT name, dynamic FROM env_var WHERE node = ?"
         label = "using_env"
@@ -785,8 +875,10 @@ class Step(Node):
                 line += " (" + " ".join(f"{k}={v}" for k, v in ng.subs.items()) + ")"
             yield "nglob", line
 
-        for name, units in self.resources():
+        for name, units in self.resources(implicit=False):
             yield "resource", f"{name}: {units} units"
+        for name, units in self.resources(implicit=True):
+            yield "resource", f"{name}: {units} units (implicit)"
 
         step_hash = self.get_hash()
         if step_hash is not None:
@@ -850,6 +942,7 @@ class Step(Node):
         resources: dict[str, int] | None = None,
         env_overrides: dict[str, str] | None = None,
         duration: float | None = None,
+        priority: int = 0,
         **kwargs,
     ):
         """Update the mutable declared properties of this step after a full recycle.
@@ -874,8 +967,8 @@ class Step(Node):
         within the same build, while `report_unbuilt` still counts it as a failure.
         """
         self.db.execute(
-            "UPDATE step SET need = ?, shell = ?, _holding = 0 WHERE node = ?",
-            (need.value, int(shell), self.i),
+            "UPDATE step SET need = ?, shell = ?, priority = ?, _holding = 0 WHERE node = ?",
+            (need.value, int(shell), priority, self.i),
         )
         if self.get_state() == StepState.FAILED:
             self.graph.mark_step_pending(self)
@@ -1044,12 +1137,20 @@ class Step(Node):
 
         `resources` maps resource name (e.g. a GPU or license semaphore) to
         the number of units claimed, or is `None` to clear all claims.
+        Implicit claims derived by the scheduler are kept,
+        except for resources that are also given in `resources`.
         """
-        self.db.execute("DELETE FROM step_resource WHERE node = ?", (self.i,))
+        self.db.execute("DELETE FROM step_resource WHERE node = ? AND NOT implicit", (self.i,))
         if resources is None:
             return
-        rows = [(self.i, name, units) for name, units in resources.items()]
-        self.db.executemany("INSERT INTO step_resource VALUES (?, ?, ?)", rows)
+        self.db.executemany(
+            "DELETE FROM step_resource WHERE node = ? AND name = ?",
+            [(self.i, name) for name in resources],
+        )
+        self.db.executemany(
+            "INSERT INTO step_resource (node, name, units) VALUES (?, ?, ?)",
+            [(self.i, name, units) for name, units in resources.items()],
+        )
 
     def add_env_deps(self, env_deps: Collection[str]) -> None:
         """Record environment variables read by this step, declared up front.
@@ -1181,8 +1282,8 @@ class Step(Node):
             where += f" AND ({' OR '.join(where_states)})"
 
         sql += f" SELECT {', '.join(fields)} FROM relevant {join} {where}"
-        for label, state, hash_json, detached, is_dynamic in self.db.execute(sql, data):
-            yield PathRecord(label, FileState(state), bool(detached), bool(is_dynamic), hash_json)
+        for label, state, hash_blob, detached, is_dynamic in self.db.execute(sql, data):
+            yield PathRecord(label, FileState(state), bool(detached), bool(is_dynamic), hash_blob)
 
     def inp_paths(self, *, dynamic: bool | None = None) -> Iterator[PathRecord]:
         """Iterate over input files of this step."""
@@ -1211,11 +1312,16 @@ class Step(Node):
         for row in self.db.execute("SELECT data FROM nglob WHERE node = ?", (self.i,)):
             yield json_converter.structure(json.loads(row[0]), NamedGlob)
 
-    def resources(self) -> Iterator[tuple[str, int]]:
-        """Iterate over the `(name, units)` pairs of the resources required by this step."""
-        yield from self.db.execute(
-            "SELECT name, units FROM step_resource WHERE node = ?", (self.i,)
-        )
+    def resources(self, *, implicit: bool | None = None) -> Iterator[tuple[str, int]]:
+        """Iterate over the `(name, units)` pairs of the resources required by this step.
+
+        With `implicit=False` (or `True`), only the declared (or implicit) claims are included.
+        """
+        sql = "SELECT name, units FROM step_resource WHERE node = ?"
+        if implicit is not None:
+            sql += " AND" if implicit else " AND NOT"
+            sql += " implicit"
+        yield from self.db.execute(sql, (self.i,))
 
     #
     # Build phase
@@ -1419,12 +1525,12 @@ class Step(Node):
     def get_hash(self) -> StepHash | None:
         """Return the stored step hash, or `None` if none is stored."""
         row = self.db.execute("SELECT hash FROM step_hash WHERE node = ?", (self.i,)).fetchone()
-        return None if row is None else StepHash.from_json(row[0])
+        return None if row is None else StepHash.from_blob(row[0])
 
     def set_hash(self, step_hash: StepHash):
         """Store the step hash."""
         self.db.execute(
-            "INSERT OR REPLACE INTO step_hash VALUES (?, ?)", (self.i, step_hash.to_json())
+            "INSERT OR REPLACE INTO step_hash VALUES (?, ?)", (self.i, step_hash.to_blob())
         )
 
     def delete_hash(self):
@@ -1444,7 +1550,7 @@ class Step(Node):
             See `truncate_output`.
         """
         self.db.execute(
-            "INSERT OR REPLACE INTO step_outcome VALUES (?, ?, ?, ?, ?, ?, ?)",
+            "INSERT OR REPLACE INTO step_outcome VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
             (
                 self.i,
                 outcome.returncode,
@@ -1453,13 +1559,14 @@ class Step(Node):
                 outcome.usage.utime,
                 outcome.usage.stime,
                 outcome.usage.wtime,
+                outcome.usage.maxrss,
             ),
         )
 
     def get_outcome(self) -> ChildOutcome | None:
         """Return the stored child outcome for this step."""
         row = self.db.execute(
-            "SELECT returncode, stdout, stderr, utime, stime, wtime "
+            "SELECT returncode, stdout, stderr, utime, stime, wtime, maxrss "
             "FROM step_outcome WHERE node = ?",
             (self.i,),
         ).fetchone()
@@ -1469,7 +1576,7 @@ class Step(Node):
             returncode=row[0],
             stdout=row[1],
             stderr=row[2],
-            usage=ResourceUsage(utime=row[3], stime=row[4], wtime=row[5]),
+            usage=ResourceUsage(utime=row[3], stime=row[4], wtime=row[5], maxrss=row[6]),
         )
 
     def delete_outcome(self) -> None:
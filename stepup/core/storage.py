@@ -0,0 +1,168 @@
+# SPDX-FileCopyrightText: 2024 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Detect the type of storage holding the workflow, to size the budget of hash jobs.
+
+Hashing files is mostly waiting for the storage device:
+
+- A rotational disk serves concurrent reads poorly, because every switch costs a seek.
+- Solid-state storage (and memory-backed file systems) handle many parallel reads well.
+- Network file systems have a high latency per request, which concurrency hides,
+  but their servers are shared, so the concurrency is kept moderate.
+
+The detection only works on Linux, where `/proc/self/mountinfo` and `/sys/dev/block` exist.
+Elsewhere, the storage type is reported as `"unknown"`.
+"""
+
+import os
+import re
+
+from path import Path
+
+__all__ = ("NETWORK_FILE_SYSTEMS", "default_hash_jobs", "detect_storage_kind", "find_mount")
+
+
+NETWORK_FILE_SYSTEMS = frozenset(
+    [
+        "9p",
+        "afs",
+        "beegfs",
+        "ceph",
+        "cifs",
+        "fuse.sshfs",
+        "glusterfs",
+        "gpfs",
+        "lustre",
+        "nfs",
+        "nfs4",
+        "panfs",
+        "smb3",
+        "smbfs",
+        "wekafs",
+    ]
+)
+"""File system types whose files are served over the network."""
+
+MEMORY_FILE_SYSTEMS = frozenset(["ramfs", "tmpfs"])
+"""File system types whose files are kept in memory."""
+
+HASH_JOBS_ROTATIONAL = 2
+"""Number of concurrent hash jobs on a rotational disk."""
+
+HASH_JOBS_NETWORK = 16
+"""Number of concurrent hash jobs on a network file system."""
+
+
+def _unescape_mountinfo(field: str) -> str:
+    """Decode the octal escapes (e.g. `\\040` for a space) in a field of `mountinfo`."""
+    return re.sub(r"\\([0-7]{3})", lambda match: chr(int(match.group(1), 8)), field)
+
+
+def find_mount(path: str, mountinfo: str = "/proc/self/mountinfo") -> tuple[str, str] | None:
+    """Find the mount holding a path.
+
+    Parameters
+    ----------
+    path
+        A path in the file system of interest. It is resolved before matching.
+    mountinfo
+        The mountinfo file of the process, see `proc_pid_mountinfo(5)`.
+
+    Returns
+    -------
+    fstype_devno
+        The file system type and the device number (`major:minor`) of the mount
+        with the longest mount point containing the path,
+        or `None` if the mountinfo file cannot be read or has no matching mount.
+    """
+    path = os.path.realpath(path)
+    best = None
+    best_length = -1
+    try:
+        with open(mountinfo) as fh:
+            for line in fh:
+                before, sep, after = line.partition(" - ")
+                words = before.split()
+                if sep == "" or len(words) < 5 or len(after.split()) == 0:
+                    continue
+                mount_point = _unescape_mountinfo(words[4])
+                prefix = mount_point.rstrip("/") + "/"
+                if (path == mount_point or path.startswith(prefix)) and len(
+                    mount_point
+                ) > best_length:
+                    best = (after.split()[0], words[2])
+                    best_length = len(mount_point)
+    except OSError:
+        return None
+    return best
+
+
+def _is_rotational(devno: str, sys_root: str) -> bool | None:
+    """Tell whether a block device is rotational, or return `None` if unknown.
+
+    A partition has no `queue` directory of its own, so that of the parent disk is used.
+    """
+    device = Path(sys_root) / "dev/block" / devno
+    for queue in device / "queue", device.realpath().parent / "queue":
+        try:
+            return (queue / "rotational").read_text().strip() == "1"
+        except OSError:
+            continue
+    return None
+
+
+def detect_storage_kind(
+    path: str, mountinfo: str = "/proc/self/mountinfo", sys_root: str = "/sys"
+) -> str:
+    """Detect the type of storage holding a path.
+
+    Parameters
+    ----------
+    path
+        A path in the file system of interest, normally the working directory.
+    mountinfo
+        The mountinfo file of the process.
+    sys_root
+        The mount point of sysfs.
+
+    Returns
+    -------
+    kind
+        One of `"network"`, `"rotational"`, `"solid"` or `"unknown"`.
+        Memory-backed file systems are reported as `"solid"`.
+    """
+    mount = find_mount(path, mountinfo)
+    if mount is None:
+        return "unknown"
+    fstype, devno = mount
+    if fstype in NETWORK_FILE_SYSTEMS or fstype.startswith("nfs"):
+        return "network"
+    if fstype in MEMORY_FILE_SYSTEMS:
+        return "solid"
+    rotational = _is_rotational(devno, sys_root)
+    if rotational is None:
+        return "unknown"
+    return "rotational" if rotational else "solid"
+
+
+def default_hash_jobs(kind: str, ncore: int) -> int:
+    """Return the default number of concurrent hash jobs for a type of storage.
+
+    Parameters
+    ----------
+    kind
+        The type of storage, as returned by `detect_storage_kind()`.
+    ncore
+        The number of available CPU cores.
+
+    Returns
+    -------
+    njob_hash
+        A few concurrent hash jobs on a rotational disk, a moderate number on a network file system,
+        and otherwise the default size of `concurrent.futures.ThreadPoolExecutor`,
+        which is also the default number of hash threads.
+    """
+    if kind == "rotational":
+        return HASH_JOBS_ROTATIONAL
+    if kind == "network":
+        return HASH_JOBS_NETWORK
+    return min(32, ncore + 4)
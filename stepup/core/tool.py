@@ -34,6 +34,7 @@ __all__ = (
     "ToolFunc",
     "connect_graph_db",
     "get_graph_db_path",
+    "nonnegative_int",
     "positive_decimal",
     "positive_int",
     "print_error",
@@ -110,6 +111,20 @@ def connect_graph_db() -> sqlite3.Connection:
     return connect(get_graph_db_path(), read_only=True)
 
 
+def nonnegative_int(value: str | int) -> int:
+    """Convert a command-line or config value to an integer, requiring it to be zero or positive.
+
+    Raises
+    ------
+    ValueError
+        If the value is not an integer or is negative.
+    """
+    number = int(value)
+    if number < 0:
+        raise ValueError(f"'{value}' is negative.")
+    return number
+
+
 def positive_int(value: str | int) -> int:
     """Convert a command-line or config value to an integer, requiring it to be strictly positive.
 
@@ -3,7 +3,7 @@
 """Print a step's traceback without the frames that only show how StepUp launched it.
 
 When a step fails, the frames that matter are the user's.
-The frames that launched the step (`_forkserver_entry`, `runpy`, ...) never do,
+The frames that launched the step (`_run_step_in_process`, `runpy`, ...) never do,
 and StepUp's own frames only matter when the failure is a StepUp bug.
 This module always removes the former, and removes the latter only for a `UsageError`,
 which is by definition a mistake in the user's code rather than in StepUp.
@@ -44,6 +44,9 @@ HINT = "(Traceback shortened. Set STEPUP_DEBUG=1 for the director traceback and
 LAUNCHER_MODULES = frozenset(["runpy", "importlib._bootstrap", "importlib._bootstrap_external"])
 """Modules whose frames only show how the step was started, never why it failed."""
 
+LAUNCHER_FUNCTIONS = frozenset(["_call_entry_point", "_load_call_script", "_run_step_in_process"])
+"""Functions in `stepup.core.run` that start a step in a forkserver child."""
+
 
 def print_step_traceback(exc: BaseException, file: TextIO) -> None:
     """Print the traceback of a failed step, with the uninteresting frames removed.
@@ -213,7 +216,7 @@ def _is_launcher_frame(frame: types.FrameType, outermost: bool) -> bool:
     module_name = frame.f_globals.get("__name__")
     if module_name in LAUNCHER_MODULES:
         return True
-    if module_name == "stepup.core.run" and frame.f_code.co_name == "_forkserver_entry":
+    if module_name == "stepup.core.run" and frame.f_code.co_name in LAUNCHER_FUNCTIONS:
         return True
     # `PYCODE_WRAPPER` (`run.py`) is fed to `python -` through stdin,
     # so its module-level frame is reported as `<stdin>`.
@@ -39,6 +39,11 @@ CREATE TABLE IF NOT EXISTS node (
     -- * To determine whether a node should be cleaned up.
     -- * To exclude detached steps from scheduling.
     -- * To keep metadata about detached nodes in case they are recycled later.
+    topo INTEGER NOT NULL DEFAULT 0,
+    -- Position of the node in a topological order of the dependency graph:
+    -- the source of every dependency has a lower value than its sink.
+    -- New nodes are appended at the end, and Node.add_source reorders
+    -- the affected region when a new edge points backwards.
     FOREIGN KEY (creator) REFERENCES node(i),
     -- The root node is always node 1, is its own creator, is never detached,
     -- and has an empty label.
@@ -54,6 +59,7 @@ CREATE TABLE IF NOT EXISTS node (
 CREATE INDEX IF NOT EXISTS node_creator_kind ON node (creator, kind);
 CREATE UNIQUE INDEX IF NOT EXISTS node_kind_label ON node (kind, label);
 CREATE INDEX IF NOT EXISTS node_detached ON node (i) WHERE detached;
+CREATE INDEX IF NOT EXISTS node_topo ON node (topo);
 
 CREATE TABLE IF NOT EXISTS dependency (
     i INTEGER PRIMARY KEY,
@@ -105,18 +111,49 @@ FROM node LEFT JOIN all_products ON node.i = all_products.current
 WHERE node.detached = (all_products.current IS NOT NULL)
 """
 
-# Recursively find all sinks of a node by following source -> sink edges,
-# including the given node itself.
-# This can be combined with either SELECT_ALL_SINKS or SELECT_CYCLIC.
-RECURSE_SINKS = """
-WITH RECURSIVE all_sink(current) AS (
-    -- Initial: Set initial node
-    SELECT ? AS current
+# Incremental maintenance of the topological order (node.topo) with the algorithm of
+# Pearce and Kelly (J. Exp. Algorithmics 11, 2006, https://doi.org/10.1145/1187436.1210590).
+# A new edge source -> sink with source.topo < sink.topo keeps the order valid,
+# which proves in O(1) that it cannot close a cycle.
+# Otherwise, only the nodes with an order between sink.topo and source.topo can be affected.
+# FORWARD_IN_ORDER finds the sinks of the new sink within that range,
+# which include the new source if and only if the edge would close a cycle.
+# BACKWARD_IN_ORDER finds the sources of the new source within that range.
+# Their order values are then redistributed, so that the second group precedes the first.
+FORWARD_IN_ORDER = """
+WITH RECURSIVE forward(current) AS (
+    SELECT ?
     UNION
-    -- Recursion: Follow edges by selecting sinks of current
-    SELECT sink AS current
-    FROM dependency INNER JOIN all_sink ON source = current
+    SELECT dependency.sink
+    FROM dependency
+    JOIN forward ON dependency.source = forward.current
+    JOIN node ON node.i = dependency.sink
+    WHERE node.topo <= ?
 )
+SELECT node.i, node.topo FROM forward JOIN node ON node.i = forward.current
+"""
+
+BACKWARD_IN_ORDER = """
+WITH RECURSIVE backward(current) AS (
+    SELECT ?
+    UNION
+    SELECT dependency.source
+    FROM dependency
+    JOIN backward ON dependency.sink = backward.current
+    JOIN node ON node.i = dependency.source
+    WHERE node.topo >= ?
+)
+SELECT node.i, node.topo FROM backward JOIN node ON node.i = backward.current
+"""
+
+# Find a dependency that violates the topological order, for the consistency check.
+SELECT_BACKWARD_DEPENDENCY = """
+SELECT dependency.source, dependency.sink
+FROM dependency
+JOIN node AS source ON source.i = dependency.source
+JOIN node AS sink ON sink.i = dependency.sink
+WHERE source.topo >= sink.topo
+LIMIT 1
 """
 
 SELECT_ALL_SINKS = """
@@ -478,11 +515,26 @@ class Node:
         # Propagate the inherited detached property to all product nodes.
         self.db.execute(RECURSIVELY_SET_DETACHED, (self.i, detached))
 
+    def _topo(self) -> int:
+        """Return the position of the node in the topological order.
+
+        Raises
+        ------
+        GraphError
+            If the node is not found in the database.
+        """
+        row = self.db.execute("SELECT topo FROM node WHERE i = ?", (self.i,)).fetchone()
+        if row is None:
+            raise GraphError(f"Node id not in database: {self.i}")
+        return row[0]
+
     def check_sources_acyclic(self, source_is: Iterable[int]) -> None:
         """Verify that several new source edges can be added without introducing a cycle.
 
-        This computes the set of (indirect) sinks of this node once,
-        and checks all candidate source identifiers against it.
+        A candidate source that precedes this node in the topological order (`node.topo`)
+        cannot be an (indirect) sink of this node, so no graph search is needed for it.
+        The remaining candidates are checked against the (indirect) sinks of this node,
+        found once for the whole batch, only up to the highest order of these candidates.
         It must only be used when this node is the **sink** of every candidate edge
         in the batch, since adding such edges cannot change what this node can reach
         going forward.
@@ -500,14 +552,31 @@ class Node:
             (or is this node itself), which means the corresponding edge would
             introduce a cyclic dependency.
         """
-        cur = self.db.execute(RECURSE_SINKS + SELECT_ALL_SINKS, (self.i,))
-        sink_is = {row[0] for row in cur}
-        if not sink_is.isdisjoint(source_is):
+        topo = self._topo()
+        source_is = list(source_is)
+        later = {}
+        for start in range(0, len(source_is), 500):
+            chunk = source_is[start : start + 500]
+            later.update(
+                self.db.execute(
+                    f"SELECT i, topo FROM node WHERE i IN ({', '.join('?' * len(chunk))}) "
+                    "AND topo >= ?",
+                    (*chunk, topo),
+                )
+            )
+        if len(later) == 0:
+            return
+        cur = self.db.execute(FORWARD_IN_ORDER, (self.i, max(later.values())))
+        if any(row[0] in later for row in cur):
             raise CyclicError("New relation introduces a cyclic dependency")
 
     def add_source(self, source: "Node", skip_cycle_check: bool = False) -> int:
         """Add a source-sink relation.
 
+        The topological order of the nodes is updated when the new edge points backwards in it.
+        This only involves the nodes whose order lies between those of the sink and the source
+        that are connected to either of them.
+
         Parameters
         ----------
         source
@@ -530,11 +599,14 @@ class Node:
         GraphError
             If the relation already exists.
         """
-        if not skip_cycle_check:
-            # Check whether the new edge would introduce a cyclic dependency.
-            cur = self.db.execute(RECURSE_SINKS + SELECT_CYCLIC, (self.i, source.i))
-            if cur.fetchone()[0] > 0:
+        source_topo = source._topo()
+        sink_topo = self._topo()
+        if source_topo >= sink_topo:
+            forward = self.db.execute(FORWARD_IN_ORDER, (self.i, source_topo)).fetchall()
+            if not skip_cycle_check and any(i == source.i for i, _ in forward):
                 raise CyclicError("New relation introduces a cyclic dependency")
+            backward = self.db.execute(BACKWARD_IN_ORDER, (source.i, sink_topo)).fetchall()
+            self._reorder(backward, forward)
         try:
             cur = self.db.execute(
                 "INSERT INTO dependency(source, sink) VALUES(?, ?)",
@@ -544,6 +616,22 @@ class Node:
             raise GraphError("Relation already exists") from exc
         return cur.lastrowid
 
+    def _reorder(self, backward: list[tuple[int, int]], forward: list[tuple[int, int]]):
+        """Move the nodes in `backward` before those in `forward` in the topological order.
+
+        Both lists contain `(i, topo)` pairs.
+        The order values of all these nodes are redistributed among them,
+        keeping the relative order within each list,
+        so nodes outside the two lists keep their place.
+        """
+        backward = sorted(backward, key=lambda row: row[1])
+        forward = sorted(forward, key=lambda row: row[1])
+        topos = sorted(topo for _, topo in backward + forward)
+        self.db.executemany(
+            "UPDATE node SET topo = ? WHERE i = ?",
+            ((topo, i) for topo, (i, _) in zip(topos, backward + forward, strict=True)),
+        )
+
     def del_sources(self, sources: list["Node"]):
         """Delete the source-sink relations between the given sources and this node."""
         self.db.executemany(
@@ -626,7 +714,11 @@ class Trellis:
         # Schema 2 became outdated due to the worker actions.
         # Schema 3 became outdated due to a change in step table (dirty field).
         # Schema 4 became outdated due to the v4.0.0 rewrite.
-        return 5
+        # Schema 5 became outdated due to the binary storage of file and step hashes.
+        # Schema 6 became outdated due to the peak memory of steps and implicit resources.
+        # Schema 7 became outdated due to the user-declared priority of steps.
+        # Schema 8 became outdated due to the topological order of the nodes.
+        return 9
 
     @classmethod
     def schema(cls) -> str:
@@ -695,6 +787,11 @@ class Trellis:
             raise ConsistencyError(
                 f"Attached node is not reachable from root via creator chain: {node.key()}"
             )
+        row = self.db.execute(SELECT_BACKWARD_DEPENDENCY).fetchone()
+        if row is not None:
+            raise ConsistencyError(
+                f"Dependency {row[0]} -> {row[1]} violates the topological order of the nodes"
+            )
         for node in self.nodes(include_detached=True):
             node.validate_row()
 
@@ -896,8 +993,11 @@ class Trellis:
         else:
             detached = True if creator is None else creator.is_detached()
             # Add new node
+            # New nodes are appended at the end of the topological order,
+            # so edges to them from existing nodes never require a reordering.
             cur = self.db.execute(
-                "INSERT INTO node (kind, label, creator, detached) VALUES (?, ?, ?, ?)",
+                "INSERT INTO node (kind, label, creator, detached, topo) "
+                "VALUES (?, ?, ?, ?, (SELECT COALESCE(MAX(topo), 0) + 1 FROM node))",
                 (node_type.kind(), label, None if creator is None else creator.i, detached),
             )
             node_i = cur.lastrowid
@@ -45,10 +45,11 @@ from .constants import (
 )
 from .enums import ReturnCode
 from .exceptions import RPCError, ToolError, UsageError
+from .hash import DEFAULT_DIGEST_ALGORITHM, DIGEST_ALGORITHM_CHOICES
 from .path import get_stepup_root
 from .reporter import ReporterHandler
 from .rpc import SocketAsyncRPCClient, SocketRPCServer
-from .tool import SubParsers, ToolFunc, positive_decimal, positive_int
+from .tool import SubParsers, ToolFunc, nonnegative_int, positive_decimal, positive_int
 from .utils import (
     is_debug,
     is_process_running,
@@ -119,6 +120,14 @@ def _add_build_parser(
         "instead of the full default workflow.",
     )
     group = parser.add_argument_group("build control")
+    group.add_argument(
+        "--adaptive-jobs",
+        default=False,
+        action=argparse.BooleanOptionalAction,
+        help="Adapt the number of jobs running in parallel to the pressure on CPU, IO and memory, "
+        "as reported by the Linux kernel (PSI). "
+        "The number of jobs then varies between --min-jobs and --jobs. (Only supported on Linux.)",
+    )
     group.add_argument(
         "--clean",
         default=True,
@@ -155,6 +164,24 @@ def _add_build_parser(
         "When given as a real number with digits after the decimal point, "
         "it is multiplied with the number of available cores. [default=%(default)s]",
     )
+    group.add_argument(
+        "--min-jobs",
+        type=positive_int,
+        default=1,
+        help="Lowest number of jobs running in parallel with --adaptive-jobs. "
+        "[default=%(default)s]",
+    )
+    group.add_argument(
+        "--hash-jobs",
+        type=nonnegative_int,
+        default=None,
+        help="Number of jobs hashing files in parallel, i.e. computing file hashes "
+        "or checking whether a step can be skipped. "
+        "These have their own slots, so steps running commands keep all --jobs slots. "
+        "Zero shares the --jobs slots instead. "
+        "[default: 2 on a rotational disk, 16 on a network file system, "
+        "otherwise the number of cores plus four, at most 32]",
+    )
     group.add_argument(
         "-k",
         "--keep-going",
@@ -171,6 +198,21 @@ def _add_build_parser(
         help="Maximum number of consecutive defers (since the last success) before "
         "a step is failed instead of parked. A livelock guard. [default=%(default)s]",
     )
+    group.add_argument(
+        "--digest-algorithm",
+        default=DEFAULT_DIGEST_ALGORITHM,
+        choices=DIGEST_ALGORITHM_CHOICES,
+        help="The hash algorithm for file contents. "
+        "Files hashed with another algorithm are rehashed once. [default=%(default)s]",
+    )
+    group.add_argument(
+        "--digest-cache",
+        default=False,
+        action=argparse.BooleanOptionalAction,
+        help="Look up file digests in a persistent cache shared by all workflows of the user, "
+        "stored under $XDG_CACHE_HOME/stepup. "
+        "This avoids rehashing unchanged files after the .stepup directory was removed.",
+    )
     group.add_argument(
         "--progress",
         default=True,
@@ -178,6 +220,14 @@ def _add_build_parser(
         help="Report progress information in the terminal user interface. "
         "(This can be useful to simplify and reduce the output.)",
     )
+    group.add_argument(
+        "--ready-heap",
+        default=False,
+        action=argparse.BooleanOptionalAction,
+        help="Select the next step to run from an in-memory priority queue, "
+        "which is updated incrementally, instead of querying the workflow database. "
+        "This reduces the dispatch overhead of very large workflows.",
+    )
     group.add_argument(
         "-r",
         "--resources",
@@ -228,6 +278,22 @@ def _add_build_parser(
         help="Comma-separated list of Python modules to pre-load into the forkserver. "
         "Only has effect when --forkserver is active. [default: none]",
     )
+    group.add_argument(
+        "--spawn-helper",
+        default=(sys.platform == "linux"),
+        action=argparse.BooleanOptionalAction,
+        help="Start the subprocesses of steps from a small helper process "
+        "instead of the director, which may have a large memory footprint. "
+        "[default: True on Linux, False elsewhere]",
+    )
+    group.add_argument(
+        "--call-workers",
+        default=False,
+        action=argparse.BooleanOptionalAction,
+        help="Run call() steps of the same Python script in warm forkserver children "
+        "that load the script only once. Only has effect when --forkserver is active. "
+        "[default: %(default)s]",
+    )
 
     group = parser.add_argument_group("diagnostics and profiling")
     group.add_argument(
@@ -573,6 +639,7 @@ def _build_director_argv(
             f"--reporter={reporter_socket_path}",
             f"--jobs={args.jobs}",
             f"--defer-cap={args.defer_cap}",
+            f"--digest-algorithm={args.digest_algorithm}",
             f"--log-level={args.log_level}",
         ]
     )
@@ -582,10 +649,22 @@ def _build_director_argv(
         argv.append("--forkserver")
     if args.preload_modules:
         argv.append(f"--preload-modules={args.preload_modules}")
+    if args.call_workers:
+        argv.append("--call-workers")
+    if args.spawn_helper:
+        argv.append("--spawn-helper")
+    if args.adaptive_jobs:
+        argv.extend(["--adaptive-jobs", f"--min-jobs={args.min_jobs}"])
+    if args.hash_jobs is not None:
+        argv.append(f"--hash-jobs={args.hash_jobs}")
     if not args.clean:
         argv.append("--no-clean")
     if not args.duration:
         argv.append("--no-duration")
+    if args.digest_cache:
+        argv.append("--digest-cache")
+    if args.ready_heap:
+        argv.append("--ready-heap")
     if args.explain_rerun:
         argv.append("--explain-rerun")
     if args.keep_going:
@@ -10,14 +10,13 @@ and formats a compact summary report of memory and CPU time at the end of a run.
 import asyncio
 import contextlib
 import resource
-import sys
 import time
 
 import attrs
 from path import Path
 
 from .cgroups import find_own_memory_cgroup
-from .outcome import ResourceUsage
+from .outcome import ResourceUsage, maxrss_mib
 
 __all__ = (
     "CgroupMemorySampler",
@@ -155,9 +154,8 @@ def finalize_resource_usage(
     summary
         A one-line condensation of the same wall and CPU times.
     """
-    # `ru_maxrss` is reported in kibibytes on Linux, but in bytes on macOS.
     ru_self = resource.getrusage(resource.RUSAGE_SELF)
-    director_mib = ru_self.ru_maxrss / 1024 if sys.platform == "linux" else ru_self.ru_maxrss / MIB
+    director_mib = maxrss_mib(ru_self.ru_maxrss)
 
     if memory_sampler is None:
         cgroup_line = CGROUP_NOT_ENABLED_LINE
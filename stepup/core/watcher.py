@@ -33,6 +33,7 @@ from path import Path
 from .asyncio import iter_until_stopped, wait_for_any_event
 from .enums import Change, HashUpdateCause
 from .executor import Executor
+from .hash import HashMemo
 from .hash_queue import HashQueue, gather_hashes
 from .reporter import ReporterClient
 from .sqlite3 import DBSession
@@ -97,7 +98,7 @@ class Watcher:
 
     The builder's job loop is not running during the watch phase,
     so this bounds the concurrency in its place.
-    Mirrors `Builder.njob`.
+    Mirrors `Builder.njob_hash`, or `Builder.njob` when hash work shares the slots of commands.
     """
 
     busy_watching: asyncio.Event = attrs.field(init=False, factory=asyncio.Event)
@@ -163,7 +164,9 @@ class Watcher:
         The iteration ends by informing the workflow of all the changes,
         after which StepUp starts the builder again (or exits).
         """
-        async with AsyncInotifyWrapper(dir_queue=self.dir_queue) as wrapper:
+        async with AsyncInotifyWrapper(
+            dir_queue=self.dir_queue, hash_memo=self.workflow.hash_memo
+        ) as wrapper:
             while not stop_event.is_set():
                 await wait_for_any_event(self.start_watching, stop_event, wrapper.stop_event)
                 if stop_event.is_set() or wrapper.stop_event.is_set():
@@ -281,6 +284,13 @@ class AsyncInotifyWrapper:
     but will be removed automatically when the directory is deleted.
     """
 
+    hash_memo: HashMemo | None = attrs.field(kw_only=True, default=None)
+    """Verified file hashes to invalidate as soon as an event is received, if any.
+
+    Events are only processed by `Watcher` after the build phase,
+    but a memo entry must not survive a change made during the build phase.
+    """
+
     inotify: Inotify | None = attrs.field(init=False, default=None)
     """Inotify object, only present while the context is open."""
 
@@ -392,6 +402,8 @@ class AsyncInotifyWrapper:
                         self.inotify.rm_watch(watch)
                         self.watches[path] = None
                         self.change_queue.put_nowait((Change.DELETED_PARENT, path))
+                        if self.hash_memo is not None:
+                            self.hash_memo.clear()
                 else:
                     paths = [path]
                     while len(paths) > 0:
@@ -406,10 +418,14 @@ class AsyncInotifyWrapper:
                         for sub_path in path.iterdir():
                             if sub_path.is_file():
                                 self.change_queue.put_nowait((Change.UPDATED, sub_path))
+                                if self.hash_memo is not None:
+                                    self.hash_memo.invalidate([sub_path])
                             elif sub_path.is_dir():
                                 paths.append(sub_path)
             else:
                 self.change_queue.put_nowait((change, path))
+                if self.hash_memo is not None:
+                    self.hash_memo.invalidate([path])
 
     def _install_watch(self, path: str):
         self.watches[Path(path)] = self.inotify.add_watch(
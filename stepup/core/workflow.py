@@ -29,7 +29,7 @@ from .enums import (
 )
 from .exceptions import ConsistencyError, GraphError
 from .file import REGULAR_OUTPUT_WHERE, File
-from .hash import FileHash, fmt_short_digest
+from .hash import FileHash, HashMemo, fmt_short_digest
 from .nglob import NamedGlob, glob_base_dir, has_any_wildcards
 from .path import dir_range_upper, parent_dir
 from .sqlite3 import prefix_clause
@@ -820,6 +820,12 @@ class Workflow(Trellis):
     not while the graph is still being modified.
     """
 
+    hash_memo: HashMemo = attrs.field(init=False, factory=HashMemo)
+    """The file hashes verified against the file system during the current build phase.
+
+    Entries are invalidated by `update_file_hashes`.
+    """
+
     #
     # Configuration and derived properties
     #
@@ -1178,6 +1184,7 @@ class Workflow(Trellis):
         """
         if len(file_hashes) == 0:
             return
+        self.hash_memo.invalidate(file_hashes)
 
         # Efficiently look up the node id and state of every requested path.
         # See get_file_hashes for why this uses an IN subquery against the path_list
@@ -1243,7 +1250,7 @@ class Workflow(Trellis):
         logger.info("Update file hashes: cause=%s new=%s", cause.name, new_states_hashes)
         self.db.executemany(
             "UPDATE file SET state = ?, hash = ? WHERE node = ?",
-            ((state.value, fh.to_json(), i) for i, state, fh in new_states_hashes),
+            ((state.value, fh.to_blob(), i) for i, state, fh in new_states_hashes),
         )
 
         # Call Workflow methods to further update the workflow.
@@ -1294,7 +1301,7 @@ class Workflow(Trellis):
             "WHERE node.kind = 'file' AND node.label IN (SELECT path FROM path_list) "
             "ORDER BY node.label"
         )
-        return {path: FileHash.from_json(hash_value) for path, hash_value in db.execute(sql)}
+        return {path: FileHash.from_blob(hash_value) for path, hash_value in db.execute(sql)}
 
     def handle_updated_file(self, file: File):
         """Modify the graph to account for a file whose content changed.
@@ -1730,7 +1737,7 @@ class Workflow(Trellis):
             "JOIN file ON file.node = node_list.i "
             "ORDER BY node.label"
         )
-        return {path: FileHash.from_json(hash_value) for path, hash_value in db.execute(sql)}
+        return {path: FileHash.from_blob(hash_value) for path, hash_value in db.execute(sql)}
 
     #
     # Build phase (low-level public API)
@@ -1925,6 +1932,7 @@ class Workflow(Trellis):
         shell: bool = False,
         env_overrides: dict[str, str] | None = None,
         duration: float | None = None,
+        priority: int = 0,
         _safe: bool = False,
     ) -> dict[str, FileHash]:
         """Define a new step.
@@ -1959,8 +1967,13 @@ class Workflow(Trellis):
         duration
             An initial estimate of the step's wall time in seconds, used by the scheduler to
             prioritize execution order before any measurement is available.
-            When `None`, a new step gets the column's default (1.0), while a recycled step
+            When `None`, a new step starts from the estimate of similar steps measured before
+            (or 1.0 when there are none, see `duration_class_keys`), while a recycled step
             keeps its previously measured (or given) duration.
+        priority
+            The priority of the step in the dispatch order, see `SELECT_NEXT_STEP`.
+            Among steps that are equally urgent otherwise,
+            those with a higher priority are started first.
         _safe
             The initial value for the `safe` field of the step.
             This is an internal field, not controlled by the end user.
@@ -2018,6 +2031,7 @@ class Workflow(Trellis):
             resources=resources,
             env_overrides=env_overrides,
             duration=duration,
+            priority=priority,
             inp_paths=inp_paths,
             env_deps=env_deps,
             out_paths=out_paths,
@@ -2052,6 +2066,7 @@ class Workflow(Trellis):
             need=need,
             shell=shell,
             duration=duration,
+            priority=priority,
             _safe=_safe,
         )
         step.set_resources(resources)
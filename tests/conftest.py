@@ -124,9 +124,9 @@ def clean_env(monkeypatch, path_tmp):
 
 def fake_hash(path):
     digest = b"d" if path.endswith("/") else hashlib.sha256(path.encode("utf8")).digest()
-    mtime = sum(bytearray(digest)) ** 0.5
+    mtime_ns = sum(bytearray(digest)) * 1_000_000
     mode = 0o755 if path.endswith("/") else 0o644
-    return FileHash(digest, mode, mtime, len(path) ** 2, len(path))
+    return FileHash(digest, mode, mtime_ns, len(path) ** 2, len(path))
 
 
 def declare_static(workflow, creator, paths):
@@ -30,6 +30,8 @@ grep hello result.txt
 # stored hash on this BUILT -> UNCONFIRMED recycle forces a real re-hash of the new content;
 # trusting the stale hash (from when the removed step built the file) would let the stat
 # comparison hide the change, and the copy step below would wrongly stay skipped.
+# (The change time of the file cannot be restored, so since it is part of the stat()
+# fingerprint, the startup check also reports data/foo.txt as updated.)
 rm .stepup/*.log
 cp plan2.py plan.py
 python3 - <<'EOF'
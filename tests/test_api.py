@@ -263,6 +263,12 @@ def test_step_bool_duration():
         step("./script.py", duration=True)
 
 
+@pytest.mark.parametrize("priority", [True, 1.5, "1"])
+def test_step_invalid_priority(priority):
+    with pytest.raises(ValueError, match="Invalid priority"):
+        step("./script.py", priority=priority)
+
+
 def test_step_bool_resource_quantity():
     with pytest.raises(ValueError, match="Invalid quantity"):
         step("./script.py", resources={"gpu": True})
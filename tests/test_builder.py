@@ -11,11 +11,13 @@ import pytest
 from conftest import get_duration_and_tail_time
 from path import Path
 
+from stepup.core import builder as builder_module
 from stepup.core.builder import Builder
 from stepup.core.enums import HashUpdateCause, Need, StepState
 from stepup.core.executor import Executor
 from stepup.core.file import File, FileState
 from stepup.core.hash import FileHash, StepHash
+from stepup.core.hash_queue import HashBatch
 from stepup.core.reporter import ReporterClient
 from stepup.core.scheduler import Scheduler
 from stepup.core.step import Step
@@ -255,8 +257,8 @@ async def test_job_loop_dispatches_hash_jobs_before_runnable_steps(wfs: Workflow
     def fake_start_task(self, job):
         dispatched.append(("step", job))
 
-    def fake_start_hash_task(self, hash_job):
-        dispatched.append(("hash", hash_job))
+    def fake_start_hash_task(self, batch):
+        dispatched.append(("hash", batch))
 
     monkeypatch.setattr(Builder, "start_task", fake_start_task)
     monkeypatch.setattr(Builder, "start_hash_task", fake_start_hash_task)
@@ -266,7 +268,72 @@ async def test_job_loop_dispatches_hash_jobs_before_runnable_steps(wfs: Workflow
     await builder.job_loop()
 
     assert [kind for kind, _job in dispatched] == ["hash", "step"]
-    assert dispatched[0][1] is hash_job
+    assert dispatched[0][1].jobs == [hash_job]
+
+
+async def test_set_njob_limit(wfs: Workflow, monkeypatch):
+    records = []
+    monkeypatch.setattr(builder_module, "append_joblog_record", lambda *args: records.append(args))
+    scheduler = Scheduler(wfs, db=wfs.db)
+    await scheduler.initialize(None)
+    builder = _make_builder(scheduler, wfs)
+    builder.njob = 4
+    builder.njob_limit = 4
+    builder.executor.write_joblog = True
+
+    await builder.set_njob_limit(2)
+
+    assert builder.njob == 4
+    assert builder.njob_limit == 2
+    assert builder.wake_job_loop.is_set()
+    assert records == [("NJOB", 0, "concurrent jobs: 2")]
+
+
+@pytest.mark.parametrize(("njob_hash", "free"), [(None, (0, None)), (2, (2, 0)), (3, (2, 1))])
+async def test_free_slots(wfs: Workflow, njob_hash: int | None, free: tuple[int, int | None]):
+    """Hash batches and hash checks only take the slots of `njob_hash`, when it is set."""
+    builder = _make_builder(None, wfs)
+    builder.njob = 3
+    builder.njob_limit = 3
+    builder.njob_hash = njob_hash
+    builder.running_tasks = {
+        "task1": HashBatch([]),
+        "task2": SimpleNamespace(runs_command=False),
+        "task3": SimpleNamespace(runs_command=True),
+    }
+    assert builder._free_slots() == free
+
+
+async def test_job_loop_keeps_command_slots_for_commands(wfs: Workflow, monkeypatch):
+    """With a separate hash budget, a hash job and a step run side by side with `njob=1`."""
+    async with wfs.db:
+        wfs.define_step(wfs.root, "echo hi")
+
+    scheduler = Scheduler(wfs, db=wfs.db)
+    await scheduler.initialize(None)
+    builder = _make_builder(scheduler, wfs)
+    builder.njob_hash = 1
+
+    started = []
+
+    def fake_start(self, job):
+        started.append(job)
+        self.running_tasks[object()] = job
+
+    monkeypatch.setattr(Builder, "start_task", fake_start)
+    monkeypatch.setattr(Builder, "start_hash_task", fake_start)
+    builder.hash_queue.submit("foo.txt", FileHash.unknown(), HashUpdateCause.EXTERNAL)
+    builder.hash_queue.submit("bar.txt", FileHash.unknown(), HashUpdateCause.EXTERNAL)
+
+    async def wait_forever():
+        await asyncio.Event().wait()
+
+    builder.wake_job_loop = SimpleNamespace(wait=wait_forever, clear=lambda: None)
+    with contextlib.suppress(TimeoutError):
+        await asyncio.wait_for(builder.job_loop(), timeout=0.5)
+
+    # One hash batch takes the only hash slot, the step takes the only command slot.
+    assert [type(job).__name__ for job in started] == ["HashBatch", "RunJob"]
 
 
 #
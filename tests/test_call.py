@@ -11,7 +11,7 @@ import pytest
 import yaml
 
 from stepup.core.api import call
-from stepup.core.call import _dispatch, _print_list, driver
+from stepup.core.call import _dispatch, _print_list, capture_driver, driver, run_case
 from stepup.core.enums import Need
 from stepup.core.stepinfo import StepInfo
 
@@ -50,6 +50,7 @@ def captured(monkeypatch):
         resources=None,
         shell=False,
         duration=None,
+        priority=0,
     ):
         calls.append(
             {
@@ -62,6 +63,7 @@ def captured(monkeypatch):
                 "need": need,
                 "resources": resources,
                 "duration": duration,
+                "priority": priority,
             }
         )
         return StepInfo(command, list(inp), list(env), list(out), list(vol), workdir)
@@ -214,6 +216,21 @@ def test_json_and_inp_mutually_exclusive(monkeypatch, path_tmp):
         driver()
 
 
+def test_capture_driver(monkeypatch, capsys):
+    """Within `capture_driver()`, `driver()` records its namespace instead of dispatching."""
+    monkeypatch.setattr("sys.argv", ["s.py", "fn", '{"x": 1}'])
+
+    def fn(x):
+        print(f"x={x}")
+
+    with capture_driver() as captured:
+        driver()
+    assert captured == [(__file__, globals())]
+    assert capsys.readouterr().out == ""
+    run_case("s.py", {"fn": fn}, ["fn", '{"x": 2}'])
+    assert capsys.readouterr().out == "x=2\n"
+
+
 # --- _print_list output ---
 
 
@@ -525,6 +542,11 @@ def test_duration_in_step(captured):
     assert captured[0]["duration"] == 3.5
 
 
+def test_priority_in_step(captured):
+    call("./s.py", "fn", priority=2)
+    assert captured[0]["priority"] == 2
+
+
 def test_env_tracked(captured):
     call("./s.py", "fn", env=["MY_VAR"])
     assert "MY_VAR" in captured[0]["env"]
@@ -7,7 +7,12 @@ import os
 import pytest
 
 from stepup.core import cgroups
-from stepup.core.cgroups import find_own_memory_cgroup, get_ncore_from_cgroup
+from stepup.core.cgroups import (
+    find_own_memory_cgroup,
+    find_pressure_files,
+    get_memory_gib_from_cgroup,
+    get_ncore_from_cgroup,
+)
 from stepup.core.exceptions import CgroupError
 
 
@@ -114,3 +119,42 @@ def test_get_ncore_from_cgroup_malformed_cpuset_falls_back_to_cpu_max(path_tmp,
     (own_dir / "cpuset.cpus.effective").write_text("not-a-cpu-list")
     (own_dir / "cpu.max").write_text("350000 100000")
     assert get_ncore_from_cgroup(cgroup_root=path_tmp) == 3
+
+
+def test_get_memory_gib_from_cgroup(path_tmp, own_dir):
+    (own_dir / "memory.max").write_text(f"{(5 * 1024 + 512) * 1024**2}\n")
+    assert get_memory_gib_from_cgroup(cgroup_root=path_tmp) == 5
+
+
+def test_get_memory_gib_from_cgroup_small_limit_floors_to_minimum_one(path_tmp, own_dir):
+    (own_dir / "memory.max").write_text(f"{512 * 1024**2}\n")
+    assert get_memory_gib_from_cgroup(cgroup_root=path_tmp) == 1
+
+
+@pytest.mark.parametrize("content", [None, "max\n", "garbage\n"])
+def test_get_memory_gib_from_cgroup_no_limit(path_tmp, own_dir, content):
+    if content is not None:
+        (own_dir / "memory.max").write_text(content)
+    with pytest.raises(CgroupError):
+        get_memory_gib_from_cgroup(cgroup_root=path_tmp)
+
+
+def test_find_pressure_files_cgroup(path_tmp, own_dir):
+    for name in "cpu", "io", "memory":
+        (own_dir / f"{name}.pressure").write_text("")
+    paths = find_pressure_files(cgroup_root=path_tmp, proc_root=path_tmp / "proc")
+    assert paths == {name: own_dir / f"{name}.pressure" for name in ("cpu", "io", "memory")}
+
+
+def test_find_pressure_files_proc(path_tmp, own_dir):
+    (own_dir / "cpu.pressure").write_text("")
+    (path_tmp / "proc").mkdir()
+    for name in "cpu", "io", "memory":
+        (path_tmp / "proc" / name).write_text("")
+    paths = find_pressure_files(cgroup_root=path_tmp, proc_root=path_tmp / "proc")
+    assert paths == {name: path_tmp / "proc" / name for name in ("cpu", "io", "memory")}
+
+
+def test_find_pressure_files_unavailable(path_tmp, own_dir):
+    with pytest.raises(CgroupError):
+        find_pressure_files(cgroup_root=path_tmp, proc_root=path_tmp / "proc")
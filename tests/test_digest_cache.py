@@ -0,0 +1,94 @@
+# SPDX-FileCopyrightText: 2024 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Unit tests for stepup.core.digest_cache."""
+
+import os
+import time
+
+import pytest
+from path import Path
+
+from stepup.core import digest_cache
+from stepup.core import hash as hash_module
+from stepup.core.digest_cache import DigestCache, default_digest_cache_path
+from stepup.core.hash import FileHash
+
+
+@pytest.fixture
+def cache(path_tmp: Path):
+    cache = DigestCache.open(path_tmp / "cache" / "digests.db")
+    yield cache
+    cache.close()
+
+
+def test_default_digest_cache_path(monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", "/some/cache")
+    assert default_digest_cache_path() == "/some/cache/stepup/digests.db"
+    monkeypatch.setenv("XDG_CACHE_HOME", "")
+    assert default_digest_cache_path() == Path("~/.cache/stepup/digests.db").expanduser()
+
+
+def test_lookup_and_store(cache: DigestCache, path_tmp: Path):
+    path = path_tmp / "data.txt"
+    path.write_bytes(b"data")
+    st = os.stat(path)
+    assert cache.lookup(st, "sha256") is None
+    cache.store(st, "sha256", b"d" * 32)
+    assert cache.lookup(st, "sha256") == b"d" * 32
+    assert cache.lookup(st, "blake2b") is None
+    path.write_bytes(b"other")
+    assert cache.lookup(os.stat(path), "sha256") is None
+
+
+def test_evict_keeps_most_recently_used(cache: DigestCache, path_tmp: Path, monkeypatch):
+    stats = []
+    for i in range(3):
+        path = path_tmp / f"data{i}.txt"
+        path.write_bytes(b"data")
+        stats.append(os.stat(path))
+    for i, st in enumerate(stats):
+        monkeypatch.setattr(digest_cache.time, "time_ns", lambda i=i: 4 * 10**18 + i)
+        cache.store(st, "sha256", bytes([i]) * 32)
+    cache.max_entries = 2
+    cache.evict()
+    assert cache.lookup(stats[0], "sha256") is None
+    assert cache.lookup(stats[1], "sha256") == b"\1" * 32
+    assert cache.lookup(stats[2], "sha256") == b"\2" * 32
+
+
+def test_reopen_and_close(path_tmp: Path, monkeypatch):
+    path = path_tmp / "data.txt"
+    path.write_bytes(b"data")
+    st = os.stat(path)
+    cache = DigestCache.open(path_tmp / "digests.db")
+    cache.store(st, "sha256", b"d" * 32)
+    cache.close()
+    assert cache.lookup(st, "sha256") is None
+    cache = DigestCache.open(path_tmp / "digests.db")
+    assert cache.lookup(st, "sha256") == b"d" * 32
+    cache.close()
+    # A cache with another schema version is emptied.
+    monkeypatch.setattr(digest_cache, "DIGEST_CACHE_SCHEMA_VERSION", 1000)
+    cache = DigestCache.open(path_tmp / "digests.db")
+    assert cache.lookup(st, "sha256") is None
+    cache.close()
+
+
+def test_refreshed_uses_cache(cache: DigestCache, path_tmp: Path, monkeypatch):
+    path = path_tmp / "data.txt"
+    path.write_bytes(b"data")
+    os.utime(path, ns=(time.time_ns(), time.time_ns()))
+    # A racy digest is not stored.
+    file_hash = FileHash.unknown().refreshed(path, cache=cache)
+    assert file_hash.racy
+    assert cache.lookup(os.stat(path), "sha256") is None
+    os.utime(path, ns=(10**18, 10**18))
+    file_hash = FileHash.unknown().refreshed(path, cache=cache)
+    assert not file_hash.racy
+    assert cache.lookup(os.stat(path), "sha256") == file_hash.digest
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("Digest computed despite a cache hit.")
+
+    monkeypatch.setattr(hash_module, "compute_file_digest", _fail)
+    assert FileHash.unknown().refreshed(path, cache=cache) == file_hash
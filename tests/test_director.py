@@ -16,6 +16,7 @@ from path import Path
 from stepup.core import director
 from stepup.core.director import SCHEDULER_CPU_ENV_VARS, DirectorHandler, interpret_jobs
 from stepup.core.exceptions import CgroupError
+from stepup.core.preload import PreloadReport
 from stepup.core.reporter import ReporterClient
 
 
@@ -296,3 +297,48 @@ async def test_wait_for_update_gives_up_when_stopping():
     handler.stop_event.set()
     await asyncio.wait_for(task, timeout=5.0)
     assert len(handler.watcher.files_changed_events) == 0
+
+
+class FakeMPContext:
+    """Records the modules that would be pre-loaded into the forkserver."""
+
+    def __init__(self):
+        self.preload = None
+
+    def set_forkserver_preload(self, preload: list[str]):
+        self.preload = preload
+
+
+async def test_set_forkserver_preload(monkeypatch):
+    """Only modules that import without side effects are pre-loaded."""
+    reports = [
+        PreloadReport("json", 0.01),
+        PreloadReport("missing", 0.0, error="ModuleNotFoundError: No module named 'missing'"),
+        PreloadReport("threaded", 0.5, threads=["worker"]),
+    ]
+    monkeypatch.setattr(director, "probe_preload_modules", lambda modules: reports)
+    messages = []
+
+    async def fake_report(tag, description, pages=None):
+        messages.append((tag, description))
+
+    mp_ctx = FakeMPContext()
+    await director._set_forkserver_preload(mp_ctx, "json, missing,threaded", fake_report)
+    assert mp_ctx.preload == ["stepup.core.executor", "json"]
+    assert messages == [
+        ("DIRECTOR", "Pre-loading json (0.01 s import time)"),
+        (
+            "WARNING",
+            "Not pre-loading missing: import failed "
+            "(ModuleNotFoundError: No module named 'missing')",
+        ),
+        ("WARNING", "Not pre-loading threaded: it starts threads (worker)"),
+    ]
+
+
+async def test_set_forkserver_preload_without_modules(monkeypatch):
+    """Without user modules, no probe is started."""
+    monkeypatch.setattr(director, "probe_preload_modules", None)
+    mp_ctx = FakeMPContext()
+    await director._set_forkserver_preload(mp_ctx, None, ReporterClient())
+    assert mp_ctx.preload == ["stepup.core.executor"]
@@ -16,7 +16,7 @@ from stepup.core.exceptions import HashCancelledError
 from stepup.core.executor import Executor, NoOverwriteDict, Run
 from stepup.core.file import File, FileState
 from stepup.core.hash import FileHash, StepHash, compute_inp_hashes
-from stepup.core.hash_queue import HashJob
+from stepup.core.hash_queue import HashBatch, HashJob
 from stepup.core.outcome import ChildOutcome, ResourceUsage
 from stepup.core.run import ThreadWorker, Worker
 from stepup.core.step import Step
@@ -152,6 +152,52 @@ async def testrun_work_thread_interrupt():
     assert 12 not in executor.running
 
 
+async def testrun_work_thread_uses_the_bounded_hash_pool():
+    executor = Executor(
+        scheduler=None,
+        workflow=None,
+        db=None,
+        reporter=None,
+        explain_rerun=False,
+        keep_going=False,
+        live_progress=False,
+        write_joblog=False,
+        infra_env={},
+        hash_threads=2,
+    )
+
+    def work(cancel_event):
+        return threading.current_thread().name
+
+    names = await asyncio.gather(
+        *(executor._run_work_thread(_make_worker_run(30 + i), work) for i in range(5))
+    )
+
+    assert all(name.startswith("stepup-hash") for name in names)
+    assert len(set(names)) <= 2
+    executor.close_hash_pool()
+    assert executor._hash_pool is None
+
+
+async def test_thread_worker_cancellation_waits_for_work():
+    """A cancelled task must not return before its work has stopped using the thread."""
+    started = threading.Event()
+    stopped = threading.Event()
+
+    def work(cancel_event):
+        started.set()
+        cancel_event.wait(10)
+        stopped.set()
+
+    worker = ThreadWorker(job_i=24, work=work)
+    task = asyncio.create_task(worker.run_in_thread())
+    await asyncio.to_thread(started.wait, 10)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert stopped.is_set()
+
+
 async def testrun_work_thread_exception():
     def work(cancel_event):
         raise ValueError("boom")
@@ -306,7 +352,7 @@ async def testnew_run_cancelled_reports_failure_instead_of_raising(wfs: Workflow
     scheduler = SimpleNamespace(
         draining=False, record_run_stopped=lambda step_i, *, succeeded: None
     )
-    executor = _make_executor(reporter=reporter, scheduler=scheduler, db=wfs.db)
+    executor = _make_executor(reporter=reporter, scheduler=scheduler, workflow=wfs, db=wfs.db)
 
     run, new_hash = await executor._new_run(1, step, [], [])
 
@@ -390,7 +436,7 @@ async def test_compute_full_step_hash_cancelled_keeps_command_outcome(
         step = wfs.find(Step, "echo hi")
 
     monkeypatch.setattr(ThreadWorker, "run_in_thread", _raise_hash_cancelled)
-    executor = _make_executor(reporter=_FakeReporter(), db=wfs.db)
+    executor = _make_executor(reporter=_FakeReporter(), workflow=wfs, db=wfs.db)
     run = Run(step, job_i=1)
     usage = ResourceUsage(utime=1.0, stime=0.5, wtime=2.0)
     run.outcome = ChildOutcome(0, "hi\n", stderr_before, usage)
@@ -432,7 +478,7 @@ async def test_try_skip_job_bails_out_when_out_hash_cancelled(wfs: Workflow, mon
     scheduler = SimpleNamespace(
         draining=False, record_run_stopped=lambda step_i, *, succeeded: None
     )
-    executor = _make_executor(reporter=reporter, scheduler=scheduler, db=wfs.db)
+    executor = _make_executor(reporter=reporter, scheduler=scheduler, workflow=wfs, db=wfs.db)
     step_hash = StepHash.from_inp(step.label, {}, {}, explained=False)
 
     # try_skip_job must not raise, even though _compute_out_step_hash is cancelled.
@@ -535,10 +581,10 @@ async def test_run_hash_job_stops_progress_bar_when_it_raises(monkeypatch):
     """Even an error that `run_hash_job` does not handle must not leave a dangling
     `job_started` in the progress bar."""
 
-    async def _boom(self, hash_job):
+    async def _boom(self, batch):
         raise ValueError("boom")
 
-    monkeypatch.setattr(Executor, "_run_hash_job", _boom)
+    monkeypatch.setattr(Executor, "_run_hash_batch", _boom)
     reporter = _FakeReporter()
     executor = _make_executor(reporter=reporter)
     hash_job = HashJob("foo.txt", FileHash.unknown(), HashUpdateCause.EXTERNAL, -2)
@@ -550,7 +596,7 @@ async def test_run_hash_job_stops_progress_bar_when_it_raises(monkeypatch):
 
 
 async def test_run_hash_job_cancelled_cancels_future_without_raising(monkeypatch):
-    def _raise_cancelled(old_hash, path, cancel_event=None):
+    def _raise_cancelled(old_hash, path, *args):
         raise HashCancelledError(path)
 
     monkeypatch.setattr(FileHash, "refreshed", _raise_cancelled)
@@ -570,7 +616,7 @@ async def test_run_hash_job_exception_resolves_future_without_raising(wfs: Workf
     "stop dispatching new steps" + report_unbuilt warning is what actually surfaces the
     failure to the user instead of it being silently lost."""
 
-    def _raise_permission_error(old_hash, path, cancel_event=None):
+    def _raise_permission_error(old_hash, path, *args):
         raise PermissionError("denied")
 
     async with wfs.db:
@@ -599,7 +645,7 @@ async def test_run_hash_job_exception_without_file_node_reports_no_provenance(
 ):
     """A file that vanished from the workflow while its hash ran still reports the error."""
 
-    def _raise_permission_error(old_hash, path, cancel_event=None):
+    def _raise_permission_error(old_hash, path, *args):
         raise PermissionError("denied")
 
     monkeypatch.setattr(FileHash, "refreshed", _raise_permission_error)
@@ -617,3 +663,46 @@ async def test_run_hash_job_exception_without_file_node_reports_no_provenance(
     tag, _label, pages = reporter.calls[-1]
     assert tag == "ERROR"
     assert pages == []
+
+
+async def test_run_hash_batch_handles_each_job_on_its_own(wfs: Workflow, tmpdir, monkeypatch):
+    """One unhashable file fails only its own job, and the other results of the batch
+    are applied in a single call per cause."""
+    orig_refreshed = FileHash.refreshed
+
+    def _refreshed(old_hash, path, *args):
+        if path == "bad.txt":
+            raise PermissionError("denied")
+        return orig_refreshed(old_hash, path, *args)
+
+    with contextlib.chdir(tmpdir):
+        for path in "a.txt", "b.txt":
+            with open(path, "w") as fh:
+                fh.write(path)
+        async with wfs.db:
+            wfs.declare_static_files(wfs.root, ["a.txt", "b.txt", "bad.txt"])
+
+        monkeypatch.setattr(FileHash, "refreshed", _refreshed)
+        calls = _spy_update_file_hashes(monkeypatch)
+        reporter = _FakeReporter()
+        scheduler = SimpleNamespace(draining=False)
+        executor = _make_executor(reporter=reporter, scheduler=scheduler, workflow=wfs, db=wfs.db)
+        jobs = [
+            HashJob(path, FileHash.unknown(), HashUpdateCause.CONFIRMED, -1 - i)
+            for i, path in enumerate(["a.txt", "bad.txt", "b.txt"])
+        ]
+
+        await executor.run_hash_batch(HashBatch(jobs))
+
+        assert reporter.jobs == [("start", -1, "H", "a.txt (+2 more)"), ("stop", -1)]
+        assert len(calls) == 1
+        assert list(calls[0][0]) == ["a.txt", "b.txt"]
+        assert jobs[0].future.result() == calls[0][0]["a.txt"]
+        assert jobs[2].future.result() == calls[0][0]["b.txt"]
+        assert isinstance(jobs[1].future.exception(), PermissionError)
+        assert scheduler.draining is True
+        assert executor.running == {}
+        async with wfs.db:
+            assert wfs.find(File, "a.txt").get_state() == FileState.CONFIRMED
+            assert wfs.find(File, "b.txt").get_state() == FileState.CONFIRMED
+            assert wfs.find(File, "bad.txt").get_state() == FileState.UNCONFIRMED
@@ -2,24 +2,53 @@
 # SPDX-License-Identifier: LGPL-3.0-or-later
 """Unit tests for stepup.core.hash"""
 
+import concurrent.futures
+import hashlib
 import os
+import struct
 import threading
+import time
 from hashlib import sha256
 
+import attrs
 import pytest
 from conftest import TrippingEvent
 from path import Path
 
+from stepup.core import hash as hash_module
 from stepup.core.exceptions import HashCancelledError, HashFailedError
 from stepup.core.hash import (
+    DEFAULT_DIGEST_ALGORITHM,
+    DIGEST_ALGORITHMS,
+    FILE_HASH_HEADER,
     HASH_CHUNK_SIZE,
+    HASH_FANOUT_MIN_FILES,
+    HASH_IO_STRATEGIES,
+    RACY_WINDOW_COARSE_NS,
+    RACY_WINDOW_NS,
+    STEP_HASH_HEADER,
+    TREE_DIGEST_ALGORITHMS,
+    TREE_SEGMENT_SIZE,
     FileHash,
+    HashMemo,
+    StepHash,
+    compute_both_hashes,
     compute_file_digest,
     compute_inp_hashes,
     compute_out_hashes,
+    find_stat_changes,
+    fmt_file_hash_diff,
+    racy_window_ns,
+    refresh_file_hashes,
 )
 
 
+def _backdate(path: str, seconds: int = 10):
+    """Move the timestamps of a file to the past, so its hash is not racy."""
+    mtime_ns = os.stat(path).st_mtime_ns - seconds * 1_000_000_000
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
 def test_new():
     file_hash = FileHash.unknown()
     assert file_hash.digest == b"u"
@@ -38,6 +67,44 @@ def test_simple():
     assert new_hash3 is not new_hash2
 
 
+def test_racy(path_tmp: Path):
+    path = path_tmp / "data.txt"
+    path.write_bytes(b"data")
+    os.utime(path, ns=(time.time_ns(), time.time_ns()))
+    file_hash = FileHash.unknown().refreshed(path)
+    assert file_hash.racy
+    # A racy hash is never trusted, so its digest is recomputed.
+    assert not file_hash.matches_stat(os.stat(path))
+    _backdate(path)
+    new_hash = file_hash.refreshed(path)
+    assert new_hash is not file_hash
+    assert not new_hash.racy
+    assert new_hash == file_hash
+    assert new_hash.refreshed(path) is new_hash
+
+
+def test_racy_window_ns(path_tmp: Path):
+    path = path_tmp / "data.txt"
+    path.write_bytes(b"data")
+    os.utime(path, ns=(1_000_000_001, 1_000_000_001))
+    assert racy_window_ns(os.stat(path)) == RACY_WINDOW_NS
+    # Whole seconds suggest a file system with a coarse timestamp resolution.
+    os.utime(path, ns=(1_000_000_000, 1_000_000_000))
+    assert racy_window_ns(os.stat(path)) == RACY_WINDOW_COARSE_NS
+
+
+def test_matches_stat_ctime(path_tmp: Path):
+    path = path_tmp / "data.txt"
+    path.write_bytes(b"data")
+    _backdate(path)
+    file_hash = FileHash.unknown().refreshed(path)
+    assert file_hash.matches_stat(os.stat(path))
+    # A chmod only changes the ctime, e.g. also when restoring the mode afterwards.
+    path.chmod(0o600)
+    path.chmod(file_hash.mode)
+    assert not file_hash.matches_stat(os.stat(path))
+
+
 def test_missing():
     non_existing = "sdfkjaskdfjsadksasdsdfoasudfioausdfosuadfyoa"
     init_hash = FileHash.unknown()
@@ -58,6 +125,139 @@ def test_symbolic_link(path_tmp: Path):
     assert compute_file_digest(path_symlink, follow_symlinks=False) == sha256(b"dest.txt").digest()
 
 
+@pytest.mark.parametrize("algorithm", sorted(DIGEST_ALGORITHMS))
+def test_compute_file_digest_algorithm(path_tmp: Path, algorithm: str):
+    path = path_tmp / "data.bin"
+    path.write_bytes(b"data" * HASH_CHUNK_SIZE)
+    digest = compute_file_digest(path, algorithm=algorithm)
+    assert digest == DIGEST_ALGORITHMS[algorithm](b"data" * HASH_CHUNK_SIZE).digest()
+    assert (digest == sha256(b"data" * HASH_CHUNK_SIZE).digest()) == (algorithm == "sha256")
+
+
+def _expected_tree_digest(data: bytes, base: str, segment_size: int) -> bytes:
+    new_hash = DIGEST_ALGORITHMS[base]
+    root = new_hash(b"stepup-tree-digest\0" + struct.pack("<QQ", segment_size, len(data)))
+    for offset in range(0, len(data), segment_size):
+        root.update(new_hash(data[offset : offset + segment_size]).digest())
+    return root.digest()
+
+
+@pytest.mark.parametrize("algorithm", sorted(TREE_DIGEST_ALGORITHMS))
+def test_compute_file_digest_tree(path_tmp: Path, algorithm: str, monkeypatch):
+    segment_size = HASH_CHUNK_SIZE + 123
+    monkeypatch.setattr(hash_module, "TREE_SEGMENT_SIZE", segment_size)
+    data = os.urandom(segment_size * 5 + 17)
+    path = path_tmp / "data.bin"
+    path.write_bytes(data)
+    base = TREE_DIGEST_ALGORITHMS[algorithm]
+    expected = _expected_tree_digest(data, base, segment_size)
+    assert compute_file_digest(path, algorithm=algorithm) == expected
+    with concurrent.futures.ThreadPoolExecutor(3) as pool:
+        digest = compute_file_digest(path, algorithm=algorithm, pool=pool, max_helpers=2)
+    assert digest == expected
+    # Never equal to a plain digest, also not for a file of a single segment.
+    path.write_bytes(b"small")
+    assert (
+        compute_file_digest(path, algorithm=algorithm) != DIGEST_ALGORITHMS[base](b"small").digest()
+    )
+
+
+def test_compute_file_digest_tree_symlink_and_empty(path_tmp: Path):
+    path = path_tmp / "empty.txt"
+    path.write_bytes(b"")
+    assert compute_file_digest(path, algorithm="sha256-tree") == _expected_tree_digest(
+        b"", "sha256", TREE_SEGMENT_SIZE
+    )
+    path_symlink = path_tmp / "link"
+    path_symlink.symlink_to("empty.txt")
+    assert compute_file_digest(
+        path_symlink, follow_symlinks=False, algorithm="sha256-tree"
+    ) == _expected_tree_digest(b"empty.txt", "sha256", TREE_SEGMENT_SIZE)
+
+
+def test_compute_file_digest_tree_cancelled(path_tmp: Path, monkeypatch):
+    monkeypatch.setattr(hash_module, "TREE_SEGMENT_SIZE", HASH_CHUNK_SIZE)
+    path = path_tmp / "data.bin"
+    path.write_bytes(os.urandom(HASH_CHUNK_SIZE * 4))
+    cancel_event = TrippingEvent(2)
+    with (
+        concurrent.futures.ThreadPoolExecutor(2) as pool,
+        pytest.raises(HashCancelledError) as excinfo,
+    ):
+        compute_file_digest(
+            path, cancel_event=cancel_event, algorithm="blake2b-tree", pool=pool, max_helpers=1
+        )
+    assert excinfo.value.args[0] == path
+
+
+def test_refreshed_tree_algorithm(path_tmp: Path):
+    path = path_tmp / "data.txt"
+    path.write_bytes(b"data")
+    _backdate(path)
+    plain_hash = FileHash.unknown().refreshed(path)
+    tree_hash = plain_hash.refreshed(path, algorithm="sha256-tree")
+    assert tree_hash != plain_hash
+    assert tree_hash.algorithm == "sha256-tree"
+    assert FileHash.from_blob(tree_hash.to_blob()) == tree_hash
+    assert tree_hash.refreshed(path) is tree_hash
+
+
+def test_refreshed_migrates_algorithm(path_tmp: Path):
+    path = path_tmp / "data.txt"
+    path.write_bytes(b"data")
+    _backdate(path)
+    old_hash = FileHash.unknown().refreshed(path)
+    assert old_hash.algorithm == DEFAULT_DIGEST_ALGORITHM
+    # The recorded algorithm is kept by default, and with it the digest of an unchanged file.
+    assert old_hash.refreshed(path) is old_hash
+    assert old_hash.refreshed(path, algorithm="sha256") is old_hash
+    new_hash = old_hash.refreshed(path, algorithm="blake2b")
+    assert new_hash.algorithm == "blake2b"
+    assert new_hash.digest == hashlib.blake2b(b"data", digest_size=32).digest()
+    assert new_hash != old_hash
+    assert fmt_file_hash_diff(old_hash, new_hash).startswith("(algorithm sha256 ➜ blake2b, ")
+    assert new_hash.refreshed(path) is new_hash
+    assert FileHash.from_blob(new_hash.to_blob()).algorithm == "blake2b"
+
+
+@pytest.mark.parametrize("size", [0, 1, HASH_CHUNK_SIZE, HASH_CHUNK_SIZE * 3 + 5])
+def test_compute_file_digest_io_strategies(path_tmp: Path, size: int):
+    data = os.urandom(size)
+    path = path_tmp / "data.bin"
+    path.write_bytes(data)
+    for io_strategy in HASH_IO_STRATEGIES:
+        assert compute_file_digest(path, io_strategy=io_strategy) == sha256(data).digest()
+    with pytest.raises(ValueError):
+        compute_file_digest(path, io_strategy="carrier-pigeon")
+
+
+def test_compute_file_digest_mmap_cancelled(path_tmp: Path):
+    path = path_tmp / "data.bin"
+    path.write_bytes(os.urandom(HASH_CHUNK_SIZE * 3))
+    cancel_event = TrippingEvent(1)
+    with pytest.raises(HashCancelledError) as excinfo:
+        compute_file_digest(path, cancel_event=cancel_event, io_strategy="mmap")
+    assert excinfo.value.args[0] == path
+
+
+@pytest.mark.skipif(not hasattr(os, "posix_fadvise"), reason="posix_fadvise not available")
+def test_compute_file_digest_drops_large_files_from_cache(path_tmp: Path, monkeypatch):
+    advices = []
+    monkeypatch.setattr(
+        os, "posix_fadvise", lambda fd, offset, size, advice: advices.append(advice)
+    )
+    monkeypatch.setattr(hash_module, "HASH_DROP_CACHE_SIZE", 100)
+    path = path_tmp / "small.bin"
+    path.write_bytes(b"x" * 99)
+    compute_file_digest(path)
+    assert advices == [os.POSIX_FADV_SEQUENTIAL]
+    advices.clear()
+    path = path_tmp / "large.bin"
+    path.write_bytes(b"x" * 100)
+    compute_file_digest(path, algorithm="sha256-tree")
+    assert advices == [os.POSIX_FADV_SEQUENTIAL, os.POSIX_FADV_DONTNEED]
+
+
 def test_hash_wrong_dir(path_tmp: Path):
     with pytest.raises(HashFailedError):
         compute_file_digest(path_tmp)
@@ -133,21 +333,57 @@ def test_refreshed_cancelled_unchanged_file(path_tmp: Path):
         file_hash.refreshed(path, cancel_event)
 
 
-def test_to_json_unknown():
-    assert FileHash.unknown().to_json() is None
+def test_to_blob_unknown():
+    assert FileHash.unknown().to_blob() is None
 
 
-def test_from_json_none():
-    assert FileHash.from_json(None) == FileHash.unknown()
+def test_from_blob_none():
+    assert FileHash.from_blob(None) == FileHash.unknown()
 
 
-def test_to_json_from_json_round_trip():
-    file_hash = FileHash(sha256(b"foo").digest(), 0o644, 1234.5, 100, 0x8000000000000001)
-    restored = FileHash.from_json(file_hash.to_json())
+def test_to_blob_from_blob_round_trip():
+    file_hash = FileHash(
+        sha256(b"foo").digest(),
+        0o644,
+        1_234_500_000_001,
+        100,
+        0x8000000000000001,
+        1_234_600_000_002,
+        racy=True,
+    )
+    blob = file_hash.to_blob()
+    assert len(blob) == FILE_HASH_HEADER.size + 32
+    restored = FileHash.from_blob(blob)
     assert restored == file_hash
-    # `==` on FileHash ignores mtime and inode (eq=False), so check those explicitly too.
-    assert restored.mtime == file_hash.mtime
+    # `==` on FileHash ignores timestamps, inode and racy (eq=False), so check those too.
+    assert restored.mtime_ns == file_hash.mtime_ns
+    assert restored.ctime_ns == file_hash.ctime_ns
     assert restored.inode == file_hash.inode
+    assert restored.racy
+
+
+@pytest.mark.parametrize("out_digest", [None, b"o" * 32])
+def test_step_hash_compact_blob_round_trip(out_digest):
+    step_hash = StepHash(b"i" * 32, None, out_digest)
+    blob = step_hash.to_blob()
+    assert len(blob) == STEP_HASH_HEADER.size + 32 + (0 if out_digest is None else 32)
+    assert StepHash.from_blob(blob) == step_hash
+
+
+def test_step_hash_explained_blob_round_trip():
+    inp_hash = FileHash(sha256(b"inp").digest(), 0o100644, 12_500_000_000, 3, 7)
+    out_hash = FileHash(sha256(b"out").digest(), 0o100755, 13_500_000_000, 4, 8)
+    step_hash = StepHash.from_inp(
+        "step", {"inp.txt": inp_hash}, {"FOO": None}, explained=True, env_overrides={"BAR": "1"}
+    ).with_out_hashes({"out.txt": out_hash})
+    restored = StepHash.from_blob(step_hash.to_blob())
+    assert restored == step_hash
+    assert restored.inp_info.inp_hashes["inp.txt"].inode == 7
+    assert restored.out_info.out_hashes["out.txt"].mtime_ns == 13_500_000_000
+
+
+def test_step_hash_from_blob_none():
+    assert StepHash.from_blob(None) is None
 
 
 def test_compute_inp_hashes_cancelled_during_second_file(path_tmp: Path):
@@ -199,3 +435,161 @@ def test_compute_inp_and_out_hashes(path_tmp: Path):
     assert out_result.messages == []
     assert list(out_result.new_hashes) == [str(path_out)]
     assert list(out_result.all_hashes) == [str(path_out)]
+
+
+def _make_many_files(path_tmp: Path, num: int) -> dict[str, FileHash]:
+    old_hashes = {}
+    for i in range(num):
+        path = path_tmp / f"file{i:03d}.txt"
+        path.write_bytes(f"content {i}".encode() * (i + 1))
+        old_hashes[str(path)] = FileHash.unknown()
+    return old_hashes
+
+
+def test_compute_hashes_fanout(path_tmp: Path):
+    old_hashes = _make_many_files(path_tmp, 5 * HASH_FANOUT_MIN_FILES)
+    serial = compute_out_hashes(old_hashes, threading.Event())
+    with concurrent.futures.ThreadPoolExecutor(4) as pool:
+        inp_result, out_result = compute_both_hashes(
+            old_hashes, old_hashes, threading.Event(), pool=pool, max_helpers=3
+        )
+    assert out_result == serial
+    assert list(out_result.all_hashes) == sorted(old_hashes)
+    assert inp_result.all_hashes == serial.all_hashes
+    assert list(inp_result.all_hashes) == sorted(old_hashes)
+    assert len(inp_result.messages) == len(old_hashes)
+
+
+def test_compute_hashes_fanout_in_busy_pool(path_tmp: Path):
+    """The helpers never start when the only thread of the pool is computing the hashes."""
+    old_hashes = _make_many_files(path_tmp, 3 * HASH_FANOUT_MIN_FILES)
+    with concurrent.futures.ThreadPoolExecutor(1) as pool:
+        future = pool.submit(
+            compute_out_hashes, old_hashes, threading.Event(), pool=pool, max_helpers=2
+        )
+        result = future.result(timeout=30)
+    assert list(result.all_hashes) == sorted(old_hashes)
+
+
+def test_compute_hashes_fanout_raises_first_failure(path_tmp: Path):
+    old_hashes = _make_many_files(path_tmp, 3 * HASH_FANOUT_MIN_FILES)
+    (path_tmp / "file000.txt").remove()
+    (path_tmp / "file000.txt").mkdir()
+    with concurrent.futures.ThreadPoolExecutor(4) as pool:
+        with pytest.raises(HashFailedError):
+            compute_out_hashes(old_hashes, threading.Event(), pool=pool, max_helpers=3)
+        cancel_event = threading.Event()
+        cancel_event.set()
+        with pytest.raises(HashCancelledError):
+            compute_inp_hashes(old_hashes, cancel_event, pool=pool, max_helpers=3)
+
+
+def test_hash_memo(path_tmp: Path):
+    path = path_tmp / "inp.txt"
+    path.write_bytes(b"input")
+    _backdate(path)
+    old_hash = FileHash.unknown().refreshed(path)
+    memo = HashMemo()
+    result = compute_inp_hashes({path: old_hash}, threading.Event(), memo=memo)
+    assert result.messages == []
+    assert memo.is_current(path, old_hash)
+    # A change that goes unnoticed: the memo is trusted for the rest of the build phase.
+    path.write_bytes(b"other")
+    result = compute_inp_hashes({path: old_hash}, threading.Event(), memo=memo)
+    assert result.messages == []
+    assert result.all_hashes[path] is old_hash
+    # After invalidation, the change is detected.
+    memo.invalidate([path])
+    result = compute_inp_hashes({path: old_hash}, threading.Event(), memo=memo)
+    assert result.messages == [
+        f"Input changed unexpectedly: {path} "
+        + fmt_file_hash_diff(old_hash, result.all_hashes[path])
+    ]
+    # The new hash is not racy, but it was not the old one, so the old one is still not current.
+    assert not memo.is_current(path, old_hash)
+
+
+def test_hash_memo_store_after_invalidation(path_tmp: Path):
+    path = path_tmp / "inp.txt"
+    path.write_bytes(b"input")
+    _backdate(path)
+    file_hash = FileHash.unknown().refreshed(path)
+    memo = HashMemo()
+    epoch = memo.epoch(path)
+    memo.invalidate([path])
+    memo.store(path, file_hash, epoch)
+    assert not memo.is_current(path, file_hash)
+    epoch = memo.epoch(path)
+    memo.clear()
+    memo.store(path, file_hash, epoch)
+    assert not memo.is_current(path, file_hash)
+    memo.store(path, file_hash, memo.epoch(path))
+    assert memo.is_current(path, file_hash)
+    # Racy and unknown hashes are never stored.
+    memo.store("racy.txt", attrs.evolve(file_hash, racy=True), memo.epoch("racy.txt"))
+    assert not memo.is_current("racy.txt", file_hash)
+    memo.store("gone.txt", FileHash.unknown(), memo.epoch("gone.txt"))
+    assert not memo.is_current("gone.txt", FileHash.unknown())
+
+
+def test_refresh_file_hashes_keeps_outcomes_apart(path_tmp: Path):
+    path_file = path_tmp / "file.txt"
+    path_file.write_bytes(b"content")
+    path_dir = path_tmp / "sub"
+    path_dir.mkdir()
+
+    outcomes = refresh_file_hashes(
+        [
+            (str(path_dir), FileHash.unknown()),
+            (str(path_file), FileHash.unknown()),
+            (str(path_tmp / "missing.txt"), FileHash.unknown()),
+        ],
+        cancel_event=threading.Event(),
+    )
+
+    assert isinstance(outcomes[0], HashFailedError)
+    assert outcomes[1] == FileHash.unknown().refreshed(str(path_file))
+    assert outcomes[2].is_unknown
+
+
+def test_refresh_file_hashes_cancelled():
+    cancel_event = threading.Event()
+    cancel_event.set()
+    outcomes = refresh_file_hashes(
+        [("a.txt", FileHash.unknown()), ("b.txt", FileHash.unknown())], cancel_event
+    )
+    assert all(isinstance(outcome, HashCancelledError) for outcome in outcomes)
+
+
+def test_find_stat_changes(path_tmp: Path):
+    sub = path_tmp / "sub"
+    sub.mkdir()
+    paths = {}
+    for name in "same.txt", "modified.txt", "deleted.txt", "sub/same.txt":
+        path = path_tmp / name
+        path.write_bytes(name.encode())
+        paths[name] = str(path)
+        _backdate(path)
+    old_hashes = {path: FileHash.unknown().refreshed(path) for path in paths.values()}
+    old_hashes[str(path_tmp / "never.txt")] = FileHash.unknown()
+    old_hashes[str(path_tmp / "created.txt")] = FileHash.unknown()
+    old_hashes[str(path_tmp / "gone/file.txt")] = FileHash.unknown().refreshed(paths["same.txt"])
+    (path_tmp / "created.txt").write_bytes(b"new")
+    Path(paths["modified.txt"]).write_bytes(b"other content")
+    Path(paths["deleted.txt"]).remove()
+
+    assert find_stat_changes(old_hashes) == [
+        paths["modified.txt"],
+        paths["deleted.txt"],
+        str(path_tmp / "created.txt"),
+        str(path_tmp / "gone/file.txt"),
+    ]
+    # A known hash recorded with another algorithm must be refreshed, an unknown one not.
+    assert find_stat_changes(old_hashes, "blake2b") == [
+        paths["same.txt"],
+        paths["modified.txt"],
+        paths["deleted.txt"],
+        paths["sub/same.txt"],
+        str(path_tmp / "created.txt"),
+        str(path_tmp / "gone/file.txt"),
+    ]
@@ -9,7 +9,7 @@ from stepup.core.enums import HashUpdateCause
 from stepup.core.executor import Executor
 from stepup.core.file import File, FileState
 from stepup.core.hash import FileHash
-from stepup.core.hash_queue import HashQueue, gather_hashes
+from stepup.core.hash_queue import HASH_BATCH_BYTES, HASH_BATCH_JOBS, HashQueue, gather_hashes
 from stepup.core.reporter import ReporterClient
 from stepup.core.workflow import Workflow
 
@@ -111,6 +111,50 @@ async def test_pop_nowait_skips_a_job_already_claimed_by_promotion():
     assert hash_queue.pop_nowait() is None
 
 
+def test_pop_batch_nowait_returns_none_when_empty():
+    hash_queue = HashQueue(wake=asyncio.Event())
+    assert hash_queue.pop_batch_nowait() is None
+
+
+async def test_pop_batch_nowait_caps_the_number_of_jobs():
+    hash_queue = HashQueue(wake=asyncio.Event())
+    jobs = [
+        hash_queue.submit(f"f{i}.txt", FileHash.unknown(), HashUpdateCause.EXTERNAL)
+        for i in range(HASH_BATCH_JOBS + 1)
+    ]
+
+    assert hash_queue.pop_batch_nowait().jobs == jobs[:-1]
+    assert hash_queue.pop_batch_nowait().jobs == jobs[-1:]
+    assert hash_queue.pop_batch_nowait() is None
+
+
+async def test_pop_batch_nowait_closes_a_batch_after_a_large_file():
+    """A large file ends its batch, so the small files behind it are not held up."""
+    hash_queue = HashQueue(wake=asyncio.Event())
+    large_hash = FileHash(b"x" * 32, 0o100644, 0, HASH_BATCH_BYTES, 1)
+    job1 = hash_queue.submit("small.txt", FileHash.unknown(), HashUpdateCause.EXTERNAL)
+    job2 = hash_queue.submit("large.bin", large_hash, HashUpdateCause.EXTERNAL)
+    job3 = hash_queue.submit("other.txt", FileHash.unknown(), HashUpdateCause.EXTERNAL)
+
+    batch = hash_queue.pop_batch_nowait()
+    assert batch.jobs == [job1, job2]
+    assert batch.job_i == job1.job_i
+    assert batch.description == "small.txt (+1 more)"
+    assert hash_queue.pop_batch_nowait().jobs == [job3]
+
+
+async def test_pop_batch_nowait_skips_jobs_already_claimed_by_promotion():
+    hash_queue = HashQueue(wake=asyncio.Event())
+    job1 = hash_queue.submit("foo.txt", FileHash.unknown(), HashUpdateCause.EXTERNAL)
+    job2 = hash_queue.submit("bar.txt", FileHash.unknown(), HashUpdateCause.EXTERNAL)
+
+    assert hash_queue.claim(job1) is True  # simulate promotion
+
+    batch = hash_queue.pop_batch_nowait()
+    assert batch.jobs == [job2]
+    assert batch.description == "bar.txt"
+
+
 async def test_shutdown_cancels_queued_futures_and_drains_queue():
     hash_queue = HashQueue(wake=asyncio.Event())
     job1 = hash_queue.submit("foo.txt", FileHash.unknown(), HashUpdateCause.EXTERNAL)
@@ -178,19 +222,24 @@ async def test_gather_hashes_returns_results_in_input_order_and_applies_them(wfs
             assert wfs.find(File, "b.txt").get_state() == FileState.CONFIRMED
 
 
-async def test_gather_hashes_respects_njob_concurrency_bound():
-    """A fake executor whose `run_hash_job` yields control mid-flight, so overlapping calls
-    would show up as a higher `max_concurrent` than `njob` allows."""
+async def test_gather_hashes_respects_njob_concurrency_bound(monkeypatch):
+    """A fake executor whose `run_hash_batch` yields control mid-flight, so overlapping calls
+    would show up as a higher `max_concurrent` than `njob` allows.
+
+    Batches of a single job make sure there is more than one batch to overlap.
+    """
+    monkeypatch.setattr("stepup.core.hash_queue.HASH_BATCH_JOBS", 1)
     concurrent = 0
     max_concurrent = 0
 
     class _FakeExecutor:
-        async def run_hash_job(self, job):
+        async def run_hash_batch(self, batch):
             nonlocal concurrent, max_concurrent
             concurrent += 1
             max_concurrent = max(max_concurrent, concurrent)
             await asyncio.sleep(0)
-            job.future.set_result(FileHash.unknown())
+            for job in batch.jobs:
+                job.future.set_result(FileHash.unknown())
             concurrent -= 1
 
     hash_queue = HashQueue(wake=asyncio.Event())
@@ -200,18 +249,19 @@ async def test_gather_hashes_respects_njob_concurrency_bound():
 
     await gather_hashes(hash_queue, _FakeExecutor(), ReporterClient(), path_hash_causes, njob=2)
 
-    assert max_concurrent <= 2
+    assert max_concurrent == 2
 
 
 async def test_gather_hashes_tolerates_a_duplicate_path_and_runs_it_once():
     """Two entries for the same path dedup to a single `HashJob` (see `HashQueue.submit`);
-    the second `run_one` must not run it again, only await the shared future."""
+    it must be hashed only once, while both entries await the shared future."""
     calls = []
 
     class _FakeExecutor:
-        async def run_hash_job(self, job):
-            calls.append(job.path)
-            job.future.set_result(FileHash.unknown())
+        async def run_hash_batch(self, batch):
+            for job in batch.jobs:
+                calls.append(job.path)
+                job.future.set_result(FileHash.unknown())
 
     hash_queue = HashQueue(wake=asyncio.Event())
     path_hash_causes = [
@@ -6,7 +6,8 @@ from types import SimpleNamespace
 
 import pytest
 
-from stepup.core.outcome import ResourceUsage
+from stepup.core import outcome
+from stepup.core.outcome import ResourceUsage, maxrss_mib
 
 
 def test_resource_usage_defaults():
@@ -14,22 +15,24 @@ def test_resource_usage_defaults():
     assert usage.utime == 0.0
     assert usage.stime == 0.0
     assert usage.wtime == 0.0
+    assert usage.maxrss == 0.0
 
 
 def test_resource_usage_add():
-    usage = ResourceUsage() + ResourceUsage(utime=1.5, stime=0.5, wtime=3.0)
-    usage += ResourceUsage(utime=2.5, stime=1.5, wtime=2.0)
+    usage = ResourceUsage() + ResourceUsage(utime=1.5, stime=0.5, wtime=3.0, maxrss=10.0)
+    usage += ResourceUsage(utime=2.5, stime=1.5, wtime=2.0, maxrss=20.0)
     assert usage.utime == pytest.approx(4.0)
     assert usage.stime == pytest.approx(2.0)
-    # Wall times are combined with max, not summed.
+    # Wall times and peak memory are combined with max, not summed.
     assert usage.wtime == pytest.approx(3.0)
+    assert usage.maxrss == pytest.approx(20.0)
 
 
 def test_resource_usage_from_diff_self_and_children():
-    ru_self_start = SimpleNamespace(ru_utime=1.0, ru_stime=2.0)
-    ru_self_end = SimpleNamespace(ru_utime=1.5, ru_stime=2.25)
-    ru_children_start = SimpleNamespace(ru_utime=0.1, ru_stime=0.2)
-    ru_children_end = SimpleNamespace(ru_utime=0.4, ru_stime=0.5)
+    ru_self_start = SimpleNamespace(ru_utime=1.0, ru_stime=2.0, ru_maxrss=1000)
+    ru_self_end = SimpleNamespace(ru_utime=1.5, ru_stime=2.25, ru_maxrss=3000)
+    ru_children_start = SimpleNamespace(ru_utime=0.1, ru_stime=0.2, ru_maxrss=0)
+    ru_children_end = SimpleNamespace(ru_utime=0.4, ru_stime=0.5, ru_maxrss=5000)
     wtime_start = 1.5
     wtime_end = 2.0
     usage = ResourceUsage.from_diff(
@@ -39,3 +42,11 @@ def test_resource_usage_from_diff_self_and_children():
     assert usage.utime == pytest.approx(0.8)
     assert usage.stime == pytest.approx(0.55)
     assert usage.wtime == pytest.approx(0.5)
+    # The peak memory is not a difference, but the largest peak up to the end snapshot.
+    assert usage.maxrss == maxrss_mib(5000)
+
+
+@pytest.mark.parametrize(("platform", "mib"), [("linux", 2.0), ("darwin", 2.0 / 1024)])
+def test_maxrss_mib(monkeypatch, platform, mib):
+    monkeypatch.setattr(outcome.sys, "platform", platform)
+    assert maxrss_mib(2048) == pytest.approx(mib)
@@ -0,0 +1,73 @@
+# SPDX-FileCopyrightText: 2024 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Unit tests for stepup.core.preload."""
+
+import os
+import sys
+
+import pytest
+
+from stepup.core.preload import PreloadReport, parse_preload_modules, probe_preload_modules
+
+
+@pytest.mark.parametrize(
+    ("value", "modules"),
+    [
+        (None, []),
+        ("", []),
+        ("numpy", ["numpy"]),
+        (" numpy, scipy.linalg ,,", ["numpy", "scipy.linalg"]),
+    ],
+)
+def test_parse_preload_modules(value: str | None, modules: list[str]):
+    assert parse_preload_modules(value) == modules
+
+
+def test_probe_preload_modules_empty():
+    assert probe_preload_modules([]) == []
+
+
+MODULE_THREAD = """
+import threading
+import time
+
+threading.Thread(target=time.sleep, args=(60,), name="worker", daemon=True).start()
+"""
+
+MODULE_SOCKET = """
+import socket
+
+pair = socket.socketpair()
+"""
+
+MODULE_NOISY = """
+import sys
+
+sys.stdout.write("no trailing newline")
+"""
+
+
+def test_probe_preload_modules(tmp_path):
+    (tmp_path / "with_thread.py").write_text(MODULE_THREAD)
+    (tmp_path / "with_socket.py").write_text(MODULE_SOCKET)
+    (tmp_path / "noisy.py").write_text(MODULE_NOISY)
+    env = dict(os.environ)
+    env["PYTHONPATH"] = str(tmp_path)
+    modules = ["json", "no_such_module", "with_thread", "with_socket", "noisy"]
+    reports = probe_preload_modules(modules, env)
+    assert [report.module for report in reports] == modules
+    assert all(report.import_time >= 0.0 for report in reports)
+    assert reports[0].problem is None
+    assert reports[1].error == "ModuleNotFoundError: No module named 'no_such_module'"
+    assert reports[1].problem.startswith("import failed")
+    assert reports[2].threads == ["worker"]
+    assert reports[2].problem == "it starts threads (worker)"
+    if sys.platform == "linux":
+        assert reports[3].nsocket == 2
+        assert reports[3].problem == "it opens 2 socket(s)"
+    assert reports[4].problem is None
+
+
+def test_preload_report_problem_order():
+    report = PreloadReport("foo", 0.1, threads=["bar"], nsocket=1)
+    assert report.problem == "it starts threads (bar)"
@@ -0,0 +1,106 @@
+# SPDX-FileCopyrightText: 2024 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Unit tests for stepup.core.pressure"""
+
+import asyncio
+
+import pytest
+from path import Path
+
+from stepup.core.pressure import PRESSURE_HIGH, PRESSURE_LOW, AdaptiveJobs, read_pressure_total
+
+
+def write_pressure(path: Path, some_total: int, full_total: int = 0):
+    path.write_text(
+        f"some avg10=0.00 avg60=0.00 avg300=0.00 total={some_total}\n"
+        f"full avg10=0.00 avg60=0.00 avg300=0.00 total={full_total}\n"
+    )
+
+
+@pytest.fixture
+def paths(path_tmp: Path) -> dict[str, Path]:
+    result = {name: path_tmp / name for name in ("cpu", "io", "memory")}
+    for path in result.values():
+        write_pressure(path, 0)
+    return result
+
+
+def test_read_pressure_total(path_tmp: Path):
+    path = path_tmp / "cpu"
+    write_pressure(path, 1234, 5678)
+    assert read_pressure_total(path) == 1234
+
+
+def test_read_pressure_total_invalid(path_tmp: Path):
+    path = path_tmp / "cpu"
+    path.write_text("full avg10=0.00 avg60=0.00 avg300=0.00 total=0\n")
+    with pytest.raises(ValueError):
+        read_pressure_total(path)
+
+
+def test_adaptive_jobs_sample(paths: dict[str, Path]):
+    adaptive = AdaptiveJobs(1, 8, paths)
+    assert adaptive.njob == 8
+    assert adaptive.sample(10.0) is None
+    write_pressure(paths["cpu"], 500_000)
+    write_pressure(paths["io"], 1_500_000)
+    assert adaptive.sample(12.0) == pytest.approx(0.75)
+    assert adaptive.sample(14.0) == pytest.approx(0.0)
+
+
+def test_adaptive_jobs_sample_unreadable(paths: dict[str, Path]):
+    adaptive = AdaptiveJobs(1, 8, paths)
+    assert adaptive.sample(10.0) is None
+    paths["memory"].remove()
+    assert adaptive.sample(12.0) is None
+
+
+def test_adaptive_jobs_update(paths: dict[str, Path]):
+    adaptive = AdaptiveJobs(2, 8, paths)
+    high = PRESSURE_HIGH + 0.1
+    low = PRESSURE_LOW / 2
+    middle = (PRESSURE_LOW + PRESSURE_HIGH) / 2
+    assert adaptive.update(high)
+    assert adaptive.njob == 6
+    assert adaptive.update(high)
+    assert adaptive.njob == 5
+    assert not adaptive.update(middle)
+    assert adaptive.njob == 5
+    assert adaptive.update(high)
+    assert adaptive.update(high)
+    assert adaptive.update(high)
+    assert adaptive.njob == 2
+    assert not adaptive.update(high)
+    assert adaptive.njob == 2
+    assert adaptive.update(low)
+    assert adaptive.njob == 3
+    for _ in range(10):
+        adaptive.update(low)
+    assert adaptive.njob == 8
+
+
+@pytest.mark.parametrize(("njob_min", "njob_max"), [(0, 4), (5, 4)])
+def test_adaptive_jobs_invalid_bounds(paths: dict[str, Path], njob_min: int, njob_max: int):
+    with pytest.raises(ValueError):
+        AdaptiveJobs(njob_min, njob_max, paths)
+
+
+async def test_adaptive_jobs_loop(paths: dict[str, Path], monkeypatch):
+    stop_event = asyncio.Event()
+    stalls = iter([None, 0.9, 0.2, 0.9, 0.0])
+
+    def fake_sample(self):
+        stall = next(stalls, None)
+        if stall is None and self.njob != 4:
+            stop_event.set()
+        return stall
+
+    monkeypatch.setattr(AdaptiveJobs, "sample", fake_sample)
+    adaptive = AdaptiveJobs(1, 4, paths, interval=0.001)
+    changes = []
+
+    async def set_njob(njob: int):
+        changes.append(njob)
+
+    await asyncio.wait_for(adaptive.loop(set_njob, stop_event), timeout=5)
+    assert changes == [3, 2, 3]
@@ -2,12 +2,15 @@
 # SPDX-License-Identifier: LGPL-3.0-or-later
 """Unit tests for stepup.core.run"""
 
+import asyncio
 import multiprocessing
 import os
 import shlex
 import shutil
 import signal
+import subprocess
 import sys
+import threading
 from types import SimpleNamespace
 
 import pytest
@@ -17,13 +20,19 @@ import stepup.core.run as run_mod
 from stepup.core.exceptions import RunError
 from stepup.core.outcome import ResourceUsage
 from stepup.core.run import (
+    CallWorkerPool,
     ChildOutcome,
     Run,
     _detect_python_entrypoint,
     _exec_in_forkserver,
+    _exec_subprocess,
     _executable_compatible_with_current_python,
     _executable_uses_same_python,
     _lost_child_outcome,
+    _open_spool,
+    _read_spool,
+    _wait4,
+    is_call_command,
     launch_command,
 )
 
@@ -147,6 +156,240 @@ async def test_launch_command_measures_resource_usage(tmp_path):
     assert outcome.usage.wtime >= outcome.usage.utime
 
 
+PY_ECHO = """
+import sys
+sys.stdout.buffer.write(sys.stdin.buffer.read())
+sys.stdout.flush()
+print("done", file=sys.stderr)
+"""
+
+
+async def test_exec_subprocess_large_stdin_stdout(tmp_path):
+    """Input and output larger than a pipe buffer flow without a pipe-full deadlock."""
+    step = SimpleNamespace(i=1, label="cat", command_and_workdir=("cat", "."))
+    run = Run(step, job_i=1)
+    data = bytes(range(256)) * 4096
+
+    outcome = await _exec_subprocess(
+        [sys.executable, "-c", PY_ECHO],
+        shell=False,
+        env=dict(os.environ),
+        cwd=Path(tmp_path),
+        stdin_data=data,
+        spool_dir=str(tmp_path),
+        run=run,
+    )
+
+    assert outcome.returncode == 0
+    assert outcome.stdout == data.decode("utf-8", "ignore")
+    assert outcome.stderr == "done\n"
+    assert run.worker is None
+
+
+@pytest.mark.skipif(not hasattr(os, "pidfd_open"), reason="Requires os.pidfd_open")
+async def test_exec_subprocess_starts_no_threads(tmp_path):
+    """Concurrent subprocesses are managed by the event loop, not by threads."""
+    nthread_before = threading.active_count()
+    nthread_max = nthread_before
+
+    async def _sample():
+        nonlocal nthread_max
+        while True:
+            nthread_max = max(nthread_max, threading.active_count())
+            await asyncio.sleep(0.01)
+
+    async def _launch(i: int):
+        step = SimpleNamespace(i=i, label="sleep", command_and_workdir=("sleep", "."))
+        return await _exec_subprocess(
+            "sleep 0.2; echo out; echo err >&2",
+            shell=True,
+            env=dict(os.environ),
+            cwd=Path(tmp_path),
+            stdin_data=None,
+            spool_dir=str(tmp_path),
+            run=Run(step, job_i=i),
+        )
+
+    sampler = asyncio.create_task(_sample())
+    try:
+        outcomes = await asyncio.gather(*[_launch(i) for i in range(8)])
+    finally:
+        sampler.cancel()
+    assert all(outcome.returncode == 0 for outcome in outcomes)
+    assert all(outcome.stdout == "out\n" for outcome in outcomes)
+    assert all(outcome.stderr == "err\n" for outcome in outcomes)
+    assert nthread_max == nthread_before
+
+
+def test_read_spool(monkeypatch, tmp_path):
+    monkeypatch.setattr(run_mod, "MAX_CAPTURE_SIZE", 8)
+    with _open_spool(str(tmp_path)) as spool:
+        spool.write(b"abcdefgh")
+        spool.flush()
+        assert _read_spool(spool) == "abcdefgh"
+        spool.write("ij\u20acxyz".encode())
+        spool.flush()
+        # The head and the tail are cut on a character boundary: the partial euro sign is dropped.
+        assert _read_spool(spool) == "abcd\n[8 bytes of output omitted]\nxyz"
+    # The spool file is anonymous, so nothing is left behind.
+    assert list(tmp_path.iterdir()) == []
+
+
+async def test_exec_subprocess_bounded_output(monkeypatch, tmp_path):
+    """Only the head and the tail of a long output are kept in memory."""
+    monkeypatch.setattr(run_mod, "MAX_CAPTURE_SIZE", 1000)
+    step = SimpleNamespace(i=1, label="seq", command_and_workdir=("seq", "."))
+    outcome = await _exec_subprocess(
+        "seq 100000; echo oops >&2",
+        shell=True,
+        env=dict(os.environ),
+        cwd=Path(tmp_path),
+        stdin_data=None,
+        spool_dir=str(tmp_path),
+        run=Run(step, job_i=1),
+    )
+    assert outcome.returncode == 0
+    assert outcome.stdout.startswith("1\n2\n3\n")
+    assert outcome.stdout.endswith("99999\n100000\n")
+    assert "bytes of output omitted]" in outcome.stdout
+    assert len(outcome.stdout) < 1100
+    assert outcome.stderr == "oops\n"
+    assert list(tmp_path.iterdir()) == []
+
+
+async def test_launch_command_forkserver_output(monkeypatch, tmp_path):
+    """Python and OS-level output of a forkserver child both end up in the outcome."""
+    monkeypatch.delenv("STEPUP_DIRECTOR_SOCKET", raising=False)
+    (tmp_path / "script.py").write_text(
+        "#!/usr/bin/env python3\n"
+        "import os, sys\n"
+        "print('python out')\n"
+        "print('python err', file=sys.stderr)\n"
+        "os.system('echo shell out; echo shell err >&2')\n"
+    )
+    (tmp_path / "script.py").chmod(0o755)
+    step = SimpleNamespace(i=1, label="script", command_and_workdir=("script.py", "."))
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir()
+    mp_ctx = multiprocessing.get_context("forkserver")
+    outcome = await launch_command(
+        "./script.py",
+        shell=False,
+        env=dict(os.environ),
+        cwd=Path(tmp_path),
+        mp_ctx=mp_ctx,
+        run=Run(step, job_i=1),
+        spool_dir=str(spool_dir),
+    )
+    assert outcome.returncode == 0
+    # Without a director, the dummy RPC client prints the `amend` call after the step's output.
+    assert outcome.stdout.startswith("python out\nshell out\n")
+    assert outcome.stderr == "python err\nshell err\n"
+    assert list(spool_dir.iterdir()) == []
+
+
+@pytest.mark.parametrize(
+    ("command", "expected"),
+    [
+        ("./work.py compute '{\"a\": 1}'", True),
+        ("./work.py compute --inp=args.json", True),
+        ("./work.py compute", False),
+        ("./work.py 'not an identifier' '{}'", False),
+        ("./work.py compute '[1, 2]'", False),
+        ("./work.sh compute '{}'", False),
+    ],
+)
+def test_is_call_command(command: str, expected: bool):
+    assert is_call_command(shlex.split(command)) == expected
+
+
+CALL_SCRIPT = """\
+#!/usr/bin/env python3
+import helper
+from stepup.core.call import driver
+
+with open("loads.txt", "a") as fh:
+    fh.write("loaded\\n")
+
+
+def square(x: int):
+    print(x * x)
+
+
+if __name__ == "__main__":
+    driver()
+"""
+
+PLAIN_SCRIPT = """\
+#!/usr/bin/env python3
+import sys
+
+with open("loads.txt", "a") as fh:
+    fh.write("loaded\\n")
+print(sys.argv[1])
+"""
+
+
+async def _run_call_cases(tmp_path, script: str, pool: CallWorkerPool) -> list[ChildOutcome]:
+    (tmp_path / "work.py").write_text(script)
+    (tmp_path / "helper.py").write_text("")
+    (tmp_path / "work.py").chmod(0o755)
+    step = SimpleNamespace(i=1, label="work", command_and_workdir=("work.py", "."))
+    outcomes = []
+    for x in 2, 3, 4:
+        command = f"./work.py square '{{\"x\": {x}}}'"
+        outcome = await launch_command(
+            command,
+            shell=False,
+            env=dict(os.environ),
+            cwd=Path(tmp_path),
+            mp_ctx=pool.mp_ctx,
+            run=Run(step, job_i=x),
+            spool_dir=str(tmp_path),
+            call_pool=pool,
+        )
+        outcomes.append(outcome)
+    return outcomes
+
+
+async def test_call_worker_pool_loads_script_once(monkeypatch, tmp_path):
+    monkeypatch.delenv("STEPUP_DIRECTOR_SOCKET", raising=False)
+    pool = CallWorkerPool(multiprocessing.get_context("forkserver"))
+    try:
+        outcomes = await _run_call_cases(tmp_path, CALL_SCRIPT, pool)
+        assert sum(len(workers) for workers in pool.idle.values()) == 1
+    finally:
+        # An idle worker left behind would block the exit of the test process.
+        await pool.close()
+    assert pool.idle == {}
+    assert [outcome.returncode for outcome in outcomes] == [0, 0, 0]
+    # Without a director, the dummy RPC client prints the `amend` call after the step's output.
+    assert [outcome.stdout.split()[0] for outcome in outcomes] == ["4", "9", "16"]
+    # Every step amends the local imports of the script, also when it was loaded by another step.
+    assert all("helper.py" in outcome.stdout for outcome in outcomes)
+    assert (tmp_path / "loads.txt").read_text() == "loaded\n"
+
+
+async def test_call_worker_pool_script_without_driver(monkeypatch, tmp_path):
+    monkeypatch.delenv("STEPUP_DIRECTOR_SOCKET", raising=False)
+    pool = CallWorkerPool(multiprocessing.get_context("forkserver"))
+    outcomes = await _run_call_cases(tmp_path, PLAIN_SCRIPT, pool)
+    assert [outcome.returncode for outcome in outcomes] == [0, 0, 0]
+    assert [outcome.stdout.split()[0] for outcome in outcomes] == ["square"] * 3
+    assert (tmp_path / "loads.txt").read_text() == "loaded\n" * 3
+    assert pool.idle == {}
+
+
+async def test_wait4_without_pidfd(monkeypatch):
+    """Without `os.pidfd_open`, the child is reaped in a thread, with the same result."""
+    monkeypatch.delattr(os, "pidfd_open", raising=False)
+    proc = subprocess.Popen([sys.executable, "-c", "import sys; sys.exit(3)"])
+    status, rusage = await _wait4(proc.pid)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    assert proc.returncode == 3
+    assert rusage.ru_utime > 0.0
+
+
 def test_lost_child_outcome_signal():
     outcome = _lost_child_outcome(-signal.SIGKILL)
     assert outcome.returncode == -signal.SIGKILL
@@ -2,32 +2,44 @@
 # SPDX-License-Identifier: LGPL-3.0-or-later
 """Unit tests for stepup.core.scheduler."""
 
+import random
 import time
 
 import pytest
 from conftest import get_duration_and_tail_time
 
 from stepup.core.enums import FileState, Need, StepState
+from stepup.core.exceptions import ConsistencyError
 from stepup.core.file import FILE_SCHEMA
 from stepup.core.hash import FileHash, StepHash
 from stepup.core.job import RunJob, ValidateDynamicJob
+from stepup.core.outcome import ChildOutcome, ResourceUsage
 from stepup.core.path import dir_range_upper
 from stepup.core.scheduler import (
     APPLY_SAFE_UPDATE,
-    EMPTY_CHANGED_AFTER,
-    EMPTY_CHECK_AFTER,
+    DURATION_HISTORY_SIZE,
     EMPTY_SAFE_UPDATE,
     FILL_SAFE_UPDATE,
+    INIT_AFTER_SUBGRAPH,
+    INIT_AVAILABLE_RESOURCE,
     INIT_CHANGED_AFTER,
     INIT_CHECK_AFTER,
+    INIT_RESOURCE_IN_USE_TRIGGERS,
     INIT_SAFE_UPDATE,
+    MEMORY_HUNGRY_MIB,
+    MEMORY_RESOURCE,
     PROPAGATE_CHECK_AFTER,
     RECOMPUTE_READY,
-    SEED_CHECK_AFTER,
     SELECT_INPUTS,
+    SELECT_NEXT_CHECK,
+    SELECT_NEXT_RUN,
     SELECT_NEXT_STEP,
     UPDATE_CHECK_AFTER,
     Scheduler,
+    estimate_duration,
+    memory_units,
+    update_after_iterative,
+    update_after_sweep,
 )
 from stepup.core.sqlite3 import connect
 from stepup.core.step import STEP_SCHEMA, Step, unavailable_input_sql
@@ -50,10 +62,9 @@ def con():
     c.executescript(STEP_SCHEMA)
     # available_resource, target_path and target_dir are normally temp tables created by
     # Scheduler.initialize.
-    c.execute(
-        "CREATE TEMPORARY TABLE IF NOT EXISTS available_resource"
-        " (name TEXT PRIMARY KEY, units INTEGER NOT NULL)"
-    )
+    c.execute(INIT_AVAILABLE_RESOURCE)
+    for sql in INIT_RESOURCE_IN_USE_TRIGGERS:
+        c.execute(sql)
     c.execute("CREATE TEMPORARY TABLE IF NOT EXISTS target_path (path TEXT PRIMARY KEY)")
     c.execute(
         "CREATE TEMPORARY TABLE IF NOT EXISTS target_dir "
@@ -169,7 +180,7 @@ def _insert_input_file(con, node_id, creator_id, state, *, detached=False, label
     if state in (FileState.MISSING, FileState.PLANNED, FileState.VOLATILE):
         hash_value = None
     else:  # CONFIRMED, BUILT, OUTDATED
-        hash_value = FileHash(b"\x01\x02\x03", 0o100644, 1000.0, 100, 42).to_json()
+        hash_value = FileHash(b"\x01\x02\x03", 0o100644, 1_000_000_000_000, 100, 42).to_blob()
     con.execute(
         "INSERT INTO file (node, state, hash) VALUES (?, ?, ?)",
         (node_id, state.value, hash_value),
@@ -229,27 +240,20 @@ def _run_update_meta_safe(con):
     con.execute(APPLY_SAFE_UPDATE)
 
 
-def _run_update_meta_after(con):
+def _run_update_meta_after(con, *, sweep=True):
     """Run the full update_meta_after logic against a bare SQLite connection.
 
+    With `sweep=True`, the in-memory sweep is used, falling back to the iterative update
+    like `Scheduler._update_meta_after()`. With `sweep=False`, only the iterative update runs.
+
     For target elevation, the caller must have populated the `target_path` temp table
     (see `_insert_target_path`) beforehand; with an empty table, no step is elevated.
     """
     con.execute(INIT_CHECK_AFTER)
     con.execute(INIT_CHANGED_AFTER)
-    con.execute(EMPTY_CHECK_AFTER)
-    con.execute(SEED_CHECK_AFTER)
-    ncheck = con.execute("SELECT COUNT(*) FROM check_after").fetchone()[0]
-    first = True
-    while ncheck > 0:
-        cur = con.execute(UPDATE_CHECK_AFTER, {"first": first})
-        changed_ids = cur.fetchall()
-        con.execute(EMPTY_CHECK_AFTER)
-        con.execute(EMPTY_CHANGED_AFTER)
-        con.executemany("INSERT INTO changed_after(i) VALUES (?)", changed_ids)
-        cur = con.execute(PROPAGATE_CHECK_AFTER)
-        ncheck = cur.rowcount
-        first = False
+    con.execute(INIT_AFTER_SUBGRAPH)
+    if not (sweep and update_after_sweep(con)):
+        update_after_iterative(con)
     con.execute("UPDATE step SET _check_after = 0 WHERE _check_after = 1")
 
 
@@ -978,6 +982,101 @@ def test_update_meta_after_elevates_flagged_step_two_hops_upstream(con):
     assert implied[6] == Need.DEFAULT
 
 
+def _insert_random_graph(con, rng: random.Random, nstep: int):
+    """Insert a random DAG of steps linked through files, with random needs and durations.
+
+    Steps only consume outputs of steps with a higher node id, so the graph is acyclic.
+    Node ids: step k is node 2 + 2 * k, its output file is node 3 + 2 * k.
+    """
+    for k in range(nstep):
+        _insert_step(
+            con,
+            2 + 2 * k,
+            1,
+            StepState.PENDING,
+            need=rng.choice([Need.OPTIONAL, Need.DEFAULT, Need.PLAN]),
+            implied_need=Need.OPTIONAL,
+            duration=rng.choice([0.5, 1.0, 2.5, 7.0]),
+            tail_time=rng.random(),
+            check_after=rng.random() < 0.3,
+            detached=rng.random() < 0.05,
+        )
+        _insert_file(con, 3 + 2 * k, 2 + 2 * k)
+        _add_dep(con, 2 + 2 * k, 3 + 2 * k)
+    for k in range(nstep):
+        for other in rng.sample(range(nstep), 3):
+            if other < k:
+                _add_dep(con, 3 + 2 * k, 2 + 2 * other)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_update_after_sweep_matches_iterative(con, seed):
+    rng = random.Random(seed)
+    _insert_random_graph(con, rng, 60)
+    before = con.execute(
+        "SELECT node, _implied_need, _tail_time, _check_after FROM step"
+    ).fetchall()
+    _run_update_meta_after(con, sweep=False)
+    expected = con.execute("SELECT node, _implied_need, _tail_time FROM step").fetchall()
+    con.executemany(
+        "UPDATE step SET _implied_need = ?, _tail_time = ?, _check_after = ? WHERE node = ?",
+        [
+            (implied_need, tail_time, check_after, i)
+            for i, implied_need, tail_time, check_after in before
+        ],
+    )
+    con.execute(INIT_AFTER_SUBGRAPH)
+    assert update_after_sweep(con)
+    con.execute("UPDATE step SET _check_after = 0 WHERE _check_after = 1")
+    assert con.execute("SELECT node, _implied_need, _tail_time FROM step").fetchall() == expected
+
+
+def test_update_after_sweep_deep_chain(con):
+    """A duration change at the end of a deep chain reaches its head in a single sweep."""
+    depth = 2000
+    for k in range(depth):
+        _insert_step(con, 2 + 2 * k, 1, StepState.PENDING, duration=1.0, tail_time=depth - k)
+        _insert_file(con, 3 + 2 * k, 1)
+        _add_dep(con, 2 + 2 * k, 3 + 2 * k)
+        if k > 0:
+            _add_dep(con, 3 + 2 * (k - 1), 2 + 2 * k)
+    con.execute("UPDATE step SET duration = 3.0, _check_after = 1 WHERE node = ?", (2 * depth,))
+    con.execute(INIT_AFTER_SUBGRAPH)
+    assert update_after_sweep(con)
+    tail = dict(con.execute("SELECT node, _tail_time FROM step").fetchall())
+    assert tail[2] == depth + 2.0
+    assert tail[2 * depth] == 3.0
+
+
+def test_update_after_sweep_falls_back_on_large_subgraph(con, monkeypatch):
+    monkeypatch.setattr("stepup.core.scheduler.AFTER_SWEEP_BASE_NODES", 2)
+    monkeypatch.setattr("stepup.core.scheduler.AFTER_SWEEP_NODES_PER_SEED", 0)
+    _insert_step(con, 2, 1, StepState.PENDING, duration=1.0, tail_time=0.0)
+    _insert_file(con, 3, 1)
+    _insert_step(con, 4, 1, StepState.PENDING, duration=2.0, tail_time=0.0, check_after=True)
+    _add_dep(con, 2, 3)
+    _add_dep(con, 3, 4)
+    con.execute(INIT_AFTER_SUBGRAPH)
+    assert not update_after_sweep(con)
+    # Nothing is written when the sweep gives up.
+    assert con.execute("SELECT _tail_time FROM step WHERE node = 2").fetchone()[0] == 0.0
+    _run_update_meta_after(con)
+    assert con.execute("SELECT _tail_time FROM step WHERE node = 2").fetchone()[0] == 3.0
+
+
+def test_update_after_sweep_falls_back_on_cycle(con):
+    _insert_step(con, 2, 1, StepState.PENDING, check_after=True)
+    _insert_file(con, 3, 1)
+    _insert_step(con, 4, 1, StepState.PENDING)
+    _insert_file(con, 5, 1)
+    _add_dep(con, 2, 3)
+    _add_dep(con, 3, 4)
+    _add_dep(con, 4, 5)
+    _add_dep(con, 5, 2)
+    con.execute(INIT_AFTER_SUBGRAPH)
+    assert not update_after_sweep(con)
+
+
 # -----------------------------------------------------------------------
 # Tests for PROPAGATE_CHECK_AFTER
 # -----------------------------------------------------------------------
@@ -1255,6 +1354,55 @@ def test_resource_exactly_at_limit_allows_step(con):
     assert _get_runnable_ids(con) == [2]
 
 
+def _get_in_use(con) -> dict[str, int]:
+    return dict(con.execute("SELECT name, in_use FROM available_resource").fetchall())
+
+
+def test_resource_in_use_follows_state_changes(con):
+    """The units in use are counted when steps enter RUNNING and released when they leave it."""
+    con.execute("INSERT INTO available_resource (name, units) VALUES ('gpu', 4), ('cpu', 8)")
+    _insert_step(con, 2, 1, StepState.PENDING)
+    _insert_step(con, 3, 1, StepState.PENDING)
+    con.execute("INSERT INTO step_resource (node, name, units) VALUES (2, 'gpu', 1), (2, 'cpu', 2)")
+    con.execute("INSERT INTO step_resource (node, name, units) VALUES (3, 'gpu', 2)")
+    assert _get_in_use(con) == {"gpu": 0, "cpu": 0}
+    con.execute("UPDATE step SET state = ? WHERE node = 2", (StepState.RUNNING.value,))
+    assert _get_in_use(con) == {"gpu": 1, "cpu": 2}
+    con.execute("UPDATE step SET state = ? WHERE node = 3", (StepState.RUNNING.value,))
+    assert _get_in_use(con) == {"gpu": 3, "cpu": 2}
+    # Changing the resources of a RUNNING step is tracked as well.
+    con.execute("DELETE FROM step_resource WHERE node = 3")
+    assert _get_in_use(con) == {"gpu": 1, "cpu": 2}
+    con.execute("UPDATE step SET state = ? WHERE node = 2", (StepState.SUCCEEDED.value,))
+    assert _get_in_use(con) == {"gpu": 0, "cpu": 0}
+
+
+@pytest.mark.parametrize("step_first", [True, False])
+def test_resource_in_use_released_when_running_step_deleted(con, step_first):
+    con.execute("INSERT INTO available_resource (name, units) VALUES ('gpu', 4)")
+    _insert_step(con, 2, 1, StepState.PENDING)
+    con.execute("INSERT INTO step_resource (node, name, units) VALUES (2, 'gpu', 3)")
+    con.execute("UPDATE step SET state = ? WHERE node = 2", (StepState.RUNNING.value,))
+    assert _get_in_use(con) == {"gpu": 3}
+    if step_first:
+        con.execute("DELETE FROM step WHERE node = 2")
+        con.execute("DELETE FROM step_resource WHERE node = 2")
+    else:
+        con.execute("DELETE FROM step_resource WHERE node = 2")
+        con.execute("DELETE FROM step WHERE node = 2")
+    assert _get_in_use(con) == {"gpu": 0}
+
+
+def test_resource_dispatch_uses_in_use_lookup(con):
+    """RESOURCE_UNAVAILABLE no longer sums the units of all RUNNING steps per candidate."""
+    plan = "\n".join(
+        row[3] for row in con.execute(f"EXPLAIN QUERY PLAN {SELECT_NEXT_STEP}", (Need.OPTIONAL,))
+    )
+    assert "SUM" not in SELECT_NEXT_STEP
+    assert "SCAN step_resource" not in plan
+    assert "SCAN available_resource" not in plan
+
+
 # -- ordering ------------------------------------------------------------
 
 
@@ -1284,6 +1432,25 @@ def test_ordering_higher_tail_time_first(con):
     assert ids == [3]
 
 
+def test_ordering_priority_before_tail_time(con):
+    """A higher user-declared priority wins over a longer tail time, but not over PLAN."""
+    _insert_step(con, 2, 1, StepState.PENDING, safe=True, implied_need=Need.DEFAULT, tail_time=9.0)
+    _insert_step(con, 3, 1, StepState.PENDING, safe=True, implied_need=Need.DEFAULT, tail_time=1.0)
+    con.execute("UPDATE step SET priority = 1 WHERE node = 3")
+    assert _get_runnable_ids(con) == [3]
+    _insert_step(con, 4, 1, StepState.PENDING, safe=True, implied_need=Need.PLAN, tail_time=1.0)
+    assert _get_runnable_ids(con) == [4]
+
+
+def test_ordering_walks_dispatch_index(con):
+    """The priority is part of the step_dispatch key, so no temporary sort is needed."""
+    plan = "\n".join(
+        row[3] for row in con.execute(f"EXPLAIN QUERY PLAN {SELECT_NEXT_STEP}", (Need.OPTIONAL,))
+    )
+    assert "step_dispatch" in plan
+    assert "TEMP B-TREE" not in plan
+
+
 def test_ordering_node_tiebreaker(con):
     """When tail_time and implied_need are equal, the tie is broken by step.node order --
     the step_dispatch index's implicit primary-key suffix -- not by label.
@@ -1325,6 +1492,26 @@ def test_select_next_step_uses_dispatch_index(con, need_threshold):
     assert "TEMP B-TREE FOR ORDER BY" not in plan
 
 
+@pytest.mark.parametrize("sql", [SELECT_NEXT_CHECK, SELECT_NEXT_RUN])
+def test_select_next_of_kind_uses_dispatch_index(con, sql):
+    """The selections restricted to one path walk a range of step_dispatch without sorting."""
+    plan = "\n".join(
+        row[3] for row in con.execute(f"EXPLAIN QUERY PLAN {sql}", (Need.OPTIONAL.value,))
+    )
+    assert "USING INDEX step_dispatch (_has_hash=?)" in plan
+    assert "TEMP B-TREE FOR ORDER BY" not in plan
+
+
+def test_select_next_of_kind(con):
+    """SELECT_NEXT_CHECK and SELECT_NEXT_RUN only return steps of their own path."""
+    _insert_step(con, 10, 1, StepState.PENDING, safe=True, implied_need=Need.DEFAULT, tail_time=1.0)
+    _insert_step(con, 11, 1, StepState.PENDING, safe=True, implied_need=Need.DEFAULT, tail_time=1.0)
+    _insert_step_hash(con, 11)
+    assert con.execute(SELECT_NEXT_STEP, (Need.OPTIONAL.value,)).fetchone()[0] == 11
+    assert con.execute(SELECT_NEXT_CHECK, (Need.OPTIONAL.value,)).fetchone()[0] == 11
+    assert con.execute(SELECT_NEXT_RUN, (Need.OPTIONAL.value,)).fetchone()[0] == 10
+
+
 # -----------------------------------------------------------------------
 # Tests for SELECT_INPUTS
 # -----------------------------------------------------------------------
@@ -1355,10 +1542,10 @@ def test_select_inputs_built_file(con):
     assert row["detached"] == 0
     assert row["state"] == FileState.BUILT.value
     assert row["dynamic"] == 0
-    file_hash = FileHash.from_json(row["hash"])
+    file_hash = FileHash.from_blob(row["hash"])
     assert file_hash.digest == b"\x01\x02\x03"
     assert file_hash.mode == 0o100644
-    assert file_hash.mtime == pytest.approx(1000.0)
+    assert file_hash.mtime_ns == 1_000_000_000_000
     assert file_hash.size == 100
     assert file_hash.inode == 42
 
@@ -1623,7 +1810,9 @@ def test_checking_in_chain_blocks_safe(con):
 
 def _insert_step_hash(con, node_id):
     """Set a minimal hash value so the step is considered checkable."""
-    con.execute("INSERT OR REPLACE INTO step_hash VALUES (?, '{}')", (node_id,))
+    con.execute(
+        "INSERT OR REPLACE INTO step_hash VALUES (?, ?)", (node_id, StepHash(b"ok").to_blob())
+    )
 
 
 def _get_checkable_ids(con, need_threshold=Need.OPTIONAL):
@@ -1937,8 +2126,9 @@ async def test_stop_times_cleared_when_no_steps_running(wfs: Workflow):
 # Tests for step-duration bookkeeping (new_durations)
 #
 # A job's measured duration is not written to the database when the job completes:
-# `record_job_completed()` buffers it in memory, and `build_completed()` writes the whole
-# buffer once at the end of the build phase, skipping steps whose duration changed
+# `record_job_completed()` buffers it in memory, and `build_completed()` appends the whole
+# buffer to the duration history once at the end of the build phase.
+# The estimate derived from the history is written, skipping steps whose duration changed
 # by 10% or less.  Only a job that ran the step's command is measured.
 # -----------------------------------------------------------------------
 
@@ -2069,6 +2259,183 @@ async def test_second_record_job_completed_overwrites_pending_duration(wfs: Work
     assert duration_after_second != duration_after_first
 
 
+def test_estimate_duration():
+    assert estimate_duration([3.0]) == 3.0
+    assert estimate_duration([1.0, 2.0, 3.0, 4.0, 5.0]) == 4.0
+    assert estimate_duration([2.0, 1.0]) == pytest.approx(1.75)
+    # A single outlier among the recent runs does not move the estimate.
+    assert estimate_duration([2.0] * 7 + [100.0]) == 2.0
+
+
+async def test_build_completed_keeps_bounded_duration_history(wfs: Workflow):
+    scheduler = Scheduler(wfs, db=wfs.db, use_duration=True)
+    await scheduler.initialize(None)
+    async with wfs.db:
+        wfs.define_step(wfs.root, "echo")
+        step = wfs.find(Step, "echo")
+        step.set_outcome(ChildOutcome(0, "", "", ResourceUsage(utime=0.5, stime=0.25)))
+
+    wtimes = [float(k) for k in range(1, DURATION_HISTORY_SIZE + 4)]
+    for wtime in wtimes:
+        scheduler.new_durations[step.i] = wtime
+        await scheduler.build_completed()
+
+    async with wfs.db:
+        rows = wfs.db.execute(
+            "SELECT run, wtime, ctime FROM step_duration WHERE node = ? ORDER BY run", (step.i,)
+        ).fetchall()
+    recent = wtimes[-DURATION_HISTORY_SIZE:]
+    assert [row[0] for row in rows] == list(range(4, DURATION_HISTORY_SIZE + 4))
+    assert [row[1] for row in rows] == recent
+    assert all(row[2] == 0.75 for row in rows)
+    duration, _, _ = await get_duration_and_tail_time(wfs.db, step)
+    assert duration == pytest.approx(estimate_duration(recent), rel=0.1)
+
+
+async def test_build_completed_skips_removed_step(wfs: Workflow):
+    scheduler = Scheduler(wfs, db=wfs.db, use_duration=True)
+    await scheduler.initialize(None)
+    scheduler.new_durations[12345] = 3.0
+
+    await scheduler.build_completed()
+
+    async with wfs.db:
+        assert wfs.db.execute("SELECT COUNT(*) FROM step_duration").fetchone()[0] == 0
+        assert wfs.db.execute("SELECT COUNT(*) FROM duration_class").fetchone()[0] == 0
+
+
+async def test_new_step_starts_from_similar_steps(wfp: Workflow):
+    scheduler = Scheduler(wfp, db=wfp.db, use_duration=True)
+    await scheduler.initialize(None)
+    async with wfp.db:
+        plan = wfp.find(Step, "./plan.py")
+        wfp.define_step(plan, "python3 first.py", workdir="sub/")
+        first = wfp.find(Step, "python3 first.py  # wd=sub/")
+    scheduler.new_durations[first.i] = 20.0
+    await scheduler.build_completed()
+
+    async with wfp.db:
+        wfp.define_step(plan, "python3 second.py", workdir="sub/")
+        wfp.define_step(plan, "python3 third.py")
+        wfp.define_step(plan, "cp a b", workdir="sub/")
+        wfp.define_step(plan, "cp c d")
+        wfp.define_step(plan, "python3 fifth.py", workdir="sub/", duration=2.0)
+    for label, expected in [
+        ("python3 second.py  # wd=sub/", 20.0),
+        ("python3 third.py", 20.0),
+        ("cp a b  # wd=sub/", 20.0),
+        ("cp c d", 1.0),
+        ("python3 fifth.py  # wd=sub/", 2.0),
+    ]:
+        async with wfp.db:
+            step = wfp.find(Step, label)
+        duration, _, _ = await get_duration_and_tail_time(wfp.db, step)
+        assert duration == expected
+
+    # Later estimates of the class are averaged in, instead of replacing the previous ones.
+    scheduler.new_durations[first.i] = 40.0
+    await scheduler.build_completed()
+    async with wfp.db:
+        duration = wfp.db.execute(
+            "SELECT duration FROM duration_class WHERE key = 'prog:python3 wd:sub/'"
+        ).fetchone()[0]
+    assert 20.0 < duration < 40.0
+
+
+def test_memory_units():
+    assert memory_units(0.0, 8) is None
+    assert memory_units(MEMORY_HUNGRY_MIB - 1, 8) is None
+    assert memory_units(MEMORY_HUNGRY_MIB, 8) == 1
+    assert memory_units(2.5 * 1024, 8) == 3
+    # A step needing more than the budget can still run, on its own.
+    assert memory_units(20 * 1024, 8) == 8
+
+
+async def _run_with_peak_memory(scheduler: Scheduler, step: Step, maxrss: float):
+    """Record one execution of a step with the given peak memory [MiB]."""
+    async with scheduler.db:
+        step.set_outcome(ChildOutcome(0, "", "", ResourceUsage(wtime=1.0, maxrss=maxrss)))
+    scheduler.new_durations[step.i] = 1.0
+    await scheduler.build_completed()
+
+
+async def test_build_completed_claims_memory_of_hungry_steps(wfs: Workflow):
+    scheduler = Scheduler(wfs, db=wfs.db, use_duration=True, default_memory_budget=8)
+    await scheduler.initialize("gpu:1")
+    assert scheduler.memory_budget == 8
+    async with wfs.db:
+        wfs.define_step(wfs.root, "echo", resources={"gpu": 1})
+        step = wfs.find(Step, "echo")
+
+    await _run_with_peak_memory(scheduler, step, 100.0)
+    async with wfs.db:
+        assert list(step.resources(implicit=True)) == []
+        assert wfs.db.execute("SELECT maxrss FROM step_duration").fetchone()[0] == 100.0
+
+    # The largest peak of the recent executions determines the claim.
+    await _run_with_peak_memory(scheduler, step, 2.5 * 1024)
+    await _run_with_peak_memory(scheduler, step, 100.0)
+    async with wfs.db:
+        assert list(step.resources(implicit=False)) == [("gpu", 1)]
+        assert list(step.resources(implicit=True)) == [(MEMORY_RESOURCE, 3)]
+        # A redeclaration of the step keeps the implicit claim...
+        step.set_resources({"gpu": 1})
+        assert list(step.resources(implicit=True)) == [(MEMORY_RESOURCE, 3)]
+        # ... unless the step declares the resource itself.
+        step.set_resources({MEMORY_RESOURCE: 1})
+        assert list(step.resources()) == [(MEMORY_RESOURCE, 1)]
+
+    await _run_with_peak_memory(scheduler, step, 4 * 1024)
+    async with wfs.db:
+        assert list(step.resources(implicit=False)) == [(MEMORY_RESOURCE, 1)]
+        assert list(step.resources(implicit=True)) == []
+
+
+async def test_initialize_adjusts_implicit_memory_claims(wfs: Workflow):
+    scheduler = Scheduler(wfs, db=wfs.db, use_duration=True, default_memory_budget=8)
+    await scheduler.initialize(None)
+    async with wfs.db:
+        wfs.define_step(wfs.root, "echo")
+        step = wfs.find(Step, "echo")
+    await _run_with_peak_memory(scheduler, step, 6 * 1024)
+    async with wfs.db:
+        assert list(step.resources()) == [(MEMORY_RESOURCE, 6)]
+
+    # A smaller budget given explicitly takes precedence over the default.
+    await scheduler.initialize(f"{MEMORY_RESOURCE}:4")
+    assert scheduler.memory_budget == 4
+    async with wfs.db:
+        assert list(step.resources()) == [(MEMORY_RESOURCE, 4)]
+
+    # Without any budget, the implicit claims are dropped, so they cannot block the step.
+    scheduler = Scheduler(wfs, db=wfs.db, use_duration=True)
+    await scheduler.initialize(None)
+    assert scheduler.memory_budget is None
+    async with wfs.db:
+        assert list(step.resources()) == []
+
+
+async def test_pop_next_jobs_respects_memory_budget(wfs: Workflow, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("STEPUP_DEBUG", "1")
+    scheduler = Scheduler(wfs, db=wfs.db, use_duration=True, default_memory_budget=8)
+    await scheduler.initialize(None)
+    async with wfs.db:
+        plan = _define_succeeded_boot_step(wfs)
+        for name in ["a", "b", "c"]:
+            wfs.define_step(plan, f"echo {name}")
+        heavy = [wfs.find(Step, f"echo {name}") for name in ["a", "b"]]
+    for step in heavy:
+        await _run_with_peak_memory(scheduler, step, 5 * 1024)
+    async with wfs.db:
+        for step in heavy:
+            step.set_state(StepState.PENDING)
+
+    jobs = await scheduler.pop_next_jobs(10)
+    assert len(jobs) == 2
+    assert "echo c" in [job.step.label for job in jobs]
+    assert await scheduler.pop_next_jobs(10) == []
+
+
 # -----------------------------------------------------------------------
 # Tests for ran_concurrently
 # -----------------------------------------------------------------------
@@ -2192,3 +2559,197 @@ async def test_pop_next_job_dispatches_checkable_step_to_checking(wfs: Workflow)
     assert job.step.i == step.i
     async with wfs.db:
         assert step.get_state() == StepState.CHECKING
+
+
+def _define_succeeded_boot_step(workflow: Workflow) -> Step:
+    """Define a boot step that has already succeeded, so its products are safe to run."""
+    workflow.define_step(workflow.root, "./plan.py", _safe=True)
+    plan = workflow.find(Step, "./plan.py")
+    plan.set_state(StepState.SUCCEEDED)
+    return plan
+
+
+@pytest.mark.parametrize("use_ready_heap", [False, True])
+async def test_pop_next_jobs_respects_resources_within_batch(
+    wfs: Workflow, use_ready_heap: bool, monkeypatch: pytest.MonkeyPatch
+):
+    """A batch never reserves more resources than are available,
+    and the remaining steps are dispatched once the running ones have released them.
+    """
+    monkeypatch.setenv("STEPUP_DEBUG", "1")
+    scheduler = Scheduler(wfs, db=wfs.db, use_ready_heap=use_ready_heap)
+    await scheduler.initialize("gpu:2")
+
+    async with wfs.db:
+        plan = _define_succeeded_boot_step(wfs)
+        for name in ["a", "b", "c"]:
+            wfs.define_step(plan, f"echo {name}", resources={"gpu": 1})
+        wfs.define_step(plan, "echo free")
+
+    jobs = await scheduler.pop_next_jobs(10)
+    assert sorted(job.step.label for job in jobs) == ["echo a", "echo b", "echo free"]
+    async with wfs.db:
+        assert all(job.step.get_state() == StepState.RUNNING for job in jobs)
+    assert await scheduler.pop_next_jobs(10) == []
+
+    async with wfs.db:
+        jobs[0].step.set_state(StepState.SUCCEEDED)
+    jobs = await scheduler.pop_next_jobs(10)
+    assert [job.step.label for job in jobs] == ["echo c"]
+
+
+@pytest.mark.parametrize("use_ready_heap", [False, True])
+async def test_pop_next_jobs_limited_by_max_jobs(
+    wfs: Workflow, use_ready_heap: bool, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setenv("STEPUP_DEBUG", "1")
+    scheduler = Scheduler(wfs, db=wfs.db, use_ready_heap=use_ready_heap)
+    await scheduler.initialize(None)
+
+    async with wfs.db:
+        plan = _define_succeeded_boot_step(wfs)
+        for name in ["a", "b", "c"]:
+            wfs.define_step(plan, f"echo {name}")
+
+    jobs = await scheduler.pop_next_jobs(2)
+    assert len(jobs) == 2
+    assert len({job.job_i for job in jobs}) == 2
+    jobs = await scheduler.pop_next_jobs(2)
+    assert len(jobs) == 1
+    assert await scheduler.pop_next_jobs(2) == []
+
+
+@pytest.mark.parametrize("use_ready_heap", [False, True])
+async def test_pop_next_jobs_follows_priority(
+    wfs: Workflow, use_ready_heap: bool, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setenv("STEPUP_DEBUG", "1")
+    scheduler = Scheduler(wfs, db=wfs.db, use_ready_heap=use_ready_heap)
+    await scheduler.initialize(None)
+
+    async with wfs.db:
+        plan = _define_succeeded_boot_step(wfs)
+        for name, duration, priority in [
+            ("a", 5.0, 0),
+            ("b", 1.0, 2),
+            ("c", 2.0, 2),
+            ("d", 9.0, -1),
+        ]:
+            wfs.define_step(plan, f"echo {name}", duration=duration, priority=priority)
+
+    jobs = await scheduler.pop_next_jobs(4)
+    assert [job.step.label for job in jobs] == ["echo c", "echo b", "echo a", "echo d"]
+
+
+@pytest.mark.parametrize("use_ready_heap", [False, True])
+@pytest.mark.parametrize(
+    ("max_jobs", "max_checks", "nrun", "ncheck"),
+    [(2, 1, 2, 1), (0, 3, 0, 3), (3, 0, 3, 0), (1, None, 0, 1), (4, None, 1, 3)],
+)
+async def test_pop_next_jobs_separate_check_budget(
+    wfs: Workflow,
+    use_ready_heap: bool,
+    max_jobs: int,
+    max_checks: int | None,
+    nrun: int,
+    ncheck: int,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """With `max_checks`, hash checks no longer take the slots of steps running commands."""
+    monkeypatch.setenv("STEPUP_DEBUG", "1")
+    scheduler = Scheduler(wfs, db=wfs.db, use_ready_heap=use_ready_heap)
+    await scheduler.initialize(None)
+
+    async with wfs.db:
+        plan = _define_succeeded_boot_step(wfs)
+        for name in ["a", "b", "c"]:
+            wfs.define_step(plan, f"echo run {name}")
+            wfs.define_step(plan, f"echo check {name}")
+            wfs.find(Step, f"echo check {name}").set_hash(StepHash(b"deadbeef"))
+
+    jobs = await scheduler.pop_next_jobs(max_jobs, max_checks)
+    async with wfs.db:
+        states = [job.step.get_state() for job in jobs]
+    assert states.count(StepState.RUNNING) == nrun
+    assert states.count(StepState.CHECKING) == ncheck
+    assert all(job.runs_command == ("run" in job.step.label) for job in jobs)
+
+
+async def test_pop_next_jobs_draining(wfs: Workflow):
+    scheduler = Scheduler(wfs, db=wfs.db)
+    await scheduler.initialize(None)
+
+    async with wfs.db:
+        wfs.define_step(wfs.root, "echo a", _safe=True)
+
+    scheduler.draining = True
+    assert await scheduler.pop_next_jobs(4) == []
+
+
+async def test_ready_heap_follows_priority_and_state_changes(
+    wfs: Workflow, monkeypatch: pytest.MonkeyPatch
+):
+    """The ready heap follows changes of priority and state made outside the scheduler.
+
+    With `STEPUP_DEBUG`, every selection is also checked against `SELECT_NEXT_STEP`.
+    """
+    monkeypatch.setenv("STEPUP_DEBUG", "1")
+    scheduler = Scheduler(wfs, db=wfs.db, use_ready_heap=True)
+    await scheduler.initialize(None)
+
+    async with wfs.db:
+        plan = _define_succeeded_boot_step(wfs)
+        for name, duration in [("a", 1.0), ("b", 3.0), ("c", 2.0)]:
+            wfs.define_step(plan, f"echo {name}")
+            wfs.find(Step, f"echo {name}").set_duration(duration)
+
+    job_b = await scheduler.pop_next_job()
+    assert job_b.step.label == "echo b"
+    assert len(scheduler.ready_entries) == 2
+
+    # A change of duration after the heap was filled reorders the remaining steps.
+    async with wfs.db:
+        wfs.find(Step, "echo a").set_duration(5.0)
+        # A step that is sent back to PENDING becomes eligible again.
+        job_b.step.set_state(StepState.PENDING)
+    jobs = await scheduler.pop_next_jobs(3)
+    assert [job.step.label for job in jobs] == ["echo a", "echo b", "echo c"]
+    assert scheduler.ready_entries == {}
+
+    # A detached step is removed from the heap.
+    async with wfs.db:
+        jobs[0].step.set_state(StepState.PENDING)
+        jobs[0].step.detach()
+    assert await scheduler.pop_next_jobs(3) == []
+
+
+async def test_ready_heap_drops_stale_keys(wfs: Workflow):
+    scheduler = Scheduler(wfs, db=wfs.db, use_ready_heap=True)
+    await scheduler.initialize(None)
+
+    async with wfs.db:
+        plan = _define_succeeded_boot_step(wfs)
+        wfs.define_step(plan, "echo a")
+        step = wfs.find(Step, "echo a")
+    for duration in range(2, 100):
+        async with wfs.db:
+            step.set_duration(duration)
+            scheduler._update_meta_safe()
+            scheduler._update_meta_after()
+            scheduler._update_meta_ready()
+            scheduler._sync_ready_heap()
+    assert len(scheduler.ready_entries) == 1
+    assert len(scheduler.ready_heap) + len(scheduler.check_heap) <= 2 + 64
+    job = await scheduler.pop_next_job()
+    assert job.step.label == "echo a"
+
+
+async def test_build_completed_checks_resource_in_use(wfs: Workflow, monkeypatch):
+    monkeypatch.setenv("STEPUP_DEBUG", "1")
+    scheduler = Scheduler(wfs, db=wfs.db)
+    await scheduler.initialize("gpu:2")
+    await scheduler.build_completed()
+    async with wfs.db:
+        wfs.db.execute("UPDATE available_resource SET in_use = 1")
+    with pytest.raises(ConsistencyError, match="gpu"):
+        await scheduler.build_completed()
@@ -0,0 +1,109 @@
+# SPDX-FileCopyrightText: 2024 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Unit tests for stepup.core.spawner."""
+
+import asyncio
+import os
+import signal
+import sys
+from collections.abc import Iterator
+from types import SimpleNamespace
+
+import pytest
+from path import Path
+
+from stepup.core.run import Run, _exec_subprocess
+from stepup.core.spawner import Spawner
+
+
+@pytest.fixture
+def spawner() -> Iterator[Spawner]:
+    spawner = Spawner.start()
+    try:
+        yield spawner
+    finally:
+        spawner.close()
+
+
+PY_ECHO = """
+import os
+import sys
+sys.stdout.buffer.write(sys.stdin.buffer.read())
+sys.stdout.flush()
+print(os.getpid(), os.getppid(), os.getsid(0), file=sys.stderr)
+"""
+
+
+def _exec(tmp_path, cmd, spawner: Spawner, run: Run | None = None, **kwargs):
+    if run is None:
+        step = SimpleNamespace(i=1, label="test", command_and_workdir=("test", "."))
+        run = Run(step, job_i=1)
+    kwargs.setdefault("shell", False)
+    kwargs.setdefault("stdin_data", None)
+    return _exec_subprocess(
+        cmd,
+        env=dict(os.environ),
+        cwd=Path(tmp_path),
+        spool_dir=str(tmp_path),
+        run=run,
+        spawner=spawner,
+        **kwargs,
+    )
+
+
+async def test_spawner_stdin_stdout(spawner: Spawner, tmp_path):
+    """Input and output larger than a pipe buffer flow between the step and the director."""
+    data = bytes(range(256)) * 4096
+    outcome = await _exec(tmp_path, [sys.executable, "-c", PY_ECHO], spawner, stdin_data=data)
+    assert outcome.returncode == 0
+    assert outcome.stdout == data.decode("utf-8", "ignore")
+    pid, ppid, sid = (int(word) for word in outcome.stderr.split())
+    # The step is a child of the helper, in a session of its own.
+    assert ppid == spawner.proc.pid
+    assert sid == pid
+    assert outcome.usage.utime > 0.0
+    assert list(Path(tmp_path).iterdir()) == []
+
+
+async def test_spawner_concurrent(spawner: Spawner, tmp_path):
+    async def _launch(i: int):
+        return await _exec(tmp_path, f"sleep 0.1; echo {i}; exit {i}", spawner, shell=True)
+
+    outcomes = await asyncio.gather(*[_launch(i) for i in range(8)])
+    assert [outcome.returncode for outcome in outcomes] == list(range(8))
+    assert [outcome.stdout for outcome in outcomes] == [f"{i}\n" for i in range(8)]
+
+
+async def test_spawner_launch_failure(spawner: Spawner, tmp_path):
+    outcome = await _exec(tmp_path, ["./missing-executable"], spawner)
+    assert outcome.returncode == 1
+    assert outcome.stderr.startswith("Failed to launch command ['./missing-executable']: ")
+    # The helper keeps serving requests after a failure.
+    outcome = await _exec(tmp_path, "echo ok", spawner, shell=True)
+    assert outcome.stdout == "ok\n"
+
+
+async def test_spawner_interrupt(spawner: Spawner, tmp_path):
+    """A step started by the helper is signalled by the director through its process group."""
+    step = SimpleNamespace(i=1, label="sleep", command_and_workdir=("sleep", "."))
+    run = Run(step, job_i=1)
+    task = asyncio.create_task(_exec(tmp_path, "sleep 60 && echo done", spawner, run, shell=True))
+    while run.worker is None:
+        await asyncio.sleep(0.01)
+    run.worker.suspend()
+    run.worker.resume()
+    run.worker.interrupt(signal.SIGTERM)
+    outcome = await asyncio.wait_for(task, 10)
+    assert outcome.returncode == -signal.SIGTERM
+    assert outcome.stdout == ""
+
+
+async def test_spawner_helper_died(spawner: Spawner, tmp_path):
+    """Without a helper, steps are started by the director itself."""
+    spawner.proc.kill()
+    spawner.proc.wait()
+    for _ in range(2):
+        outcome = await _exec(tmp_path, [sys.executable, "-c", PY_ECHO], spawner, stdin_data=b"x")
+        assert outcome.returncode == 0
+        assert outcome.stdout == "x"
+        assert int(outcome.stderr.split()[1]) == os.getpid()
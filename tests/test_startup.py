@@ -7,6 +7,7 @@ import os
 
 from conftest import declare_static
 
+from stepup.core import startup
 from stepup.core.builder import Builder
 from stepup.core.enums import HashUpdateCause, StepState
 from stepup.core.executor import Executor
@@ -170,6 +171,47 @@ async def test_rescan_files_reports_externally_updated_static_file(wfs: Workflow
             assert wfs.find(File, "foo.txt").get_hash() != old_hash
 
 
+async def test_rescan_files_submits_only_files_with_changed_properties(
+    wfs: Workflow, tmpdir, monkeypatch
+):
+    """The stat pre-pass keeps unchanged `EXTERNAL` files away from `gather_hashes`,
+    while a stray `UNCONFIRMED` file always gets its hash job, which confirms it."""
+    submitted = []
+    orig_gather_hashes = startup.gather_hashes
+
+    async def spy(hash_queue, executor, reporter, path_hash_causes, njob):
+        submitted.extend(path for path, _old_hash, _cause in path_hash_causes)
+        return await orig_gather_hashes(hash_queue, executor, reporter, path_hash_causes, njob)
+
+    monkeypatch.setattr(startup, "gather_hashes", spy)
+    with contextlib.chdir(tmpdir):
+        for path in "same.txt", "changed.txt", "stray.txt":
+            with open(path, "w") as fh:
+                fh.write(path)
+            # Old enough to trust the recorded properties, see `FileHash.racy`.
+            os.utime(path, ns=(10**18, 10**18))
+        async with wfs.db:
+            wfs.declare_static_files(wfs.root, ["same.txt", "changed.txt", "stray.txt"])
+            real_hashes = {
+                path: FileHash.unknown().refreshed(path)
+                for path in ["same.txt", "changed.txt", "stray.txt"]
+            }
+            wfs.update_file_hashes(real_hashes, cause=HashUpdateCause.CONFIRMED)
+            _make_stray_unconfirmed(wfs, "stray.txt")
+        with open("changed.txt", "w") as fh:
+            fh.write("something else")
+
+        builder = _make_builder(wfs)
+        reporter = _FakeReporter()
+        await rescan_files(wfs, reporter, builder)
+
+        assert sorted(submitted) == ["changed.txt", "stray.txt"]
+        assert reporter.calls[0] == ("STARTUP", "Checking 3 file(s) for changes")
+        assert reporter.calls[1][:1] == ("UPDATED",)
+        async with wfs.db:
+            assert wfs.find(File, "stray.txt").get_state() == FileState.CONFIRMED
+
+
 async def test_rescan_nglobs_persists_readable_matches(wfp: Workflow, tmpdir):
     """A restart-detected nglob change (files added/removed while the director was not
     running) must persist matches in the same format later reads expect.
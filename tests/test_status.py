@@ -8,11 +8,14 @@ from stepup.core.constants import GRAPH_DB
 from stepup.core.enums import FileState, Need, StepState
 from stepup.core.exceptions import ToolError
 from stepup.core.file import FILE_SCHEMA
+from stepup.core.hash import FileHash
 from stepup.core.sqlite3 import connect
 from stepup.core.status import print_status, status_tool
 from stepup.core.step import STEP_SCHEMA
 from stepup.core.trellis import TRELLIS_SCHEMA
 
+FILE_HASH_BLOB = FileHash(b"d" * 32, 0o100644, 0, 1, 1).to_blob()
+
 
 @pytest.fixture
 def con():
@@ -45,11 +48,11 @@ def _insert_file(con, node_id, label, state, *, detached=False):
         "INSERT INTO node (i, kind, label, creator, detached) VALUES (?, 'file', ?, 1, ?)",
         (node_id, label, detached),
     )
-    # CONFIRMED/BUILT/OUTDATED files require a non-null (JSON) hash.
+    # CONFIRMED/BUILT/OUTDATED files require a non-null (binary) hash.
     needs_hash = state in (FileState.CONFIRMED, FileState.BUILT, FileState.OUTDATED)
     con.execute(
         "INSERT INTO file (node, state, hash) VALUES (?, ?, ?)",
-        (node_id, state.value, "{}" if needs_hash else None),
+        (node_id, state.value, FILE_HASH_BLOB if needs_hash else None),
     )
 
 
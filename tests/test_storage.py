@@ -0,0 +1,91 @@
+# SPDX-FileCopyrightText: 2024 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Unit tests for stepup.core.storage."""
+
+import pytest
+from path import Path
+
+from stepup.core.storage import default_hash_jobs, detect_storage_kind, find_mount
+
+MOUNTINFO = """\
+22 1 254:0 / / rw,relatime shared:1 - ext4 /dev/vda rw
+23 22 0:22 / /proc rw,relatime shared:2 - proc proc rw
+24 22 8:1 / /data rw,relatime shared:3 - xfs /dev/sda1 rw
+25 22 0:40 / /home rw,relatime shared:4 - nfs4 server:/home rw,vers=4.2
+26 24 0:41 / /data/my\\040scratch rw,relatime shared:5 - tmpfs tmpfs rw
+"""
+
+
+@pytest.fixture
+def mountinfo(tmpdir) -> Path:
+    path = Path(tmpdir) / "mountinfo"
+    path.write_text(MOUNTINFO)
+    return path
+
+
+@pytest.fixture
+def sys_root(tmpdir) -> Path:
+    """A fake sysfs with a rotational disk sda (partition sda1) and a solid-state disk vda."""
+    sys_root = Path(tmpdir) / "sys"
+    devices = sys_root / "devices"
+    (devices / "sda/queue").makedirs_p()
+    (devices / "sda/queue/rotational").write_text("1\n")
+    (devices / "sda/sda1").makedirs_p()
+    (devices / "vda/queue").makedirs_p()
+    (devices / "vda/queue/rotational").write_text("0\n")
+    block = sys_root / "dev/block"
+    block.makedirs_p()
+    (devices / "sda/sda1").symlink(block / "8:1")
+    (devices / "vda").symlink(block / "254:0")
+    return sys_root
+
+
+@pytest.mark.parametrize(
+    ("path", "expected"),
+    [
+        ("/", ("ext4", "254:0")),
+        ("/proc/self", ("proc", "0:22")),
+        ("/data", ("xfs", "8:1")),
+        ("/data/my scratch/x", ("tmpfs", "0:41")),
+        ("/database", ("ext4", "254:0")),
+        ("/home/user", ("nfs4", "0:40")),
+    ],
+)
+def test_find_mount(mountinfo: Path, path: str, expected: tuple[str, str]):
+    assert find_mount(path, mountinfo) == expected
+
+
+def test_find_mount_unreadable(tmpdir):
+    assert find_mount("/", Path(tmpdir) / "missing") is None
+
+
+@pytest.mark.parametrize(
+    ("path", "kind"),
+    [
+        ("/", "solid"),
+        ("/data/file", "rotational"),
+        ("/home/user", "network"),
+        ("/data/my scratch", "solid"),
+        ("/proc", "unknown"),
+    ],
+)
+def test_detect_storage_kind(mountinfo: Path, sys_root: Path, path: str, kind: str):
+    assert detect_storage_kind(path, mountinfo, sys_root) == kind
+
+
+def test_detect_storage_kind_without_mountinfo(tmpdir):
+    assert detect_storage_kind("/", Path(tmpdir) / "missing") == "unknown"
+
+
+@pytest.mark.parametrize(
+    ("kind", "ncore", "njob_hash"),
+    [
+        ("rotational", 64, 2),
+        ("network", 1, 16),
+        ("solid", 4, 8),
+        ("solid", 64, 32),
+        ("unknown", 1, 5),
+    ],
+)
+def test_default_hash_jobs(kind: str, ncore: int, njob_hash: int):
+    assert default_hash_jobs(kind, ncore) == njob_hash
@@ -32,7 +32,7 @@ from stepup.core.tracebacks import (
 Frame = tuple[str, str, str]
 """A frame to fabricate: the module name it reports, its file name and its function name."""
 
-FORKSERVER: Frame = ("stepup.core.run", "stepup/core/run.py", "_forkserver_entry")
+FORKSERVER: Frame = ("stepup.core.run", "stepup/core/run.py", "_run_step_in_process")
 LAUNCH_COMMAND: Frame = ("stepup.core.run", "stepup/core/run.py", "launch_command")
 RUNPY: Frame = ("runpy", "<frozen runpy>", "_run_code")
 BOOTSTRAP: Frame = ("importlib._bootstrap", "<frozen importlib._bootstrap>", "_load_unlocked")
@@ -130,8 +130,8 @@ def test_keep_frames_keeps_a_stdin_frame_that_is_not_the_outermost():
     assert not dropped_internal
 
 
-def test_keep_frames_only_treats_forkserver_entry_as_a_launcher():
-    """The rule is about `_forkserver_entry`, not about `run.py` as a whole."""
+def test_keep_frames_only_treats_launcher_functions_as_launchers():
+    """The rule is about the functions starting a step, not about `run.py` as a whole."""
     exc = _raise_through([LAUNCH_COMMAND, PLAN], RuntimeError("bug"))
     keep, dropped_internal = _keep_frames(exc)
     assert keep == [True, True]
@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: LGPL-3.0-or-later
 """Unit tests for stepup.core.trellis."""
 
+import random
 import sqlite3
 from collections.abc import Iterator
 
@@ -11,7 +12,7 @@ import pytest_asyncio
 
 from stepup.core.exceptions import ConsistencyError, CyclicError, GraphError
 from stepup.core.sqlite3 import DBSession
-from stepup.core.trellis import Node, Root, Trellis
+from stepup.core.trellis import SELECT_BACKWARD_DEPENDENCY, Node, Root, Trellis
 
 
 @pytest_asyncio.fixture
@@ -665,6 +666,79 @@ async def test_add_source_skip_cycle_check(lt):
         assert list(foo0.sources()) == [foo1]
 
 
+def _assert_topological_order(lt: LogTrellis):
+    assert lt.db.execute(SELECT_BACKWARD_DEPENDENCY).fetchone() is None
+
+
+async def test_add_source_forward_keeps_order(lt):
+    async with lt.db:
+        foos = [lt.create(Foo, lt.root, str(i), value=i) for i in range(3)]
+        topos = [foo._topo() for foo in foos]
+        assert topos == sorted(topos)
+        foos[2].add_source(foos[0])
+        foos[1].add_source(foos[0])
+        assert [foo._topo() for foo in foos] == topos
+
+
+async def test_add_source_backward_reorders(lt):
+    async with lt.db:
+        foos = [lt.create(Foo, lt.root, str(i), value=i) for i in range(5)]
+        foos[1].add_source(foos[0])  # 0 -> 1
+        foos[4].add_source(foos[3])  # 3 -> 4
+        foos[0].add_source(foos[4])  # 4 -> 0, reorders 3, 4 before 0, 1
+        _assert_topological_order(lt)
+        # Node 2 is not connected and keeps its place.
+        assert foos[2]._topo() == 3
+        with pytest.raises(CyclicError):
+            foos[3].add_source(foos[1])
+        _assert_topological_order(lt)
+
+
+async def test_add_source_random_dag(lt):
+    """Random edges are accepted exactly when they do not close a cycle."""
+    rng = random.Random(42)
+    async with lt.db:
+        foos = [lt.create(Foo, lt.root, str(i), value=i) for i in range(30)]
+        sinks = {i: set() for i in range(30)}
+
+        def reaches(begin: int, end: int) -> bool:
+            todo = [begin]
+            seen = set()
+            while len(todo) > 0:
+                current = todo.pop()
+                if current == end:
+                    return True
+                if current not in seen:
+                    seen.add(current)
+                    todo.extend(sinks[current])
+            return False
+
+        for _ in range(150):
+            source, sink = rng.randrange(30), rng.randrange(30)
+            if sink in sinks[source]:
+                continue
+            if reaches(sink, source):
+                with pytest.raises(CyclicError):
+                    foos[sink].check_sources_acyclic([foos[source].i])
+                with pytest.raises(CyclicError):
+                    foos[sink].add_source(foos[source])
+            else:
+                foos[sink].check_sources_acyclic([foos[source].i])
+                foos[sink].add_source(foos[source])
+                sinks[source].add(sink)
+            _assert_topological_order(lt)
+
+
+async def test_check_consistency_topological_order(lt):
+    async with lt.db:
+        foo0 = lt.create(Foo, lt.root, "0", value=0)
+        foo1 = lt.create(Foo, lt.root, "1", value=1)
+        foo1.add_source(foo0)
+        lt.db.execute("UPDATE node SET topo = 100 WHERE i = ?", (foo0.i,))
+        with pytest.raises(ConsistencyError):
+            lt._check_consistency()
+
+
 async def test_load_existing(path_tmp):
     with DBSession.open(path_tmp / "lt.db") as dblock1:
         lt = LogTrellis(dblock1)
@@ -295,19 +295,27 @@ def test_async_build_resolves_relative_stepup_root(
     monkeypatch.setattr(asyncio, "create_subprocess_exec", raise_not_found)
     args = argparse.Namespace(
         targets=[],
+        adaptive_jobs=False,
         cgroup=False,
         clean=True,
         duration=True,
         explain_rerun=False,
         keep_going=False,
         jobs=Decimal("1.0"),
+        min_jobs=1,
+        hash_jobs=None,
         joblog=False,
         fix_epoch=True,
         forkserver=False,
         perf=None,
         preload_modules=None,
+        call_workers=False,
+        spawn_helper=False,
         progress=False,
         defer_cap=100,
+        digest_algorithm="sha256",
+        digest_cache=False,
+        ready_heap=False,
         resources=None,
         sqllog=False,
         watch=False,
@@ -432,14 +440,22 @@ def _base_build_args(**overrides) -> argparse.Namespace:
         "duration": True,
         "explain_rerun": False,
         "keep_going": False,
+        "adaptive_jobs": False,
         "jobs": Decimal("1.0"),
+        "min_jobs": 1,
+        "hash_jobs": None,
         "joblog": False,
         "fix_epoch": True,
         "forkserver": False,
         "perf": None,
         "preload_modules": None,
+        "call_workers": False,
+        "spawn_helper": False,
         "progress": True,
         "defer_cap": 100,
+        "digest_algorithm": "sha256",
+        "digest_cache": False,
+        "ready_heap": False,
         "resources": None,
         "sqllog": False,
         "watch": False,
@@ -479,6 +495,7 @@ def test_build_director_argv_baseline() -> None:
         "--reporter=/tmp/sockets/reporter",
         "--jobs=1.0",
         "--defer-cap=100",
+        "--digest-algorithm=sha256",
         "--log-level=WARNING",
     ]
 
@@ -501,6 +518,10 @@ def test_build_director_argv_jobs_verbatim(jobs: Decimal) -> None:
         ("watch_first", "--watch-first"),
         ("yappi", "--yappi"),
         ("forkserver", "--forkserver"),
+        ("call_workers", "--call-workers"),
+        ("spawn_helper", "--spawn-helper"),
+        ("ready_heap", "--ready-heap"),
+        ("adaptive_jobs", "--adaptive-jobs"),
     ],
 )
 def test_build_director_argv_plain_boolean_flags(attr: str, flag: str) -> None:
@@ -511,6 +532,25 @@ def test_build_director_argv_plain_boolean_flags(attr: str, flag: str) -> None:
     assert flag in argv_true
 
 
+def test_build_director_argv_min_jobs() -> None:
+    """`--min-jobs` is only forwarded together with `--adaptive-jobs`."""
+    argv = _call_build_director_argv(_base_build_args(min_jobs=3))
+    assert "--min-jobs=3" not in argv
+    argv = _call_build_director_argv(_base_build_args(adaptive_jobs=True, min_jobs=3))
+    assert argv[-2:] == ["--adaptive-jobs", "--min-jobs=3"]
+
+
+@pytest.mark.parametrize(
+    ("hash_jobs", "flag"), [(None, None), (0, "--hash-jobs=0"), (8, "--hash-jobs=8")]
+)
+def test_build_director_argv_hash_jobs(hash_jobs: int | None, flag: str | None) -> None:
+    """`--hash-jobs` is only forwarded when given, leaving the default to the director."""
+    argv = _call_build_director_argv(_base_build_args(hash_jobs=hash_jobs))
+    assert [arg for arg in argv if arg.startswith("--hash-jobs")] == (
+        [] if flag is None else [flag]
+    )
+
+
 @pytest.mark.parametrize(
     ("attr", "true_flag", "false_flag"),
     [
@@ -1393,19 +1433,27 @@ def test_async_build_director_spawn_failure_does_not_hang(
     monkeypatch.setattr(asyncio, "create_subprocess_exec", raise_not_found)
     args = argparse.Namespace(
         targets=[],
+        adaptive_jobs=False,
         cgroup=False,
         clean=True,
         duration=True,
         explain_rerun=False,
         keep_going=False,
         jobs=Decimal("1.0"),
+        min_jobs=1,
+        hash_jobs=None,
         joblog=False,
         fix_epoch=True,
         forkserver=False,
         perf=None,
         preload_modules=None,
+        call_workers=False,
+        spawn_helper=False,
         progress=False,
         defer_cap=100,
+        digest_algorithm="sha256",
+        digest_cache=False,
+        ready_heap=False,
         resources=None,
         sqllog=False,
         watch=False,
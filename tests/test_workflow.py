@@ -381,6 +381,19 @@ async def test_simple_example(wfs: Workflow):
         assert step.get_state() == StepState.SUCCEEDED
 
 
+async def test_update_file_hashes_invalidates_hash_memo(wfs: Workflow):
+    async with wfs.db:
+        declare_static(wfs, wfs.root, ["foo.txt", "bar.txt"])
+    foo_hash = fake_hash("foo.txt")
+    bar_hash = fake_hash("bar.txt")
+    wfs.hash_memo.store("foo.txt", foo_hash, wfs.hash_memo.epoch("foo.txt"))
+    wfs.hash_memo.store("bar.txt", bar_hash, wfs.hash_memo.epoch("bar.txt"))
+    async with wfs.db:
+        wfs.update_file_hashes({"foo.txt": FileHash.unknown()}, cause=HashUpdateCause.EXTERNAL)
+    assert not wfs.hash_memo.is_current("foo.txt", foo_hash)
+    assert wfs.hash_memo.is_current("bar.txt", bar_hash)
+
+
 async def test_define_boot_input_static(wfs: Workflow):
     async with wfs.db:
         to_check = wfs.define_step(wfs.root, "echo", inp_paths=["foo.txt"])
@@ -2290,6 +2303,21 @@ async def test_define_step_invalid_duration(wfp: Workflow):
             wfp.define_step(plan, "echo", duration=-1.0)
 
 
+async def test_define_step_priority(wfp: Workflow):
+    async with wfp.db:
+        plan = wfp.find(Step, "./plan.py")
+        wfp.define_step(plan, "echo foo > bar", out_paths=["bar"], priority=3)
+        echo = wfp.find(Step, "echo foo > bar")
+        assert ("priority", "3") in echo.format_properties()
+
+        # Detach and recycle: the priority is a declared property and follows the new declaration.
+        echo.detach()
+        wfp.define_step(plan, "echo foo > bar", out_paths=["bar"])
+        sql = "SELECT priority FROM step WHERE node = ?"
+        assert wfp.db.execute(sql, (echo.i,)).fetchone()[0] == 0
+        assert not any(key == "priority" for key, _ in echo.format_properties())
+
+
 async def test_output_clean_nested(wfp: Workflow):
     async with wfp.db:
         plan = wfp.find(Step, "./plan.py")
@@ -4421,7 +4449,11 @@ async def test_large_inode(wfp: Workflow):
         large_inode = 0x8000000000000001
         wfp.declare_static_files(plan, ["foo.txt"])
         wfp.update_file_hashes(
-            {"foo.txt": FileHash(hashlib.sha256(b"foo").digest(), 0o644, 1.0, 10, large_inode)},
+            {
+                "foo.txt": FileHash(
+                    hashlib.sha256(b"foo").digest(), 0o644, 1_000_000_000, 10, large_inode
+                )
+            },
             cause=HashUpdateCause.CONFIRMED,
         )
         foo = wfp.find(File, "foo.txt")
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: 2024 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Compare the I/O strategies of `stepup.core.hash.compute_file_digest` on a large file.
+
+Usage
+-----
+```bash
+python tools/bench_digest_io.py [--size-mib 1024] [--repeat 3] [--threads 4] [--dir /some/disk]
+```
+
+A file of random data is written to a temporary directory (on the file system of `--dir`)
+and hashed repeatedly with every combination of strategy and digest algorithm:
+
+- `read`: chunks are read into a reused buffer (the default).
+- `mmap`: the file is mapped into memory and slices of the map are hashed.
+- `tree`: the tree variant of the algorithm, hashing segments sequentially.
+- `tree-N`: the same, with up to N threads hashing segments in parallel.
+
+Each combination is measured cold (after dropping the file from the page cache)
+and warm (immediately after the cold run).
+The cold throughput depends on the storage, the warm one on the CPU and memory bandwidth.
+The last column shows how much the page cache grew during the cold run,
+taken from `/proc/meminfo` (Linux only).
+Files smaller than `HASH_DROP_CACHE_SIZE` remain in the cache after hashing,
+while larger files should leave the page cache (almost) unchanged.
+"""
+
+import argparse
+import concurrent.futures
+import os
+import tempfile
+import time
+
+from stepup.core.hash import (
+    DIGEST_ALGORITHMS,
+    HASH_CHUNK_SIZE,
+    compute_file_digest,
+)
+
+
+def drop_from_page_cache(path: str) -> None:
+    """Write back and drop the pages of a file from the page cache, if the platform allows."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def page_cache_kib() -> int | None:
+    """Return the size of the page cache in KiB, or `None` when it cannot be determined."""
+    try:
+        with open("/proc/meminfo") as fh:
+            for line in fh:
+                if line.startswith("Cached:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def write_random_file(path: str, size: int) -> None:
+    """Write `size` random bytes to `path`."""
+    with open(path, "wb") as fh:
+        remaining = size
+        while remaining > 0:
+            chunk = os.urandom(min(remaining, 64 * HASH_CHUNK_SIZE))
+            fh.write(chunk)
+            remaining -= len(chunk)
+
+
+def time_digest(path: str, repeat: int, **kwargs) -> tuple[float, float, int | None]:
+    """Hash a file cold and warm, `repeat` times, and return the best times and cache growth."""
+    best_cold = best_warm = float("inf")
+    cache_growth = None
+    for _ in range(repeat):
+        drop_from_page_cache(path)
+        cached_before = page_cache_kib()
+        start = time.perf_counter()
+        compute_file_digest(path, **kwargs)
+        best_cold = min(best_cold, time.perf_counter() - start)
+        cached_after = page_cache_kib()
+        if cached_before is not None and cached_after is not None:
+            cache_growth = cached_after - cached_before
+        start = time.perf_counter()
+        compute_file_digest(path, **kwargs)
+        best_warm = min(best_warm, time.perf_counter() - start)
+    return best_cold, best_warm, cache_growth
+
+
+def main() -> None:
+    """Parse command-line arguments, run the benchmark and print a table of results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mib", type=int, default=1024, help="Size of the test file.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs per combination.")
+    parser.add_argument("--threads", type=int, default=4, help="Threads for the tree variant.")
+    parser.add_argument("--dir", default=None, help="Directory in which the file is written.")
+    args = parser.parse_args()
+
+    size = args.size_mib << 20
+    with (
+        tempfile.TemporaryDirectory(dir=args.dir) as tmpdir,
+        concurrent.futures.ThreadPoolExecutor(args.threads) as pool,
+    ):
+        path = os.path.join(tmpdir, "data.bin")
+        write_random_file(path, size)
+        strategies = {
+            "read": lambda algorithm: {"algorithm": algorithm, "io_strategy": "read"},
+            "mmap": lambda algorithm: {"algorithm": algorithm, "io_strategy": "mmap"},
+            "tree": lambda algorithm: {"algorithm": f"{algorithm}-tree"},
+            f"tree-{args.threads}": lambda algorithm: {
+                "algorithm": f"{algorithm}-tree",
+                "pool": pool,
+                "max_helpers": args.threads - 1,
+            },
+        }
+        print(
+            f"{'algorithm':10s} {'strategy':10s} {'cold MB/s':>10s} {'warm MB/s':>10s} "
+            f"{'cache +MiB':>10s}"
+        )
+        for algorithm in DIGEST_ALGORITHMS:
+            for name, make_kwargs in strategies.items():
+                cold, warm, growth = time_digest(path, args.repeat, **make_kwargs(algorithm))
+                growth_str = "n/a" if growth is None else f"{growth / 1024:.0f}"
+                print(
+                    f"{algorithm:10s} {name:10s} {size / cold / 1e6:10.0f} "
+                    f"{size / warm / 1e6:10.0f} {growth_str:>10s}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: 2024 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Compare the iterative and sweep updates of `_implied_need` and `_tail_time`.
+
+Usage
+-----
+```bash
+python tools/bench_meta_after.py [--depth 2000] [--width 20000] [--repeat 3]
+```
+
+Two synthetic graphs are built in an in-memory database, with the schema of a workflow:
+
+- `chain`: a pipeline of `--depth` steps, each consuming the output of the previous one.
+- `fan`: `--width` independent steps whose outputs are all consumed by a single final step.
+
+For each graph, two updates are timed:
+
+- `initial`: all steps are flagged, as after the plan has defined them.
+- `change`: only the duration of the final step changes,
+  which affects the tail time of every other step.
+
+The `iterative` engine (`update_after_iterative`) needs one round of SQL per level of the graph,
+while the `sweep` engine (`update_after_sweep`) loads the affected subgraph once.
+For the benchmark, the size limit of the sweep is lifted,
+so the sweep is also timed where the director would fall back to the iterative update.
+"""
+
+import argparse
+import time
+
+import stepup.core.scheduler as scheduler_module
+from stepup.core.enums import Need, StepState
+from stepup.core.file import FILE_SCHEMA
+from stepup.core.scheduler import (
+    INIT_AFTER_SUBGRAPH,
+    INIT_CHANGED_AFTER,
+    INIT_CHECK_AFTER,
+    update_after_iterative,
+    update_after_sweep,
+)
+from stepup.core.sqlite3 import connect
+from stepup.core.step import STEP_SCHEMA
+from stepup.core.trellis import TRELLIS_SCHEMA
+
+
+def create_database():
+    """Return an in-memory connection with the tables used by the updates."""
+    con = connect(":memory:")
+    con.executescript(TRELLIS_SCHEMA)
+    con.executescript(FILE_SCHEMA)
+    con.executescript(STEP_SCHEMA)
+    con.execute("CREATE TEMPORARY TABLE target_path (path TEXT PRIMARY KEY)")
+    con.execute("CREATE TEMPORARY TABLE target_dir (path TEXT PRIMARY KEY, upper TEXT NOT NULL)")
+    con.execute(INIT_CHECK_AFTER)
+    con.execute(INIT_CHANGED_AFTER)
+    con.execute(INIT_AFTER_SUBGRAPH)
+    con.execute("INSERT INTO node (i, kind, label, creator, detached) VALUES (1, 'root', '', 1, 0)")
+    return con
+
+
+def insert_step(con, i: int):
+    """Insert a step node with node id `i` and its output file with node id `i + 1`."""
+    con.execute(
+        "INSERT INTO node (i, kind, label, creator, detached) VALUES (?, 'step', ?, 1, 0)",
+        (i, f"step{i}"),
+    )
+    con.execute(
+        "INSERT INTO step (node, state, need, shell, _safe, _check_safe, _implied_need,"
+        " _check_after) VALUES (?, ?, ?, 0, 0, 0, ?, 1)",
+        (i, StepState.PENDING.value, Need.DEFAULT.value, Need.OPTIONAL.value),
+    )
+    con.execute(
+        "INSERT INTO node (i, kind, label, creator, detached) VALUES (?, 'file', ?, ?, 0)",
+        (i + 1, f"file{i}", i),
+    )
+    con.execute("INSERT INTO dependency (source, sink) VALUES (?, ?)", (i, i + 1))
+
+
+def build_chain(con, depth: int) -> int:
+    """Build a chain of steps and return the node id of the last step."""
+    for k in range(depth):
+        i = 2 + 2 * k
+        insert_step(con, i)
+        if k > 0:
+            con.execute("INSERT INTO dependency (source, sink) VALUES (?, ?)", (i - 1, i))
+    return 2 * depth
+
+
+def build_fan(con, width: int) -> int:
+    """Build independent steps feeding a single final step and return the final step's id."""
+    final = 2 + 2 * width
+    insert_step(con, final)
+    for k in range(width):
+        i = 2 + 2 * k
+        insert_step(con, i)
+        con.execute("INSERT INTO dependency (source, sink) VALUES (?, ?)", (i + 1, final))
+    return final
+
+
+def run_engine(con, engine: str) -> float:
+    """Update the flagged steps with the given engine and return the wall time."""
+    start = time.perf_counter()
+    if engine == "sweep":
+        if not update_after_sweep(con):
+            raise RuntimeError("The sweep gave up.")
+    else:
+        update_after_iterative(con)
+    elapsed = time.perf_counter() - start
+    con.execute("UPDATE step SET _check_after = 0 WHERE _check_after")
+    return elapsed
+
+
+def time_graph(build, size: int, engine: str, repeat: int) -> tuple[float, float]:
+    """Return the best times of the initial and change updates of a freshly built graph."""
+    best_initial = best_change = float("inf")
+    for _ in range(repeat):
+        con = create_database()
+        final = build(con, size)
+        best_initial = min(best_initial, run_engine(con, engine))
+        for duration in 2.0, 3.0:
+            con.execute("UPDATE step SET duration = ? WHERE node = ?", (duration, final))
+            best_change = min(best_change, run_engine(con, engine))
+        con.close()
+    return best_initial, best_change
+
+
+def main():
+    """Parse command-line arguments, run the benchmark and print a table of results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--depth", type=int, default=2000, help="Number of steps in the chain.")
+    parser.add_argument("--width", type=int, default=20000, help="Number of steps in the fan.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs per combination.")
+    args = parser.parse_args()
+
+    scheduler_module.AFTER_SWEEP_BASE_NODES = 1 << 62
+    print(f"{'graph':10s} {'engine':10s} {'initial ms':>12s} {'change ms':>12s}")
+    for name, build, size in ("chain", build_chain, args.depth), ("fan", build_fan, args.width):
+        for engine in "iterative", "sweep":
+            initial, change = time_graph(build, size, engine, args.repeat)
+            print(f"{name:10s} {engine:10s} {initial * 1e3:12.1f} {change * 1e3:12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: 2024 Toon Verstraelen <Toon.Verstraelen@UGent.be>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Measure the startup time of Python steps with and without modules pre-loaded in the forkserver.
+
+Usage
+-----
+```bash
+python tools/bench_preload.py numpy matplotlib.pyplot [--nstep 50]
+```
+
+The modules are first probed with `stepup.core.preload.probe_preload_modules`,
+which shows their import times and whether they are safe to pre-load.
+Then, for each mode (`plain` and `preload`), a fresh interpreter starts a forkserver
+and forks `--nstep` children one after the other, each importing the given modules.
+The time to start the forkserver is paid once per build,
+while the time per child is paid by every Python step.
+"""
+
+import argparse
+import multiprocessing
+import subprocess
+import sys
+import time
+
+from stepup.core.preload import probe_preload_modules
+
+
+def import_all(modules: list[str]) -> None:
+    """Import the modules, as a Python step using them would do."""
+    for module in modules:
+        __import__(module)
+
+
+def measure(modules: list[str], preload: bool, nstep: int) -> tuple[float, float]:
+    """Return the forkserver start time and the mean time per child, in seconds."""
+    mp_ctx = multiprocessing.get_context("forkserver")
+    mp_ctx.set_forkserver_preload(["stepup.core.executor", *(modules if preload else [])])
+    start = time.perf_counter()
+    # The first child starts the forkserver and is therefore not representative.
+    proc = mp_ctx.Process(target=import_all, args=([],))
+    proc.start()
+    proc.join()
+    time_server = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(nstep):
+        proc = mp_ctx.Process(target=import_all, args=(modules,))
+        proc.start()
+        proc.join()
+        if proc.exitcode != 0:
+            raise RuntimeError(f"Child failed with exit code {proc.exitcode}")
+    return time_server, (time.perf_counter() - start) / nstep
+
+
+def main() -> None:
+    """Parse command-line arguments, run the benchmark and print a table of results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("modules", nargs="+", help="Modules imported by every step.")
+    parser.add_argument("--nstep", type=int, default=50, help="Number of children per mode.")
+    parser.add_argument("--measure", choices=["plain", "preload"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure is not None:
+        # Worker mode: each mode runs in a fresh interpreter, with a forkserver of its own.
+        time_server, time_step = measure(args.modules, args.measure == "preload", args.nstep)
+        print(f"{time_server} {time_step}")
+        return
+
+    print(f"{'module':30s} {'import ms':>10s}  problem")
+    for report in probe_preload_modules(args.modules):
+        print(f"{report.module:30s} {report.import_time * 1e3:10.1f}  {report.problem or '-'}")
+    print()
+    print(f"{'mode':10s} {'server ms':>10s} {'step ms':>10s} {'total s':>10s}")
+    for mode in "plain", "preload":
+        cp = subprocess.run(
+            [sys.executable, __file__, *args.modules, f"--nstep={args.nstep}", f"--measure={mode}"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        time_server, time_step = (float(word) for word in cp.stdout.split())
+        total = time_server + args.nstep * time_step
+        print(f"{mode:10s} {time_server * 1e3:10.1f} {time_step * 1e3:10.1f} {total:10.2f}")
+
+
+if __name__ == "__main__":
+    main()